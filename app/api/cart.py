@@ -10,6 +10,7 @@ from datetime import datetime
 
 from config.database import get_db
 from app.services.cart_service import CartService
+from app.services.cart_tokens import CartTokenError
 from app.services.order_service import OrderService
 from app.database.models import Customer, Order, OrderItem, Product, OrderStatus
 from app.core.context_manager import ContextManager
@@ -69,6 +70,7 @@ class ProductInfo(BaseModel):
     category: Optional[str]
     sku: Optional[str]
     image_path: Optional[str]
+    image_variants: Optional[Dict[str, Dict[str, str]]] = None
 
 
 class CompleteCartRequest(BaseModel):
@@ -197,7 +199,7 @@ async def get_cart_session(
     """
     try:
         cart_service = CartService(db)
-        validation = cart_service.validate_cart_session(token)
+        validation = cart_service.validate_cart_token(token)
         
         logger.info(f"🔍 API: Validación de token {token[:8]}... → valid={validation.get('valid')}")
         
@@ -227,9 +229,9 @@ async def get_cart_products(
     Lista de productos ordenados alfabéticamente
     """
     try:
-        # Validar token primero
+        # Validar token primero (en memoria si la sesión no se usó)
         cart_service = CartService(db)
-        validation = cart_service.validate_cart_session(token)
+        validation = cart_service.validate_cart_token(token)
         
         if not validation.get("valid"):
             raise HTTPException(
@@ -403,7 +405,7 @@ async def complete_cart(
         
         logger.info(f"🔔 Contexto actualizado para {phone}: checkout iniciado, order_id={order.id}")
         
-        # 5. Enviar mensajes al usuario por WhatsApp (con retry logic)
+        # 5. Enviar mensajes al usuario por WhatsApp (si WAHA falla quedan en la cola de reintentos)
         try:
             from app.services.webhook_retry_service import webhook_retry_service
             
@@ -631,7 +633,7 @@ async def complete_cart(
             
             # ⚠️ FALLBACK: Si ambos mensajes fallaron después de todos los reintentos
             if not success1 and not success2:
-                logger.critical(f"🚨 CRÍTICO: No se pudo comunicar con WAHA después de 4 intentos para orden {order.order_number}")
+                logger.critical(f"🚨 CRÍTICO: No se pudo comunicar con WAHA para orden {order.order_number}, mensajes en cola de reintentos")
                 logger.critical(f"   Customer: {phone}, Order: {order.id}")
                 
                 # TODO: Implementar notificación al panel de administrador
@@ -687,6 +689,14 @@ async def get_pending_order(
     """Obtiene la orden PENDING asociada a esta sesión si existe"""
     try:
         cart_service = CartService(db)
+        
+        # Sesión sin usar: todavía no tiene orden
+        try:
+            if cart_service.read_token_claims(token) is not None:
+                return {"has_pending_order": False}
+        except CartTokenError:
+            return {"has_pending_order": False}
+        
         session = cart_service.get_cart_session(token)
         
         if not session or not session.order_id:
@@ -736,6 +746,22 @@ async def check_cart_status(
     """
     try:
         cart_service = CartService(db)
+        
+        # Sesión sin usar: el estado sale del token firmado
+        try:
+            claims = cart_service.read_token_claims(token)
+        except CartTokenError:
+            claims = None
+        if claims is not None:
+            return {
+                "exists": True,
+                "used": False,
+                "expired": claims.is_expired,
+                "valid": not claims.is_expired,
+                "order_id": None,
+                "expires_at": claims.expires_at.isoformat()
+            }
+        
         session = cart_service.get_cart_session(token)
         
         if not session:
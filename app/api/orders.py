@@ -298,6 +298,8 @@ async def update_order_status(
         elif request.status == "confirmed":
             # Actualizar estado a confirmed y establecer timestamp
             from datetime import datetime
+            from app.services.product_affinity import product_affinity
+            product_affinity.on_status_change(db, order, order.status, "confirmed")
             order.status = "confirmed"
             order.confirmed_at = datetime.utcnow()
             db.commit()
@@ -305,6 +307,8 @@ async def update_order_status(
             logger.info(f"✅ Orden {order.order_number} marcada como CONFIRMED en {order.confirmed_at}")
         else:
             # Para otros estados (pending), actualizar directamente
+            from app.services.product_affinity import product_affinity
+            product_affinity.on_status_change(db, order, order.status, request.status)
             order.status = request.status
             db.commit()
             db.refresh(order)
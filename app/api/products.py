@@ -5,16 +5,23 @@ from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import or_, func
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field
 from datetime import datetime
 import os
 import uuid
 import shutil
+import asyncio
+import time
 from pathlib import Path
 
 from config.database import get_db
 from app.database.models import Product
+from app.utils.media_io import MediaTooLargeError, stream_to_file
+from app.services.image_delivery_cache import image_delivery_cache
+from app.core.order_phrase_parser import invalidate_catalog_index
+from app.services.product_vector_index import product_vector_index, product_text
+from app.services.image_pipeline import image_pipeline, content_key, content_key_from_path
 from loguru import logger
 
 router = APIRouter(prefix="/api/products", tags=["products"])
@@ -55,6 +62,9 @@ class ProductResponse(ProductBase):
     """Modelo de respuesta de producto"""
     id: str
     image_path: Optional[str] = None
+    image_variants: Optional[Dict[str, Dict[str, str]]] = Field(
+        None, description="URLs de thumb/card/full en WebP y JPEG (cache inmutable)"
+    )
     created_at: datetime
     updated_at: datetime
     in_stock: bool = Field(..., description="Si el producto tiene stock y está activo")
@@ -78,6 +88,15 @@ class ProductStats(BaseModel):
 # ENDPOINTS
 # ============================================
 
+async def _reindex_product(product: Product) -> None:
+    """Actualiza el embedding del producto (o lo quita si está inactivo) fuera del event loop"""
+    if product.is_active:
+        text = product_text(product.name, product.category, product.description)
+        await asyncio.to_thread(product_vector_index.upsert, product.id, text)
+    else:
+        await asyncio.to_thread(product_vector_index.remove, product.id)
+
+
 @router.get("/", response_model=List[ProductResponse])
 async def list_products(
     skip: int = Query(0, ge=0, description="Número de productos a saltar"),
@@ -253,6 +272,8 @@ async def create_product(product_data: ProductCreate, db: Session = Depends(get_
         db.add(new_product)
         db.commit()
         db.refresh(new_product)
+        invalidate_catalog_index()
+        await _reindex_product(new_product)
         
         logger.info(f"✅ Producto creado: {new_product.name} (ID: {new_product.id})")
         return new_product
@@ -302,6 +323,8 @@ async def update_product(
         
         db.commit()
         db.refresh(product)
+        invalidate_catalog_index()
+        await _reindex_product(product)
         
         logger.info(f"✅ Producto actualizado: {product.name} (ID: {product_id})")
         return product
@@ -335,6 +358,8 @@ async def delete_product(product_id: str, db: Session = Depends(get_db)):
         # Eliminar producto
         db.delete(product)
         db.commit()
+        invalidate_catalog_index()
+        await asyncio.to_thread(product_vector_index.remove, product_id)
         
         logger.info(f"🗑️ Producto eliminado: {product_name} (ID: {product_id})")
         return {
@@ -406,6 +431,8 @@ async def toggle_active(product_id: str, db: Session = Depends(get_db)):
         
         db.commit()
         db.refresh(product)
+        invalidate_catalog_index()
+        await _reindex_product(product)
         
         status = "activado" if product.is_active else "desactivado"
         logger.info(f"🔄 Producto {status}: {product.name}")
@@ -462,6 +489,36 @@ def validate_image_file(file: UploadFile) -> None:
         )
 
 
+async def _release_image(image_path: str, db: Session) -> None:
+    """
+    Libera la imagen anterior de un producto
+
+    Las imágenes legacy (nombre aleatorio) se borran directamente; las
+    almacenadas por contenido pueden estar compartidas, así que se borran
+    solo si quedaron huérfanas, junto con sus variantes.
+    """
+    try:
+        await asyncio.to_thread(image_delivery_cache.invalidate, image_path)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo invalidar la variante WhatsApp: {str(e)}")
+    
+    if not content_key_from_path(image_path) and os.path.exists(image_path):
+        try:
+            os.remove(image_path)
+            logger.info(f"🗑️ Imagen eliminada: {image_path}")
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo eliminar imagen: {str(e)}")
+    
+    try:
+        # Con storage_lock: ninguna subida queda entre escribir su original y el commit
+        async with image_pipeline.storage_lock:
+            snapshot_at = time.time()
+            referenced = [path for (path,) in db.query(Product.image_path).filter(Product.image_path.isnot(None)).all()]
+            await asyncio.to_thread(image_pipeline.collect_garbage, referenced, snapshot_at)
+    except Exception as e:
+        logger.warning(f"⚠️ Error limpiando imágenes huérfanas: {str(e)}")
+
+
 def generate_unique_filename(original_filename: str) -> str:
     """
     Generar un nombre de archivo único manteniendo la extensión original
@@ -503,34 +560,43 @@ async def upload_product_image(
         # Validar archivo
         validate_image_file(file)
         
-        # Validar tamaño (leer contenido)
-        contents = await file.read()
-        if len(contents) > MAX_FILE_SIZE:
+        # Guardar archivo por chunks (valida el tamaño sin cargarlo entero en memoria)
+        upload_path = UPLOAD_DIR / generate_unique_filename(file.filename or "image.jpg")
+        try:
+            _, sha256 = await asyncio.to_thread(stream_to_file, file.file, upload_path, MAX_FILE_SIZE)
+        except MediaTooLargeError:
             raise HTTPException(
                 status_code=400,
                 detail=f"El archivo es demasiado grande. Tamaño máximo: {MAX_FILE_SIZE / 1024 / 1024:.1f} MB"
             )
         
-        # Eliminar imagen anterior si existe
-        if product.image_path and os.path.exists(product.image_path):
+        # Almacenar por contenido: la misma imagen es un solo archivo y nunca cambia de contenido
+        filename = f"{content_key(sha256)}{upload_path.suffix}"
+        file_path = UPLOAD_DIR / filename
+        async with image_pipeline.storage_lock:
             try:
-                os.remove(product.image_path)
-                logger.info(f"🗑️ Imagen anterior eliminada: {product.image_path}")
-            except Exception as e:
-                logger.warning(f"⚠️ No se pudo eliminar imagen anterior: {str(e)}")
+                # Ya existe: renovar el mtime (puede ser un huérfano que el GC de otro proceso está por borrar)
+                os.utime(file_path)
+                upload_path.unlink()
+            except FileNotFoundError:
+                os.replace(upload_path, file_path)
+            
+            # Actualizar path en BD (guardar path relativo)
+            previous_path = product.image_path
+            product.image_path = str(file_path)
+            db.commit()
+        db.refresh(product)
         
-        # Generar nombre único para el archivo
-        filename = generate_unique_filename(file.filename or "image.jpg")
-        file_path = UPLOAD_DIR / filename
+        # Variantes thumb/card/full (pool de procesos) y variante WhatsApp
+        variants = await image_pipeline.process(str(file_path))
+        try:
+            await asyncio.to_thread(image_delivery_cache.prepare, str(file_path))
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo generar la variante WhatsApp: {str(e)}")
         
-        # Guardar archivo
-        with open(file_path, "wb") as f:
-            f.write(contents)
-        
-        # Actualizar path en BD (guardar path relativo)
-        product.image_path = str(file_path)
-        db.commit()
-        db.refresh(product)
+        # Limpiar imagen anterior (si ningún otro producto la usa)
+        if previous_path and previous_path != product.image_path:
+            await _release_image(previous_path, db)
         
         logger.info(f"📷 Imagen subida para producto '{product.name}': {filename}")
         
@@ -539,6 +605,7 @@ async def upload_product_image(
             "message": "Imagen subida exitosamente",
             "filename": filename,
             "image_url": f"/static/products/{filename}",
+            "image_variants": variants,
             "product_name": product.name
         }
         
@@ -566,19 +633,15 @@ async def delete_product_image(product_id: str, db: Session = Depends(get_db)):
         if not product.image_path:
             raise HTTPException(status_code=404, detail="El producto no tiene imagen")
         
-        # Eliminar archivo físico
-        if os.path.exists(product.image_path):
-            try:
-                os.remove(product.image_path)
-                logger.info(f"🗑️ Imagen eliminada: {product.image_path}")
-            except Exception as e:
-                logger.error(f"❌ Error eliminando archivo: {str(e)}")
-        
         # Actualizar BD
+        previous_path = product.image_path
         product.image_path = None
         db.commit()
         db.refresh(product)
         
+        # Eliminar archivos (si ningún otro producto usa la misma imagen)
+        await _release_image(previous_path, db)
+        
         return {
             "success": True,
             "message": "Imagen eliminada exitosamente",
@@ -0,0 +1,136 @@
+"""
+API endpoints para inspeccionar y re-encolar envíos fallidos a WAHA
+"""
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from config.database import get_db
+from app.database.models import RetryJob, DeadLetter
+from app.services.webhook_retry_service import webhook_retry_service
+from loguru import logger
+
+router = APIRouter(prefix="/api/retries", tags=["retries"])
+
+
+@router.get("/stats")
+async def get_retry_stats():
+    """
+    Métricas de la cola de reintentos (pendientes, dead letters, éxitos)
+    """
+    return webhook_retry_service.get_stats()
+
+
+@router.get("/pending", response_model=List[Dict[str, Any]])
+async def list_pending(
+    chat_key: Optional[str] = Query(None, description="Filtrar por número de destino"),
+    limit: int = Query(100, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    """
+    Listar envíos pendientes de reintento (por próximo intento)
+    """
+    query = db.query(RetryJob)
+    if chat_key:
+        query = query.filter(RetryJob.chat_key == chat_key)
+    jobs = query.order_by(RetryJob.next_attempt_at).limit(limit).all()
+    return [job.to_dict() for job in jobs]
+
+
+@router.get("/dead-letters", response_model=List[Dict[str, Any]])
+async def list_dead_letters(
+    include_replayed: bool = Query(False, description="Incluir los ya re-encolados"),
+    limit: int = Query(100, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    """
+    Listar envíos que agotaron sus reintentos (más recientes primero)
+    """
+    query = db.query(DeadLetter)
+    if not include_replayed:
+        query = query.filter(DeadLetter.replayed_at.is_(None))
+    dead_letters = query.order_by(DeadLetter.failed_at.desc()).limit(limit).all()
+    return [dead_letter.to_dict() for dead_letter in dead_letters]
+
+
+@router.post("/dead-letters/{dead_letter_id}/replay")
+async def replay_dead_letter(dead_letter_id: str, db: Session = Depends(get_db)):
+    """
+    Re-encolar un envío fallido (se reintenta en la próxima pasada del scheduler)
+    """
+    try:
+        dead_letter = db.query(DeadLetter).filter(DeadLetter.id == dead_letter_id).first()
+
+        if not dead_letter:
+            raise HTTPException(status_code=404, detail="Dead letter no encontrado")
+
+        if dead_letter.replayed_at:
+            raise HTTPException(status_code=400, detail="Este envío ya fue re-encolado")
+
+        job = webhook_retry_service.replay_dead_letter(db, dead_letter)
+        db.commit()
+
+        logger.info(f"🔁 Dead letter re-encolado: {dead_letter.operation_name} → {dead_letter.chat_key}")
+
+        return {
+            "success": True,
+            "message": "Envío re-encolado",
+            "retry_job_id": job.id
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error re-encolando dead letter {dead_letter_id}: {e}", exc_info=True)
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Error al re-encolar el envío")
+
+
+@router.post("/dead-letters/replay-all")
+async def replay_all_dead_letters(db: Session = Depends(get_db)):
+    """
+    Re-encolar todos los envíos fallidos no re-encolados (ej: después de una caída de WAHA)
+    """
+    try:
+        dead_letters = db.query(DeadLetter).filter(
+            DeadLetter.replayed_at.is_(None)
+        ).order_by(DeadLetter.created_at).all()
+
+        for dead_letter in dead_letters:
+            webhook_retry_service.replay_dead_letter(db, dead_letter)
+        db.commit()
+
+        logger.info(f"🔁 {len(dead_letters)} dead letters re-encolados")
+
+        return {
+            "success": True,
+            "replayed": len(dead_letters)
+        }
+
+    except Exception as e:
+        logger.error(f"Error re-encolando dead letters: {e}", exc_info=True)
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Error al re-encolar los envíos")
+
+
+@router.delete("/dead-letters/{dead_letter_id}")
+async def delete_dead_letter(dead_letter_id: str, db: Session = Depends(get_db)):
+    """
+    Descartar un envío fallido
+    """
+    try:
+        dead_letter = db.query(DeadLetter).filter(DeadLetter.id == dead_letter_id).first()
+
+        if not dead_letter:
+            raise HTTPException(status_code=404, detail="Dead letter no encontrado")
+
+        db.delete(dead_letter)
+        db.commit()
+
+        return {"success": True, "message": "Dead letter eliminado"}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error eliminando dead letter {dead_letter_id}: {e}", exc_info=True)
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Error al eliminar el dead letter")
@@ -7,6 +7,7 @@ from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from config.database import get_db
 from app.database.models import Settings
+from app.services.admin_notification_service import invalidate_admin_numbers_cache
 from loguru import logger
 
 router = APIRouter(prefix="/api/settings", tags=["settings"])
@@ -110,6 +111,9 @@ async def create_setting(request: CreateSettingRequest, db: Session = Depends(ge
         db.commit()
         db.refresh(setting)
 
+        if request.key == "admin_numbers":
+            invalidate_admin_numbers_cache()
+
         logger.info(f"✅ Configuración creada: {request.key}")
 
         return {
@@ -150,6 +154,9 @@ async def update_setting(
         db.commit()
         db.refresh(setting)
 
+        if key == "admin_numbers":
+            invalidate_admin_numbers_cache()
+
         logger.info(f"✅ Configuración actualizada: {key}")
 
         return {
@@ -185,6 +192,9 @@ async def delete_setting(key: str, db: Session = Depends(get_db)):
         db.delete(setting)
         db.commit()
 
+        if key == "admin_numbers":
+            invalidate_admin_numbers_cache()
+
         logger.info(f"✅ Configuración eliminada: {key}")
 
         return {
@@ -270,6 +280,7 @@ async def add_admin_number(request: AddAdminNumberRequest, db: Session = Depends
 
         db.commit()
         db.refresh(setting)
+        invalidate_admin_numbers_cache()
 
         logger.info(f"✅ Número de admin agregado: {phone}")
 
@@ -317,6 +328,7 @@ async def remove_admin_number(request: RemoveAdminNumberRequest, db: Session = D
 
         db.commit()
         db.refresh(setting)
+        invalidate_admin_numbers_cache()
 
         logger.info(f"✅ Número de admin eliminado: {phone}")
 
@@ -0,0 +1,185 @@
+"""
+Modelos por tarea, precarga y keep-alive
+
+Todo usaba settings.ollama_model, desde etiquetas de una palabra hasta las
+respuestas libres, y la primera llamada después de que Ollama descargaba el
+modelo pagaba la carga completa (varios segundos tras un rato sin tráfico).
+
+- Modelo por tarea: clasificación (intención, análisis del turno),
+  extracción (productos y cantidades) y generación (respuestas). Vacío =
+  settings.ollama_model.
+- ModelKeeper: al arrancar precarga cada modelo configurado en cada backend
+  que lo sirve (request de 1 token con el mismo keep_alive/num_ctx que las
+  llamadas reales, si no Ollama lo recargaría) y lo repite cada
+  llm_keepalive_interval_seconds para que no se descargue.
+- Cold starts: load_ms reportado por el proxy por encima de llm_cold_start_ms
+  cuenta como arranque en frío, por modelo.
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+from loguru import logger
+
+from config.settings import settings
+
+
+# Tareas
+CLASSIFICATION = "classification"
+EXTRACTION = "extraction"
+GENERATION = "generation"
+
+
+def model_for(task: str) -> str:
+    """Modelo configurado para una tarea"""
+    configured = {
+        CLASSIFICATION: settings.llm_model_classification,
+        EXTRACTION: settings.llm_model_extraction,
+        GENERATION: settings.llm_model_generation
+    }.get(task)
+    return configured or settings.ollama_model
+
+
+def configured_models() -> List[str]:
+    """Modelos distintos en uso (orden estable)"""
+    return list(dict.fromkeys(model_for(task) for task in (CLASSIFICATION, EXTRACTION, GENERATION)))
+
+
+class ModelKeeper:
+    """Precarga modelos, los mantiene residentes y cuenta cold starts"""
+
+    def __init__(self, keepalive_interval: float = 600.0, cold_start_ms: float = 500.0):
+        """
+        Args:
+            keepalive_interval: Segundos entre pings de keep-alive (0 = solo precarga)
+            cold_start_ms: load_ms a partir del cual una llamada fue un arranque en frío
+        """
+        self.keepalive_interval = keepalive_interval
+        self.cold_start_ms = cold_start_ms
+
+        self.running = False
+        self._task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+
+        # Métricas por modelo
+        self._per_model: Dict[str, Dict[str, Any]] = {}
+        self._warmups = 0
+        self._warmup_failures = 0
+
+    # ═══════════════════════════════════════════════════════════
+    # CICLO DE VIDA
+    # ═══════════════════════════════════════════════════════════
+
+    async def start(self):
+        """Precarga en segundo plano y arranca el keep-alive (no bloquea el arranque)"""
+        if self.running:
+            return
+        self.running = True
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"✅ [Models] Precargando {', '.join(configured_models())}")
+
+    async def stop(self):
+        self.running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while self.running:
+            try:
+                await asyncio.to_thread(self.warm_up)
+            except Exception as e:
+                logger.error(f"❌ [Models] Error en precarga: {e}")
+
+            if self.keepalive_interval <= 0:
+                break
+            try:
+                await asyncio.sleep(self.keepalive_interval)
+            except asyncio.CancelledError:
+                break
+
+    def warm_up(self) -> Dict[str, float]:
+        """
+        Carga (o mantiene cargado) cada modelo en cada backend que lo sirve
+
+        Bloqueante. Va directo a cada backend, sin pasar por el balanceo.
+
+        Returns:
+            "{backend} {modelo}" → load_ms
+        """
+        from app.clients.llm_router import llm_router
+        from app.clients.ollama_sync import OllamaSyncClient
+
+        builder = OllamaSyncClient()
+        loads = {}
+        for model in configured_models():
+            payload = builder._build_payload("", temperature=0.0, max_tokens=1, stop=None, model=model)
+            for backend in llm_router.backends:
+                if not backend.serves(model):
+                    continue
+                try:
+                    response = requests.post(f"{backend.url}/generate", json=payload, timeout=settings.ollama_timeout)
+                    response.raise_for_status()
+                    load_ms = float(response.json().get("load_ms") or 0.0)
+                except Exception as e:
+                    self._warmup_failures += 1
+                    logger.warning(f"⚠️ [Models] No se pudo precargar {model} en {backend.url}: {e}")
+                    continue
+
+                self._warmups += 1
+                loads[f"{backend.url} {model}"] = load_ms
+                backend.loaded_models.add(model)
+                if load_ms >= self.cold_start_ms:
+                    logger.info(f"🔥 [Models] {model} cargado en {backend.url} ({load_ms:.0f}ms)")
+        return loads
+
+    # ═══════════════════════════════════════════════════════════
+    # MÉTRICAS
+    # ═══════════════════════════════════════════════════════════
+
+    def record_call(self, model: str, load_ms: Optional[float]):
+        """Registra el load_ms de una llamada real (None si el proxy no lo reportó)"""
+        if load_ms is None:
+            return
+        with self._lock:
+            stats = self._per_model.setdefault(model, {
+                "calls": 0, "cold_starts": 0, "cold_load_ms": 0.0, "last_cold_start_at": None
+            })
+            stats["calls"] += 1
+            if load_ms >= self.cold_start_ms:
+                stats["cold_starts"] += 1
+                stats["cold_load_ms"] += load_ms
+                stats["last_cold_start_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+                logger.warning(f"🧊 [Models] Cold start de {model}: {load_ms:.0f}ms de carga")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Modelos por tarea, precargas y cold starts"""
+        with self._lock:
+            return {
+                "tasks": {task: model_for(task) for task in (CLASSIFICATION, EXTRACTION, GENERATION)},
+                "keepalive_interval_seconds": self.keepalive_interval or None,
+                "warmups": self._warmups,
+                "warmup_failures": self._warmup_failures,
+                "models": {
+                    model: {
+                        "calls": stats["calls"],
+                        "cold_starts": stats["cold_starts"],
+                        "avg_cold_load_ms": round(stats["cold_load_ms"] / stats["cold_starts"], 1) if stats["cold_starts"] else None,
+                        "last_cold_start_at": stats["last_cold_start_at"]
+                    }
+                    for model, stats in self._per_model.items()
+                }
+            }
+
+
+# Instancia global
+model_keeper = ModelKeeper(
+    keepalive_interval=settings.llm_keepalive_interval_seconds,
+    cold_start_ms=settings.llm_cold_start_ms
+)
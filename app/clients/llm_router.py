@@ -0,0 +1,298 @@
+"""
+Router de LLM sobre varios backends
+
+El proxy de Ollama era un único endpoint (settings.ollama_proxy_url), así que
+solo se podía usar una máquina. El router reparte las llamadas entre los
+proxies configurados en LLM_BACKENDS (cada nodo corre ollama_proxy.py junto
+a su Ollama):
+
+- Selección por menos requests en curso; a igualdad, menor latencia EWMA.
+- Modelos declarados por backend ("url|modelo1|modelo2"): un backend con
+  lista solo recibe esos modelos. Sin lista acepta cualquiera.
+- Afinidad: un backend que ya sirvió el modelo (lo tiene cargado) tiene
+  preferencia frente a uno igual de ocupado que tendría que cargarlo.
+- Salud pasiva: tras N fallos seguidos el backend queda fuera durante un
+  cooldown; luego vuelve a recibir tráfico y un éxito lo rehabilita.
+- Failover: un error de conexión se reintenta una vez en otro backend.
+- Hedging opcional (llm_hedge_after_seconds > 0, solo sin streaming): si la
+  respuesta tarda más que el umbral se lanza un duplicado en otro backend y
+  gana la primera que responda.
+
+Es thread-safe: lo usan el worker síncrono y el event loop.
+"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, TypeVar
+
+import requests
+from loguru import logger
+
+from config.settings import settings
+from app.core.circuit_breaker import is_service_failure
+
+
+T = TypeVar("T")
+
+
+@dataclass
+class LLMBackend:
+    """Un proxy de Ollama y sus métricas"""
+    url: str
+    models: Set[str] = field(default_factory=set)  # Vacío = acepta cualquier modelo
+    outstanding: int = 0
+    ewma_latency: Optional[float] = None
+    consecutive_failures: int = 0
+    unhealthy_until: float = 0.0
+    loaded_models: Set[str] = field(default_factory=set)
+    requests: int = 0
+    failures: int = 0
+    hedges_won: int = 0
+
+    def serves(self, model: str) -> bool:
+        return not self.models or model in self.models
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.unhealthy_until
+
+
+def parse_backends(spec: str) -> List[LLMBackend]:
+    """
+    Parsea LLM_BACKENDS
+
+    Formato: "http://a:5001,http://b:5001|llama3.2:1b|qwen2.5:0.5b"
+    """
+    backends = []
+    for entry in spec.split(","):
+        parts = [part.strip() for part in entry.strip().split("|") if part.strip()]
+        if not parts:
+            continue
+        backends.append(LLMBackend(url=parts[0].rstrip("/"), models=set(parts[1:])))
+    return backends
+
+
+class LLMRouter:
+    """Balanceo por menos requests en curso con salud, latencia EWMA y afinidad de modelo"""
+
+    def __init__(
+        self,
+        backends: Iterable[LLMBackend],
+        ewma_alpha: float = 0.3,
+        failure_threshold: int = 3,
+        cooldown_seconds: float = 15.0,
+        hedge_after_seconds: float = 0.0
+    ):
+        """
+        Args:
+            backends: Proxies disponibles
+            ewma_alpha: Peso de la última latencia en el EWMA
+            failure_threshold: Fallos seguidos que sacan a un backend de rotación
+            cooldown_seconds: Tiempo fuera de rotación
+            hedge_after_seconds: Segundos antes de lanzar un duplicado (0 = sin hedging)
+        """
+        self.backends: List[LLMBackend] = list(backends)
+        if not self.backends:
+            raise ValueError("LLMRouter necesita al menos un backend")
+
+        self.ewma_alpha = ewma_alpha
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_seconds = cooldown_seconds
+        self.hedge_after_seconds = hedge_after_seconds
+
+        self._lock = threading.Lock()
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+
+        # Métricas
+        self._hedges_sent = 0
+        self._failovers = 0
+
+    # ═══════════════════════════════════════════════════════════
+    # SELECCIÓN
+    # ═══════════════════════════════════════════════════════════
+
+    def _select(self, model: str, exclude: Iterable[LLMBackend] = ()) -> Optional[LLMBackend]:
+        """Elige backend y reserva un request en curso (con lock)"""
+        excluded = {id(b) for b in exclude}
+        candidates = [b for b in self.backends if b.serves(model) and id(b) not in excluded]
+        if not candidates:
+            return None
+
+        now = time.monotonic()
+        healthy = [b for b in candidates if b.healthy(now)]
+        # Todos fuera de rotación: mejor intentar que fallar sin llamar
+        pool = healthy or candidates
+
+        def score(backend: LLMBackend):
+            # Tener el modelo cargado vale un request en curso
+            affinity = 1 if model in backend.loaded_models else 0
+            latency = backend.ewma_latency if backend.ewma_latency is not None else 0.0
+            return (backend.outstanding - affinity, latency)
+
+        backend = min(pool, key=score)
+        backend.outstanding += 1
+        backend.requests += 1
+        return backend
+
+    def _release(self, backend: LLMBackend, model: str, duration: float, error: Optional[BaseException]):
+        """Libera el request y actualiza salud y latencia"""
+        with self._lock:
+            backend.outstanding -= 1
+
+            if error is not None and is_service_failure(error):
+                backend.failures += 1
+                backend.consecutive_failures += 1
+                if backend.consecutive_failures >= self.failure_threshold:
+                    backend.unhealthy_until = time.monotonic() + self.cooldown_seconds
+                    logger.warning(
+                        f"⚠️ [LLMRouter] {backend.url} fuera de rotación {self.cooldown_seconds:.0f}s "
+                        f"({backend.consecutive_failures} fallos seguidos: {error})"
+                    )
+                return
+
+            if backend.consecutive_failures >= self.failure_threshold:
+                logger.info(f"✅ [LLMRouter] {backend.url} recuperado")
+            backend.consecutive_failures = 0
+            backend.unhealthy_until = 0.0
+            backend.loaded_models.add(model)
+            if backend.ewma_latency is None:
+                backend.ewma_latency = duration
+            else:
+                backend.ewma_latency += self.ewma_alpha * (duration - backend.ewma_latency)
+
+    @contextmanager
+    def acquire(self, model: str, exclude: Iterable[LLMBackend] = ()) -> Iterator[LLMBackend]:
+        """
+        Reserva un backend para una llamada (sirve también alrededor de un await)
+
+            with llm_router.acquire(model) as backend:
+                requests.post(f"{backend.url}/generate", ...)
+        """
+        with self._lock:
+            backend = self._select(model, exclude)
+        if backend is None:
+            raise RuntimeError(f"Ningún backend LLM sirve el modelo '{model}'")
+
+        start = time.perf_counter()
+        error: Optional[BaseException] = None
+        try:
+            yield backend
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._release(backend, model, time.perf_counter() - start, error)
+
+    # ═══════════════════════════════════════════════════════════
+    # LLAMADAS
+    # ═══════════════════════════════════════════════════════════
+
+    def run(self, model: str, call: Callable[[LLMBackend], T], hedge: bool = False) -> T:
+        """
+        Ejecuta call(backend) con failover y hedging opcional
+
+        Args:
+            model: Modelo pedido (selección y afinidad)
+            call: Función que hace el request contra backend.url
+            hedge: Permitir un duplicado si tarda más de hedge_after_seconds
+                   (solo para llamadas sin efectos, sin streaming)
+        """
+        if hedge and self.hedge_after_seconds > 0 and len(self.backends) > 1:
+            return self._run_hedged(model, call)
+
+        tried: List[LLMBackend] = []
+        try:
+            with self.acquire(model) as backend:
+                tried.append(backend)
+                return call(backend)
+        except requests.exceptions.ConnectionError as e:
+            # El backend no aceptó la conexión: reintentar una vez en otro
+            if not self._has_alternative(model, tried):
+                raise
+            with self._lock:
+                self._failovers += 1
+            logger.warning(f"🔀 [LLMRouter] {tried[0].url} no responde ({e}), reintentando en otro backend")
+            with self.acquire(model, exclude=tried) as backend:
+                return call(backend)
+
+    def _has_alternative(self, model: str, exclude: List[LLMBackend]) -> bool:
+        return any(b.serves(model) and b not in exclude for b in self.backends)
+
+    def _run_hedged(self, model: str, call: Callable[[LLMBackend], T]) -> T:
+        """Lanza el request y, si tarda, un duplicado en otro backend; gana el primero"""
+        pool = self._get_hedge_pool()
+        used: List[LLMBackend] = []
+
+        def attempt(exclude: List[LLMBackend]):
+            with self.acquire(model, exclude=exclude) as backend:
+                used.append(backend)
+                return backend, call(backend)
+
+        primary = pool.submit(attempt, [])
+        done, _ = wait([primary], timeout=self.hedge_after_seconds)
+        if done and primary.exception() is None:
+            return primary.result()[1]
+
+        futures = [primary]
+        if self._has_alternative(model, used[:1]):
+            with self._lock:
+                self._hedges_sent += 1
+            logger.info(f"🔀 [LLMRouter] Respuesta lenta (>{self.hedge_after_seconds:.1f}s), enviando duplicado")
+            futures.append(pool.submit(attempt, used[:1]))
+
+        # El perdedor termina en segundo plano; su resultado se descarta
+        last_error: Optional[BaseException] = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    backend, result = future.result()
+                    if future is not primary:
+                        with self._lock:
+                            backend.hedges_won += 1
+                    return result
+                last_error = future.exception()
+        raise last_error
+
+    def _get_hedge_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(
+                    max_workers=max(4, len(self.backends) * 4), thread_name_prefix="llm-hedge"
+                )
+            return self._hedge_pool
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estado por backend"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "hedge_after_seconds": self.hedge_after_seconds or None,
+                "hedges_sent": self._hedges_sent,
+                "failovers": self._failovers,
+                "backends": [
+                    {
+                        "url": b.url,
+                        "models": sorted(b.models) or None,
+                        "healthy": b.healthy(now),
+                        "outstanding": b.outstanding,
+                        "ewma_latency_ms": round(b.ewma_latency * 1000, 1) if b.ewma_latency is not None else None,
+                        "loaded_models": sorted(b.loaded_models),
+                        "requests": b.requests,
+                        "failures": b.failures,
+                        "hedges_won": b.hedges_won
+                    }
+                    for b in self.backends
+                ]
+            }
+
+
+# Instancia global
+llm_router = LLMRouter(
+    parse_backends(settings.llm_backends or settings.ollama_proxy_url),
+    failure_threshold=settings.llm_backend_failure_threshold,
+    cooldown_seconds=settings.llm_backend_cooldown_seconds,
+    hedge_after_seconds=settings.llm_hedge_after_seconds
+)
@@ -3,6 +3,8 @@ from loguru import logger
 import requests
 import asyncio 
 from config.settings import settings
+from app.core.circuit_breaker import llm_breaker
+from app.clients.llm_router import llm_router
 from typing import Dict, Any, Optional, List
 import json
 import concurrent.futures
@@ -15,6 +17,14 @@ class OllamaClient:
         self.model = settings.ollama_model
         self.timeout = httpx.Timeout(settings.ollama_timeout, connect=300.0)
     
+    @staticmethod
+    def _cache_options() -> Dict[str, Any]:
+        """Opciones constantes entre llamadas para que Ollama conserve modelo y KV-cache"""
+        options: Dict[str, Any] = {"keep_alive": settings.ollama_keep_alive}
+        if settings.ollama_num_ctx:
+            options["num_ctx"] = settings.ollama_num_ctx
+        return options
+    
     async def generate(
         self,
         prompt: str,
@@ -29,30 +39,29 @@ class OllamaClient:
         try:
             import aiohttp
             
-            # Llamar al proxy (no directamente a Ollama)
-            proxy_url = "http://localhost:5001/generate"
-            
             payload = {
                 "model": model,
                 "prompt": prompt,
                 "temperature": temperature,
-                "max_tokens": max_tokens
+                "max_tokens": max_tokens,
+                **self._cache_options()
             }
             
             logger.info(f"⏱️ [Ollama] Enviando a proxy...")
             
             timeout = aiohttp.ClientTimeout(total=70.0)
             
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(proxy_url, json=payload) as response:
-                    result = await response.json()
-                    
-                    if result.get("success"):
-                        generated_text = result["response"]
-                        logger.info(f"✅ [Ollama] Texto generado: {len(generated_text)} caracteres")
-                        return generated_text.strip()
-                    else:
-                        raise Exception(f"Proxy error: {result.get('error')}")
+            # Llamar al proxy (no directamente a Ollama) que elija el router
+            with llm_breaker.guard(), llm_router.acquire(model) as backend:
+                async with aiohttp.ClientSession(timeout=timeout) as session:
+                    async with session.post(f"{backend.url}/generate", json=payload) as response:
+                        result = await response.json()
+                        if not result.get("success"):
+                            raise Exception(f"Proxy error: {result.get('error')}")
+
+            generated_text = result["response"]
+            logger.info(f"✅ [Ollama] Texto generado: {len(generated_text)} caracteres")
+            return generated_text.strip()
             
         except Exception as e:
             logger.error(f"❌ [Ollama] Error: {e}", exc_info=True)
@@ -79,10 +88,13 @@ class OllamaClient:
             "model": self.model,
             "messages": messages,
             "stream": False,
+            "keep_alive": settings.ollama_keep_alive,
             "options": {
                 "temperature": temperature
             }
         }
+        if settings.ollama_num_ctx:
+            payload["options"]["num_ctx"] = settings.ollama_num_ctx
         
         if format == "json":
             payload["format"] = "json"
@@ -91,11 +103,12 @@ class OllamaClient:
             async with httpx.AsyncClient(timeout=self.timeout) as client:
                 logger.debug(f"🤖 Chat con Ollama: {len(messages)} mensajes")
                 
-                response = await client.post(
-                    f"{self.base_url}/api/chat",
-                    json=payload
-                )
-                response.raise_for_status()
+                with llm_breaker.guard():
+                    response = await client.post(
+                        f"{self.base_url}/api/chat",
+                        json=payload
+                    )
+                    response.raise_for_status()
                 
                 result = response.json()
                 
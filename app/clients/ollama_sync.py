@@ -1,9 +1,18 @@
 """
 Cliente síncrono para Ollama (se ejecuta en proceso separado)
 """
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional, Union
+
 import requests
 from loguru import logger
 
+from config.settings import settings
+from app.core.circuit_breaker import llm_breaker
+from app.clients.llm_router import LLMRouter, LLMBackend, llm_router, parse_backends
+from app.clients.llm_models import model_keeper
+
 
 def call_ollama_sync(base_url: str, model: str, prompt: str, temperature: float, max_tokens: int) -> dict:
     """
@@ -45,4 +54,300 @@ def call_ollama_sync(base_url: str, model: str, prompt: str, temperature: float,
         return {
             "success": False,
             "error": str(e)
-        }
\ No newline at end of file
+        }
+
+# ═══════════════════════════════════════════════════════════
+# CLIENTE SÍNCRONO VÍA PROXY (usado por el worker síncrono)
+# ═══════════════════════════════════════════════════════════
+
+# Callback de streaming: recibe el texto acumulado y retorna True para cortar la generación
+TokenCallback = Callable[[str], bool]
+
+
+class OllamaSyncClient:
+    """
+    Cliente síncrono para el proxy de Ollama (ollama_proxy.py)
+
+    Soporta generación completa y en streaming. En streaming, un callback
+    puede cortar la generación en cuanto el texto acumulado es suficiente
+    (ej: ya apareció una etiqueta de intención válida); al cerrar la conexión
+    el proxy aborta la generación en Ollama y el modelo queda libre antes.
+
+    Todas las llamadas pasan por llm_breaker: con el LLM caído o lento
+    fallan al instante con CircuitOpenError y los llamadores usan su fallback.
+    El proxy de cada llamada lo elige el router (ver llm_router.py).
+    """
+
+    def __init__(self, proxy_url: Optional[str] = None, model: Optional[str] = None):
+        # Con proxy_url explícito se usa solo ese backend (scripts, benchmarks)
+        self.router: LLMRouter = LLMRouter(parse_backends(proxy_url)) if proxy_url else llm_router
+        self.model = model or settings.ollama_model
+
+    def _build_payload(
+        self,
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        stop: Optional[List[str]],
+        model: Optional[str],
+        format: Optional[Union[str, Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Construye el request para el proxy
+
+        keep_alive y num_ctx se envían igual en todas las llamadas: así Ollama
+        no descarga ni recarga el modelo y puede reutilizar el prefijo ya evaluado.
+        """
+        payload = {
+            "model": model or self.model,
+            "prompt": prompt,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "keep_alive": settings.ollama_keep_alive
+        }
+        if settings.ollama_num_ctx:
+            payload["num_ctx"] = settings.ollama_num_ctx
+        if stop:
+            payload["stop"] = stop
+        if format:
+            payload["format"] = format
+        return payload
+
+    def generate(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: int = 500,
+        stop: Optional[List[str]] = None,
+        timeout: float = 30.0,
+        model: Optional[str] = None,
+        format: Optional[Union[str, Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Genera texto completo (sin streaming)
+
+        Args:
+            format: "json" o un JSON schema para restringir la salida (structured output)
+
+        Returns:
+            dict con 'success', 'response' o 'error', y 'total_time'
+
+        Raises:
+            CircuitOpenError: si el breaker del LLM está abierto
+        """
+        start = time.perf_counter()
+
+        payload = self._build_payload(prompt, temperature, max_tokens, stop, model, format)
+
+        def _call(backend: LLMBackend) -> Dict[str, Any]:
+            response = requests.post(f"{backend.url}/generate", json=payload, timeout=timeout)
+            response.raise_for_status()
+            result = response.json()
+            if not result.get("success", True):
+                raise Exception(f"Ollama proxy error: {result.get('error')}")
+            return result
+
+        # Sin streaming no hay efectos: se puede duplicar en otro backend si tarda
+        with llm_breaker.guard():
+            result = self.router.run(payload["model"], _call, hedge=True)
+        model_keeper.record_call(payload["model"], result.get("load_ms"))
+
+        result["total_time"] = time.perf_counter() - start
+        return result
+
+    def generate_stream(
+        self,
+        prompt: str,
+        on_token: Optional[TokenCallback] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 500,
+        stop: Optional[List[str]] = None,
+        timeout: float = 30.0,
+        model: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Genera texto en streaming con corte temprano opcional
+
+        Args:
+            prompt: Prompt completo
+            on_token: Callback con el texto acumulado; si retorna True se corta el stream
+            temperature: Temperatura del modelo
+            max_tokens: Máximo de tokens a generar
+            stop: Secuencias de parada de Ollama
+            timeout: Timeout de conexión/lectura entre tokens (segundos)
+            model: Modelo a usar (default: settings.ollama_model)
+
+        Returns:
+            dict con 'success', 'response', 'ttft' (time-to-first-token),
+            'total_time', 'stopped_early' y métricas del proxy si la
+            generación terminó sola ('prompt_eval_ms', 'eval_ms', ...)
+
+        Raises:
+            CircuitOpenError: si el breaker del LLM está abierto
+        """
+        start = time.perf_counter()
+
+        payload = self._build_payload(prompt, temperature, max_tokens, stop, model)
+        payload["stream"] = True
+
+        def _call(backend: LLMBackend) -> Dict[str, Any]:
+            ttft = None
+            text = ""
+            stopped_early = False
+            stats: Dict[str, Any] = {}
+
+            # Al salir del 'with' se cierra la conexión: si cortamos antes, el proxy aborta en Ollama
+            with requests.post(f"{backend.url}/generate", json=payload, stream=True, timeout=timeout) as response:
+                response.raise_for_status()
+
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+
+                    chunk = json.loads(line)
+
+                    if "error" in chunk:
+                        raise Exception(f"Ollama proxy error: {chunk['error']}")
+
+                    if chunk.get("done"):
+                        stats = {k: v for k, v in chunk.items() if k != "done"}
+                        break
+
+                    token = chunk.get("token", "")
+                    if not token:
+                        continue
+
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+
+                    text += token
+
+                    if on_token and on_token(text):
+                        stopped_early = True
+                        break
+
+            return {"text": text, "ttft": ttft, "stopped_early": stopped_early, "stats": stats}
+
+        with llm_breaker.guard():
+            streamed = self.router.run(payload["model"], _call)
+
+        text = streamed["text"]
+        ttft = streamed["ttft"]
+        stopped_early = streamed["stopped_early"]
+        stats = streamed["stats"]
+        # El proxy solo reporta métricas si la generación terminó sola
+        model_keeper.record_call(payload["model"], stats.get("load_ms"))
+
+        total_time = time.perf_counter() - start
+
+        logger.debug(
+            f"[OllamaSync] Stream: ttft={ttft if ttft is None else f'{ttft:.2f}s'}, "
+            f"total={total_time:.2f}s, corte_temprano={stopped_early}"
+        )
+
+        return {
+            "success": True,
+            "response": text,
+            "ttft": ttft,
+            "total_time": total_time,
+            "stopped_early": stopped_early,
+            **stats
+        }
+
+    def embed(
+        self,
+        texts: List[str],
+        model: Optional[str] = None,
+        timeout: float = 30.0
+    ) -> List[List[float]]:
+        """
+        Embeddings de varios textos en una sola llamada
+
+        Args:
+            texts: Textos a vectorizar
+            model: Modelo de embeddings (default: settings.embedding_model)
+
+        Returns:
+            Un vector por texto, en el mismo orden
+
+        Raises:
+            CircuitOpenError: si el breaker del LLM está abierto
+        """
+        payload = {
+            "model": model or settings.embedding_model,
+            "input": texts,
+            "keep_alive": settings.ollama_keep_alive
+        }
+
+        def _call(backend: LLMBackend) -> List[List[float]]:
+            response = requests.post(f"{backend.url}/embed", json=payload, timeout=timeout)
+            response.raise_for_status()
+            result = response.json()
+            if not result.get("success", True):
+                raise Exception(f"Ollama proxy error: {result.get('error')}")
+            embeddings = result.get("embeddings") or []
+            if len(embeddings) != len(texts):
+                raise Exception(f"Ollama proxy error: {len(embeddings)} embeddings para {len(texts)} textos")
+            return embeddings
+
+        with llm_breaker.guard():
+            return self.router.run(payload["model"], _call, hedge=True)
+
+
+# ═══════════════════════════════════════════════════════════
+# CONDICIONES DE CORTE TEMPRANO
+# ═══════════════════════════════════════════════════════════
+
+def stop_on_label(labels: List[str]) -> TokenCallback:
+    """
+    Corta en cuanto la primera palabra generada es una etiqueta completa
+
+    Ninguna etiqueta debe ser prefijo de otra (ej: 'create_order' y 'check_order' sirven).
+    """
+    label_set = set(labels)
+
+    def _callback(text: str) -> bool:
+        words = text.strip().lower().split()
+        if not words:
+            return False
+        return words[0].strip('"\'.,:;') in label_set
+
+    return _callback
+
+
+def stop_on_newline(text: str) -> bool:
+    """Corta en el primer salto de línea después de contenido (respuestas de una línea)"""
+    stripped = text.lstrip()
+    return bool(stripped) and "\n" in stripped
+
+
+def stop_on_json_object(text: str) -> bool:
+    """Corta cuando el primer objeto JSON generado quedó balanceado"""
+    start = text.find("{")
+    if start == -1:
+        return False
+
+    depth = 0
+    in_string = False
+    escaped = False
+    for char in text[start:]:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return True
+    return False
+
+
+# Cliente compartido
+ollama_sync_client = OllamaSyncClient()
@@ -1,9 +1,20 @@
 import httpx
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from loguru import logger
 from config.settings import settings
-from typing import Optional, Dict, Any
+from typing import AsyncIterator, Optional, Dict, Any
 import requests
 
+from app.utils.media_io import StreamedMedia, MediaTooLargeError, stream_download
+from app.services.image_delivery_cache import image_delivery_cache
+from app.core.circuit_breaker import waha_breaker, CircuitOpenError
+
+# Cliente HTTP de larga vida del loop actual (lo fija el executor de notificaciones);
+# sin él cada envío abre su propio cliente
+shared_http_client: ContextVar[Optional[httpx.AsyncClient]] = ContextVar("waha_shared_http_client", default=None)
+
+
 class WAHAClient:
     """Cliente completo para interactuar con WAHA (WhatsApp HTTP API)"""
     
@@ -17,6 +28,16 @@ class WAHAClient:
         }
         self.timeout = httpx.Timeout(30.0, connect=10.0)
     
+    @asynccontextmanager
+    async def _http_client(self, timeout: httpx.Timeout) -> AsyncIterator[httpx.AsyncClient]:
+        """Cliente compartido si existe en el contexto, si no uno efímero"""
+        shared = shared_http_client.get()
+        if shared is not None:
+            yield shared
+            return
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            yield client
+    
     async def send_text_message(
     self,
     phone: str,
@@ -44,21 +65,23 @@ class WAHAClient:
             # Timeout más corto
             timeout = httpx.Timeout(10.0, connect=5.0)
             
-            async with httpx.AsyncClient(timeout=timeout) as client:
+            async with self._http_client(timeout) as client:
                 logger.info(f"🔵 [WAHA] Enviando request...")
                 
                 try:
-                    response = await client.post(
-                        url,
-                        json=payload,
-                        headers=self.headers
-                    )
+                    with waha_breaker.guard():
+                        response = await client.post(
+                            url,
+                            json=payload,
+                            headers=self.headers,
+                            timeout=timeout
+                        )
+                        response.raise_for_status()
                     
                     logger.info(f"🔵 [WAHA] ✅ Response recibido!")
                     logger.info(f"🔵 [WAHA] Status: {response.status_code}")
                     logger.info(f"🔵 [WAHA] Body: {response.text[:500]}")
                     
-                    response.raise_for_status()
                     result = response.json()
                     
                     logger.info(f"✅ Mensaje enviado a {phone}")
@@ -71,6 +94,9 @@ class WAHAClient:
                     logger.error(f"❌ [WAHA] HTTP Error {e.response.status_code}: {e.response.text}")
                     raise
                 
+        except CircuitOpenError as e:
+            logger.warning(f"⚡ [WAHA] Envío a {phone} no intentado: {e}")
+            raise
         except Exception as e:
             logger.error(f"❌ Error enviando mensaje: {e}", exc_info=True)
             raise
@@ -103,12 +129,13 @@ class WAHAClient:
         
         try:
             async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/sendImage",
-                    json=payload,
-                    headers=self.headers
-                )
-                response.raise_for_status()
+                with waha_breaker.guard():
+                    response = await client.post(
+                        f"{self.base_url}/api/sendImage",
+                        json=payload,
+                        headers=self.headers
+                    )
+                    response.raise_for_status()
                 
                 result = response.json()
                 logger.info(f"Imagen enviada a {phone}")
@@ -133,7 +160,6 @@ class WAHAClient:
             caption: Texto que acompaña la imagen (opcional)
         """
         import os
-        import base64
         
         try:
             # Verificar que el archivo existe
@@ -143,47 +169,45 @@ class WAHAClient:
             logger.info(f"📸 Enviando imagen a {chat_id}")
             logger.info(f"   Archivo: {file_path}")
             
-            # Leer archivo y convertir a base64
-            with open(file_path, 'rb') as image_file:
-                image_data = base64.b64encode(image_file.read()).decode('utf-8')
+            # Variante optimizada para WhatsApp (generada una vez por contenido)
+            image = image_delivery_cache.prepare(file_path)
+            if image is None:
+                raise FileNotFoundError(f"Imagen no encontrada: {file_path}")
             
-            # Determinar mimetype
-            extension = os.path.splitext(file_path)[1].lower()
-            mimetype_map = {
-                '.jpg': 'image/jpeg',
-                '.jpeg': 'image/jpeg',
-                '.png': 'image/png',
-                '.gif': 'image/gif',
-                '.webp': 'image/webp'
-            }
-            mimetype = mimetype_map.get(extension, 'image/jpeg')
+            # Por URL si WAHA puede llegar a /static; si no, base64 memoizado
+            url = image_delivery_cache.get_url(image)
+            if url:
+                file_payload = {
+                    "url": url,
+                    "mimetype": image.mimetype,
+                    "filename": image.filename
+                }
+            else:
+                file_payload = {
+                    "mimetype": image.mimetype,
+                    "data": image_delivery_cache.get_base64(image),
+                    "filename": image.filename
+                }
             
             # Preparar payload
             payload = {
                 "chatId": chat_id,
-                "file": {
-                    "mimetype": mimetype,
-                    "data": image_data,
-                    "filename": os.path.basename(file_path)
-                },
+                "file": file_payload,
                 "session": self.session_name
             }
             
-            print(payload)
             if caption:
                 payload["caption"] = caption
             
             # Enviar
-            response = requests.post(
-                f"{self.base_url}/api/sendImage",
-                headers=self.headers,
-                json=payload,
-                timeout=30.0
-            )
-
-
-            
-            response.raise_for_status()
+            with waha_breaker.guard():
+                response = requests.post(
+                    f"{self.base_url}/api/sendImage",
+                    headers=self.headers,
+                    json=payload,
+                    timeout=30.0
+                )
+                response.raise_for_status()
             result = response.json()
             
             logger.info(f"✅ Imagen enviada exitosamente")
@@ -208,6 +232,27 @@ class WAHAClient:
         Returns:
             Bytes del archivo o None si no se pudo descargar
         """
+        media = await self.download_media_stream(message_data)
+        if media is None:
+            return None
+        with media:
+            return media.read_bytes()
+    
+    async def download_media_stream(
+        self,
+        message_data: Dict,
+        max_bytes: Optional[int] = None
+    ) -> Optional[StreamedMedia]:
+        """
+        Descarga un archivo multimedia por chunks (sin cargarlo entero en memoria)
+        
+        Args:
+            message_data: Datos del mensaje de WAHA que contiene media
+            max_bytes: Tamaño máximo (default: settings.max_media_bytes)
+            
+        Returns:
+            StreamedMedia (el llamador debe cerrarlo) o None si no se pudo descargar
+        """
         try:
             # WAHA puede proporcionar la media de diferentes formas
             media_url = message_data.get("mediaUrl")
@@ -216,20 +261,25 @@ class WAHAClient:
                 logger.warning("No se encontro mediaUrl en el mensaje")
                 return None
             
+            # Si es una URL relativa, construir URL completa
+            if media_url.startswith("/"):
+                media_url = f"{self.base_url}{media_url}"
+            
             async with httpx.AsyncClient(timeout=60.0) as client:
-                # Si es una URL relativa, construir URL completa
-                if media_url.startswith("/"):
-                    media_url = f"{self.base_url}{media_url}"
-                
-                response = await client.get(
+                media = await stream_download(
+                    client,
                     media_url,
-                    headers={"X-Api-Key": self.api_key}
+                    headers={"X-Api-Key": self.api_key},
+                    max_bytes=max_bytes or settings.max_media_bytes,
+                    spool_bytes=settings.media_spool_bytes
                 )
-                response.raise_for_status()
-                
-                logger.info(f"Media descargada: {len(response.content)} bytes")
-                return response.content
-                
+            
+            logger.info(f"Media descargada: {media.size} bytes ({'memoria' if media.in_memory else 'disco'})")
+            return media
+            
+        except MediaTooLargeError as e:
+            logger.warning(f"Media rechazada: {e}")
+            return None
         except Exception as e:
             logger.error(f"Error descargando media: {e}")
             return None
@@ -300,13 +350,13 @@ class WAHAClient:
             url = f"{self.base_url}/api/sendLocation"
             
             async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    url,
-                    json=payload,
-                    headers=self.headers
-                )
-                
-                response.raise_for_status()
+                with waha_breaker.guard():
+                    response = await client.post(
+                        url,
+                        json=payload,
+                        headers=self.headers
+                    )
+                    response.raise_for_status()
                 result = response.json()
                 
                 logger.info(f"✅ [WAHA] Ubicación enviada exitosamente")
@@ -1,36 +1,72 @@
+import asyncio
+import time
 import tempfile
 import os
 from pathlib import Path
 from loguru import logger
 from config.settings import settings
-from typing import Optional
+from typing import Optional, Tuple, Union
 import subprocess
 
+from app.services.transcription_pool import transcription_pool
+from app.services.transcription_cache import transcription_cache, audio_digest, TranscriptionCache
+
 
 class WhisperClient:
     """Cliente para transcribir audio usando Whisper"""
-    
+
     def __init__(self):
         self.model = settings.whisper_model
         self.language = settings.whisper_language
         self.use_ollama = True  # Intentar usar Ollama primero
-    
+
     async def transcribe_audio(
-        self, 
-        audio_data: bytes,
-        audio_format: str = "ogg"
+        self,
+        audio_data: Union[bytes, memoryview],
+        audio_format: str = "ogg",
+        audio_hash: Optional[str] = None
     ) -> Optional[str]:
         """
-        Transcribe audio a texto
-        
+        Transcribe audio a texto (con cache por contenido)
+
         Args:
-            audio_data: Bytes del archivo de audio
+            audio_data: Bytes del archivo de audio o memoryview
             audio_format: Formato del audio (ogg, mp3, wav, etc)
-            
+            audio_hash: sha256 hex del audio si ya se calculó (ej: durante la descarga)
+
         Returns:
             Texto transcrito o None si falla
         """
+        # Buscar en cache ANTES de escribir el audio a disco o mandarlo al pool
+        cache_key = TranscriptionCache.make_key(
+            audio_hash or audio_digest(audio_data), self.model, self.language
+        )
+        cached = await transcription_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        text, processing_seconds = await self._transcribe_uncached(audio_data, audio_format)
+        if text:
+            await transcription_cache.put(cache_key, text, processing_seconds)
+        return text
+
+    async def _transcribe_uncached(self, audio_data: Union[bytes, memoryview], audio_format: str) -> Tuple[Optional[str], float]:
+        """
+        Transcribe sin pasar por el cache
+
+        Returns:
+            (texto o None, segundos de procesamiento)
+        """
         try:
+            # Pool con el modelo precargado: el audio viaja en memoria, sin archivos
+            if transcription_pool.available:
+                result = await transcription_pool.transcribe_with_stats(audio_data)
+                if not result:
+                    return None, 0.0
+                return result["text"], result["processing_seconds"]
+
+            start = time.perf_counter()
+
             # Guardar audio temporalmente
             with tempfile.NamedTemporaryFile(
                 suffix=f".{audio_format}",
@@ -38,31 +74,31 @@ class WhisperClient:
             ) as temp_audio:
                 temp_audio.write(audio_data)
                 temp_path = temp_audio.name
-            
+
             try:
                 # Intentar con Ollama primero (si está disponible)
                 if self.use_ollama:
                     text = await self._transcribe_with_ollama(temp_path)
                     if text:
-                        return text
-                
-                # Fallback a Whisper local
-                text = await self._transcribe_with_whisper(temp_path)
-                return text
-                
+                        return text, time.perf_counter() - start
+
+                # Fallback a Whisper CLI, fuera del event loop
+                text = await asyncio.to_thread(self._transcribe_with_whisper, temp_path)
+                return text, time.perf_counter() - start
+
             finally:
                 # Limpiar archivo temporal
                 if os.path.exists(temp_path):
                     os.unlink(temp_path)
-            
+
         except Exception as e:
             logger.error(f"Error transcribiendo audio: {e}")
-            return None
-    
+            return None, 0.0
+
     async def _transcribe_with_ollama(self, audio_path: str) -> Optional[str]:
         """
         Transcribe usando Ollama (si tiene soporte para Whisper)
-        
+
         Nota: Ollama puede no tener Whisper integrado aún.
         Esta es una implementación preparada para el futuro.
         """
@@ -70,60 +106,61 @@ class WhisperClient:
             # TODO: Implementar cuando Ollama soporte Whisper
             logger.debug("Transcripción con Ollama no disponible aún")
             return None
-            
+
         except Exception as e:
             logger.debug(f"Ollama whisper no disponible: {e}")
             return None
-    
-    async def _transcribe_with_whisper(self, audio_path: str) -> Optional[str]:
+
+    def _transcribe_with_whisper(self, audio_path: str) -> Optional[str]:
         """
-        Transcribe usando Whisper CLI local
-        
+        Transcribe usando Whisper CLI local (fallback si el pool no está disponible)
+
+        Bloqueante: se ejecuta con asyncio.to_thread. Recarga el modelo en cada
+        llamada, por eso solo se usa si faster-whisper no está instalado.
+
         Requiere: pip install openai-whisper
         """
         try:
-            logger.info(f"🎤 Transcribiendo audio con Whisper ({self.model})...")
-            
-            # Usar subprocess para llamar a whisper
-            cmd = [
-                "whisper",
-                audio_path,
-                "--model", self.model,
-                "--language", self.language,
-                "--output_format", "txt",
-                "--output_dir", tempfile.gettempdir()
-            ]
-            
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=60
-            )
-            
-            if result.returncode != 0:
-                logger.error(f"Error en whisper: {result.stderr}")
-                return None
-            
-            # Leer el archivo de salida
-            audio_name = Path(audio_path).stem
-            txt_path = Path(tempfile.gettempdir()) / f"{audio_name}.txt"
-            
-            if txt_path.exists():
-                text = txt_path.read_text().strip()
-                txt_path.unlink()  # Limpiar
-                
-                logger.info(f"✓ Audio transcrito: {len(text)} caracteres")
-                return text
-            
+            logger.info(f"🎤 Transcribiendo audio con Whisper CLI ({self.model})...")
+
+            # Directorio de salida propio: evita choques entre transcripciones simultáneas
+            with tempfile.TemporaryDirectory() as output_dir:
+                cmd = [
+                    "whisper",
+                    audio_path,
+                    "--model", self.model,
+                    "--language", self.language,
+                    "--output_format", "txt",
+                    "--output_dir", output_dir
+                ]
+
+                result = subprocess.run(
+                    cmd,
+                    capture_output=True,
+                    text=True,
+                    timeout=60
+                )
+
+                if result.returncode != 0:
+                    logger.error(f"Error en whisper: {result.stderr}")
+                    return None
+
+                # Leer el archivo de salida
+                txt_path = Path(output_dir) / f"{Path(audio_path).stem}.txt"
+
+                if txt_path.exists():
+                    text = txt_path.read_text().strip()
+                    logger.info(f"✓ Audio transcrito: {len(text)} caracteres")
+                    return text
+
             return None
-            
+
         except subprocess.TimeoutExpired:
             logger.error("Timeout transcribiendo audio")
             return None
         except FileNotFoundError:
-            logger.error("Whisper no está instalado. Instala con: pip install openai-whisper")
+            logger.error("Whisper no está instalado. Instala con: pip install faster-whisper")
             return None
         except Exception as e:
             logger.error(f"Error con Whisper: {e}")
-            return None
\ No newline at end of file
+            return None
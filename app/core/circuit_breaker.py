@@ -0,0 +1,298 @@
+"""
+Circuit breakers para dependencias externas (LLM y WAHA)
+
+Con Ollama lento cada mensaje esperaba el timeout completo (20-30s) en la
+detección de intención, SlotExtractor y MultiProductHandler; con WAHA caído
+cada envío esperaba su timeout. Un breaker por dependencia lleva una ventana
+deslizante de llamadas y, si la dependencia está fallando, corta en seco:
+
+- closed: las llamadas pasan; se registran éxito/fallo y duración.
+- open: cuando en la ventana hay al menos min_calls y la tasa de fallos
+  (o de llamadas lentas) supera el umbral. Las llamadas fallan al instante
+  con CircuitOpenError durante open_seconds.
+- half_open: pasado open_seconds se dejan pasar half_open_max_calls
+  llamadas de prueba. Si todas salen bien se cierra; si una falla vuelve
+  a open.
+
+Los llamadores ya tienen fallbacks (regex, extractores de texto, respuestas
+por defecto, cola de reintentos): CircuitOpenError solo hace que lleguen a
+ellos sin esperar el timeout.
+
+Es thread-safe: el LLM se llama desde el worker síncrono y WAHA desde el
+event loop, el executor de notificaciones y el worker.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, Optional, Tuple
+
+from loguru import logger
+
+from config.settings import settings
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """La dependencia está marcada como caída; la llamada no se intentó"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit breaker '{name}' abierto (reintentar en {retry_after:.0f}s)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_service_failure(exc: BaseException) -> bool:
+    """
+    True si el error indica que el servicio está fallando
+
+    Los 4xx (request inválido, chat inexistente) son errores del llamador:
+    el servicio respondió, no deben abrir el circuito.
+    """
+    response = getattr(exc, "response", None)
+    status_code = getattr(response, "status_code", None)
+    if status_code is not None and 400 <= status_code < 500:
+        return False
+    return True
+
+
+class CircuitBreaker:
+    """Breaker con ventana deslizante de errores y latencia, y sondeo half-open"""
+
+    def __init__(
+        self,
+        name: str,
+        window_seconds: float = 60.0,
+        min_calls: int = 5,
+        failure_threshold: float = 0.5,
+        slow_call_seconds: float = 15.0,
+        slow_call_threshold: float = 0.8,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 1,
+        is_failure: Callable[[BaseException], bool] = is_service_failure
+    ):
+        """
+        Args:
+            name: Nombre de la dependencia (logs y métricas)
+            window_seconds: Duración de la ventana deslizante
+            min_calls: Llamadas mínimas en la ventana para evaluar tasas
+            failure_threshold: Tasa de fallos que abre el circuito (0-1)
+            slow_call_seconds: Duración a partir de la cual una llamada es lenta
+            slow_call_threshold: Tasa de llamadas lentas que abre el circuito (0-1)
+            open_seconds: Tiempo en open antes de sondear
+            half_open_max_calls: Llamadas de prueba en half_open
+            is_failure: Decide si una excepción cuenta como fallo del servicio
+        """
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = max(1, min_calls)
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_threshold = slow_call_threshold
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self.is_failure = is_failure
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+        # (timestamp, éxito, duración)
+        self._calls: Deque[Tuple[float, bool, float]] = deque()
+
+        # Métricas
+        self._rejected = 0
+        self._opened_count = 0
+        self._last_error: Optional[str] = None
+
+    # ═══════════════════════════════════════════════════════════
+    # ESTADO
+    # ═══════════════════════════════════════════════════════════
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    @property
+    def is_open(self) -> bool:
+        """True si las llamadas se rechazan ahora (open sin cooldown cumplido)"""
+        return self.state == OPEN
+
+    def _current_state(self, now: float) -> str:
+        """Estado efectivo; open pasa a half_open al cumplirse open_seconds (con lock)"""
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._half_open_in_flight = 0
+            self._half_open_successes = 0
+            logger.info(f"🟡 [Breaker:{self.name}] half_open, sondeando la dependencia")
+        return self._state
+
+    def _retry_after(self, now: float) -> float:
+        return max(0.0, self.open_seconds - (now - self._opened_at))
+
+    def _open(self, now: float, reason: str):
+        self._state = OPEN
+        self._opened_at = now
+        self._opened_count += 1
+        self._calls.clear()
+        logger.error(f"🔴 [Breaker:{self.name}] Circuito abierto por {self.open_seconds:.0f}s: {reason}")
+
+    def _close(self):
+        self._state = CLOSED
+        self._calls.clear()
+        logger.info(f"🟢 [Breaker:{self.name}] Circuito cerrado, dependencia recuperada")
+
+    # ═══════════════════════════════════════════════════════════
+    # LLAMADAS
+    # ═══════════════════════════════════════════════════════════
+
+    def allow_request(self):
+        """
+        Reserva un permiso para llamar
+
+        Raises:
+            CircuitOpenError: si el circuito está abierto o los sondeos están ocupados
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+
+            if state == OPEN:
+                self._rejected += 1
+                raise CircuitOpenError(self.name, self._retry_after(now))
+
+            if state == HALF_OPEN:
+                if self._half_open_in_flight >= self.half_open_max_calls:
+                    self._rejected += 1
+                    raise CircuitOpenError(self.name, 0.0)
+                self._half_open_in_flight += 1
+
+    def record_success(self, duration: float):
+        """Registra una llamada exitosa"""
+        with self._lock:
+            now = time.monotonic()
+            slow = duration >= self.slow_call_seconds
+
+            if self._state == HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+                if slow:
+                    self._open(now, f"sondeo lento ({duration:.1f}s)")
+                    return
+                self._half_open_successes += 1
+                if self._half_open_successes >= self.half_open_max_calls:
+                    self._close()
+                return
+
+            self._calls.append((now, True, duration))
+            self._evaluate(now)
+
+    def record_failure(self, duration: float, error: Optional[BaseException] = None):
+        """Registra una llamada fallida"""
+        with self._lock:
+            now = time.monotonic()
+            if error is not None:
+                self._last_error = f"{type(error).__name__}: {error}"[:200]
+
+            if self._state == HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+                self._open(now, f"sondeo fallido ({self._last_error})")
+                return
+
+            self._calls.append((now, False, duration))
+            self._evaluate(now)
+
+    def _evaluate(self, now: float):
+        """Recorta la ventana y abre el circuito si se supera algún umbral (con lock)"""
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+        if self._state != CLOSED or len(self._calls) < self.min_calls:
+            return
+
+        total = len(self._calls)
+        failures = sum(1 for _, success, _ in self._calls if not success)
+        slow = sum(1 for _, _, duration in self._calls if duration >= self.slow_call_seconds)
+
+        if failures / total >= self.failure_threshold:
+            self._open(now, f"{failures}/{total} fallos en {self.window_seconds:.0f}s ({self._last_error})")
+        elif slow / total >= self.slow_call_threshold:
+            self._open(now, f"{slow}/{total} llamadas > {self.slow_call_seconds:.0f}s")
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """
+        Protege una llamada (sirve también alrededor de un await)
+
+            with llm_breaker.guard():
+                response = requests.post(...)
+
+        Raises:
+            CircuitOpenError: sin intentar la llamada si el circuito está abierto
+        """
+        self.allow_request()
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            duration = time.perf_counter() - start
+            if isinstance(e, Exception) and self.is_failure(e):
+                self.record_failure(duration, e)
+            else:
+                self.record_success(duration)
+            raise
+        else:
+            self.record_success(time.perf_counter() - start)
+
+    def get_state(self) -> Dict[str, Any]:
+        """Estado y métricas del breaker"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            calls = [c for c in self._calls if now - c[0] <= self.window_seconds]
+            failures = sum(1 for _, success, _ in calls if not success)
+            slow = sum(1 for _, _, duration in calls if duration >= self.slow_call_seconds)
+
+            return {
+                "state": state,
+                "retry_after_seconds": round(self._retry_after(now), 1) if state == OPEN else None,
+                "window_calls": len(calls),
+                "window_failure_rate": round(failures / len(calls), 3) if calls else None,
+                "window_slow_rate": round(slow / len(calls), 3) if calls else None,
+                "avg_latency_ms": round(sum(c[2] for c in calls) / len(calls) * 1000, 1) if calls else None,
+                "times_opened": self._opened_count,
+                "rejected": self._rejected,
+                "last_error": self._last_error
+            }
+
+
+# Instancias globales
+llm_breaker = CircuitBreaker(
+    "llm",
+    window_seconds=settings.breaker_window_seconds,
+    min_calls=settings.breaker_min_calls,
+    failure_threshold=settings.breaker_failure_threshold,
+    slow_call_seconds=settings.llm_breaker_slow_call_seconds,
+    slow_call_threshold=settings.breaker_slow_call_threshold,
+    open_seconds=settings.breaker_open_seconds
+)
+
+waha_breaker = CircuitBreaker(
+    "waha",
+    window_seconds=settings.breaker_window_seconds,
+    min_calls=settings.breaker_min_calls,
+    failure_threshold=settings.breaker_failure_threshold,
+    slow_call_seconds=settings.waha_breaker_slow_call_seconds,
+    slow_call_threshold=settings.breaker_slow_call_threshold,
+    open_seconds=settings.breaker_open_seconds
+)
+
+
+def get_breaker_states() -> Dict[str, Dict[str, Any]]:
+    """Estado actual de todos los breakers"""
+    return {breaker.name: breaker.get_state() for breaker in (llm_breaker, waha_breaker)}
@@ -10,6 +10,8 @@ from app.database.repository import (
     MessageRepository
 )
 from app.core.correlation import set_client_context
+from app.core.prompt_context import roll_conversation, format_history_line
+from config.settings import settings
 
 
 class ContextManager:
@@ -44,12 +46,8 @@ class ContextManager:
         # Establecer contexto de cliente para tracking en logs
         set_client_context(phone, conversation.id)
 
-        # Obtener historial de mensajes
-        messages = self.message_repo.get_conversation_history(
-            conversation.id, 
-            limit=10,
-            db=self.db
-        )
+        # Historial: ventana guardada en la conversación (sin consultar Message)
+        message_history = self._get_recent_messages(conversation)
         
         # Construir contexto
         context = {
@@ -65,14 +63,8 @@ class ContextManager:
             "slots_schema": conversation.slots_schema or {},  # <-- IMPORTANTE
             "current_slot": conversation.current_slot,
             "validation_attempts": conversation.validation_attempts or {},
-            "message_history": [
-                {
-                    "content": msg.content,
-                    "is_from_bot": msg.is_from_bot,
-                    "timestamp": msg.created_at.isoformat()
-                }
-                for msg in messages
-            ],
+            "message_history": message_history,
+            "conversation_summary": conversation.summary or "",
             "conversation_started_at": conversation.started_at.isoformat(),
             "last_activity": conversation.last_activity_at.isoformat()
         }
@@ -96,12 +88,18 @@ class ContextManager:
         is_from_bot: bool = False,
         waha_message_id: Optional[str] = None
     ) -> None:
-        """Guarda un mensaje en el contexto"""
-        context = self.get_or_create_context(phone)
+        """Guarda un mensaje y actualiza la ventana de mensajes y el resumen de la conversación"""
+        customer = self.customer_repo.get_or_create(phone, self.db)
+        conversation = self.conversation_repo.get_active_conversation(customer.id, self.db)
+        if not conversation:
+            conversation = self.conversation_repo.create_conversation(customer.id, self.db)
         
-        self.message_repo.create_message(
-            conversation_id=context["conversation_id"],
-            customer_id=context["customer_id"],
+        # Backfill antes de crear el mensaje para no contarlo dos veces
+        recent = self._get_recent_messages(conversation)
+        
+        message = self.message_repo.create_message(
+            conversation_id=conversation.id,
+            customer_id=customer.id,
             content=content,
             message_type=message_type,
             is_from_bot=is_from_bot,
@@ -109,8 +107,48 @@ class ContextManager:
             db=self.db
         )
         
+        conversation.recent_messages, conversation.summary = roll_conversation(
+            recent,
+            conversation.summary,
+            self._history_entry(message.content, message.is_from_bot, message.created_at),
+            window=settings.context_recent_messages,
+            max_summary_chars=settings.context_summary_max_chars
+        )
+        flag_modified(conversation, "recent_messages")
+        self.db.commit()
+        
         logger.debug(f"💾 Mensaje guardado para {phone}")
     
+    @staticmethod
+    def _history_entry(content: str, is_from_bot: bool, created_at: Optional[datetime]) -> Dict[str, Any]:
+        return {
+            "content": content,
+            "is_from_bot": is_from_bot,
+            "timestamp": (created_at or datetime.utcnow()).isoformat()
+        }
+    
+    def _get_recent_messages(self, conversation) -> List[Dict[str, Any]]:
+        """
+        Ventana de mensajes recientes de la conversación
+        
+        Conversaciones anteriores a la ventana en la fila: se construye una vez
+        desde Message y se guarda.
+        """
+        if conversation.recent_messages is not None:
+            return list(conversation.recent_messages)
+        
+        messages = self.message_repo.get_conversation_history(
+            conversation.id,
+            limit=settings.context_recent_messages,
+            db=self.db
+        )
+        conversation.recent_messages = [
+            self._history_entry(msg.content, msg.is_from_bot, msg.created_at)
+            for msg in messages
+        ]
+        self.db.commit()
+        return list(conversation.recent_messages)
+    
     def update_conversation_state(
         self,
         phone: str,
@@ -154,12 +192,14 @@ class ContextManager:
         if context.get("customer_name"):
             summary_parts.append(f"Cliente: {context['customer_name']}")
         
+        # Resumen incremental de lo anterior a la ventana
+        if context.get("conversation_summary"):
+            summary_parts.append(f"Resumen:\n{context['conversation_summary']}")
+        
         # Mensajes recientes (últimos 5)
-        recent_messages = messages[-5:]
-        conversation_text = "\n".join([
-            f"{'Bot' if msg['is_from_bot'] else 'Cliente'}: {msg['content']}"
-            for msg in recent_messages
-        ])
+        conversation_text = "\n".join(
+            format_history_line(msg, user_label="Cliente") for msg in messages[-5:]
+        )
         summary_parts.append(f"Conversación reciente:\n{conversation_text}")
         
         # Estado actual
@@ -1,6 +1,9 @@
 from typing import Dict, Any, List, Optional
 from loguru import logger
 from app.clients.ollama_client import OllamaClient
+from app.core.normalized_message import get_normalized
+from app.core.prompt_context import prompt_context, history_section, summary_section
+from app.clients.llm_models import CLASSIFICATION, GENERATION
 
 
 class IntentDetector:
@@ -84,7 +87,7 @@ class IntentDetector:
             # 🚨 REGEX FALLBACK: Detectar casos críticos ANTES del LLM
             # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
             import re
-            message_lower = message.lower()
+            message_lower = get_normalized(message).lower
             
             # CASO 1: remove_from_order (MÁXIMA PRIORIDAD)
             remove_keywords = r'(eliminar|quitar|remover|borrar|sacar|cancelar)'
@@ -167,89 +170,38 @@ class IntentDetector:
         else:
             return await self._handle_other(message, context)
     
+    @classmethod
+    def format_intents_catalog(cls) -> str:
+        """Lista las intenciones con ejemplos (parte estática del prompt)"""
+        intents_list = []
+        for key, info in cls.INTENTS.items():
+            examples_str = ", ".join([f'"{ex}"' for ex in info['examples'][:3]])
+            intents_list.append(f"- {key}: {info['description']}\n  Ejemplos: {examples_str}")
+        
+        return "\n".join(intents_list)
+    
     def _build_intent_prompt(
         self,
         message: str,
         context: Dict[str, Any]
     ) -> str:
-        """Construye el prompt para detección de intención"""
-        
-        # Listar intenciones con ejemplos
-        intents_list = []
-        for key, info in self.INTENTS.items():
-            examples_str = ", ".join([f'"{ex}"' for ex in info['examples'][:3]])
-            intents_list.append(f"- {key}: {info['description']}\n  Ejemplos: {examples_str}")
-        
-        intents_text = "\n".join(intents_list)
-        
-        # Contexto de conversación
-        conversation_context = ""
-        if context.get("message_history"):
-            recent = context["message_history"][-3:]
-            conversation_context = "Mensajes recientes:\n" + "\n".join([
-                f"{'Bot' if msg['is_from_bot'] else 'Usuario'}: {msg['content']}"
-                for msg in recent
-            ])
-        
-        prompt = f"""Eres un asistente de ventas por WhatsApp. Tu tarea es identificar la intención del usuario.
-
-INTENCIONES DISPONIBLES:
-{intents_text}
-
-🚨 REGLA #1 - MÁXIMA PRIORIDAD (VERIFICAR PRIMERO):
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-Si el mensaje contiene CUALQUIERA de estas palabras:
-   "eliminar", "quitar", "remover", "borrar", "sacar", "cancelar"
-   
-Y ADEMÁS menciona:
-   "orden", "pedido", "compra" o "de mi orden/pedido"
-
-→ ES **remove_from_order** SIN EXCEPCIONES
-
-NO IMPORTA si también dice "quiero" o cualquier otra palabra.
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-
-Ejemplos de remove_from_order:
-   ✓ "quiero eliminar un mouse de mi orden"
-   ✓ "quiero eliminar el monitor de mi orden" 
-   ✓ "quitar laptop de mi pedido"
-   ✓ "eliminar teclado"
-   ✓ "borrar de mi orden el mouse"
-   ✓ "ya no quiero el mouse en mi pedido"
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-
-REGLAS ADICIONALES:
-
-2. **AGREGAR/COMPRAR productos** (create_order):
-   - Si el mensaje contiene "quiero", "comprar", "ordenar", "necesito" + producto
-   - Y NO contiene palabras de eliminación
-   → create_order
-   - Ejemplos: "quiero una laptop", "comprar mouse", "ordenar teclado"
-
-3. **CONSULTAR orden** (check_order):
-   - Si pregunta "dónde está", "cuándo llega", "estado", "cómo va"
-   → check_order
-
-{conversation_context}
-
-MENSAJE DEL USUARIO:
-"{message}"
-
-Analiza el mensaje siguiendo las REGLAS CRÍTICAS en orden de prioridad.
-
-Responde SOLO en formato JSON:
-{{
-    "intent": "nombre_de_la_intención",
-    "confidence": 0.95,
-    "entities": {{
-        "product": "laptop",
-        "quantity": 2
-    }},
-    "requires_action": true
-}}"""
+        """
+        Construye el prompt para detección de intención
         
-        return prompt
+        Usa la plantilla 'intent_detection' del registro: instrucciones y
+        catálogo de intenciones en el prefijo estático, historial y mensaje
+        al final para aprovechar el KV-cache de Ollama. Resumen e historial
+        se recortan al presupuesto de clasificación.
+        """
+        return prompt_context.render(
+            "intent_detection",
+            CLASSIFICATION,
+            {
+                "conversation_context:summary": summary_section(context),
+                "conversation_context:history": history_section(context, limit=3),
+            },
+            message=message
+        )
     
     async def _handle_greeting(self, context: Dict[str, Any]) -> str:
         """Maneja saludos"""
@@ -341,12 +293,7 @@ Responde SOLO en formato JSON:
     ) -> str:
         """Maneja mensajes que no encajan en categorías"""
         try:
-            conversation_summary = "\n".join([
-                f"{'Bot' if msg['is_from_bot'] else 'Usuario'}: {msg['content']}"
-                for msg in context.get("message_history", [])[-5:]
-            ])
-            
-            prompt = f"""Eres un asistente de ventas amigable por WhatsApp.
+            prompt_template = """Eres un asistente de ventas amigable por WhatsApp.
 
 CONVERSACION PREVIA:
 {conversation_summary}
@@ -359,6 +306,15 @@ Manten la respuesta breve (maximo 3 lineas).
 
 IMPORTANTE: No inventes informacion sobre productos o precios. Si te preguntan algo especifico que no sabes, reconocelo."""
             
+            # Historial recortado al presupuesto de generación
+            conversation_summary = prompt_context.fit_sections(
+                GENERATION,
+                prompt_template.format(conversation_summary="", message=message),
+                {"history": history_section(context, limit=5, header="")},
+                label="intent_detector.other"
+            )["history"]
+            prompt = prompt_template.format(conversation_summary=conversation_summary, message=message)
+            
             result = await self.ollama.generate(
                 prompt=prompt,
                 temperature=0.7
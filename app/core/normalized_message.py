@@ -0,0 +1,182 @@
+"""
+Mensaje normalizado - Una sola normalización por turno
+
+El mismo mensaje se pasaba a minúsculas, se limpiaba y se re-escaneaba en el
+worker, IntentDetector, SlotExtractor y los módulos, cada uno con sus reglas
+de tildes y puntuación ("sí" vs "si", "no" encontrado dentro de "nombre").
+NormalizedMessage se construye una vez por mensaje y trae:
+
+- text / lower / folded: original sin espacios extremos, en minúsculas, y en
+  minúsculas sin tildes (conserva la ñ) con espacios colapsados
+- tokens: palabras de folded
+- numbers: cada secuencia de dígitos como entero ("x2" → 2, "#45-12" → 45, 12)
+- coordinates, emails, phones: lo que los extractores buscaban
+- key: hash de folded para claves de cache ("Hola!" y "hola" no coinciden,
+  "Sí" y "si" sí); lo usa el cache de consultas del índice vectorial
+
+El worker lo publica para todo el turno vía contextvars (igual que
+turn_understanding) y las etapas lo obtienen con get_normalized(message):
+si el texto es el del turno reutilizan el objeto, si no (un fragmento, otro
+texto) lo construyen.
+"""
+import hashlib
+import json
+import re
+import unicodedata
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Iterable, Optional, Tuple
+
+
+_WORD_RE = re.compile(r"[a-z0-9ñ]+")
+_NUMBER_RE = re.compile(r"\d+")
+_COORDS_RE = re.compile(r"(-?\d+\.?\d*)\s*,\s*(-?\d+\.?\d*)")
+_EMAIL_RE = re.compile(r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b")
+# Celulares colombianos: 3001234567, 300-123-4567, +57 300 123 4567
+_PHONE_RE = re.compile(r"(?<!\d)(?:\+?57[\s-]?)?(3\d{2})[\s-]?(\d{3})[\s-]?(\d{4})(?!\d)")
+
+
+def fold_text(text: str) -> str:
+    """Minúsculas sin tildes (conserva la ñ) y espacios colapsados"""
+    text = text.lower().replace("ñ", "\0")
+    text = "".join(c for c in unicodedata.normalize("NFD", text) if unicodedata.category(c) != "Mn")
+    return " ".join(text.replace("\0", "ñ").split())
+
+
+@dataclass(frozen=True)
+class NormalizedMessage:
+    """Formas normalizadas de un mensaje y lo detectado en él"""
+    raw: str
+    text: str
+    lower: str
+    folded: str
+    tokens: Tuple[str, ...]
+    numbers: Tuple[int, ...]
+    coordinates: Optional[Tuple[str, str]]
+    emails: Tuple[str, ...]
+    phones: Tuple[str, ...]
+    key: str
+
+    def has_any(self, words: Iterable[str]) -> bool:
+        """
+        True si aparece alguna palabra o frase completa (sin tildes)
+
+        "si" no coincide con "sigo" ni "no" con "nombre".
+        """
+        padded = f" {' '.join(self.tokens)} "
+        for word in words:
+            phrase = " ".join(_WORD_RE.findall(fold_text(word)))
+            if phrase and f" {phrase} " in padded:
+                return True
+        return False
+
+    @cached_property
+    def quantity(self) -> Optional[int]:
+        """Primera cantidad en dígitos o palabras ("tres", "un par de")"""
+        from app.core.order_phrase_parser import find_quantity
+        return find_quantity(self)
+
+    def __str__(self) -> str:
+        return self.text
+
+
+def _find_coordinates(text: str) -> Optional[Tuple[str, str]]:
+    """Coordenadas de un mensaje de ubicación (JSON de WAHA o "lat,lon")"""
+    if text.startswith("{"):
+        try:
+            data = json.loads(text)
+        except (json.JSONDecodeError, ValueError):
+            data = None
+        if isinstance(data, dict):
+            lat = data.get("latitude") or data.get("lat")
+            lon = data.get("longitude") or data.get("lon") or data.get("lng")
+            if lat is not None and lon is not None:
+                return str(lat), str(lon)
+
+    match = _COORDS_RE.search(text)
+    return match.groups() if match else None
+
+
+def _find_phones(text: str) -> Tuple[str, ...]:
+    """Celulares sin código de país ("+57 300 123 4567" → "3001234567")"""
+    # Mensaje que es solo un número con separadores arbitrarios
+    cleaned = re.sub(r"[^\d+]", "", text)
+    if re.match(r"^\+?(?:57)?3\d{9}$", cleaned):
+        return (re.sub(r"^\+?57", "", cleaned),)
+    return tuple("".join(groups) for groups in _PHONE_RE.findall(text))
+
+
+def normalize_message(raw: str) -> NormalizedMessage:
+    """Construye el NormalizedMessage de un texto"""
+    raw = raw or ""
+    text = raw.strip()
+    folded = fold_text(text)
+    return NormalizedMessage(
+        raw=raw,
+        text=text,
+        lower=text.lower(),
+        folded=folded,
+        tokens=tuple(_WORD_RE.findall(folded)),
+        numbers=tuple(int(n) for n in _NUMBER_RE.findall(text)),
+        coordinates=_find_coordinates(text),
+        emails=tuple(email.lower() for email in _EMAIL_RE.findall(text)),
+        phones=_find_phones(text),
+        key=_folded_key(folded)
+    )
+
+
+def _folded_key(folded: str) -> str:
+    return hashlib.sha1(folded.encode("utf-8")).hexdigest()
+
+
+# ═══════════════════════════════════════════════════════════
+# MENSAJE DEL TURNO ACTUAL (por hilo/tarea, vía contextvars)
+# ═══════════════════════════════════════════════════════════
+
+current_message: ContextVar[Optional[NormalizedMessage]] = ContextVar('current_message', default=None)
+
+
+def set_current_message(message: Optional[NormalizedMessage]) -> None:
+    """Publica el mensaje normalizado del turno"""
+    current_message.set(message)
+
+
+def get_normalized(message) -> NormalizedMessage:
+    """
+    NormalizedMessage de un texto, reutilizando el del turno si es el mismo
+
+    Args:
+        message: Texto o NormalizedMessage (se retorna tal cual)
+    """
+    if isinstance(message, NormalizedMessage):
+        return message
+    current = current_message.get()
+    if current is not None and (current.raw == message or current.text == (message or "").strip()):
+        return current
+    return normalize_message(message)
+
+
+def folded_text(message) -> str:
+    """Solo la forma plegada (sin construir el objeto completo si el texto no es el del turno)"""
+    if isinstance(message, NormalizedMessage):
+        return message.folded
+    current = current_message.get()
+    if current is not None and current.raw == message:
+        return current.folded
+    return fold_text(message or "")
+
+
+def message_key(message) -> str:
+    """Clave de cache del mensaje (la del turno si el texto es el del turno)"""
+    if isinstance(message, NormalizedMessage):
+        return message.key
+    current = current_message.get()
+    if current is not None and current.raw == message:
+        return current.key
+    return _folded_key(fold_text(message or ""))
+
+
+def clear_current_message() -> None:
+    """Limpia el mensaje del turno (al terminar de procesarlo)"""
+    current_message.set(None)
@@ -0,0 +1,361 @@
+"""
+Parser determinista de pedidos en español
+
+MultiProductHandler llamaba al LLM y buscaba JSON en su respuesta solo para
+separar frases como "dos laptops y un mouse" o "3 teclados, 1 monitor".
+Este parser cubre esos casos en microsegundos:
+
+- Cantidades con dígitos ("3", "x2", "3x") y en palabras, incluidas las
+  compuestas ("veintidós", "treinta y dos") y "un par de", "una docena de".
+  "un/una" cuenta como 1; un plural sin número queda sin cantidad (como
+  pide el prompt del LLM).
+- Conjunciones ",", "y", "e", "más", "también", "además", "+".
+- Artículos, verbos de pedido y muletillas ("quiero", "por favor") fuera.
+- Plurales plegados ("monitores" ≈ "monitor", "mouses" ≈ "mouse") tanto en
+  el mensaje como en el catálogo.
+- Cada ítem se busca en el índice del catálogo; el nombre del catálogo
+  sustituye al texto del usuario cuando la coincidencia es única.
+
+Cada ítem lleva una confianza y el resultado la mínima de sus ítems. Por
+debajo de settings.order_parser_min_confidence (texto que no coincide con
+el catálogo, números dentro del nombre, cantidades sin producto) el
+llamador consulta al LLM.
+"""
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from config.settings import settings
+from app.core.normalized_message import fold_text, folded_text, get_normalized
+
+
+# ═══════════════════════════════════════════════════════════
+# LÉXICO
+# ═══════════════════════════════════════════════════════════
+
+UNITS = {
+    "uno": 1, "un": 1, "una": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5,
+    "seis": 6, "siete": 7, "ocho": 8, "nueve": 9
+}
+
+NUMBER_WORDS = {
+    **UNITS,
+    "diez": 10, "once": 11, "doce": 12, "trece": 13, "catorce": 14, "quince": 15,
+    "dieciseis": 16, "diecisiete": 17, "dieciocho": 18, "diecinueve": 19,
+    "veinte": 20, "veintiuno": 21, "veintiun": 21, "veintiuna": 21, "veintidos": 22,
+    "veintitres": 23, "veinticuatro": 24, "veinticinco": 25, "veintiseis": 26,
+    "veintisiete": 27, "veintiocho": 28, "veintinueve": 29,
+    "cien": 100, "ciento": 100
+}
+
+TENS = {
+    "treinta": 30, "cuarenta": 40, "cincuenta": 50, "sesenta": 60,
+    "setenta": 70, "ochenta": 80, "noventa": 90
+}
+
+# Expresiones de cantidad de varias palabras (se aplican antes de tokenizar)
+PHRASE_QUANTITIES = [
+    (re.compile(r"\bmedia\s+docena\s+de\b"), "6"),
+    (re.compile(r"\b(?:una\s+)?docena\s+de\b"), "12"),
+    (re.compile(r"\bun\s+par(?:\s+de)?\b"), "2"),
+]
+
+CONJUNCTIONS = {",", "y", "e", "mas", "tambien", "ademas", "+", "&"}
+
+ARTICLES = {"el", "la", "los", "las", "lo", "unos", "unas", "del", "al"}
+
+# Muletillas y verbos de pedido que no forman parte del producto
+FILLERS = {
+    "hola", "buenas", "buenos", "dias", "tardes", "noches", "porfa", "porfavor", "gracias",
+    "quiero", "quisiera", "queria", "deseo", "necesito", "busco", "me", "gustaria", "podrias",
+    "puedes", "dame", "dar", "das", "mandame", "enviame", "ponme", "agrega", "agregame",
+    "anade", "anademe", "suma", "sumale", "comprar", "pedir", "ordenar", "llevar", "llevo",
+    "tambien", "ademas", "otro", "otra", "otros", "otras", "porfis", "pls"
+}
+FILLER_PHRASES = re.compile(r"\b(por\s+favor|me\s+gustaria|quisiera\s+pedir|quiero\s+pedir|para\s+llevar)\b")
+
+UNIT_WORDS = {"unidad", "unidades", "pieza", "piezas", "x", "de"}
+
+_TOKEN_RE = re.compile(r"[a-z0-9ñ]+(?:[.\-][a-z0-9ñ]+)*|[,+&]")
+_TIMES_RE = re.compile(r"^(?:x(\d+)|(\d+)x)$")
+
+
+def fold(word: str) -> str:
+    """
+    Pliega singular y plural a la misma forma
+
+    No busca el singular correcto sino una forma común: "mouse" y "mouses"
+    → "mous", "monitor" y "monitores" → "monitor", "lapiz" y "lapices" → "lapiz".
+    """
+    if len(word) <= 3 or word.isdigit():
+        return word
+    if word.endswith("ces"):
+        word = word[:-3] + "z"
+    elif word.endswith("es"):
+        word = word[:-2]
+    elif word.endswith("s"):
+        word = word[:-1]
+    if word.endswith("e") and len(word) > 3:
+        word = word[:-1]
+    return word
+
+
+def tokenize(message) -> List[str]:
+    """Tokens del parser sobre el texto plegado del mensaje (str o NormalizedMessage)"""
+    text = folded_text(message)
+    for pattern, replacement in PHRASE_QUANTITIES:
+        text = pattern.sub(replacement, text)
+    text = FILLER_PHRASES.sub(" ", text)
+    return _TOKEN_RE.findall(text)
+
+
+def word_to_number(token: str) -> Optional[int]:
+    """Número en dígitos o palabra (None si no es un número)"""
+    if token.isdigit():
+        return int(token)
+    return NUMBER_WORDS.get(token, TENS.get(token))
+
+
+def find_quantity(message) -> Optional[int]:
+    """Primera cantidad del mensaje ("quiero tres" → 3, "treinta y dos" → 32)"""
+    normalized = get_normalized(message)
+    # Respuesta que es solo un número ("3"): ya viene en numbers, sin tokenizar
+    if normalized.numbers and normalized.tokens == (str(normalized.numbers[0]),):
+        return normalized.numbers[0]
+    tokens = tokenize(normalized)
+    for i, token in enumerate(tokens):
+        if token in TENS and i + 2 < len(tokens) and tokens[i + 1] == "y" and tokens[i + 2] in UNITS:
+            return TENS[token] + UNITS[tokens[i + 2]]
+        times = _TIMES_RE.match(token)
+        if times:
+            return int(times.group(1) or times.group(2))
+        number = word_to_number(token)
+        if number is not None:
+            return number
+    return None
+
+
+# ═══════════════════════════════════════════════════════════
+# ÍNDICE DEL CATÁLOGO
+# ═══════════════════════════════════════════════════════════
+
+class CatalogIndex:
+    """Nombres de productos indexados por tokens plegados"""
+
+    def __init__(self, product_names: Iterable[str] = ()):
+        self.products: Dict[str, FrozenSet[str]] = {}
+        self.by_token: Dict[str, Set[str]] = {}
+        # Forma plegada → palabra tal como aparece en el catálogo
+        self.surface: Dict[str, str] = {}
+        # Nombres que contienen una conjunción ("mouse y pad"): no se cortan
+        self.protected: List[Tuple[str, ...]] = []
+
+        for name in product_names:
+            words = [w for w in _TOKEN_RE.findall(fold_text(name)) if w not in ",+&"]
+            if not words:
+                continue
+            folded = [fold(w) for w in words]
+            self.products[name] = frozenset(f for f in folded if f not in CONJUNCTIONS and f not in ARTICLES)
+            for word, f in zip(words, folded):
+                self.by_token.setdefault(f, set()).add(name)
+                self.surface.setdefault(f, word)
+            if any(w in CONJUNCTIONS for w in words):
+                self.protected.append(tuple(folded))
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def match(self, folded_tokens: List[str]) -> Tuple[Optional[str], List[str], float]:
+        """
+        Busca un producto para los tokens de un ítem
+
+        Returns:
+            (nombre del catálogo si es único, candidatos, confianza)
+        """
+        query = frozenset(folded_tokens)
+        if not query or not self.products:
+            return None, [], 0.4
+
+        # Productos que contienen todos los tokens del usuario
+        candidates = set.intersection(*(self.by_token.get(t, set()) for t in query))
+        if len(candidates) == 1:
+            name = next(iter(candidates))
+            return name, [name], 1.0
+        if candidates:
+            exact = [name for name in candidates if self.products[name] == query]
+            if len(exact) == 1:
+                return exact[0], exact, 1.0
+            # Nombre genérico ("laptop" con varias laptops): el ítem está claro, el modelo no
+            return None, sorted(candidates), 0.9
+
+        # Coincidencia parcial: algunos tokens no están en el catálogo
+        overlap: Dict[str, int] = {}
+        for token in query:
+            for name in self.by_token.get(token, ()):
+                overlap[name] = overlap.get(name, 0) + 1
+        if overlap:
+            best = max(overlap.values())
+            return None, sorted(n for n, c in overlap.items() if c == best), 0.6 * best / len(query)
+
+        return None, [], 0.4
+
+
+# ═══════════════════════════════════════════════════════════
+# PARSER
+# ═══════════════════════════════════════════════════════════
+
+@dataclass
+class ParsedItem:
+    """Un producto del pedido"""
+    product: str
+    quantity: Optional[int]
+    confidence: float
+    candidates: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ParseResult:
+    """Resultado del parser; confidence es la mínima de los ítems"""
+    items: List[ParsedItem]
+    confidence: float
+
+    def to_list(self) -> List[Dict[str, Optional[object]]]:
+        """
+        Formato de MultiProductHandler: [{'product': str, 'quantity': int|None}]
+
+        Omite las cantidades sin producto ("quiero dos"): siguen en items para
+        bajar la confianza, pero un nombre vacío coincidiría con cualquier
+        producto del catálogo.
+        """
+        return [{"product": item.product, "quantity": item.quantity} for item in self.items if item.product]
+
+
+class OrderPhraseParser:
+    """Separa un mensaje de pedido en productos y cantidades"""
+
+    def __init__(self, catalog: Optional[CatalogIndex] = None):
+        self.catalog = catalog or CatalogIndex()
+
+    def parse(self, message) -> ParseResult:
+        """Parsea un mensaje (str o NormalizedMessage)"""
+        tokens = tokenize(message)
+        items = [item for item in (self._parse_segment(seg) for seg in self._split(tokens)) if item]
+        if not items:
+            return ParseResult(items=[], confidence=0.0)
+        return ParseResult(items=items, confidence=min(item.confidence for item in items))
+
+    def _split(self, tokens: List[str]) -> List[List[str]]:
+        """Corta en conjunciones, salvo "treinta y dos" y nombres del catálogo con conjunción"""
+        folded = [fold(t) for t in tokens]
+        protected: Set[int] = set()
+        for name in self.catalog.protected:
+            size = len(name)
+            for start in range(len(folded) - size + 1):
+                if tuple(folded[start:start + size]) == name:
+                    protected.update(range(start, start + size))
+
+        segments: List[List[str]] = [[]]
+        for i, token in enumerate(tokens):
+            if token in CONJUNCTIONS and i not in protected:
+                compound = (
+                    token == "y" and 0 < i < len(tokens) - 1
+                    and tokens[i - 1] in TENS and tokens[i + 1] in UNITS
+                )
+                if not compound:
+                    segments.append([])
+                    continue
+            segments[-1].append(token)
+        return [segment for segment in segments if segment]
+
+    def _parse_segment(self, tokens: List[str]) -> Optional[ParsedItem]:
+        quantity: Optional[int] = None
+        words = [t for t in tokens if t not in FILLERS]
+
+        # Cantidad al inicio: "3", "3x", "tres", "treinta y dos", "un"
+        while words and words[0] in ARTICLES:
+            words = words[1:]
+        if words:
+            first = words[0]
+            times = _TIMES_RE.match(first)
+            if first in TENS and len(words) > 2 and words[1] == "y" and words[2] in UNITS:
+                quantity = TENS[first] + UNITS[words[2]]
+                words = words[3:]
+            elif times:
+                quantity = int(times.group(1) or times.group(2))
+                words = words[1:]
+            elif word_to_number(first) is not None:
+                quantity = word_to_number(first)
+                words = words[1:]
+
+        # Cantidad al final: "mouse x2", "mouse x 2"
+        if quantity is None and words:
+            times = _TIMES_RE.match(words[-1])
+            if times:
+                quantity = int(times.group(1) or times.group(2))
+                words = words[:-1]
+            elif len(words) >= 2 and words[-2] == "x" and words[-1].isdigit():
+                quantity = int(words[-1])
+                words = words[:-2]
+
+        words = [w for w in words if w not in ARTICLES and w not in UNIT_WORDS]
+        if not words:
+            # Cantidad sin producto ("dos") o solo muletillas
+            return ParsedItem(product="", quantity=quantity, confidence=0.0) if quantity else None
+
+        folded = [fold(w) for w in words]
+        name, candidates, confidence = self.catalog.match(folded)
+
+        # Números sueltos dentro del nombre ("monitor 24") que el catálogo no explica
+        if name is None and any(w.isdigit() for w in words):
+            confidence = min(confidence, 0.5)
+
+        if quantity is not None and quantity <= 0:
+            confidence = 0.0
+
+        product = name or " ".join(self.catalog.surface.get(f, w) for f, w in zip(folded, words))
+        return ParsedItem(product=product, quantity=quantity, confidence=round(confidence, 3), candidates=candidates)
+
+
+# ═══════════════════════════════════════════════════════════
+# PARSER COMPARTIDO (índice del catálogo cacheado)
+# ═══════════════════════════════════════════════════════════
+
+_parser: Optional[OrderPhraseParser] = None
+_parser_built_at = 0.0
+_parser_lock = threading.Lock()
+
+
+def _load_catalog_names() -> List[str]:
+    from config.database import get_db_context
+    from app.database.models import Product
+
+    with get_db_context() as db:
+        return [name for (name,) in db.query(Product.name).filter(Product.is_active == True).all()]
+
+
+def get_order_phrase_parser() -> OrderPhraseParser:
+    """Parser con el índice de productos activos (se reconstruye cada catalog_index_ttl_seconds)"""
+    global _parser, _parser_built_at
+
+    with _parser_lock:
+        if _parser is None or time.monotonic() - _parser_built_at > settings.catalog_index_ttl_seconds:
+            try:
+                names = _load_catalog_names()
+            except Exception as e:
+                logger.warning(f"⚠️ [OrderParser] No se pudo cargar el catálogo: {e}")
+                names = []
+            _parser = OrderPhraseParser(CatalogIndex(names))
+            _parser_built_at = time.monotonic()
+            logger.debug(f"📚 [OrderParser] Índice del catálogo: {len(names)} productos")
+        return _parser
+
+
+def invalidate_catalog_index():
+    """Forzar la reconstrucción del índice (productos creados, renombrados o desactivados)"""
+    global _parser
+    with _parser_lock:
+        _parser = None
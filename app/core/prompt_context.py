@@ -0,0 +1,308 @@
+"""
+Contexto de prompts con presupuesto de tokens
+
+Los prompts crecían con el historial y el catálogo sin ningún control, y en
+los nodos de inferencia por CPU el tiempo de evaluación del prompt es lineal
+en tokens. Este módulo:
+
+- Estima tokens (caracteres / prompt_chars_per_token; sin tokenizer local).
+- Arma las partes variables de una plantilla dentro del presupuesto de su
+  tarea (clasificación, extracción, generación): se mide lo fijo (prefijo,
+  mensaje) y el resto se reparte entre las secciones en orden (max_share
+  evita que una sección deje sin espacio a las siguientes).
+  Cada sección mete ítems por orden de importancia (el historial del más
+  reciente al más antiguo, el catálogo en su orden) hasta agotar lo que le
+  toca y se renderiza en su orden natural.
+- Mantiene el resumen incremental de la conversación: la fila de la
+  conversación guarda los últimos context_recent_messages mensajes y un
+  resumen extractivo de los anteriores. Cada mensaje guardado entra a la
+  ventana; el que sale de ella se comprime a una línea y se agrega al
+  resumen (recortado por el principio a context_summary_max_chars). Así no
+  hace falta consultar Message en cada turno ni llamar al LLM para resumir.
+- Registra por plantilla tokens estimados, prompts fuera de presupuesto e
+  ítems recortados (ver /llm/status).
+"""
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from config.settings import settings
+from app.clients.llm_models import CLASSIFICATION, EXTRACTION, GENERATION
+
+
+def estimate_tokens(text: str) -> int:
+    """Tokens aproximados de un texto"""
+    if not text:
+        return 0
+    return int(len(text) / settings.prompt_chars_per_token) + 1
+
+
+def budget_for(task: str) -> int:
+    """Presupuesto de tokens del prompt para una tarea"""
+    return {
+        CLASSIFICATION: settings.prompt_budget_classification_tokens,
+        EXTRACTION: settings.prompt_budget_extraction_tokens,
+        GENERATION: settings.prompt_budget_generation_tokens
+    }.get(task, settings.prompt_budget_generation_tokens)
+
+
+@dataclass
+class ContextSection:
+    """
+    Parte variable recortable de un prompt
+
+    Attributes:
+        items: Ítems en orden de importancia (el primero es el último en recortarse)
+        header: Texto antes de los ítems (solo si queda al menos uno)
+        separator: Separador entre ítems
+        reverse: Renderizar en orden inverso al de importancia (historial: el
+                 más reciente es el más importante pero va al final)
+        max_share: Fracción máxima del espacio disponible que puede ocupar
+    """
+    items: List[str]
+    header: str = ""
+    separator: str = "\n"
+    reverse: bool = False
+    max_share: float = 1.0
+
+    def fit(self, max_tokens: int) -> Tuple[str, int]:
+        """
+        Renderiza tantos ítems como quepan
+
+        Returns:
+            (texto, ítems descartados)
+        """
+        if not self.items or max_tokens <= 0:
+            return "", len(self.items)
+
+        used = estimate_tokens(self.header)
+        separator_tokens = estimate_tokens(self.separator) - 1
+        kept: List[str] = []
+        for item in self.items:
+            cost = estimate_tokens(item) + separator_tokens
+            if used + cost > max_tokens:
+                break
+            kept.append(item)
+            used += cost
+
+        if not kept:
+            return "", len(self.items)
+        if self.reverse:
+            kept.reverse()
+        return self.header + self.separator.join(kept), len(self.items) - len(kept)
+
+
+# ═══════════════════════════════════════════════════════════
+# HISTORIAL Y RESUMEN INCREMENTAL
+# ═══════════════════════════════════════════════════════════
+
+def format_history_line(entry: Dict[str, Any], user_label: str = "Usuario") -> str:
+    return f"{'Bot' if entry.get('is_from_bot') else user_label}: {entry.get('content', '')}"
+
+
+def history_section(
+    context: Dict[str, Any],
+    limit: Optional[int] = None,
+    header: str = "Mensajes recientes:\n",
+    user_label: str = "Usuario",
+    max_share: float = 1.0
+) -> ContextSection:
+    """Sección de historial (más reciente = más importante) desde el contexto del ContextManager"""
+    history = context.get("message_history") or []
+    if limit is not None:
+        history = history[-limit:]
+    return ContextSection(
+        items=[format_history_line(entry, user_label) for entry in reversed(history)],
+        header=header,
+        reverse=True,
+        max_share=max_share
+    )
+
+
+def summary_section(context: Dict[str, Any], max_share: float = 0.3) -> ContextSection:
+    """Sección con el resumen de la conversación (se recorta por el principio, lo antiguo primero)"""
+    summary = context.get("conversation_summary") or ""
+    lines = [line for line in summary.split("\n") if line]
+    return ContextSection(
+        items=list(reversed(lines)),
+        header="Resumen de la conversación:\n",
+        reverse=True,
+        max_share=max_share
+    )
+
+
+def catalog_section(catalog: str, max_share: float = 1.0) -> ContextSection:
+    """Catálogo "a, b, c" recortable por producto"""
+    return ContextSection(
+        items=[name.strip() for name in catalog.split(",") if name.strip()],
+        separator=", ",
+        max_share=max_share
+    )
+
+
+def _compact(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    # Primera oración si cabe, si no, corte por palabra
+    sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    if len(sentence) <= limit:
+        return sentence
+    return text[:limit].rsplit(" ", 1)[0] + "…"
+
+
+def summarize_entry(entry: Dict[str, Any]) -> str:
+    """Línea del resumen para un mensaje que sale de la ventana"""
+    # Las respuestas del bot se resumen más que las del cliente (menos información nueva)
+    limit = 60 if entry.get("is_from_bot") else 120
+    return f"{'Bot' if entry.get('is_from_bot') else 'Cliente'}: {_compact(entry.get('content', ''), limit)}"
+
+
+def roll_conversation(
+    recent: List[Dict[str, Any]],
+    summary: Optional[str],
+    entry: Dict[str, Any],
+    window: int,
+    max_summary_chars: int
+) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    Agrega un mensaje a la ventana y pasa al resumen los que salen de ella
+
+    Returns:
+        (nueva ventana, nuevo resumen)
+    """
+    recent = list(recent) + [entry]
+    lines = [line for line in (summary or "").split("\n") if line]
+    while len(recent) > window:
+        lines.append(summarize_entry(recent.pop(0)))
+
+    # Recortar por el principio (lo más antiguo)
+    while lines and sum(len(line) + 1 for line in lines) > max_summary_chars:
+        lines.pop(0)
+    return recent, "\n".join(lines)
+
+
+# ═══════════════════════════════════════════════════════════
+# CONSTRUCTOR
+# ═══════════════════════════════════════════════════════════
+
+class PromptContextBuilder:
+    """Renderiza plantillas del PromptRegistry dentro del presupuesto de su tarea"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def fit_sections(
+        self,
+        task: str,
+        fixed_text: str,
+        sections: Dict[str, ContextSection],
+        label: str
+    ) -> Dict[str, str]:
+        """
+        Reparte el presupuesto de la tarea entre las secciones
+
+        Args:
+            task: Tarea (CLASSIFICATION, EXTRACTION, GENERATION)
+            fixed_text: Todo lo que no se recorta (prefijo, mensaje, ...)
+            sections: Campo → sección, en el orden en que reciben espacio
+            label: Nombre para métricas (plantilla o prompt)
+
+        Returns:
+            Campo → texto de la sección
+        """
+        budget = budget_for(task)
+        available = budget - estimate_tokens(fixed_text)
+
+        rendered: Dict[str, str] = {}
+        dropped = 0
+        for name, section in sections.items():
+            share = int(max(available, 0) * section.max_share) if section.max_share < 1.0 else available
+            text, section_dropped = section.fit(share)
+            rendered[name] = text
+            dropped += section_dropped
+            available -= estimate_tokens(text)
+
+        self._record(label, task, budget, estimate_tokens(fixed_text) + sum(estimate_tokens(t) for t in rendered.values()), dropped)
+        if dropped:
+            logger.debug(f"✂️ [PromptContext] {label}: {dropped} ítems fuera del presupuesto de {budget} tokens")
+        return rendered
+
+    def render(
+        self,
+        template_name: str,
+        task: str,
+        sections: Dict[str, ContextSection],
+        **variables
+    ) -> str:
+        """
+        Renderiza una plantilla con las secciones recortadas al presupuesto
+
+        Args:
+            template_name: Plantilla del PromptRegistry
+            task: Tarea (define el presupuesto)
+            sections: Campo de la plantilla → sección recortable, en el orden en que
+                      reciben espacio. Varias secciones pueden ir al mismo campo con
+                      "campo:parte"; se concatenan en ese orden con una línea en blanco.
+            **variables: Campos fijos (mensaje, ...)
+        """
+        from app.core.prompt_registry import get_prompt_registry
+
+        template = get_prompt_registry().get(template_name)
+        fields = {name.split(":")[0] for name in sections}
+        fixed_text = template.render(**{name: "" for name in fields}, **variables)
+
+        rendered = self.fit_sections(task, fixed_text, sections, template.key)
+
+        values: Dict[str, List[str]] = {}
+        for name, text in rendered.items():
+            if text:
+                values.setdefault(name.split(":")[0], []).append(text)
+        return template.render(
+            **{name: "\n\n".join(values.get(name, [])) for name in fields},
+            **variables
+        )
+
+    def _record(self, label: str, task: str, budget: int, tokens: int, dropped: int):
+        with self._lock:
+            stats = self._stats.setdefault(label, {
+                "task": task, "budget": budget, "calls": 0, "tokens_total": 0,
+                "tokens_max": 0, "over_budget": 0, "truncated": 0, "items_dropped": 0
+            })
+            stats["budget"] = budget
+            stats["calls"] += 1
+            stats["tokens_total"] += tokens
+            stats["tokens_max"] = max(stats["tokens_max"], tokens)
+            if tokens > budget:
+                stats["over_budget"] += 1
+            if dropped:
+                stats["truncated"] += 1
+                stats["items_dropped"] += dropped
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Tokens estimados y recortes por plantilla"""
+        with self._lock:
+            return {
+                "chars_per_token": settings.prompt_chars_per_token,
+                "prompts": {
+                    label: {
+                        "task": stats["task"],
+                        "budget": stats["budget"],
+                        "calls": stats["calls"],
+                        "avg_tokens": round(stats["tokens_total"] / stats["calls"], 1),
+                        "max_tokens": stats["tokens_max"],
+                        "over_budget": stats["over_budget"],
+                        "truncated": stats["truncated"],
+                        "items_dropped": stats["items_dropped"]
+                    }
+                    for label, stats in self._stats.items()
+                }
+            }
+
+
+# Instancia global
+prompt_context = PromptContextBuilder()
@@ -0,0 +1,156 @@
+"""
+Registro de Prompts - Plantillas versionadas para llamadas al LLM
+
+Cada plantilla separa un prefijo estático de un sufijo variable. Ollama
+(llama.cpp) reutiliza el KV-cache del prefijo común con el prompt anterior,
+así que mantener las instrucciones fijas al principio y el mensaje, historial
+y catálogo al final evita re-evaluar cientos de tokens por llamada.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from loguru import logger
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """
+    Plantilla de prompt versionada
+
+    Attributes:
+        name: Nombre lógico (ej: "product_extraction")
+        version: Versión de la plantilla (ej: "v2")
+        prefix: Instrucciones estáticas; NO se formatea, debe ser idéntico en cada llamada
+        suffix: Partes variables, formateadas con str.format
+    """
+    name: str
+    version: str
+    prefix: str
+    suffix: str
+
+    @property
+    def key(self) -> str:
+        """Identificador único nombre@versión (útil en logs y métricas)"""
+        return f"{self.name}@{self.version}"
+
+    def render(self, **variables) -> str:
+        """
+        Construye el prompt completo
+
+        Args:
+            **variables: Valores para los campos del sufijo
+
+        Returns:
+            Prefijo estático + sufijo formateado
+        """
+        return self.prefix + self.suffix.format(**variables)
+
+
+class PromptRegistry:
+    """Registro centralizado de plantillas de prompts"""
+
+    def __init__(self):
+        self._templates: Dict[str, Dict[str, PromptTemplate]] = {}
+        self._active: Dict[str, str] = {}
+
+    def register(self, template: PromptTemplate, activate: bool = True):
+        """
+        Registra una plantilla
+
+        Args:
+            template: Plantilla a registrar
+            activate: Si True, pasa a ser la versión usada por get(name)
+        """
+        self._templates.setdefault(template.name, {})[template.version] = template
+        if activate or template.name not in self._active:
+            self._active[template.name] = template.version
+        logger.debug(f"📝 [PromptRegistry] Plantilla registrada: {template.key} (prefijo: {len(template.prefix)} chars)")
+
+    def get(self, name: str, version: Optional[str] = None) -> PromptTemplate:
+        """
+        Obtiene una plantilla
+
+        Args:
+            name: Nombre de la plantilla
+            version: Versión específica (default: la activa)
+
+        Raises:
+            KeyError: Si la plantilla o versión no existe
+        """
+        versions = self._templates[name]
+        return versions[version or self._active[name]]
+
+    def render(self, name: str, version: Optional[str] = None, **variables) -> str:
+        """Atajo para get(name, version).render(**variables)"""
+        return self.get(name, version).render(**variables)
+
+    def list_templates(self) -> List[str]:
+        """Lista las claves nombre@versión registradas"""
+        return [
+            template.key
+            for versions in self._templates.values()
+            for template in versions.values()
+        ]
+
+
+# Instancia global del registro
+_prompt_registry = None
+
+def get_prompt_registry() -> PromptRegistry:
+    """Obtiene la instancia global del registro de prompts (con las plantillas por defecto)"""
+    global _prompt_registry
+    if _prompt_registry is None:
+        _prompt_registry = PromptRegistry()
+        _register_default_templates(_prompt_registry)
+    return _prompt_registry
+
+
+def _register_default_templates(registry: PromptRegistry):
+    """Registra las plantillas del sistema definidas en config/prompts.py"""
+    from config import prompts
+
+    registry.register(PromptTemplate(
+        name="intent_label",
+        version="v2",
+        prefix=prompts.INTENT_LABEL_PREFIX,
+        suffix=prompts.INTENT_LABEL_SUFFIX
+    ))
+
+    registry.register(PromptTemplate(
+        name="product_extraction",
+        version="v2",
+        prefix=prompts.PRODUCT_EXTRACTION_RULES + prompts.PRODUCT_EXTRACTION_EXAMPLES,
+        suffix=prompts.PRODUCT_EXTRACTION_SUFFIX
+    ))
+
+    registry.register(PromptTemplate(
+        name="product_quantities",
+        version="v2",
+        prefix=prompts.PRODUCT_QUANTITIES_PREFIX,
+        suffix=prompts.PRODUCT_QUANTITIES_SUFFIX
+    ))
+
+    registry.register(PromptTemplate(
+        name="product_list",
+        version="v2",
+        prefix=prompts.PRODUCT_LIST_PREFIX,
+        suffix=prompts.PRODUCT_LIST_SUFFIX
+    ))
+
+    registry.register(PromptTemplate(
+        name="turn_understanding",
+        version="v1",
+        prefix=prompts.TURN_UNDERSTANDING_PREFIX,
+        suffix=prompts.TURN_UNDERSTANDING_SUFFIX
+    ))
+
+    # El catálogo de intenciones es estático: se formatea una sola vez en el prefijo
+    from app.core.intent_detector import IntentDetector
+
+    registry.register(PromptTemplate(
+        name="intent_detection",
+        version="v2",
+        prefix=prompts.INTENT_DETECTION_RULES.format(
+            intents_text=IntentDetector.format_intents_catalog()
+        ) + prompts.INTENT_DETECTION_OUTPUT_FORMAT,
+        suffix=prompts.INTENT_DETECTION_SUFFIX
+    ))
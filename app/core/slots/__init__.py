@@ -5,6 +5,7 @@ from .slot_definition import SlotDefinition, SlotType
 from .slot_extractor import SlotExtractor
 from .slot_validator import SlotValidator
 from .slot_manager import SlotManager, SlotFillingResult
+from .interrupt_gate import InterruptGate, interrupt_gate
 
 __all__ = [
     "SlotDefinition",
@@ -12,5 +13,7 @@ __all__ = [
     "SlotExtractor",
     "SlotValidator",
     "SlotManager",
-    "SlotFillingResult"
+    "SlotFillingResult",
+    "InterruptGate",
+    "interrupt_gate"
 ]
\ No newline at end of file
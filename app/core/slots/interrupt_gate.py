@@ -0,0 +1,147 @@
+"""
+Gate de interrupciones con un módulo activo
+
+Con un módulo en curso el worker detectaba la intención de cada mensaje
+solo para ver si era un cancel_order, incluidas respuestas como
+"efectivo", "si" o "4.71,-74.07" al slot que el módulo acaba de pedir.
+Eso es una llamada al LLM en casi todos los turnos intermedios.
+
+Antes de detectar la intención se mira el slot que el módulo espera:
+
+1. Cancelación explícita de la orden (mismo regex que el worker): se
+   detecta. Es barato: el worker la resuelve por regex, sin LLM.
+2. La respuesta se puede extraer con el extractor tipado del slot (ubicación,
+   opción válida, número, confirmación, ...) o el slot es texto libre: no
+   hace falta detectar la intención.
+3. No se pudo extraer pero suena a interrupción ("ya no", "olvídalo", ...):
+   se detecta la intención.
+4. Si no, la respuesta va al módulo, que repreguntará el slot.
+
+Sin slot conocido (módulos sin slots, o slots de producto que se validan
+contra el catálogo) se mantiene la detección de siempre.
+"""
+import re
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+from .slot_definition import SlotDefinition, SlotType
+from .slot_extractor import SlotExtractor
+from app.core.normalized_message import get_normalized
+
+
+# Cancelación de la orden completa (ver SyncMessageWorker._detect_intent_with_ollama)
+CANCEL_KEYWORDS = re.compile(r'(cancel|anul|ya\s+no\s+quier|no\s+quier|mejor\s+no|desist)')
+ORDER_KEYWORDS = re.compile(r'(orden|ordenar|ordeno|pedido|pedir|pido|compra|comprar|compro)')
+
+# Indicios de que el usuario quiere salir del flujo
+INTERRUPT_CUES = re.compile(
+    r'(cancel|anul|ya\s+no|no\s+quiero|mejor\s+no|olv[ií]d|desist|d[eé]jalo|no\s+importa|salir|basta|stop)'
+)
+
+# Slots cuya respuesta se extrae sin LLM
+TYPED_SLOTS = {
+    SlotType.LOCATION,
+    SlotType.CHOICE,
+    SlotType.NUMBER,
+    SlotType.BOOLEAN,
+    SlotType.CONFIRMATION,
+    SlotType.EMAIL,
+    SlotType.PHONE,
+    SlotType.DATE,
+    SlotType.ADDRESS,
+}
+
+
+class InterruptGate:
+    """Decide si un mensaje con módulo activo necesita detección de intención"""
+
+    def __init__(self):
+        self.extractor = SlotExtractor()
+
+        # Métricas
+        self._checked = 0
+        self._skipped = 0
+
+    @staticmethod
+    def get_expected_slot(module, context: Dict[str, Any]) -> Optional[SlotDefinition]:
+        """Definición del slot que el módulo activo está pidiendo (None si no hay)"""
+        slot_name = context.get('current_slot')
+        slot_manager = getattr(module, 'slot_manager', None)
+        if not slot_name or slot_manager is None:
+            return None
+        return slot_manager.slots_schema.get(slot_name)
+
+    def needs_intent_check(self, module, context: Dict[str, Any], message: str) -> bool:
+        """
+        True si hay que detectar la intención para ver si el mensaje interrumpe el flujo
+
+        Args:
+            module: Módulo activo
+            context: Contexto del módulo (current_slot, ...)
+            message: Mensaje del usuario
+        """
+        message_lower = get_normalized(message).lower
+
+        if CANCEL_KEYWORDS.search(message_lower) and ORDER_KEYWORDS.search(message_lower):
+            return self._check("cancelación explícita")
+
+        slot = self.get_expected_slot(module, context)
+        if slot is None or not self._is_gated(slot):
+            return self._check("sin slot tipado")
+
+        if self._parses(slot, message):
+            return self._skip(f"respuesta válida para '{slot.name}'")
+
+        if INTERRUPT_CUES.search(message_lower):
+            return self._check(f"no es un valor de '{slot.name}' y parece interrupción")
+
+        return self._skip(f"no es un valor de '{slot.name}', lo repregunta el módulo")
+
+    @staticmethod
+    def _is_gated(slot: SlotDefinition) -> bool:
+        if slot.type in TYPED_SLOTS:
+            return True
+        # Texto libre (referencias, notas): cualquier respuesta es el valor.
+        # Los nombres de producto se validan contra el catálogo y siguen el camino normal.
+        return slot.type == SlotType.TEXT and not slot.validation_rules.get('validate_against_db')
+
+    def _parses(self, slot: SlotDefinition, message: str) -> bool:
+        """Intenta el extractor tipado del slot"""
+        if slot.type == SlotType.TEXT:
+            # Cualquier texto vale, salvo que suene a interrupción
+            normalized = get_normalized(message)
+            return bool(normalized.text) and not INTERRUPT_CUES.search(normalized.lower)
+
+        slot_type = SlotType.CONFIRMATION if slot.type == SlotType.BOOLEAN else slot.type
+        value = self.extractor.extract(slot_type, message)
+        if value is None or value == "":
+            return False
+
+        choices = slot.validation_rules.get('choices')
+        if slot.type == SlotType.CHOICE and choices and not str(value).isdigit():
+            return str(value).lower() in [str(choice).lower() for choice in choices]
+        return True
+
+    def _check(self, reason: str) -> bool:
+        self._checked += 1
+        logger.debug(f"🚦 [InterruptGate] Detectar intención: {reason}")
+        return True
+
+    def _skip(self, reason: str) -> bool:
+        self._skipped += 1
+        logger.info(f"⚡ [InterruptGate] Sin detección de intención: {reason}")
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Mensajes con módulo activo que pasaron o se saltaron la detección"""
+        total = self._checked + self._skipped
+        return {
+            "checked": self._checked,
+            "skipped": self._skipped,
+            "skip_rate": round(self._skipped / total, 3) if total else None
+        }
+
+
+# Instancia global
+interrupt_gate = InterruptGate()
@@ -8,6 +8,13 @@ from loguru import logger
 import requests
 
 from app.core.slots.slot_definition import SlotType
+from app.clients.ollama_sync import ollama_sync_client, stop_on_newline
+from app.clients.llm_models import model_for, EXTRACTION
+from app.core.prompt_context import prompt_context, catalog_section
+from app.core.turn_understanding import get_current_turn
+from app.core.circuit_breaker import llm_breaker
+from app.core.normalized_message import get_normalized
+from config.settings import settings
 
 
 class SlotExtractor:
@@ -89,96 +96,47 @@ class SlotExtractor:
             - String con un solo producto si hay uno
             - None si no hay productos
         """
+        # ⚡ Si el worker ya analizó este mensaje (llamada estructurada), reutilizarlo
+        turn = get_current_turn(message)
+        if turn is not None:
+            if turn.products:
+                extracted = ", ".join(turn.product_names())
+                logger.info(f"✅ [SlotExtractor] Producto del análisis del turno: '{extracted}'")
+                return extracted
+            logger.info(f"🔄 [SlotExtractor] El análisis del turno no trae productos, usando fallback")
+            return self._extract_text_fallback(message)
+
+        # LLM caído o lento (breaker abierto): fallback sin esperar el timeout
+        if llm_breaker.is_open:
+            logger.info(f"⚡ [SlotExtractor] LLM no disponible, usando fallback")
+            return self._extract_text_fallback(message)
+
         try:
             # Obtener lista de productos disponibles para contexto
-            available_products = self._get_available_products_list()
+            available_products = self._get_available_products_list(message)
             
-            prompt = f"""Eres un asistente experto en extraer nombres de productos de mensajes de clientes.
-
-TAREA: Extrae el nombre o nombres de productos que el cliente menciona (para comprar, agregar, eliminar, etc.).
-
-REGLAS ESTRICTAS:
-1. Extrae ÚNICAMENTE el nombre del producto (sustantivo principal)
-2. NO incluyas verbos ni partes de verbos: quiero, deseo, necesito, comprar, adquirir, ordenar, orden (del verbo ordenar), eliminar, quitar, remover
-3. NO incluyas artículos: un, una, el, la, los, las
-4. NO incluyas saludos: hola, buenos días, gracias
-5. NO incluyas palabras de contexto: orden, pedido, compra, carrito
-6. NO incluyas palabras de relleno: por favor, me gustaría, podría, de mi
-7. Si hay marca y modelo, inclúyelos: "laptop HP" no solo "laptop"
-8. Si el cliente menciona MÚLTIPLES productos, sepáralos por comas
-9. Responde SOLO con el/los nombre(s) del producto, sin explicaciones
-10. Si el mensaje no menciona un producto claro, responde "NO_PRODUCTO"
-11. IMPORTANTE: Si el mensaje dice "ordenar una [PRODUCTO]", extrae solo [PRODUCTO], NO "orden"
-
-PRODUCTOS DISPONIBLES (para referencia):
-{available_products}
-
-EJEMPLOS CORRECTOS (COMPRAR/ORDENAR):
-Mensaje: "Hola! Quiero comprar una laptop"
-Producto: laptop
-
-Mensaje: "Quiero ordenar una laptop"
-Producto: laptop
-
-Mensaje: "Quisiera ordenar un mouse"
-Producto: mouse
-
-Mensaje: "Quiero una laptop y un mouse"
-Producto: laptop, mouse
-
-Mensaje: "Me gustaría una laptop HP y auriculares"
-Producto: laptop HP, auriculares
-
-EJEMPLOS CORRECTOS (ELIMINAR/QUITAR):
-Mensaje: "quiero eliminar la laptop de mi orden"
-Producto: laptop
-
-Mensaje: "quiero eliminar la dell de mi orden"
-Producto: dell
-
-Mensaje: "quitar el mouse de mi pedido"
-Producto: mouse
-
-Mensaje: "remover laptop HP 15 de la orden"
-Producto: laptop HP 15
-
-EJEMPLOS INCORRECTOS:
-Mensaje: "Hola, buenos días"
-Producto: NO_PRODUCTO
-
-Mensaje: "¿cómo está mi orden?"
-Producto: NO_PRODUCTO
-
-EJEMPLOS DE ERRORES COMUNES (EVITAR):
-❌ Mensaje: "quiero ordenar una laptop"
-   Respuesta incorrecta: orden
-   Respuesta correcta: laptop
-
-❌ Mensaje: "quiero eliminar la dell de mi orden"
-   Respuesta incorrecta: orden
-   Respuesta correcta: dell
-
-MENSAJE DEL CLIENTE: "{message}"
-Producto:"""
+            # Instrucciones y ejemplos en el prefijo estático; catálogo y mensaje al final
+            prompt = prompt_context.render(
+                "product_extraction",
+                EXTRACTION,
+                {"available_products": catalog_section(available_products)},
+                message=message
+            )
 
             logger.info(f"🔵 [SlotExtractor] Usando LLM para extraer producto de: '{message[:50]}...'")
             
-            response = requests.post(
-                'http://localhost:5001/generate',
-                json={
-                    "model": "llama3.2:latest",
-                    "prompt": prompt,
-                    "temperature": 0.1,  # Baja temperatura para respuestas más consistentes
-                    "max_tokens": 30  # Reducido para respuestas más cortas
-                },
-                timeout=20.0
+            # Streaming: la respuesta es una sola línea, cortar en el primer salto de línea
+            result = ollama_sync_client.generate_stream(
+                prompt=prompt,
+                on_token=stop_on_newline,
+                temperature=0.1,  # Baja temperatura para respuestas más consistentes
+                max_tokens=30,  # Reducido para respuestas más cortas
+                timeout=20.0,
+                model=model_for(EXTRACTION)
             )
             
-            response.raise_for_status()
-            result = response.json()
-            
             if result.get("success"):
-                extracted = result["response"].strip()
+                extracted = result["response"].strip().split("\n")[0]
                 
                 # Limpiar respuesta
                 extracted = extracted.lower().strip()
@@ -224,9 +182,13 @@ Producto:"""
             logger.error(f"❌ [SlotExtractor] Error usando LLM para extraer producto: {e}")
             return self._extract_text_fallback(message)
     
-    def _get_available_products_list(self) -> str:
+    def _get_available_products_list(self, message: Optional[str] = None) -> str:
         """
         Obtiene lista de productos disponibles para contexto del LLM
+
+        Con mensaje e índice de embeddings disponible van solo los
+        product_retrieval_top_k productos más parecidos al mensaje (cualquiera
+        del catálogo, no solo los primeros por nombre).
         """
         try:
             from config.database import get_db_context
@@ -234,6 +196,12 @@ Producto:"""
             
             with get_db_context() as db:
                 product_service = ProductService(db)
+
+                if message:
+                    similar = product_service.get_similar_products(message, settings.product_retrieval_top_k)
+                    if similar:
+                        return ", ".join(p.name for p in similar)
+
                 products = product_service.get_all_products(only_available=True)
                 
                 if products:
@@ -251,7 +219,7 @@ Producto:"""
         Fallback simple si el LLM falla
         """
         # Limpiar mensaje
-        cleaned = message.lower().strip()
+        cleaned = get_normalized(message).lower
         
         # Palabras a remover (más completo)
         stop_words = [
@@ -283,67 +251,37 @@ Producto:"""
         
         return None
     
-    def _extract_number(self, message: str) -> Optional[str]:
+    def _extract_number(self, message: str) -> Optional[int]:
         """
         Extrae un número del mensaje
-        Detecta tanto números escritos como palabras (una, uno, un)
+        Detecta dígitos ("5", "x2") y palabras ("una", "tres", "veintidós", "un par")
         """
-        message_lower = message.lower()
-        
-        # Detectar palabras que significan "1"
-        uno_patterns = [
-            r'\buna\b',      # "quiero una laptop"
-            r'\buno\b',      # "quiero uno"
-            r'\bun\b',       # "quiero un mouse"
-        ]
-        
-        for pattern in uno_patterns:
-            if re.search(pattern, message_lower):
-                logger.info(f"✅ [SlotExtractor] Detectado 'una/uno/un' → cantidad = 1")
-                return 1
-        
-        # Buscar números escritos en el mensaje
-        numbers = re.findall(r'\b\d+\b', message)
-        if numbers:
-            return int(numbers[0])
-        
-        return None
+        quantity = get_normalized(message).quantity
+        if quantity is not None:
+            logger.info(f"✅ [SlotExtractor] Cantidad detectada: '{message}' → {quantity}")
+        return quantity
     
     def _extract_email(self, message: str) -> Optional[str]:
         """
         Extrae un email del mensaje
         """
-        email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-        emails = re.findall(email_pattern, message)
-        if emails:
-            return emails[0].lower()
-        return None
+        emails = get_normalized(message).emails
+        return emails[0] if emails else None
     
     def _extract_phone(self, message: str) -> Optional[str]:
         """
         Extrae un teléfono del mensaje
         Soporta formatos colombianos: 3001234567, 300-123-4567, +57 300 123 4567
         """
-        # Remover espacios y caracteres especiales
-        cleaned = re.sub(r'[^\d+]', '', message)
-        
-        # Buscar número colombiano (10 dígitos empezando con 3)
-        if re.match(r'^3\d{9}$', cleaned):
-            return cleaned
-        
-        # Buscar número con código de país (+57)
-        if re.match(r'^\+?57?3\d{9}$', cleaned):
-            # Normalizar a formato sin +57
-            return re.sub(r'^\+?57', '', cleaned)
-        
-        return None
+        phones = get_normalized(message).phones
+        return phones[0] if phones else None
     
     def _extract_date(self, message: str) -> Optional[str]:
         """
         Extrae una fecha del mensaje
         Soporta: DD/MM/YYYY, DD-MM-YYYY, "hoy", "mañana"
         """
-        message_lower = message.lower()
+        message_lower = get_normalized(message).lower
         
         # Palabras clave para fechas relativas
         if 'hoy' in message_lower:
@@ -371,7 +309,7 @@ Producto:"""
         Extrae una elección del mensaje
         Busca números (1, 2, 3) o palabras clave
         """
-        message_lower = message.lower().strip()
+        message_lower = get_normalized(message).lower
         
         # Si el mensaje es solo un número
         if message_lower.isdigit():
@@ -428,53 +366,35 @@ Producto:"""
         Returns:
             String en formato "latitude,longitude" o None
         """
-        try:
-            import json
-            
-            # Intentar parsear como JSON (formato WAHA)
-            try:
-                data = json.loads(message)
-                if isinstance(data, dict):
-                    lat = data.get('latitude') or data.get('lat')
-                    lon = data.get('longitude') or data.get('lon') or data.get('lng')
-                    
-                    if lat is not None and lon is not None:
-                        logger.info(f"📍 [SlotExtractor] Ubicación extraída de JSON: {lat}, {lon}")
-                        return f"{lat},{lon}"
-            except (json.JSONDecodeError, ValueError):
-                pass
-            
-            # Intentar extraer coordenadas del texto
-            # Formato: "latitud, longitud" o "lat: X, lon: Y"
-            coords_pattern = r'(-?\d+\.?\d*)\s*,\s*(-?\d+\.?\d*)'
-            match = re.search(coords_pattern, message)
-            if match:
-                lat, lon = match.groups()
-                logger.info(f"📍 [SlotExtractor] Ubicación extraída de texto: {lat}, {lon}")
-                return f"{lat},{lon}"
-            
-            # Si no se pudo extraer, verificar si es solicitud de ubicación
-            logger.warning(f"⚠️ [SlotExtractor] No se pudieron extraer coordenadas de: '{message[:100]}'")
-            return None
-            
-        except Exception as e:
-            logger.error(f"❌ [SlotExtractor] Error extrayendo ubicación: {e}")
-            return None
+        # JSON de WAHA o texto "latitud, longitud" (detectado al normalizar el mensaje)
+        coordinates = get_normalized(message).coordinates
+        if coordinates:
+            lat, lon = coordinates
+            logger.info(f"📍 [SlotExtractor] Ubicación extraída: {lat}, {lon}")
+            return f"{lat},{lon}"
+        
+        logger.warning(f"⚠️ [SlotExtractor] No se pudieron extraer coordenadas de: '{message[:100]}'")
+        return None
     
     def _extract_confirmation(self, message: str) -> Optional[str]:
         """
         Extrae una confirmación (sí/no) del mensaje
         """
-        message_lower = message.lower().strip()
+        normalized = get_normalized(message)
         
         # Respuestas afirmativas
-        affirmative = ['si', 'sí', 'yes', 'ok', 'vale', 'confirmo', 'confirmar', 'claro', 'por supuesto']
-        if any(word in message_lower for word in affirmative):
+        affirmative = ['si', 'yes', 'ok', 'vale', 'confirmo', 'confirmar', 'claro', 'por supuesto']
+        if normalized.has_any(affirmative):
             return 'si'
         
         # Respuestas negativas
         negative = ['no', 'nop', 'nope', 'cancelar', 'cancelo']
-        if any(word in message_lower for word in negative):
+        if normalized.has_any(negative):
             return 'no'
         
+        # Sin palabra clave: usar la confirmación del análisis del turno (si existe)
+        turn = get_current_turn(message)
+        if turn is not None and turn.confirmation is not None:
+            return 'si' if turn.confirmation else 'no'
+        
         return None
\ No newline at end of file
@@ -4,6 +4,7 @@ Validador de Slots - Valida valores extraídos
 from typing import Any, Dict, Tuple, Optional
 from loguru import logger
 from .slot_definition import SlotType
+from app.core.normalized_message import get_normalized, fold_text
 
 
 class SlotValidator:
@@ -117,7 +118,8 @@ class SlotValidator:
         if not suggested_products:
             return None
         
-        value_lower = value.lower().strip()
+        # Solo palabras, sin tildes ni puntuación ("La primera." → "la primera")
+        value_lower = " ".join(get_normalized(value).tokens)
         
         # Mapeo de palabras ordinales a índices
         ordinal_map = {
@@ -175,6 +177,11 @@ class SlotValidator:
                     logger.warning(f"❌ [SlotValidator] Producto no encontrado: '{product_name}'")
                     # Sugerir productos similares
                     similar_products = product_service.search_products(product_name)
+                    if not similar_products:
+                        # Sin match textual: vecinos semánticos (el cliente confirma cuál)
+                        similar_products = product_service.get_similar_products(
+                            product_name, 5, min_score=settings.semantic_match_min_score
+                        )
                     if similar_products:
                         # Guardar las sugerencias en el contexto para la próxima respuesta
                         product_names = [p.name for p in similar_products[:5]]  # Guardar hasta 5
@@ -286,10 +293,10 @@ class SlotValidator:
             # Si no hay opciones definidas, aceptar cualquier texto
             return True, None
         
-        # Verificar si está en las opciones (case insensitive)
-        value_lower = value.lower()
+        # Verificar si está en las opciones (sin mayúsculas ni tildes)
+        value_folded = get_normalized(value).folded
         for choice in choices:
-            if value_lower == choice.lower():
+            if value_folded == fold_text(choice):
                 return True, None
         
         return False, f"Debe ser una de estas opciones: {', '.join(choices)}"
@@ -351,15 +358,13 @@ class SlotValidator:
     ) -> Tuple[bool, Optional[str]]:
         """Valida dirección"""
         
-        import re
-        
         # Debe tener al menos longitud mínima
         min_length = rules.get('min_length', 10)
         if len(value) < min_length:
             return False, f"Dirección debe tener al menos {min_length} caracteres"
         
         # Debe contener al menos un número
-        if not re.search(r'\d', value):
+        if not get_normalized(value).numbers:
             return False, "Dirección debe contener número de calle"
         
         return True, None
@@ -0,0 +1,184 @@
+"""
+Comprensión del turno - Una sola llamada al LLM por mensaje
+
+Antes, un mismo mensaje podía costar hasta cuatro inferencias: intención
+(sync_worker), nombre de producto (SlotExtractor), cantidades
+(MultiProductHandler) y de nuevo intención para detectar cancel_order con un
+módulo activo. Aquí se hace UNA llamada con salida restringida por JSON
+schema (format de Ollama) y el resultado validado queda disponible para
+todo el turno vía contextvars, igual que app/core/correlation.py.
+
+Los módulos consultan get_current_turn(message) y, si no hay resultado para
+ese mensaje, siguen con su extracción propia (LLM o regex) como antes.
+"""
+import time
+from contextvars import ContextVar
+from typing import List, Literal, Optional
+
+from loguru import logger
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+from app.clients.ollama_sync import ollama_sync_client
+from app.clients.llm_models import model_for, CLASSIFICATION
+from app.core.prompt_context import prompt_context, catalog_section
+
+
+VALID_INTENTS = ("greeting", "goodbye", "create_order", "check_order", "cancel_order", "remove_from_order", "other")
+
+IntentLabel = Literal["greeting", "goodbye", "create_order", "check_order", "cancel_order", "remove_from_order", "other"]
+
+
+class ProductMention(BaseModel):
+    """Producto mencionado en el mensaje"""
+    product: str = Field(..., min_length=2, max_length=100)
+    quantity: Optional[int] = Field(None, ge=1, le=1000)
+
+    @field_validator("product")
+    @classmethod
+    def clean_product(cls, value: str) -> str:
+        return value.strip().strip('"').strip("'").lower()
+
+
+class TurnUnderstanding(BaseModel):
+    """Resultado validado del análisis de un mensaje"""
+    intent: IntentLabel
+    confidence: float = Field(..., ge=0.0, le=1.0)
+    products: List[ProductMention] = Field(default_factory=list, max_length=20)
+    confirmation: Optional[bool] = None
+
+    # Metadatos (no forman parte del schema enviado al LLM)
+    message: str = Field("", exclude=True)
+    detection_method: str = Field("llm_structured", exclude=True)
+
+    def product_names(self) -> List[str]:
+        """Nombres de productos en el orden mencionado"""
+        return [p.product for p in self.products]
+
+    def products_with_quantities(self) -> List[dict]:
+        """Formato que consume MultiProductHandler: [{'product', 'quantity'}]"""
+        return [{"product": p.product, "quantity": p.quantity} for p in self.products]
+
+    def to_intent_result(self) -> dict:
+        """Formato de _detect_intent_with_ollama: {'intent', 'confidence', 'detection_method'}"""
+        return {
+            "intent": self.intent,
+            "confidence": self.confidence,
+            "detection_method": self.detection_method
+        }
+
+
+def _output_schema() -> dict:
+    """JSON schema de la salida del LLM (solo los campos que debe generar)"""
+    schema = TurnUnderstanding.model_json_schema(mode="serialization")
+    for field in ("message", "detection_method"):
+        schema.get("properties", {}).pop(field, None)
+    schema["required"] = ["intent", "confidence", "products", "confirmation"]
+    return schema
+
+
+# ═══════════════════════════════════════════════════════════
+# RESULTADO DEL TURNO ACTUAL (por hilo/tarea, vía contextvars)
+# ═══════════════════════════════════════════════════════════
+
+current_turn: ContextVar[Optional[TurnUnderstanding]] = ContextVar('current_turn', default=None)
+
+
+def set_current_turn(turn: Optional[TurnUnderstanding]) -> None:
+    """Publica el análisis del mensaje que se está procesando"""
+    current_turn.set(turn)
+
+
+def get_current_turn(message: Optional[str] = None) -> Optional[TurnUnderstanding]:
+    """
+    Obtiene el análisis del turno actual
+
+    Args:
+        message: Si se indica, solo retorna el análisis si corresponde a este mensaje
+
+    Returns:
+        TurnUnderstanding o None si no hay análisis (o es de otro mensaje)
+    """
+    turn = current_turn.get()
+    if turn is None:
+        return None
+    if message is not None and turn.message.strip() != message.strip():
+        return None
+    return turn
+
+
+def clear_current_turn() -> None:
+    """Limpia el análisis del turno (al terminar de procesar el mensaje)"""
+    current_turn.set(None)
+
+
+# ═══════════════════════════════════════════════════════════
+# EXTRACTOR
+# ═══════════════════════════════════════════════════════════
+
+class TurnUnderstandingExtractor:
+    """Analiza un mensaje con una única llamada de salida estructurada"""
+
+    def __init__(self):
+        self.schema = _output_schema()
+
+    def extract(self, message: str, available_products: Optional[str] = None) -> Optional[TurnUnderstanding]:
+        """
+        Obtiene intención, productos, cantidades y confirmación del mensaje
+
+        Args:
+            message: Mensaje del usuario
+            available_products: Catálogo de referencia (default: el mismo que usa SlotExtractor)
+
+        Returns:
+            TurnUnderstanding validado, o None si el LLM falla o la salida no cumple el schema
+        """
+        if available_products is None:
+            # Import local: SlotExtractor también consulta este módulo
+            from app.core.slots.slot_extractor import SlotExtractor
+            available_products = SlotExtractor()._get_available_products_list(message)
+
+        # El catálogo se recorta al presupuesto de clasificación
+        prompt = prompt_context.render(
+            "turn_understanding",
+            CLASSIFICATION,
+            {"available_products": catalog_section(available_products)},
+            message=message
+        )
+
+        start = time.perf_counter()
+        try:
+            result = ollama_sync_client.generate(
+                prompt=prompt,
+                temperature=0.0,
+                max_tokens=200,
+                timeout=30.0,
+                model=model_for(CLASSIFICATION),
+                format=self.schema
+            )
+        except Exception as e:
+            logger.error(f"❌ [TurnUnderstanding] Error llamando al LLM: {e}")
+            return None
+
+        if not result.get("success"):
+            logger.error(f"❌ [TurnUnderstanding] Error del proxy: {result.get('error')}")
+            return None
+
+        try:
+            turn = TurnUnderstanding.model_validate_json(result.get("response", ""))
+        except ValidationError as e:
+            logger.warning(f"⚠️ [TurnUnderstanding] Salida fuera del schema: {e.error_count()} errores")
+            logger.debug(f"   Respuesta: {result.get('response', '')[:200]}")
+            return None
+
+        turn.message = message
+
+        logger.info(
+            f"✅ [TurnUnderstanding] intent={turn.intent} ({turn.confidence:.2f}), "
+            f"productos={turn.products_with_quantities()}, confirmación={turn.confirmation} "
+            f"en {time.perf_counter() - start:.2f}s"
+        )
+        return turn
+
+
+# Instancia global
+turn_understanding_extractor = TurnUnderstandingExtractor()
@@ -7,7 +7,8 @@ from sqlalchemy import (
     Text, 
     JSON, 
     ForeignKey,
-    Float
+    Float,
+    UniqueConstraint
 )
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -72,6 +73,10 @@ class Conversation(Base):
     
     context_data = Column(JSON, default=dict)
     
+    # Últimos mensajes completos + resumen incremental de los anteriores (ver app/core/prompt_context.py)
+    recent_messages = Column(JSON, nullable=True)
+    summary = Column(Text, nullable=True)
+    
     started_at = Column(DateTime, default=datetime.utcnow)
     last_activity_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     completed_at = Column(DateTime, nullable=True)
@@ -156,6 +161,12 @@ class Product(Base):
         if not self.image_path:
             return False
         return os.path.exists(self.image_path)
+
+    @property
+    def image_variants(self):
+        """URLs de thumb/card/full (WebP y JPEG) si la imagen ya fue procesada"""
+        from app.services.image_pipeline import variant_urls
+        return variant_urls(self.image_path)
     
 class ProductCategory(Base):
     """Categorías de productos"""
@@ -324,6 +335,31 @@ class OrderItem(Base):
         }
 
 
+class CustomerProductAffinity(Base):
+    """
+    Cuántas veces compró cada cliente cada producto
+
+    Se mantiene incrementalmente al confirmar, cancelar o modificar órdenes
+    (ver app/services/product_affinity.py) para que el ofrecimiento no agregue
+    order_items en cada turno.
+    """
+
+    __tablename__ = "customer_product_affinity"
+    __table_args__ = (UniqueConstraint("customer_id", "product_id", name="uq_affinity_customer_product"),)
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    customer_id = Column(String, ForeignKey("customers.id"), nullable=False, index=True)
+    product_id = Column(String, ForeignKey("products.id"), nullable=False, index=True)
+    product_name = Column(String(200), nullable=False)
+
+    times_ordered = Column(Integer, default=0, nullable=False)  # Items de órdenes con el producto
+    total_quantity = Column(Integer, default=0, nullable=False)  # Unidades compradas
+    last_ordered_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<CustomerProductAffinity {self.customer_id[:8]} → {self.product_name} x{self.times_ordered}>"
+
+
 class CartSession(Base):
     """
     Sesiones de carrito para webapp
@@ -436,4 +472,139 @@ class Settings(Base):
             "description": self.description,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None
-        }
\ No newline at end of file
+        }
+
+
+class ClusterMember(Base):
+    """
+    Instancias vivas del bot (modo cluster)
+
+    Cada instancia publica su URL y renueva heartbeat_at periódicamente.
+    Las instancias cuyo heartbeat expiró se consideran muertas y sus
+    teléfonos pasan automáticamente a otra instancia.
+    """
+
+    __tablename__ = "cluster_members"
+
+    instance_id = Column(String(200), primary_key=True)
+    base_url = Column(String(500), nullable=False)
+    heartbeat_at = Column(DateTime, nullable=False, index=True)
+    started_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ClusterMember {self.instance_id} ({self.base_url})>"
+
+    def to_dict(self):
+        return {
+            "instance_id": self.instance_id,
+            "base_url": self.base_url,
+            "heartbeat_at": self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None
+        }
+
+
+class ClusterLease(Base):
+    """
+    Leases con expiración para jobs que deben correr en una sola instancia
+
+    Ej: order_monitor. El dueño renueva expires_at en cada heartbeat; si
+    muere, el lease expira y otra instancia lo toma.
+    """
+
+    __tablename__ = "cluster_leases"
+
+    name = Column(String(100), primary_key=True)
+    owner_id = Column(String(200), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ClusterLease {self.name} → {self.owner_id}>"
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "owner_id": self.owner_id,
+            "expires_at": self.expires_at.isoformat() if self.expires_at else None
+        }
+
+
+class RetryJob(Base):
+    """
+    Envíos a WAHA pendientes de reintento (cola persistente)
+
+    Un envío que falla se guarda aquí con su próximo intento; el scheduler
+    de reintentos lo vuelve a ejecutar en segundo plano. Los envíos a un
+    mismo chat se reintentan en orden de creación.
+    """
+
+    __tablename__ = "retry_jobs"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    operation = Column(String(100), nullable=False)  # Método de WAHAClient (ej: send_text_message)
+    operation_name = Column(String(300))  # Descripción para logs
+    chat_key = Column(String(100), nullable=False, index=True)  # Destinatario (ordena los reintentos)
+    args = Column(JSON, nullable=False, default=list)
+    kwargs = Column(JSON, nullable=False, default=dict)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, nullable=False, index=True)
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<RetryJob {self.operation} → {self.chat_key} (intento {self.attempts})>"
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "operation": self.operation,
+            "operation_name": self.operation_name,
+            "chat_key": self.chat_key,
+            "args": self.args,
+            "kwargs": self.kwargs,
+            "attempts": self.attempts,
+            "next_attempt_at": self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            "last_error": self.last_error,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class DeadLetter(Base):
+    """
+    Envíos que agotaron sus reintentos
+
+    Se conservan para inspección y para re-encolarlos desde la API de
+    administración (/api/retries/dead-letters/{id}/replay).
+    """
+
+    __tablename__ = "dead_letters"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    operation = Column(String(100), nullable=False)
+    operation_name = Column(String(300))
+    chat_key = Column(String(100), nullable=False, index=True)
+    args = Column(JSON, nullable=False, default=list)
+    kwargs = Column(JSON, nullable=False, default=dict)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text)
+    created_at = Column(DateTime, nullable=False)  # Creación del envío original
+    failed_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    replayed_at = Column(DateTime)
+
+    def __repr__(self):
+        return f"<DeadLetter {self.operation} → {self.chat_key}>"
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "operation": self.operation,
+            "operation_name": self.operation_name,
+            "chat_key": self.chat_key,
+            "args": self.args,
+            "kwargs": self.kwargs,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "failed_at": self.failed_at.isoformat() if self.failed_at else None,
+            "replayed_at": self.replayed_at.isoformat() if self.replayed_at else None
+        }
@@ -2,6 +2,7 @@
 Aplicación principal FastAPI
 """
 import sys
+import asyncio
 from pathlib import Path
 from typing import Dict, List
 from contextlib import asynccontextmanager
@@ -13,7 +14,6 @@ sys.path.insert(0, str(root_dir))
 from fastapi import FastAPI, Request, BackgroundTasks
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from config.settings import settings
 from config.logging_config import setup_logging
 from loguru import logger
@@ -39,6 +39,24 @@ from app.core.module_registry import get_module_registry
 from app.modules.create_order_module import CreateOrderModule
 from app.modules.check_order_module import CheckOrderModule
 from app.core.correlation import set_client_context
+from app.services.cluster_coordinator import (
+    cluster_coordinator,
+    CLUSTER_SECRET_HEADER,
+    CLUSTER_FORWARDED_HEADER,
+    CLUSTER_HOPS_HEADER,
+    MAX_FORWARD_HOPS
+)
+from app.services.transcription_pool import transcription_pool
+from app.services.image_pipeline import image_pipeline
+from app.services.notification_executor import notification_executor
+from app.core.circuit_breaker import get_breaker_states
+from app.clients.llm_router import llm_router
+from app.clients.llm_models import model_keeper
+from app.core.slots.interrupt_gate import interrupt_gate
+from app.core.prompt_context import prompt_context
+from app.services.product_vector_index import product_vector_index
+from app.utils.static_files import CachedStaticFiles
+from app.services.voice_pipeline import voice_pipeline
 
 async def process_buffered_messages(
     phone: str,
@@ -52,16 +70,25 @@ async def process_buffered_messages(
         
         first_message_id = messages_list[0].message_id if messages_list else None
         
+        # Si todo el turno fueron notas de voz, guardarlo como "voice" en el historial
+        message_type = "voice" if messages_list and all(m.message_type == "voice" for m in messages_list) else "text"
+        
         # Encolar en worker síncrono
-        sync_worker.enqueue_message(phone, combined_message, first_message_id)
+        sync_worker.enqueue_message(phone, combined_message, first_message_id, message_type)
         
         logger.info(f"✓ Mensaje encolado para {phone}")
         
     except Exception as e:
         logger.error(f"❌ Error: {e}", exc_info=True)
 
-async def process_incoming_message(webhook_data: Dict):
-    """Procesa webhooks de WAHA"""
+async def process_incoming_message(webhook_data: Dict, hops: int = 0):
+    """
+    Procesa webhooks de WAHA
+
+    Args:
+        webhook_data: Payload del webhook
+        hops: Veces que otras instancias del cluster ya lo reenviaron
+    """
     try:
         payload = webhook_data.get("payload", {})
         message_id = payload.get("id")
@@ -92,6 +119,17 @@ async def process_incoming_message(webhook_data: Dict):
         set_client_context(phone)
 
         logger.info(f"📱 Mensaje de {phone}: {message_type}")
+
+        # Modo cluster: cada teléfono se procesa en una única instancia
+        # (un reenvío también se verifica: la vista de quien reenvió puede ser vieja)
+        if not cluster_coordinator.owns(phone):
+            owner = cluster_coordinator.owner_of(phone)
+            if hops >= MAX_FORWARD_HOPS:
+                logger.warning(f"⚠️ Webhook con {hops} reenvíos (dueño según esta instancia: {owner.instance_id}), procesando localmente")
+            elif await cluster_coordinator.forward_webhook(owner, webhook_data, hops):
+                return
+            else:
+                logger.warning(f"⚠️ Dueño {owner.instance_id} no disponible, procesando localmente")
         
         # ⚠️ VERIFICACIÓN PRIORITARIA: Revisar si es un mensaje de ubicación ANTES de procesar como texto
         # Verificar en múltiples lugares del payload
@@ -145,10 +183,17 @@ async def process_incoming_message(webhook_data: Dict):
             )
             
         elif message_type in ["ptt", "audio"]:
-            media_url = payload.get("mediaUrl")
-            await message_processor.process_voice_message(
+            if not settings.enable_voice_messages:
+                await message_processor.waha.send_text_message(
+                    phone, "Lo siento, actualmente no puedo procesar mensajes de voz. Podrias escribirme?"
+                )
+                return
+            
+            # Reserva su lugar en el buffer y transcribe en paralelo con el debounce
+            logger.info(f"🎤 Nota de voz: transcribiendo y agregando al buffer")
+            await voice_pipeline.submit(
                 phone=phone,
-                media_url=media_url,
+                media_url=payload.get("mediaUrl"),
                 message_id=message_id
             )
             
@@ -258,6 +303,11 @@ async def process_incoming_message(webhook_data: Dict):
 async def lifespan(app: FastAPI):
     """Ciclo de vida"""
     logger.info("🚀 Iniciando BotVentasWhatsApp")
+
+    # Tablas que falten (afinidad, reintentos, cluster...): create_all no toca las
+    # existentes; las columnas nuevas siguen por los scripts migrate_*
+    from config.database import init_db
+    await asyncio.to_thread(init_db)
     
     # ✅ Inicializar módulos AQUÍ
     logger.info("🔌 Inicializando módulos...")
@@ -316,9 +366,25 @@ async def lifespan(app: FastAPI):
     
     logger.info("✅ Módulos inicializados")
     
+    # Coordinación entre instancias (no-op si cluster_enabled=False)
+    from app.services.order_monitor_worker import ORDER_MONITOR_LEASE
+    from app.services.webhook_retry_service import RETRY_SCHEDULER_LEASE, webhook_retry_service
+    from app.services.co_purchase_recommender import RECOMMENDER_LEASE, co_purchase_recommender
+    cluster_coordinator.register_singleton(ORDER_MONITOR_LEASE)
+    cluster_coordinator.register_singleton(RETRY_SCHEDULER_LEASE)
+    cluster_coordinator.register_singleton(RECOMMENDER_LEASE)
+    await cluster_coordinator.start()
+    
     message_buffer_manager.set_processing_callback(process_buffered_messages)
+    message_buffer_manager.start()
     logger.info("✓ Buffer Manager configurado")
     
+    # Executor de notificaciones (un loop y un pool HTTP compartidos)
+    notification_executor.start()
+    
+    # Scheduler de reintentos de envíos a WAHA
+    await webhook_retry_service.start()
+    
     # Iniciar worker síncrono
     sync_worker.start()
     
@@ -327,13 +393,38 @@ async def lifespan(app: FastAPI):
     await order_monitor_worker.start()
     logger.info("✓ Order Monitor Worker iniciado")
     
+    # Pool de transcripción (carga Whisper una vez por proceso)
+    if settings.enable_voice_messages:
+        await transcription_pool.start()
+    
+    # Pool de variantes de imágenes subidas
+    image_pipeline.start()
+    
+    # Índice de embeddings de productos: embebe lo que falte (en segundo plano)
+    product_vector_index.start()
+    
+    # Matriz de co-compra para los ofrecimientos (job de refresco en segundo plano)
+    await co_purchase_recommender.start()
+    
+    # Precarga de modelos LLM por tarea y keep-alive (en segundo plano)
+    if settings.llm_warmup_enabled:
+        await model_keeper.start()
+    
     yield
     
     logger.info("👋 Cerrando aplicación")
     
     # Detener workers
+    await message_buffer_manager.stop()
     await order_monitor_worker.stop()
     sync_worker.stop()
+    await asyncio.to_thread(notification_executor.stop)
+    await webhook_retry_service.stop()
+    await transcription_pool.stop()
+    await image_pipeline.stop()
+    await model_keeper.stop()
+    await co_purchase_recommender.stop()
+    await cluster_coordinator.stop()
 
 
 # Crear app
@@ -367,14 +458,16 @@ from app.api.orders import router as orders_router
 from app.api.products import router as products_router
 from app.api.cart import router as cart_router
 from app.api.settings import router as settings_router
+from app.api.retries import router as retries_router
 
 app.include_router(orders_router)
 app.include_router(products_router)
 app.include_router(cart_router)
 app.include_router(settings_router)
+app.include_router(retries_router)
 
 # Montar carpeta de archivos estáticos (imágenes de productos)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
 
 logger.info("✅ FastAPI app creada")
 
@@ -393,6 +486,88 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/cluster/status")
+async def cluster_status():
+    """Estado del cluster visto desde esta instancia"""
+    return cluster_coordinator.get_status()
+
+
+@app.get("/stt/status")
+async def stt_status():
+    """Métricas del pool de transcripción (RTF, cola, errores) y del cache"""
+    from app.services.transcription_cache import transcription_cache
+    return {
+        **transcription_pool.get_stats(),
+        "voice_notes_in_flight": voice_pipeline.get_stats()["in_flight"],
+        "cache": transcription_cache.get_stats()
+    }
+
+
+@app.get("/notifications/status")
+async def notifications_status():
+    """Métricas del executor de notificaciones (cola, descartes, latencia por tipo)"""
+    return notification_executor.get_stats()
+
+
+@app.get("/breakers/status")
+async def breakers_status():
+    """Estado de los circuit breakers del LLM y WAHA (closed/open/half_open, tasas de la ventana)"""
+    return get_breaker_states()
+
+
+@app.get("/llm/status")
+async def llm_status():
+    """Backends LLM del router, modelos por tarea con sus cold starts, llamadas evitadas por el gate de interrupciones, tamaño de los prompts e índice de productos"""
+    return {
+        "router": llm_router.get_stats(),
+        "models": model_keeper.get_stats(),
+        "interrupt_gate": interrupt_gate.get_stats(),
+        "prompts": prompt_context.get_stats(),
+        "product_index": product_vector_index.get_stats()
+    }
+
+
+@app.get("/images/status")
+async def images_status():
+    """Métricas del pipeline de variantes y del cache de entrega por WhatsApp"""
+    from app.services.image_delivery_cache import image_delivery_cache
+    return {
+        "pipeline": image_pipeline.get_stats(),
+        "whatsapp": image_delivery_cache.get_stats()
+    }
+
+
+@app.get("/offers/status")
+async def offers_status():
+    """Rankings cacheados del ofrecimiento (afinidad por cliente y más vendidos) y matriz de co-compra"""
+    from app.services.product_affinity import product_affinity
+    from app.services.co_purchase_recommender import co_purchase_recommender
+    return {
+        "affinity": product_affinity.get_stats(),
+        "co_purchase": co_purchase_recommender.get_stats()
+    }
+
+
+@app.post("/internal/cluster/webhook")
+async def cluster_forwarded_webhook(request: Request, background_tasks: BackgroundTasks):
+    """Recibe webhooks reenviados por otra instancia del cluster"""
+    if not cluster_coordinator.enabled:
+        return JSONResponse(status_code=404, content={"detail": "Not Found"})
+    if not cluster_coordinator.verify_secret(request.headers.get(CLUSTER_SECRET_HEADER)):
+        return JSONResponse(status_code=403, content={"error": "forbidden"})
+
+    try:
+        hops = int(request.headers.get(CLUSTER_HOPS_HEADER, "1"))
+    except ValueError:
+        hops = 1
+
+    data = await request.json()
+    logger.info(f"🔀 Webhook reenviado por {request.headers.get(CLUSTER_FORWARDED_HEADER)} ({hops} salto(s))")
+
+    background_tasks.add_task(process_incoming_message, data, hops)
+    return {"status": "received"}
+
+
 @app.post("/webhook/waha")
 async def waha_webhook(request: Request, background_tasks: BackgroundTasks):
     """Endpoint webhook WAHA"""
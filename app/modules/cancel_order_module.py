@@ -9,6 +9,7 @@ from app.services.order_service import OrderService
 from app.database.repository import CustomerRepository
 from app.database.models import OrderStatus
 from config.database import get_db_context
+from app.core.normalized_message import get_normalized
 
 
 class CancelOrderModule:
@@ -177,16 +178,16 @@ class CancelOrderModule:
         Returns:
             Dict con resultado de cancelación y contexto limpio
         """
-        message_lower = message.lower().strip()
+        normalized = get_normalized(message)
         order_id = context.get("cancel_order_id")
         order_number = context.get("cancel_order_number")
 
-        logger.info(f"🔍 Respuesta de confirmación recibida: '{message_lower}'")
+        logger.info(f"🔍 Respuesta de confirmación recibida: '{normalized.lower}'")
 
         # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
         # CASO A: Usuario confirma cancelación (SÍ)
         # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-        if any(word in message_lower for word in ['si', 'sí', 'yes', 'ok', 'confirmo', 'cancela']):
+        if normalized.has_any(['si', 'yes', 'ok', 'confirmo', 'cancela', 'cancelala', 'cancelalo']):
             logger.info(f"✅ Usuario confirmó cancelación de orden {order_number}")
 
             try:
@@ -203,40 +204,20 @@ class CancelOrderModule:
 
                     # Notificar al usuario y limpiar conversación
                     from app.services.order_notification_service import OrderNotificationService
-                    from config.database import SessionLocal
-                    import asyncio
-                    import threading
+                    from app.services.notification_executor import notification_executor
 
-                    # Store order_id to pass to thread (SQLAlchemy objects are not thread-safe)
+                    # Store order_id to pass to the job (SQLAlchemy objects are not thread-safe)
                     cancel_order_id = order_id
 
-                    # Helper function to run async notification in a separate thread with its own event loop and DB session
-                    def run_cancellation_notification():
-                        thread_db = None
-                        try:
-                            # Create a new database session for this thread
-                            thread_db = SessionLocal()
-
-                            # Create service with thread's database session
-                            notification_service = OrderNotificationService(thread_db)
-
-                            # Run async notification with its own event loop
-                            asyncio.run(
-                                notification_service.notify_order_cancelled(
-                                    order_id=cancel_order_id,
-                                    cancelled_by_admin=False  # Cancelada por el usuario
-                                )
-                            )
-                        except Exception as e:
-                            logger.warning(f"⚠️ Error en thread de notificación de cancelación: {e}")
-                        finally:
-                            if thread_db:
-                                thread_db.close()
-
-                    # Run in background thread to avoid blocking
+                    # Job for the shared notification executor (gets its own DB session)
+                    async def run_cancellation_notification(job_db):
+                        await OrderNotificationService(job_db).notify_order_cancelled(
+                            order_id=cancel_order_id,
+                            cancelled_by_admin=False  # Cancelada por el usuario
+                        )
+
                     try:
-                        notification_thread = threading.Thread(target=run_cancellation_notification, daemon=True)
-                        notification_thread.start()
+                        notification_executor.submit("customer_order_cancelled", run_cancellation_notification)
                         logger.info(f"📤 Notificación de cancelación programada para orden {order_number}")
                     except Exception as notify_error:
                         logger.error(f"⚠️ Error programando notificación: {notify_error}")
@@ -275,7 +256,7 @@ class CancelOrderModule:
         # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
         # CASO B: Usuario rechaza cancelación (NO)
         # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-        elif any(word in message_lower for word in ['no', 'nop', 'nope', 'mantenla', 'conserva', 'dejala']):
+        elif normalized.has_any(['no', 'nop', 'nope', 'mantenla', 'conserva', 'conservala', 'dejala']):
             logger.info(f"❌ Usuario rechazó cancelación de orden {order_number}")
 
             return {
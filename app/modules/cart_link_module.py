@@ -68,7 +68,7 @@ class CartLinkModule:
                 if active_sessions and len(active_sessions) > 0:
                     # Ya tiene una sesión activa, reenviar el mismo link
                     existing_session = active_sessions[0]
-                    cart_link = f"{settings.webapp_base_url}/cart/{existing_session.token}"
+                    cart_link = cart_service.build_cart_link(existing_session)
                     
                     logger.info(f"♻️ Reenviando link existente: {existing_session.token[:8]}...")
                     
@@ -124,7 +124,7 @@ class CartLinkModule:
                     "response": response,
                     "context_updates": {
                         "current_module": None,  # No necesitamos mantener el módulo activo
-                        "cart_session_token": result.get("token") if not active_sessions else existing_session.token,
+                        "cart_session_token": result.get("token") if not active_sessions else cart_service.link_token(existing_session),
                         "awaiting_cart_completion": True  # Flag para saber que estamos esperando que complete el carrito
                     }
                 }
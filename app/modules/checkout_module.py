@@ -14,6 +14,7 @@ from app.services.order_service import OrderService
 from app.core.slots.slot_definition import SlotDefinition, SlotType
 from app.core.slots.slot_manager import SlotManager
 from app.core.correlation import set_client_context
+from app.core.normalized_message import get_normalized
 
 
 class CheckoutModule:
@@ -100,12 +101,12 @@ class CheckoutModule:
                 logger.info(f"🔍 [{self.name}] Procesando confirmación de reutilización de dirección")
 
                 # Detectar intención SI/NO
-                message_lower = message.lower().strip()
-                affirmative_words = ["si", "sí", "yes", "ok", "dale", "claro", "perfecto", "correcto", "exacto", "vale"]
+                normalized = get_normalized(message)
+                affirmative_words = ["si", "yes", "ok", "dale", "claro", "perfecto", "correcto", "exacto", "vale"]
                 negative_words = ["no", "nop", "nope", "cambiar", "nueva", "otro", "otra"]
 
-                is_affirmative = any(word in message_lower for word in affirmative_words)
-                is_negative = any(word in message_lower for word in negative_words)
+                is_affirmative = normalized.has_any(affirmative_words)
+                is_negative = normalized.has_any(negative_words)
 
                 if is_affirmative and not is_negative:
                     # ✅ Usuario quiere REUTILIZAR dirección previa
@@ -279,40 +280,21 @@ class CheckoutModule:
                 # 🔔 Notificar a administradores ahora que el usuario completó todos los datos
                 try:
                     from app.services.admin_notification_service import AdminNotificationService
-                    from config.database import SessionLocal
-                    import asyncio
-                    import threading
+                    from app.services.notification_executor import notification_executor
 
-                    # Store order_id to pass to thread (SQLAlchemy objects are not thread-safe)
+                    # Store order_id to pass to the job (SQLAlchemy objects are not thread-safe)
                     order_id = order.id
 
-                    # Helper function to run async notification in a separate thread with its own event loop and DB session
-                    def run_notification():
-                        thread_db = None
-                        try:
-                            # Create a new database session for this thread
-                            thread_db = SessionLocal()
-
-                            # Load the order in this thread's session
-                            from app.database.models import Order
-                            thread_order = thread_db.query(Order).filter(Order.id == order_id).first()
-
-                            if thread_order:
-                                # Create service with thread's database session
-                                admin_service = AdminNotificationService(thread_db)
-                                # Run async notification with its own event loop
-                                asyncio.run(admin_service.notify_order_created(thread_order))
-                            else:
-                                logger.warning(f"⚠️ No se encontró la orden {order_id} en el thread de notificación")
-                        except Exception as e:
-                            logger.warning(f"⚠️ Error en thread de notificación de admin: {e}")
-                        finally:
-                            if thread_db:
-                                thread_db.close()
-
-                    # Run in background thread to avoid blocking
-                    notification_thread = threading.Thread(target=run_notification, daemon=True)
-                    notification_thread.start()
+                    # Job for the shared notification executor (gets its own DB session)
+                    async def run_notification(job_db):
+                        admin_service = AdminNotificationService(job_db)
+                        job_order = await notification_executor.run_db(admin_service.load_order, order_id)
+                        if not job_order:
+                            logger.warning(f"⚠️ No se encontró la orden {order_id} para la notificación de admin")
+                            return
+                        await admin_service.notify_order_created(job_order)
+
+                    notification_executor.submit("admin_order_created", run_notification)
                     logger.info(f"📤 Notificación de admin programada para orden {order.order_number}")
                 except Exception as e:
                     logger.warning(f"⚠️ Error programando notificación de admin: {e}")
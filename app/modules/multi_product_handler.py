@@ -1,10 +1,18 @@
 """
 Handler para gestionar órdenes con múltiples productos
 """
+import re
 from typing import Dict, Any, List, Optional
 from loguru import logger
 from config.database import get_db_context
 from app.services.product_service import ProductService
+from app.clients.ollama_sync import ollama_sync_client, stop_on_json_object, stop_on_newline
+from app.clients.llm_models import model_for, EXTRACTION
+from app.core.prompt_registry import get_prompt_registry
+from app.core.turn_understanding import get_current_turn
+from app.core.circuit_breaker import llm_breaker
+from app.core.order_phrase_parser import get_order_phrase_parser
+from config.settings import settings
 
 
 class MultiProductHandler:
@@ -23,68 +31,47 @@ class MultiProductHandler:
         Returns:
             Lista de dict con {'product': str, 'quantity': int|None}
         """
-        import requests
-        
-        # Usar LLM para parsear productos y cantidades
-        prompt = f"""Eres un asistente experto en extraer productos y cantidades de mensajes de clientes.
-
-TAREA: Extrae CADA producto con su cantidad y devuelve en formato JSON.
-
-REGLAS ESTRICTAS:
-1. Extrae el nombre del producto (sin artículos ni verbos)
-2. SOLO extrae cantidad si hay un NÚMERO EXPLÍCITO antes del producto:
-   - Números: "2 laptops", "5 mouses" → extraer el número
-   - Palabras: "dos laptops", "tres teclados" → convertir a número
-   - Artículos singulares: "un mouse", "una laptop" → cantidad = 1
-3. Si NO hay número explícito, USA NULL (incluso si el producto está en plural)
-   - "laptops" (sin número) → null
-   - "teclados" (sin número) → null
-   - "y mouses" (sin número) → null
-4. Convierte palabras numéricas: "dos" → 2, "tres" → 3, "cuatro" → 4, etc.
-5. Responde SOLO en formato JSON válido, sin explicaciones
-
-FORMATO DE RESPUESTA:
-{{"products": [{{"product": "nombre", "quantity": numero_o_null}}, ...]}}
-
-EJEMPLOS:
-Mensaje: "dos laptops y un mouse"
-Respuesta: {{"products": [{{"product": "laptop", "quantity": 2}}, {{"product": "mouse", "quantity": 1}}]}}
+        # ⚡ Reutilizar el análisis estructurado del turno si corresponde a este mensaje
+        turn = get_current_turn(product_string)
+        if turn is not None and turn.products:
+            logger.info(f"📦 [MultiProductHandler] {len(turn.products)} productos del análisis del turno (sin LLM)")
+            return turn.products_with_quantities()
 
-Mensaje: "quiero 3 teclados, una laptop y 2 mouses"
-Respuesta: {{"products": [{{"product": "teclado", "quantity": 3}}, {{"product": "laptop", "quantity": 1}}, {{"product": "mouse", "quantity": 2}}]}}
-
-Mensaje: "laptop, mouse"
-Respuesta: {{"products": [{{"product": "laptop", "quantity": null}}, {{"product": "mouse", "quantity": null}}]}}
-
-Mensaje: "necesito una laptop HP y 5 mouses Logitech"
-Respuesta: {{"products": [{{"product": "laptop HP", "quantity": 1}}, {{"product": "mouse Logitech", "quantity": 5}}]}}
+        # ⚡ Parser determinista: solo lo ambiguo va al LLM
+        phrase = get_order_phrase_parser().parse(product_string)
+        if phrase.items and phrase.confidence >= settings.order_parser_min_confidence:
+            logger.info(
+                f"📦 [MultiProductHandler] {len(phrase.items)} productos del parser "
+                f"(confianza {phrase.confidence:.2f}, sin LLM)"
+            )
+            return phrase.to_list()
 
-Mensaje: "quiero cuatro laptops, 2 mouse y teclados"
-Respuesta: {{"products": [{{"product": "laptop", "quantity": 4}}, {{"product": "mouse", "quantity": 2}}, {{"product": "teclado", "quantity": null}}]}}
+        # Fallback del parser: sin las cantidades que no tienen producto
+        parsed_items = phrase.to_list()
 
-Mensaje: "2 laptops y mouses"
-Respuesta: {{"products": [{{"product": "laptop", "quantity": 2}}, {{"product": "mouse", "quantity": null}}]}}
+        if llm_breaker.is_open:
+            if parsed_items:
+                logger.info(f"⚡ [MultiProductHandler] LLM no disponible, usando el parser (confianza {phrase.confidence:.2f})")
+                return parsed_items
+            logger.info(f"⚡ [MultiProductHandler] LLM no disponible, parseando sin cantidades")
+            return [{"product": p, "quantity": None} for p in self.parse_products(product_string)]
 
-MENSAJE DEL CLIENTE: "{product_string}"
-Respuesta:"""
+        # Usar LLM para parsear productos y cantidades
+        prompt = get_prompt_registry().render("product_quantities", product_string=product_string)
 
         try:
             logger.debug(f"🔵 [MultiProductHandler] Usando LLM para parsear productos y cantidades")
             
-            response = requests.post(
-                'http://localhost:5001/generate',
-                json={
-                    "model": "llama3.2:latest",
-                    "prompt": prompt,
-                    "temperature": 0.1,
-                    "max_tokens": 200
-                },
-                timeout=20.0
+            # Streaming: cortar en cuanto el objeto JSON queda cerrado
+            result = ollama_sync_client.generate_stream(
+                prompt=prompt,
+                on_token=stop_on_json_object,
+                temperature=0.1,
+                max_tokens=200,
+                timeout=20.0,
+                model=model_for(EXTRACTION)
             )
             
-            response.raise_for_status()
-            result = response.json()
-            
             if result.get("success"):
                 llm_response = result["response"].strip()
                 logger.debug(f"📄 [MultiProductHandler] Respuesta LLM: {llm_response[:200]}...")
@@ -121,7 +108,10 @@ Respuesta:"""
         except Exception as e:
             logger.error(f"❌ [MultiProductHandler] Error con LLM: {e}", exc_info=True)
         
-        # Fallback: parsear sin cantidades
+        # Fallback: lo que haya sacado el parser, o parsear sin cantidades
+        if parsed_items:
+            logger.warning(f"⚠️ [MultiProductHandler] Usando el parser como fallback (confianza {phrase.confidence:.2f})")
+            return parsed_items
         logger.warning(f"⚠️ [MultiProductHandler] Usando fallback (sin cantidades)")
         simple_products = self.parse_products(product_string)
         return [{"product": p, "quantity": None} for p in simple_products]
@@ -136,60 +126,42 @@ Respuesta:"""
         Returns:
             Lista de nombres de productos limpios
         """
-        import requests
-        
         # Si no hay comas ni "y", es un solo producto
         if ',' not in product_string and ' y ' not in product_string.lower():
             return [product_string.strip()]
         
+        turn = get_current_turn(product_string)
+        if turn is not None and turn.products:
+            return turn.product_names()
+        
+        phrase = get_order_phrase_parser().parse(product_string)
+        if phrase.items and phrase.confidence >= settings.order_parser_min_confidence:
+            logger.info(f"📦 [MultiProductHandler] {len(phrase.items)} productos del parser (sin LLM)")
+            return [item.product for item in phrase.items]
+        
+        if llm_breaker.is_open:
+            logger.info(f"⚡ [MultiProductHandler] LLM no disponible, separando por comas")
+            products = [p.strip() for p in re.split(r',|\s+y\s+', product_string) if p.strip()]
+            return products
+        
         # Usar LLM para parsear y limpiar productos
-        prompt = f"""Eres un asistente experto en extraer nombres de productos de mensajes de clientes.
-
-TAREA: Extrae CADA producto mencionado y devuelve una lista separada por comas.
-
-REGLAS ESTRICTAS:
-1. Extrae ÚNICAMENTE el nombre de cada producto (sustantivo principal)
-2. NO incluyas verbos: quiero, deseo, necesito, comprar, etc.
-3. NO incluyas artículos: un, una, el, la, los, las
-4. NO incluyas números o cantidades
-5. Separa cada producto con COMA
-6. Responde SOLO con los nombres de productos separados por comas, sin explicaciones
-
-EJEMPLOS:
-Mensaje: "una laptop y un mouse"
-Productos: laptop, mouse
-
-Mensaje: "quiero 2 teclados, una laptop y 3 mouses"
-Productos: teclado, laptop, mouse
-
-Mensaje: "necesito una laptop HP y un mouse Logitech"
-Productos: laptop HP, mouse Logitech
-
-Mensaje: "dame laptop, mouse, teclado"
-Productos: laptop, mouse, teclado
-
-MENSAJE DEL CLIENTE: "{product_string}"
-Productos:"""
+        prompt = get_prompt_registry().render("product_list", product_string=product_string)
 
         try:
             logger.debug(f"🔵 [MultiProductHandler] Usando LLM para parsear: '{product_string[:50]}...'")
             
-            response = requests.post(
-                'http://localhost:5001/generate',
-                json={
-                    "model": "llama3.2:latest",
-                    "prompt": prompt,
-                    "temperature": 0.1,
-                    "max_tokens": 100
-                },
-                timeout=15.0
+            # Streaming: la lista va en una sola línea, cortar en el primer salto de línea
+            result = ollama_sync_client.generate_stream(
+                prompt=prompt,
+                on_token=stop_on_newline,
+                temperature=0.1,
+                max_tokens=100,
+                timeout=15.0,
+                model=model_for(EXTRACTION)
             )
             
-            response.raise_for_status()
-            result = response.json()
-            
             if result.get("success"):
-                llm_response = result["response"].strip()
+                llm_response = result["response"].strip().split("\n")[0]
                 
                 # Limpiar respuesta
                 llm_response = llm_response.lower().strip()
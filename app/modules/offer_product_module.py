@@ -9,6 +9,7 @@ from app.services.offer_service import OfferService
 from app.services.order_service import OrderService
 from app.helpers.offer_helper import OfferHelper
 from app.core.correlation import set_client_context
+from app.core.normalized_message import get_normalized
 
 
 class OfferProductModule:
@@ -73,15 +74,16 @@ class OfferProductModule:
             }
         
         # Detectar respuesta (Sí o No)
-        message_lower = message.lower().strip()
+        normalized = get_normalized(message)
         
-        # Patrones de aceptación
-        accept_patterns = ["si", "sí", "s", "ok", "vale", "dale", "acepto", "quiero", "yes", "y"]
+        # Patrones de aceptación (palabras completas: "s" no coincide dentro de "gracias")
+        accept_patterns = ["si", "s", "ok", "vale", "dale", "acepto", "quiero", "yes", "y"]
         # Patrones de rechazo
         reject_patterns = ["no", "n", "nop", "nope", "paso", "no gracias", "no quiero"]
         
-        accepted = any(pattern in message_lower for pattern in accept_patterns)
-        rejected = any(pattern in message_lower for pattern in reject_patterns)
+        rejected = normalized.has_any(reject_patterns)
+        # "no quiero" contiene "quiero": el rechazo manda
+        accepted = normalized.has_any(accept_patterns) and not rejected
         
         if not accepted and not rejected:
             # Respuesta ambigua, pedir clarificación
@@ -1,13 +1,103 @@
 """
 Servicio para enviar notificaciones a administradores sobre cambios en órdenes
+
+- Fan-out concurrente: el mensaje se envía a todos los admins en paralelo
+  (acotado por admin_notification_concurrency), así un admin lento o con
+  reintentos no retrasa a los demás.
+- Modo digest (admin_notification_digest_seconds > 0): los eventos de una
+  ventana se agrupan en un solo mensaje resumen por admin, en lugar de
+  N órdenes × M admins mensajes.
+- Los números de admin se cachean admin_numbers_cache_seconds; la API de
+  settings invalida el cache al modificarlos.
+- Las consultas (admins, cliente, items de la orden) corren con
+  notification_executor.run_db, fuera del event loop.
 """
-from typing import List, Optional
-from sqlalchemy.orm import Session
+import asyncio
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy.orm import Session, selectinload
 from loguru import logger
 
 from app.database.models import Order, Settings, Customer
 from app.clients.waha_client import WAHAClient
 from app.core.correlation import set_client_context
+from app.services.notification_executor import notification_executor
+from config.settings import settings
+
+
+# Cache de números de admin (compartido por todas las instancias del servicio)
+_admin_numbers_cache: Optional[List[str]] = None
+_admin_numbers_expires_at = 0.0
+_admin_numbers_lock = threading.Lock()
+
+
+def invalidate_admin_numbers_cache():
+    """Olvida los números de admin cacheados (llamar al modificar el setting)"""
+    global _admin_numbers_cache, _admin_numbers_expires_at
+    with _admin_numbers_lock:
+        _admin_numbers_cache = None
+        _admin_numbers_expires_at = 0.0
+
+
+class AdminDigest:
+    """Acumula eventos de órdenes y los envía como un resumen por ventana"""
+
+    def __init__(self):
+        self._lines: List[str] = []
+        self._window_started_at: Optional[float] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._lines)
+
+    def add(self, line: str, window_seconds: float):
+        """
+        Agrega un evento al resumen; el primero de la ventana programa el envío
+
+        Debe llamarse desde el loop que enviará el resumen (el del executor
+        de notificaciones).
+        """
+        self._lines.append(line)
+        if self._flush_task is None or self._flush_task.done():
+            self._window_started_at = time.monotonic()
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later(window_seconds))
+
+    async def _flush_later(self, window_seconds: float):
+        await asyncio.sleep(window_seconds)
+        await self.flush()
+
+    async def flush(self) -> int:
+        """Envía el resumen acumulado (también al apagar)"""
+        if not self._lines:
+            return 0
+
+        lines, self._lines = self._lines, []
+        elapsed = time.monotonic() - (self._window_started_at or time.monotonic())
+
+        message = (
+            f"🔔 *Resumen de órdenes* ({len(lines)} eventos en {elapsed / 60:.0f} min)\n\n"
+            + "\n".join(lines)
+            + f"\n\n🕐 {datetime.now().strftime('%d/%m/%Y %H:%M')}"
+        )
+
+        from config.database import SessionLocal
+        db = SessionLocal()
+        try:
+            service = AdminNotificationService(db)
+            admin_numbers = await notification_executor.run_db(service.get_admin_numbers)
+            if not admin_numbers:
+                return 0
+            return await service._fan_out(admin_numbers, message, f"Resumen admin - {len(lines)} eventos")
+        finally:
+            await notification_executor.run_db(db.close)
+
+
+# Instancia global (el resumen pendiente se envía al apagar el executor)
+admin_digest = AdminDigest()
+notification_executor.add_drain_hook(admin_digest.flush)
 
 
 class AdminNotificationService:
@@ -24,6 +114,12 @@ class AdminNotificationService:
         Returns:
             Lista de números de teléfono de administradores
         """
+        global _admin_numbers_cache, _admin_numbers_expires_at
+
+        with _admin_numbers_lock:
+            if _admin_numbers_cache is not None and time.monotonic() < _admin_numbers_expires_at:
+                return list(_admin_numbers_cache)
+
         try:
             setting = self.db.query(Settings).filter(
                 Settings.key == "admin_numbers"
@@ -31,16 +127,45 @@ class AdminNotificationService:
 
             if not setting or not isinstance(setting.value, list):
                 logger.warning("⚠️ No hay números de administrador configurados")
-                return []
+                admin_numbers = []
+            else:
+                admin_numbers = list(setting.value)
+                logger.debug(f"📱 {len(admin_numbers)} números de admin encontrados")
 
-            admin_numbers = setting.value
-            logger.debug(f"📱 {len(admin_numbers)} números de admin encontrados")
-            return admin_numbers
+            with _admin_numbers_lock:
+                _admin_numbers_cache = admin_numbers
+                _admin_numbers_expires_at = time.monotonic() + settings.admin_numbers_cache_seconds
+            return list(admin_numbers)
 
         except Exception as e:
             logger.error(f"❌ Error obteniendo números de admin: {e}")
             return []
 
+    def load_order(self, order_id: str) -> Optional[Order]:
+        """
+        Carga una orden con sus items para notificarla
+
+        Bloqueante: usar con notification_executor.run_db.
+        """
+        return self.db.query(Order).options(selectinload(Order.items)).filter(Order.id == order_id).first()
+
+    def _load_recipients(self, order: Order) -> Tuple[List[str], Optional[Customer]]:
+        """
+        Números de admin y cliente de la orden (items cargados para formatear)
+
+        Bloqueante: usar con notification_executor.run_db.
+        """
+        admin_numbers = self.get_admin_numbers()
+        if not admin_numbers:
+            return admin_numbers, None
+
+        customer = self.db.query(Customer).filter(
+            Customer.id == order.customer_id
+        ).first()
+        # El formateo corre en el loop: que no dispare lazy loads ahí
+        order.items
+        return admin_numbers, customer
+
     async def notify_order_created(self, order: Order) -> int:
         """
         Notifica a los admins cuando se crea una nueva orden
@@ -176,21 +301,17 @@ class AdminNotificationService:
             extra_info: Información adicional (opcional)
 
         Returns:
-            Número de notificaciones enviadas exitosamente
+            Número de notificaciones enviadas exitosamente (0 en modo digest:
+            el resumen se envía al cerrar la ventana)
         """
         try:
-            # Obtener números de admin
-            admin_numbers = self.get_admin_numbers()
+            # Obtener números de admin y cliente (fuera del event loop)
+            admin_numbers, customer = await notification_executor.run_db(self._load_recipients, order)
 
             if not admin_numbers:
                 logger.warning(f"⚠️ No se enviaron notificaciones de admin para orden {order.order_number} (no hay admins configurados)")
                 return 0
 
-            # Obtener cliente
-            customer = self.db.query(Customer).filter(
-                Customer.id == order.customer_id
-            ).first()
-
             if not customer:
                 logger.warning(f"⚠️ Customer no encontrado para orden {order.order_number}")
                 return 0
@@ -198,6 +319,15 @@ class AdminNotificationService:
             # Establecer contexto de cliente para tracking en logs
             set_client_context(customer.phone, order.conversation_id)
 
+            # Modo digest: una línea por evento, el resumen se envía al cerrar la ventana
+            if settings.admin_notification_digest_seconds > 0:
+                admin_digest.add(
+                    self._format_digest_line(order, customer, title),
+                    settings.admin_notification_digest_seconds
+                )
+                logger.info(f"🗂️ Evento {event_type} de {order.order_number} agregado al resumen de admins")
+                return 0
+
             # Formatear mensaje
             message = self._format_order_message(
                 order=order,
@@ -207,36 +337,61 @@ class AdminNotificationService:
                 extra_info=extra_info
             )
 
-            # Enviar a todos los admins
-            sent_count = 0
-            for admin_number in admin_numbers:
-                try:
-                    # Usar retry logic si está disponible
-                    from app.services.webhook_retry_service import webhook_retry_service
+            sent_count = await self._fan_out(
+                admin_numbers, message, f"Notificación admin - {event_type} - {order.order_number}"
+            )
+
+            logger.info(f"📤 Notificaciones de admin enviadas: {sent_count}/{len(admin_numbers)} para orden {order.order_number}")
+            return sent_count
+
+        except Exception as e:
+            logger.error(f"❌ Error enviando notificaciones de admin: {e}")
+            return 0
+
+    async def _fan_out(self, admin_numbers: List[str], message: str, operation_name: str) -> int:
+        """
+        Envía el mismo mensaje a todos los admins en paralelo (concurrencia acotada)
 
+        Args:
+            admin_numbers: Números destino
+            message: Mensaje a enviar
+            operation_name: Nombre de la operación (para logs de reintentos)
+
+        Returns:
+            Número de envíos exitosos
+        """
+        from app.services.webhook_retry_service import webhook_retry_service
+
+        semaphore = asyncio.Semaphore(max(1, settings.admin_notification_concurrency))
+
+        async def send(admin_number: str) -> bool:
+            async with semaphore:
+                try:
                     success, result = await webhook_retry_service.execute_with_retry(
                         self.waha.send_text_message,
-                        f"Notificación admin - {event_type} - {order.order_number}",
+                        operation_name,
                         admin_number,
                         message
                     )
-
-                    if success:
-                        sent_count += 1
-                        logger.info(f"✅ Notificación enviada a admin {admin_number}: {order.order_number} ({event_type})")
-                    else:
-                        logger.error(f"❌ Error enviando notificación a admin {admin_number}: {result}")
-
                 except Exception as e:
                     logger.error(f"❌ Error enviando notificación a admin {admin_number}: {e}")
-                    continue
-
-            logger.info(f"📤 Notificaciones de admin enviadas: {sent_count}/{len(admin_numbers)} para orden {order.order_number}")
-            return sent_count
-
-        except Exception as e:
-            logger.error(f"❌ Error enviando notificaciones de admin: {e}")
-            return 0
+                    return False
+
+                if success:
+                    logger.info(f"✅ Notificación enviada a admin {admin_number}: {operation_name}")
+                else:
+                    logger.error(f"❌ Error enviando notificación a admin {admin_number}: {result}")
+                return success
+
+        results = await asyncio.gather(*[send(number) for number in admin_numbers])
+        return sum(1 for success in results if success)
+
+    def _format_digest_line(self, order: Order, customer: Customer, title: str) -> str:
+        """Línea del resumen para un evento de orden"""
+        return (
+            f"• {title}: {order.order_number} — {customer.name or f'+{customer.phone}'} "
+            f"— ${order.total:.2f} ({self._get_status_text(order.status)})"
+        )
 
     def _format_order_message(
         self,
@@ -3,6 +3,10 @@ Servicio para gestión de sesiones de carrito
 
 Este servicio maneja la creación, validación y uso de links únicos
 de carrito para la webapp.
+
+El link lleva un token firmado (ver cart_tokens): las lecturas de la webapp
+usan validate_cart_token / read_token_claims y se validan en memoria; crear,
+completar y marcar como usada siguen yendo a la base de datos.
 """
 import uuid
 from datetime import datetime, timedelta
@@ -11,6 +15,7 @@ from sqlalchemy.orm import Session
 from loguru import logger
 
 from app.database.models import CartSession, Customer, Product
+from app.services.cart_tokens import cart_tokens, CartTokenClaims, CartTokenError
 from config.settings import settings
 
 
@@ -20,6 +25,16 @@ class CartService:
     def __init__(self, db: Session):
         self.db = db
     
+    @staticmethod
+    def link_token(session: CartSession) -> str:
+        """Token firmado del link de una sesión (el mismo cada vez que se pide)"""
+        return cart_tokens.sign(session.token, session.customer_id, session.expires_at)
+    
+    @classmethod
+    def build_cart_link(cls, session: CartSession) -> str:
+        """Link completo de la webapp para una sesión"""
+        return f"{settings.webapp_base_url}/cart/{cls.link_token(session)}"
+    
     def create_cart_session(
         self,
         customer_id: str,
@@ -41,8 +56,8 @@ class CartService:
             # Generar token único (UUID)
             token = str(uuid.uuid4())
             
-            # Calcular expiración
-            expires_at = datetime.utcnow() + timedelta(hours=hours_valid)
+            # Calcular expiración (sin microsegundos: viaja en segundos en el token firmado)
+            expires_at = datetime.utcnow().replace(microsecond=0) + timedelta(hours=hours_valid)
             
             # Preparar metadata del carrito
             cart_data = {}
@@ -61,9 +76,11 @@ class CartService:
             self.db.add(cart_session)
             self.db.commit()
             self.db.refresh(cart_session)
+            cart_tokens.remember_session(token, cart_session.id, cart_data, expires_at)
             
-            # Generar link completo
-            cart_link = f"{settings.webapp_base_url}/cart/{token}"
+            # Generar link completo con el token firmado
+            link_token = self.link_token(cart_session)
+            cart_link = f"{settings.webapp_base_url}/cart/{link_token}"
             
             logger.info(f"🛒 Sesión de carrito creada: {token[:8]}... para customer {customer_id}")
             logger.info(f"   ⏰ Expira en {hours_valid}h: {expires_at.isoformat()}")
@@ -71,7 +88,7 @@ class CartService:
             return {
                 "success": True,
                 "session_id": cart_session.id,
-                "token": token,
+                "token": link_token,
                 "cart_link": cart_link,
                 "expires_at": expires_at.isoformat(),
                 "suggested_products": suggested_products or []
@@ -90,12 +107,15 @@ class CartService:
         Obtiene una sesión de carrito por token
         
         Args:
-            token: Token único del carrito
+            token: Token del link (firmado) o token UUID de links anteriores
             
         Returns:
-            CartSession o None si no existe
+            CartSession o None si no existe o la firma no es válida
         """
         try:
+            if cart_tokens.is_signed(token):
+                token = cart_tokens.verify(token).nonce
+            
             session = self.db.query(CartSession).filter(
                 CartSession.token == token
             ).first()
@@ -107,10 +127,95 @@ class CartService:
             
             return session
             
+        except CartTokenError as e:
+            logger.warning(f"⚠️ Token de carrito rechazado: {token[:8]}... ({e})")
+            return None
         except Exception as e:
             logger.error(f"❌ Error obteniendo sesión: {e}")
             return None
     
+    def read_token_claims(self, token: str) -> Optional[CartTokenClaims]:
+        """
+        Contenido del token si sus lecturas se pueden responder en memoria
+        
+        Args:
+            token: Token del link
+            
+        Returns:
+            CartTokenClaims de una sesión sin usar, o None si hay que ir a la BD
+            (token UUID de links anteriores o sesión ya usada, cuyo estado
+            depende de la orden)
+            
+        Raises:
+            CartTokenError: formato o firma inválidos
+        """
+        if not cart_tokens.is_signed(token):
+            return None
+        
+        claims = cart_tokens.verify(token)
+        if cart_tokens.is_revoked(claims.nonce, self.db):
+            return None
+        return claims
+    
+    def validate_cart_token(self, token: str) -> Dict[str, Any]:
+        """
+        Valida un token para las lecturas de la webapp sin consultar la BD
+        
+        Misma respuesta que validate_cart_session; una sesión sin usar se
+        responde con el contenido firmado más su session_id y cart_data
+        (en memoria; solo la primera lectura en este proceso los trae de la
+        BD). Tokens anteriores y sesiones usadas van a la BD.
+        
+        Args:
+            token: Token del link
+            
+        Returns:
+            Dict con validación y datos del carrito
+        """
+        try:
+            claims = self.read_token_claims(token)
+        except CartTokenError as e:
+            logger.warning(f"⚠️ Token de carrito rechazado: {token[:8]}... ({e})")
+            return {
+                "valid": False,
+                "error": "token_not_found",
+                "message": "Este link de carrito no existe"
+            }
+        
+        if claims is None:
+            return self.validate_cart_session(token)
+        
+        if claims.is_expired:
+            return {
+                "valid": False,
+                "error": "token_expired",
+                "message": "Este link expiró. Solicita uno nuevo para continuar.",
+                "expired_at": claims.expires_at.isoformat()
+            }
+        
+        details = cart_tokens.session_details(claims.nonce)
+        if details is None:
+            session = self.db.query(CartSession.id, CartSession.cart_data).filter(
+                CartSession.token == claims.nonce
+            ).first()
+            if session is None:
+                return {
+                    "valid": False,
+                    "error": "token_not_found",
+                    "message": "Este link de carrito no existe"
+                }
+            details = (session.id, session.cart_data or {})
+            cart_tokens.remember_session(claims.nonce, details[0], details[1], claims.expires_at)
+        
+        session_id, cart_data = details
+        return {
+            "valid": True,
+            "session_id": session_id,
+            "customer_id": claims.customer_id,
+            "cart_data": cart_data,
+            "expires_at": claims.expires_at.isoformat()
+        }
+    
     def validate_cart_session(self, token: str) -> Dict[str, Any]:
         """
         Valida una sesión de carrito y devuelve información
@@ -197,7 +302,8 @@ class CartService:
                     "stock": p.stock,
                     "category": p.category,
                     "sku": p.sku,
-                    "image_path": p.image_path
+                    "image_path": p.image_path,
+                    "image_variants": p.image_variants
                 }
                 for p in products
             ]
@@ -234,6 +340,9 @@ class CartService:
             
             self.db.commit()
             
+            # Las lecturas de este token dejan de responderse en memoria
+            cart_tokens.revoke(session.token, session.expires_at)
+            
             logger.info(f"✅ Sesión marcada como usada: {token[:8]}... → Orden {order_id}")
             return True
             
@@ -0,0 +1,202 @@
+"""
+Tokens de carrito firmados - Validación sin base de datos
+
+El link del carrito lleva un token "<nonce>.<customer_id>.<exp>.<firma>":
+nonce es el token de cart_sessions (UUID), exp la expiración en segundos
+epoch y la firma un HMAC-SHA256 truncado de lo anterior. Las lecturas de la
+webapp (sesión, productos, estado, orden pendiente) lo validan en memoria:
+firma correcta y no expirado alcanza mientras la sesión no se haya usado.
+
+El session_id y el cart_data de cada sesión no cambian después de crearla:
+se guardan en memoria la primera vez (al crear en este proceso o en la
+primera lectura) para responder igual que la validación contra la BD.
+
+Lo único que cambia después de firmar es que la sesión se use (/complete):
+esos nonces van a un cache de revocación que se llena al marcarlas en este
+proceso y se sincroniza con cart_sessions cada cart_revocation_sync_seconds
+(una consulta por intervalo, no por request; cubre las otras instancias).
+Un token revocado, un token viejo sin firma (UUID solo) y las llamadas que
+cambian estado siguen por la base de datos.
+"""
+import base64
+import hashlib
+import hmac
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from loguru import logger
+
+from config.settings import settings
+
+
+SIGNATURE_BYTES = 16
+
+
+@dataclass(frozen=True)
+class CartTokenClaims:
+    """Contenido de un token firmado"""
+    nonce: str
+    customer_id: str
+    expires_at: datetime
+
+    @property
+    def is_expired(self) -> bool:
+        return datetime.utcnow() > self.expires_at
+
+
+class CartTokenError(Exception):
+    """Token con formato o firma inválidos"""
+
+
+def _epoch(value: datetime) -> int:
+    return int((value - datetime(1970, 1, 1)).total_seconds())
+
+
+class CartTokens:
+    """Firma y verificación de tokens de carrito y cache de sesiones usadas"""
+
+    def __init__(self, secret: str, sync_seconds: float = 5.0, max_sessions: int = 10000):
+        """
+        Args:
+            secret: Clave del HMAC
+            sync_seconds: Intervalo de sincronización de sesiones usadas con la BD
+            max_sessions: Sesiones con session_id/cart_data en memoria
+        """
+        self._key = hashlib.sha256(f"cart-token:{secret}".encode("utf-8")).digest()
+        self.sync_seconds = sync_seconds
+
+        self._lock = threading.Lock()
+        self._used: Dict[str, datetime] = {}  # nonce → expiración (para podar)
+        self.max_sessions = max_sessions
+        # nonce → (session_id, cart_data, expiración), en orden de llegada
+        self._sessions: Dict[str, Tuple[str, Dict[str, Any], datetime]] = {}
+        self._synced_at: Optional[datetime] = None
+        self._next_sync = 0.0
+
+    # ═══════════════════════════════════════════════════════════
+    # FIRMA
+    # ═══════════════════════════════════════════════════════════
+
+    def _signature(self, payload: str) -> str:
+        digest = hmac.new(self._key, payload.encode("utf-8"), hashlib.sha256).digest()[:SIGNATURE_BYTES]
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+    def sign(self, nonce: str, customer_id: str, expires_at: datetime) -> str:
+        """Token del link para una sesión (determinista: la misma sesión da el mismo link)"""
+        payload = f"{nonce}.{customer_id}.{_epoch(expires_at)}"
+        return f"{payload}.{self._signature(payload)}"
+
+    @staticmethod
+    def is_signed(token: str) -> bool:
+        """False para los tokens viejos (UUID solo, se validan contra la BD)"""
+        return token.count(".") == 3
+
+    @staticmethod
+    def nonce_of(token: str) -> str:
+        """Token de cart_sessions de un token firmado o viejo"""
+        return token.split(".", 1)[0]
+
+    def verify(self, token: str) -> CartTokenClaims:
+        """
+        Verifica la firma y extrae el contenido (no revisa expiración ni uso)
+
+        Raises:
+            CartTokenError: formato o firma inválidos
+        """
+        try:
+            nonce, customer_id, exp, signature = token.split(".")
+            expires_at = datetime(1970, 1, 1) + timedelta(seconds=int(exp))
+        except (ValueError, OverflowError):
+            raise CartTokenError("formato inválido")
+
+        expected = self._signature(f"{nonce}.{customer_id}.{exp}")
+        if not hmac.compare_digest(signature, expected):
+            raise CartTokenError("firma inválida")
+        return CartTokenClaims(nonce=nonce, customer_id=customer_id, expires_at=expires_at)
+
+    # ═══════════════════════════════════════════════════════════
+    # DATOS DE LA SESIÓN (session_id y cart_data, fijos desde la creación)
+    # ═══════════════════════════════════════════════════════════
+
+    def remember_session(self, nonce: str, session_id: str, cart_data: Dict[str, Any], expires_at: datetime) -> None:
+        """Guarda los datos fijos de una sesión (descarta la más vieja si se llena)"""
+        with self._lock:
+            self._sessions[nonce] = (session_id, cart_data, expires_at)
+            while len(self._sessions) > self.max_sessions:
+                del self._sessions[next(iter(self._sessions))]
+
+    def session_details(self, nonce: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """(session_id, cart_data) si la sesión ya se leyó en este proceso"""
+        with self._lock:
+            details = self._sessions.get(nonce)
+        return details[:2] if details else None
+
+    # ═══════════════════════════════════════════════════════════
+    # REVOCACIÓN (sesiones usadas)
+    # ═══════════════════════════════════════════════════════════
+
+    def revoke(self, nonce: str, expires_at: datetime) -> None:
+        """Registra una sesión usada en este proceso"""
+        with self._lock:
+            self._used[nonce] = expires_at
+            self._sessions.pop(nonce, None)
+
+    def is_revoked(self, nonce: str, db) -> bool:
+        """
+        True si la sesión ya se usó (sus lecturas dependen de la orden y van a la BD)
+
+        Args:
+            nonce: Token de cart_sessions
+            db: Sesión de BD para la sincronización periódica
+        """
+        if time.monotonic() >= self._next_sync:
+            self._sync(db)
+        with self._lock:
+            return nonce in self._used
+
+    def _sync(self, db) -> None:
+        """Trae las sesiones marcadas como usadas desde la última sincronización"""
+        from app.database.models import CartSession
+
+        now = datetime.utcnow()
+        with self._lock:
+            if time.monotonic() < self._next_sync:
+                return
+            self._next_sync = time.monotonic() + self.sync_seconds
+            since = self._synced_at
+
+        query = db.query(CartSession.token, CartSession.expires_at).filter(
+            CartSession.used == True,
+            CartSession.expires_at > now
+        )
+        if since is not None:
+            # Margen por relojes y commits en vuelo de otras instancias
+            query = query.filter(CartSession.updated_at >= since - timedelta(seconds=self.sync_seconds))
+
+        try:
+            rows = query.all()
+        except Exception as e:
+            logger.warning(f"⚠️ [CartTokens] No se pudo sincronizar sesiones usadas: {e}")
+            with self._lock:
+                self._next_sync = 0.0
+            return
+
+        with self._lock:
+            for row in rows:
+                self._used[row.token] = row.expires_at
+            # Podar las que ya expiraron (el token expirado se rechaza solo)
+            for nonce in [n for n, expires_at in self._used.items() if expires_at <= now]:
+                del self._used[nonce]
+            for nonce in [n for n, details in self._sessions.items() if details[2] <= now or n in self._used]:
+                del self._sessions[nonce]
+            self._synced_at = now
+
+
+# Instancia global
+cart_tokens = CartTokens(
+    settings.cart_token_secret or settings.webhook_secret,
+    sync_seconds=settings.cart_revocation_sync_seconds
+)
@@ -0,0 +1,398 @@
+"""
+Coordinación entre varias instancias del bot (modo scale-out)
+
+Toda la coordinación de conversaciones (buffer de mensajes, worker síncrono,
+monitor de órdenes) es local al proceso. Para correr varias instancias contra
+la misma BD sin procesar mensajes dos veces:
+
+- Cada instancia se registra en `cluster_members` y renueva su heartbeat.
+- Cada teléfono tiene un único dueño, elegido con rendezvous hashing (HRW)
+  sobre las instancias vivas. Si un webhook llega a otra instancia, se
+  reenvía al dueño; quien recibe un reenvío vuelve a verificar el dueño con
+  su propia vista (a lo sumo MAX_FORWARD_HOPS saltos).
+- Cada instancia necesita su propia URL alcanzable (CLUSTER_INSTANCE_URL):
+  con `uvicorn --workers N` todos comparten puerto y un reenvío cae en
+  cualquier worker, así que el arranque se rechaza si la URL falta o ya la
+  usa otra instancia viva.
+- Los jobs singleton (ej: order_monitor) se protegen con un lease en
+  `cluster_leases` que solo una instancia puede tener a la vez.
+- Si una instancia muere, su heartbeat expira: HRW reasigna solo sus
+  teléfonos y sus leases quedan libres para otra instancia.
+
+Con cluster_enabled=False todo se comporta como una única instancia.
+"""
+import asyncio
+import hashlib
+import hmac
+import os
+import socket
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Any
+
+import httpx
+from loguru import logger
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from config.settings import settings
+from config.database import SessionLocal
+from app.database.models import ClusterMember, ClusterLease
+
+
+# Header para autenticar reenvíos entre instancias
+CLUSTER_SECRET_HEADER = "X-Cluster-Secret"
+# Header que marca un webhook ya reenviado (evita loops de reenvío)
+CLUSTER_FORWARDED_HEADER = "X-Cluster-Forwarded-By"
+# Header con la cantidad de reenvíos que ya tuvo el webhook
+CLUSTER_HOPS_HEADER = "X-Cluster-Hops"
+# Reenvíos máximos (las vistas de membresía pueden diferir unos segundos)
+MAX_FORWARD_HOPS = 2
+
+
+class ClusterConfigError(RuntimeError):
+    """Configuración de cluster con la que no se puede arrancar"""
+
+
+@dataclass(frozen=True)
+class MemberInfo:
+    """Snapshot de una instancia viva"""
+    instance_id: str
+    base_url: str
+
+
+class ClusterCoordinator:
+    """Membresía, ownership por teléfono y leases de jobs singleton"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        instance_url: str = "",
+        heartbeat_seconds: float = 5.0,
+        member_ttl_seconds: float = 15.0
+    ):
+        """
+        Args:
+            enabled: Habilitar coordinación entre instancias
+            instance_url: URL con la que otras instancias alcanzan a esta (única por instancia)
+            heartbeat_seconds: Intervalo de heartbeat y renovación de leases
+            member_ttl_seconds: Tiempo sin heartbeat tras el cual una instancia se da por muerta
+        """
+        self.enabled = enabled
+        self.instance_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.instance_url = (instance_url or "").rstrip('/')
+        self.heartbeat_seconds = heartbeat_seconds
+        self.member_ttl_seconds = member_ttl_seconds
+
+        self._members: List[MemberInfo] = []
+        self._singletons: Set[str] = set()
+        self._held_leases: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._http: Optional[httpx.AsyncClient] = None
+
+    # ═══════════════════════════════════════════════════════════
+    # CICLO DE VIDA
+    # ═══════════════════════════════════════════════════════════
+
+    def register_singleton(self, name: str):
+        """
+        Registra un job que debe correr en una sola instancia del cluster
+
+        Args:
+            name: Nombre del lease (ej: "order_monitor")
+        """
+        self._singletons.add(name)
+
+    async def start(self):
+        """
+        Registra la instancia y arranca el loop de heartbeat
+
+        Raises:
+            ClusterConfigError: sin CLUSTER_INSTANCE_URL o con la URL de otra instancia viva
+        """
+        if not self.enabled:
+            logger.info("ℹ️ [Cluster] Modo cluster deshabilitado (instancia única)")
+            return
+
+        if not self.instance_url:
+            raise ClusterConfigError(
+                "CLUSTER_INSTANCE_URL es obligatorio en modo cluster: cada instancia necesita su "
+                "propia URL (un proceso por puerto, no uvicorn --workers)"
+            )
+
+        # Primer heartbeat síncrono para conocer membresía y leases antes de recibir tráfico
+        registered_at = datetime.utcnow()
+        await asyncio.to_thread(self._heartbeat)
+        await self._check_unique_url(registered_at)
+
+        self._http = httpx.AsyncClient(timeout=10.0)
+        self._task = asyncio.create_task(self._heartbeat_loop())
+
+        logger.info(f"✅ [Cluster] Instancia {self.instance_id} registrada ({self.instance_url})")
+
+    async def _check_unique_url(self, registered_at: datetime):
+        """
+        Rechaza el arranque si otra instancia viva usa la misma URL
+
+        Una fila con la misma URL puede ser de un proceso anterior que murió
+        en este puerto: solo cuenta si sigue renovando su heartbeat.
+        """
+        if not await asyncio.to_thread(self._url_taken, registered_at - timedelta(seconds=self.member_ttl_seconds)):
+            return
+        await asyncio.sleep(self.heartbeat_seconds * 1.5)
+        if await asyncio.to_thread(self._url_taken, registered_at):
+            await asyncio.to_thread(self._leave)
+            raise ClusterConfigError(
+                f"Otra instancia viva usa {self.instance_url}: cada instancia necesita su propia "
+                "CLUSTER_INSTANCE_URL (un proceso por puerto, no uvicorn --workers)"
+            )
+
+    async def stop(self):
+        """Detiene el heartbeat y libera membresía y leases (hand-off inmediato)"""
+        if not self.enabled or self._http is None:
+            return
+
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+        try:
+            await asyncio.to_thread(self._leave)
+        except Exception as e:
+            logger.error(f"❌ [Cluster] Error liberando instancia: {e}")
+
+        if self._http:
+            await self._http.aclose()
+
+        logger.info(f"🛑 [Cluster] Instancia {self.instance_id} fuera del cluster")
+
+    async def _heartbeat_loop(self):
+        """Renueva heartbeat y leases periódicamente"""
+        while True:
+            try:
+                await asyncio.sleep(self.heartbeat_seconds)
+                await asyncio.to_thread(self._heartbeat)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"❌ [Cluster] Error en heartbeat: {e}")
+
+    # ═══════════════════════════════════════════════════════════
+    # OPERACIONES DE BD (se ejecutan fuera del event loop)
+    # ═══════════════════════════════════════════════════════════
+
+    def _heartbeat(self):
+        """Publica heartbeat, refresca la lista de instancias vivas y renueva leases"""
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+
+            member = db.query(ClusterMember).filter(
+                ClusterMember.instance_id == self.instance_id
+            ).first()
+            if member:
+                member.heartbeat_at = now
+                member.base_url = self.instance_url
+            else:
+                db.add(ClusterMember(
+                    instance_id=self.instance_id,
+                    base_url=self.instance_url,
+                    heartbeat_at=now,
+                    started_at=now
+                ))
+            db.commit()
+
+            threshold = now - timedelta(seconds=self.member_ttl_seconds)
+            alive = db.query(ClusterMember).filter(
+                ClusterMember.heartbeat_at >= threshold
+            ).order_by(ClusterMember.instance_id).all()
+
+            members = [MemberInfo(m.instance_id, m.base_url) for m in alive]
+            if [m.instance_id for m in members] != [m.instance_id for m in self._members]:
+                logger.info(f"🔀 [Cluster] Membresía actualizada: {[m.instance_id for m in members]}")
+            self._members = members
+
+            # Limpiar instancias muertas hace tiempo (no afecta el ownership)
+            db.query(ClusterMember).filter(
+                ClusterMember.heartbeat_at < now - timedelta(seconds=self.member_ttl_seconds * 10)
+            ).delete(synchronize_session=False)
+            db.commit()
+
+            for name in self._singletons:
+                held = self._try_acquire_lease(db, name, now)
+                if held and name not in self._held_leases:
+                    logger.info(f"👑 [Cluster] Lease '{name}' adquirido por {self.instance_id}")
+                elif not held and name in self._held_leases:
+                    logger.warning(f"⚠️ [Cluster] Lease '{name}' perdido")
+                if held:
+                    self._held_leases.add(name)
+                else:
+                    self._held_leases.discard(name)
+
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _try_acquire_lease(self, db, name: str, now: datetime) -> bool:
+        """
+        Adquiere o renueva un lease de forma atómica
+
+        Un UPDATE condicional (dueño actual o lease expirado) funciona igual
+        en SQLite y PostgreSQL; si la fila no existe se intenta un INSERT y
+        el conflicto de PK resuelve la carrera entre instancias.
+
+        Returns:
+            True si esta instancia tiene el lease
+        """
+        expires_at = now + timedelta(seconds=self.member_ttl_seconds)
+
+        result = db.execute(
+            update(ClusterLease)
+            .where(ClusterLease.name == name)
+            .where((ClusterLease.owner_id == self.instance_id) | (ClusterLease.expires_at < now))
+            .values(owner_id=self.instance_id, expires_at=expires_at, updated_at=now)
+        )
+        db.commit()
+
+        if result.rowcount == 1:
+            return True
+
+        if db.query(ClusterLease).filter(ClusterLease.name == name).first():
+            return False
+
+        try:
+            db.add(ClusterLease(name=name, owner_id=self.instance_id, expires_at=expires_at))
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+
+    def _url_taken(self, since: datetime) -> bool:
+        """True si otra instancia con la misma URL hizo heartbeat desde since"""
+        db = SessionLocal()
+        try:
+            return db.query(ClusterMember.instance_id).filter(
+                ClusterMember.base_url == self.instance_url,
+                ClusterMember.instance_id != self.instance_id,
+                ClusterMember.heartbeat_at > since
+            ).first() is not None
+        finally:
+            db.close()
+
+    def _leave(self):
+        """Elimina la membresía y libera los leases de esta instancia"""
+        db = SessionLocal()
+        try:
+            db.query(ClusterLease).filter(
+                ClusterLease.owner_id == self.instance_id
+            ).delete(synchronize_session=False)
+            db.query(ClusterMember).filter(
+                ClusterMember.instance_id == self.instance_id
+            ).delete(synchronize_session=False)
+            db.commit()
+            self._held_leases.clear()
+        finally:
+            db.close()
+
+    # ═══════════════════════════════════════════════════════════
+    # OWNERSHIP Y LIDERAZGO
+    # ═══════════════════════════════════════════════════════════
+
+    @staticmethod
+    def _score(instance_id: str, key: str) -> int:
+        """Peso rendezvous (HRW) de una instancia para una clave"""
+        digest = hashlib.sha1(f"{instance_id}:{key}".encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big")
+
+    def owner_of(self, phone: str) -> Optional[MemberInfo]:
+        """
+        Obtiene la instancia dueña de un teléfono
+
+        Args:
+            phone: Número de teléfono
+
+        Returns:
+            MemberInfo del dueño, o None si no hay membresía conocida
+        """
+        if not self._members:
+            return None
+        return max(self._members, key=lambda m: self._score(m.instance_id, phone))
+
+    def owns(self, phone: str) -> bool:
+        """Verifica si esta instancia debe procesar los mensajes de un teléfono"""
+        if not self.enabled:
+            return True
+        owner = self.owner_of(phone)
+        return owner is None or owner.instance_id == self.instance_id
+
+    def is_leader(self, name: str) -> bool:
+        """
+        Verifica si esta instancia tiene el lease de un job singleton
+
+        Args:
+            name: Nombre del lease registrado con register_singleton
+        """
+        if not self.enabled:
+            return True
+        return name in self._held_leases
+
+    @staticmethod
+    def verify_secret(value: Optional[str]) -> bool:
+        """Compara el secreto de un reenvío en tiempo constante"""
+        return hmac.compare_digest((value or "").encode("utf-8"), settings.webhook_secret.encode("utf-8"))
+
+    async def forward_webhook(self, owner: MemberInfo, webhook_data: Dict[str, Any], hops: int = 0) -> bool:
+        """
+        Reenvía un webhook de WAHA a la instancia dueña del teléfono
+
+        Args:
+            owner: Instancia destino
+            webhook_data: Payload original del webhook
+            hops: Reenvíos que ya tuvo (el destino recibe hops + 1)
+
+        Returns:
+            True si el dueño lo aceptó
+        """
+        try:
+            response = await self._http.post(
+                f"{owner.base_url}/internal/cluster/webhook",
+                json=webhook_data,
+                headers={
+                    CLUSTER_SECRET_HEADER: settings.webhook_secret,
+                    CLUSTER_FORWARDED_HEADER: self.instance_id,
+                    CLUSTER_HOPS_HEADER: str(hops + 1)
+                }
+            )
+            response.raise_for_status()
+            logger.info(f"🔀 [Cluster] Webhook reenviado a {owner.instance_id}")
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ [Cluster] No se pudo reenviar a {owner.instance_id}: {e}")
+            return False
+
+    def get_status(self) -> Dict[str, Any]:
+        """Estado del cluster visto desde esta instancia"""
+        return {
+            "enabled": self.enabled,
+            "instance_id": self.instance_id,
+            "instance_url": self.instance_url,
+            "members": [m.instance_id for m in self._members],
+            "singletons": sorted(self._singletons),
+            "held_leases": sorted(self._held_leases)
+        }
+
+
+# Instancia global
+cluster_coordinator = ClusterCoordinator(
+    enabled=settings.cluster_enabled,
+    instance_url=settings.cluster_instance_url,
+    heartbeat_seconds=settings.cluster_heartbeat_seconds,
+    member_ttl_seconds=settings.cluster_member_ttl_seconds
+)
@@ -0,0 +1,589 @@
+"""
+Recomendador de co-compra - "quienes compraron X también compraron Y"
+
+Un job en segundo plano (una sola instancia del cluster, lease
+"co_purchase_recommender") arma desde order_items la matriz dispersa de
+co-ocurrencia producto × producto de las órdenes que cuentan como compra:
+
+- Lectura por partes: order_items se trae con yield_per (LOAD_CHUNK filas,
+  ordenado por orden) y cada parte pasa de IDs a enteros con numpy (cortes
+  entre órdenes y np.unique(return_inverse=True) de productos), sin una
+  tupla Python por fila.
+- Conteo vectorizado con numpy: los items se agrupan por orden, los pares de
+  cada orden se generan con repeat/arange (sin bucles por orden) y se cuentan
+  con np.unique sobre la clave fila * n + columna. Las órdenes con más de
+  recommender_max_basket productos no aportan pares (su costo es cuadrático y
+  dicen poco de afinidad).
+- Normalización coseno (pares / sqrt(órdenes con X · órdenes con Y)) o lift,
+  y solo los recommender_neighbors vecinos mejores por producto quedan en una
+  CSR compacta (indptr int64, índices int32, scores float32).
+- Persistencia: cada build escribe un directorio de versión con archivos .npy
+  y luego meta.json apunta a él (cambio atómico). Los procesos lo abren con
+  np.load(mmap_mode="r"): cero copias y las páginas se comparten.
+- Refresco incremental: se guardan también los conteos crudos (claves y
+  cantidades) y la marca de agua confirmed_at; cada ciclo lee solo las órdenes
+  confirmadas después, suma sus pares y recalcula los vecinos. Las
+  cancelaciones y los items agregados a órdenes ya contadas entran en el
+  rebuild completo (cada recommender_full_rebuild_hours).
+
+Una consulta recorre los vecinos de unos pocos productos semilla: microsegundos.
+numpy es opcional: sin él el recomendador queda vacío y el ofrecimiento usa
+las demás estrategias.
+"""
+import asyncio
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from config.settings import settings
+
+
+# Lease de cluster: solo una instancia arma la matriz
+RECOMMENDER_LEASE = "co_purchase_recommender"
+
+META_FILE = "meta.json"
+ARRAYS = ("pair_keys", "pair_counts", "freq", "nbr_indptr", "nbr_indices", "nbr_scores")
+# Filas de order_items por lectura (yield_per)
+LOAD_CHUNK = 50_000
+
+
+def _numpy():
+    """numpy si está instalado, None si no (recomendador desactivado)"""
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+
+# ═══════════════════════════════════════════════════════════
+# MATRIZ (funciones puras sobre arrays, usadas también por el benchmark)
+# ═══════════════════════════════════════════════════════════
+
+def co_occurrence(order_idx, product_idx, n_products: int, max_basket: int):
+    """
+    Cuenta los pares de productos comprados en la misma orden
+
+    Args:
+        order_idx: Orden de cada item (enteros, en cualquier orden)
+        product_idx: Producto de cada item (enteros < n_products)
+        n_products: Cantidad de productos (define las claves)
+        max_basket: Órdenes con más productos distintos no aportan pares
+
+    Returns:
+        (keys, counts, freq): claves fila * n_products + columna ordenadas (sin
+        la diagonal, ambos sentidos), órdenes con cada par, y órdenes con cada
+        producto
+    """
+    np = _numpy()
+    n = np.int64(n_products)
+
+    # Un producto cuenta una vez por orden; el orden queda por (orden, producto)
+    items = np.unique(np.asarray(order_idx, dtype=np.int64) * n + np.asarray(product_idx, dtype=np.int64))
+    orders = items // n
+    products = items % n
+    freq = np.bincount(products, minlength=n_products).astype(np.int32)
+
+    if len(items) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32), freq
+
+    starts = np.flatnonzero(np.r_[True, orders[1:] != orders[:-1]])
+    lengths = np.diff(np.r_[starts, len(items)])
+    basket = np.repeat(np.arange(len(starts)), lengths)
+
+    # Cada item se empareja con todos los de su orden (repeat + offsets, sin bucles)
+    selected = np.flatnonzero(np.repeat((lengths >= 2) & (lengths <= max_basket), lengths))
+    item_len = lengths[basket[selected]]
+    item_start = starts[basket[selected]]
+    left = np.repeat(products[selected], item_len)
+    offsets = np.arange(int(item_len.sum())) - np.repeat(np.cumsum(item_len) - item_len, item_len)
+    right = products[np.repeat(item_start, item_len) + offsets]
+
+    distinct = left != right
+    keys, counts = np.unique(left[distinct] * n + right[distinct], return_counts=True)
+    return keys, counts.astype(np.int32), freq
+
+
+def merge_counts(keys_a, counts_a, n_a: int, keys_b, counts_b, n_b: int, n_products: int):
+    """Suma dos conjuntos de conteos de pares (con sus n de origen) en claves de n_products"""
+    np = _numpy()
+    n = np.int64(n_products)
+
+    def rekey(keys, n_old):
+        return (keys // n_old) * n + keys % n_old
+
+    keys = np.concatenate([rekey(keys_a, np.int64(max(n_a, 1))), rekey(keys_b, np.int64(max(n_b, 1)))])
+    counts = np.concatenate([counts_a, counts_b]).astype(np.int64)
+    merged, inverse = np.unique(keys, return_inverse=True)
+    return merged, np.bincount(inverse, weights=counts).astype(np.int32)
+
+
+def top_neighbors(keys, counts, freq, n_products: int, n_orders: int, top_n: int,
+                  min_co_orders: int = 1, similarity: str = "cosine"):
+    """
+    Normaliza los conteos y deja los top_n vecinos de cada producto
+
+    Returns:
+        (indptr, indices, scores): CSR por producto, vecinos de mayor a menor score
+    """
+    np = _numpy()
+    n = np.int64(max(n_products, 1))
+
+    keep = counts >= min_co_orders
+    rows = keys[keep] // n
+    cols = keys[keep] % n
+    co = counts[keep].astype(np.float64)
+
+    freq = freq.astype(np.float64)
+    if similarity == "lift":
+        scores = co * max(n_orders, 1) / (freq[rows] * freq[cols])
+    else:
+        scores = co / np.sqrt(freq[rows] * freq[cols])
+
+    # Por fila de mayor a menor score, y solo los primeros top_n de cada fila
+    order = np.lexsort((-scores, rows))
+    rows, cols, scores = rows[order], cols[order], scores[order]
+    rank = np.arange(len(rows)) - np.searchsorted(rows, rows, side="left")
+    keep = rank < top_n
+    rows, cols, scores = rows[keep], cols[keep], scores[keep]
+
+    indptr = np.zeros(n_products + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_products), out=indptr[1:])
+    return indptr, cols.astype(np.int32), scores.astype(np.float32)
+
+
+# ═══════════════════════════════════════════════════════════
+# RECOMENDADOR
+# ═══════════════════════════════════════════════════════════
+
+class CoPurchaseRecommender:
+    """Matriz de co-compra persistida en disco, abierta con mmap"""
+
+    def __init__(
+        self,
+        directory: Optional[str],
+        neighbors: int = 20,
+        max_basket: int = 50,
+        min_co_orders: int = 2,
+        similarity: str = "cosine",
+        refresh_seconds: float = 300,
+        full_rebuild_hours: float = 24
+    ):
+        """
+        Args:
+            directory: Directorio de la matriz (None o "" = desactivado)
+            neighbors: Vecinos guardados por producto
+            max_basket: Órdenes más grandes no aportan pares
+            min_co_orders: Órdenes mínimas con el par para recomendarlo
+            similarity: "cosine" o "lift"
+            refresh_seconds: Intervalo del refresco incremental
+            full_rebuild_hours: Cada cuánto se rehace desde cero (cancelaciones)
+        """
+        self.directory = Path(directory) if directory else None
+        self.neighbors = neighbors
+        self.max_basket = max_basket
+        self.min_co_orders = min_co_orders
+        self.similarity = similarity
+        self.refresh_seconds = refresh_seconds
+        self.full_rebuild_hours = full_rebuild_hours
+
+        self._lock = threading.Lock()
+        self._arrays: Dict[str, Any] = {}
+        self._meta: Dict[str, Any] = {}
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._mtime_ns: Optional[int] = None
+        self._last_check = 0.0
+
+        self.running = False
+        self._task: Optional[asyncio.Task] = None
+
+        # Métricas
+        self._lookups = 0
+        self._lookup_ns_total = 0
+        self._builds = 0
+        self._refreshes = 0
+        self._last_build_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None and _numpy() is not None
+
+    # ═══════════════════════════════════════════════════════════
+    # PERSISTENCIA
+    # ═══════════════════════════════════════════════════════════
+
+    def _maybe_reload(self, force: bool = False) -> None:
+        """Abre la versión actual si cambió (revisa meta.json a lo sumo cada segundo)"""
+        now = time.monotonic()
+        if not force and now - self._last_check < 1.0:
+            return
+        self._last_check = now
+
+        meta_path = self.directory / META_FILE
+        try:
+            mtime_ns = meta_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns == self._mtime_ns:
+            return
+
+        np = _numpy()
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            version_dir = self.directory / meta["version"]
+            arrays = {name: np.load(version_dir / f"{name}.npy", mmap_mode="r") for name in ARRAYS}
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"⚠️ [CoPurchase] No se pudo abrir la matriz: {e}")
+            return
+
+        with self._lock:
+            self._arrays = arrays
+            self._meta = meta
+            self._ids = list(meta["product_ids"])
+            self._rows = {product_id: row for row, product_id in enumerate(self._ids)}
+            self._mtime_ns = mtime_ns
+        logger.info(
+            f"📂 [CoPurchase] Matriz {meta['version']}: {len(self._ids)} productos, "
+            f"{meta.get('pairs', 0)} pares, {meta.get('orders', 0)} órdenes"
+        )
+
+    def _save(self, arrays: Dict[str, Any], meta: Dict[str, Any]) -> None:
+        """Escribe una versión nueva y cambia meta.json para apuntarla"""
+        np = _numpy()
+        version = f"v{int(time.time() * 1000)}"
+        version_dir = self.directory / version
+        version_dir.mkdir(parents=True, exist_ok=True)
+        for name in ARRAYS:
+            np.save(version_dir / f"{name}.npy", arrays[name])
+
+        meta = {**meta, "version": version}
+        meta_path = self.directory / META_FILE
+        tmp_meta = meta_path.with_suffix(".tmp")
+        tmp_meta.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp_meta, meta_path)
+
+        # Versiones viejas: los mmap abiertos siguen siendo válidos tras borrar el archivo
+        for old in self.directory.glob("v*"):
+            if old.is_dir() and old.name != version:
+                shutil.rmtree(old, ignore_errors=True)
+
+        self._maybe_reload(force=True)
+
+    # ═══════════════════════════════════════════════════════════
+    # BUILD (job en segundo plano)
+    # ═══════════════════════════════════════════════════════════
+
+    def _load_items(self, db, product_ids: List[str], since: Optional[datetime] = None):
+        """
+        Índices (orden, producto) de los items de las órdenes que cuentan, marca de agua y órdenes leídas
+
+        order_items se lee por partes (yield_per, ordenado por orden) y cada
+        parte se convierte a enteros con numpy: en memoria quedan dos arrays
+        int64, no una tupla por fila.
+
+        Args:
+            db: Sesión de BD
+            product_ids: IDs de las filas actuales (se agregan los nuevos al final)
+            since: Solo órdenes confirmadas después (refresco incremental)
+
+        Returns:
+            (order_idx, product_idx, marca de agua, órdenes)
+        """
+        from sqlalchemy import func, select
+        from app.database.models import Order, OrderItem
+        from app.services.product_affinity import COUNTED_STATUSES
+
+        np = _numpy()
+        filters = [Order.status.in_(COUNTED_STATUSES)]
+        if since is not None:
+            filters.append(Order.confirmed_at > since)
+
+        stmt = select(OrderItem.order_id, OrderItem.product_id).join(
+            Order, OrderItem.order_id == Order.id
+        ).where(*filters).order_by(OrderItem.order_id).execution_options(yield_per=LOAD_CHUNK)
+
+        rows = {product_id: row for row, product_id in enumerate(product_ids)}
+        order_parts, product_parts = [], []
+        last_order, next_order = None, 0
+        # Core (no la capa ORM): filas planas, sin construir objetos por fila
+        for part in db.connection().execute(stmt).partitions():
+            order_idx, last_order, next_order = self._index_orders(
+                np.array([item[0] for item in part]), last_order, next_order
+            )
+            order_parts.append(order_idx)
+            product_parts.append(self._index_products(np.array([item[1] for item in part]), product_ids, rows))
+
+        watermark, orders = db.query(func.max(Order.confirmed_at), func.count(Order.id)).filter(*filters).one()
+        if not order_parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), watermark, orders
+        return np.concatenate(order_parts), np.concatenate(product_parts), watermark, orders
+
+    @staticmethod
+    def _index_orders(order_ids, last_order, next_order: int):
+        """
+        Enteros consecutivos para IDs de orden ya ordenados (una parte de la lectura)
+
+        Returns:
+            (order_idx, último ID, próximo entero libre): los dos últimos
+            continúan la numeración en la parte siguiente
+        """
+        np = _numpy()
+        new = np.empty(len(order_ids), dtype=bool)
+        new[0] = last_order is None or order_ids[0] != last_order
+        new[1:] = order_ids[1:] != order_ids[:-1]
+        order_idx = next_order - 1 + np.cumsum(new, dtype=np.int64)
+        return order_idx, order_ids[-1], int(order_idx[-1]) + 1
+
+    @staticmethod
+    def _index_products(item_products, product_ids: List[str], rows: Dict[str, int]):
+        """Fila de cada item con np.unique (el bucle Python recorre solo los productos distintos)"""
+        np = _numpy()
+        distinct, inverse = np.unique(item_products, return_inverse=True)
+        mapped = np.empty(len(distinct), dtype=np.int64)
+        for i, product_id in enumerate(distinct.tolist()):
+            row = rows.get(product_id)
+            if row is None:
+                row = rows[product_id] = len(product_ids)
+                product_ids.append(product_id)
+            mapped[i] = row
+        return mapped[inverse.reshape(-1)]
+
+    def rebuild(self, db) -> Dict[str, Any]:
+        """Rehace la matriz desde cero con todas las órdenes que cuentan"""
+        start = time.perf_counter()
+        product_ids: List[str] = []
+        order_idx, product_idx, watermark, orders = self._load_items(db, product_ids)
+
+        keys, counts, freq = co_occurrence(order_idx, product_idx, len(product_ids), self.max_basket)
+        meta = {
+            "product_ids": product_ids,
+            "orders": int(orders),
+            "watermark": watermark.isoformat() if watermark else None,
+            "full_built_at": datetime.utcnow().isoformat()
+        }
+        result = self.publish(keys, counts, freq, meta, start)
+        self._builds += 1
+        logger.info(
+            f"🧮 [CoPurchase] Matriz armada: {len(order_idx)} items, {orders} órdenes, "
+            f"{result['pairs']} pares en {result['seconds']:.2f}s"
+        )
+        return result
+
+    def refresh(self, db) -> Optional[Dict[str, Any]]:
+        """Suma a la matriz las órdenes confirmadas desde la última marca de agua"""
+        np = _numpy()
+        self._maybe_reload(force=True)
+        with self._lock:
+            meta, arrays = dict(self._meta), dict(self._arrays)
+        if not meta.get("watermark"):
+            return self.rebuild(db)
+
+        start = time.perf_counter()
+        since = datetime.fromisoformat(meta["watermark"])
+        old_ids = list(meta["product_ids"])
+        product_ids = list(old_ids)
+        order_idx, product_idx, watermark, orders = self._load_items(db, product_ids, since=since)
+        if not len(order_idx):
+            return None
+        n = len(product_ids)
+
+        new_keys, new_counts, new_freq = co_occurrence(order_idx, product_idx, n, self.max_basket)
+        keys, counts = merge_counts(
+            np.asarray(arrays["pair_keys"]), np.asarray(arrays["pair_counts"]), len(old_ids),
+            new_keys, new_counts, n, n
+        )
+        freq = new_freq.copy()
+        freq[:len(old_ids)] += np.asarray(arrays["freq"])
+
+        meta.update({
+            "product_ids": product_ids,
+            "orders": int(meta.get("orders", 0)) + int(orders),
+            "watermark": watermark.isoformat() if watermark else meta["watermark"]
+        })
+        result = self.publish(keys, counts, freq, meta, start)
+        self._refreshes += 1
+        logger.info(f"🧮 [CoPurchase] Refresco: +{orders} órdenes, {result['pairs']} pares en {result['seconds']:.3f}s")
+        return result
+
+    def publish(self, keys, counts, freq, meta: Dict[str, Any], start: float) -> Dict[str, Any]:
+        """
+        Calcula los vecinos de unos conteos y los publica como versión nueva
+
+        Args:
+            keys, counts, freq: Salida de co_occurrence / merge_counts
+            meta: Al menos product_ids y orders (más marca de agua y fechas)
+            start: perf_counter del inicio del build (para métricas)
+        """
+        n = len(meta["product_ids"])
+        indptr, indices, scores = top_neighbors(
+            keys, counts, freq, n, meta["orders"], self.neighbors, self.min_co_orders, self.similarity
+        )
+        arrays = {
+            "pair_keys": keys, "pair_counts": counts, "freq": freq,
+            "nbr_indptr": indptr, "nbr_indices": indices, "nbr_scores": scores
+        }
+        meta.update({
+            "pairs": int(len(keys)),
+            "neighbors": int(len(indices)),
+            "similarity": self.similarity,
+            "built_at": datetime.utcnow().isoformat()
+        })
+        self._save(arrays, meta)
+        self._last_build_seconds = time.perf_counter() - start
+        return {"pairs": int(len(keys)), "neighbors": int(len(indices)), "seconds": self._last_build_seconds}
+
+    def _full_rebuild_due(self) -> bool:
+        built = self._meta.get("full_built_at")
+        if not built:
+            return True
+        age = datetime.utcnow() - datetime.fromisoformat(built)
+        return age.total_seconds() >= self.full_rebuild_hours * 3600
+
+    def run_once(self) -> None:
+        """Un ciclo del job: rebuild si toca, si no refresco incremental"""
+        from config.database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            self._maybe_reload(force=True)
+            if self._full_rebuild_due():
+                self.rebuild(db)
+            else:
+                self.refresh(db)
+        finally:
+            db.close()
+
+    async def start(self):
+        """Abre la matriz y arranca el job de refresco (no bloquea el arranque)"""
+        if not self.enabled:
+            if self.directory is not None:
+                logger.warning("⚠️ [CoPurchase] numpy no está instalado, recomendador desactivado")
+            return
+        if self.running:
+            return
+
+        await asyncio.to_thread(self._maybe_reload, True)
+        self.running = True
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"✅ [CoPurchase] Job iniciado (refresco cada {self.refresh_seconds:.0f}s)")
+
+    async def stop(self):
+        self.running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        from app.services.cluster_coordinator import cluster_coordinator
+
+        while self.running:
+            try:
+                if cluster_coordinator.is_leader(RECOMMENDER_LEASE):
+                    await asyncio.to_thread(self.run_once)
+                else:
+                    # Otra instancia arma la matriz: solo recargar si cambió
+                    await asyncio.to_thread(self._maybe_reload, True)
+            except Exception as e:
+                logger.error(f"❌ [CoPurchase] Error en el job: {e}")
+
+            try:
+                await asyncio.sleep(self.refresh_seconds)
+            except asyncio.CancelledError:
+                break
+
+    # ═══════════════════════════════════════════════════════════
+    # CONSULTA
+    # ═══════════════════════════════════════════════════════════
+
+    def recommend(
+        self,
+        product_ids: Iterable[str],
+        k: int = 5,
+        exclude: Optional[Iterable[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Productos comprados junto con los dados
+
+        Args:
+            product_ids: Productos semilla (la orden actual o el historial del cliente)
+            k: Máximo de recomendaciones
+            exclude: IDs que no se deben recomendar (las semillas se excluyen siempre)
+
+        Returns:
+            [(product_id, score)] de mayor a menor; [] sin matriz o sin vecinos
+        """
+        if not self.enabled:
+            return []
+        self._maybe_reload()
+
+        start = time.perf_counter_ns()
+        with self._lock:
+            arrays, ids, rows = self._arrays, self._ids, self._rows
+        if not arrays:
+            return []
+
+        seeds = set(product_ids)
+        skip = seeds | set(exclude or ())
+        indptr, indices, scores = arrays["nbr_indptr"], arrays["nbr_indices"], arrays["nbr_scores"]
+
+        totals: Dict[str, float] = {}
+        for product_id in seeds:
+            row = rows.get(product_id)
+            if row is None:
+                continue
+            begin, end = int(indptr[row]), int(indptr[row + 1])
+            for neighbor, score in zip(indices[begin:end].tolist(), scores[begin:end].tolist()):
+                candidate = ids[neighbor]
+                if candidate not in skip:
+                    totals[candidate] = totals.get(candidate, 0.0) + score
+
+        ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:k]
+        self._lookups += 1
+        self._lookup_ns_total += time.perf_counter_ns() - start
+        return ranked
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Tamaño de la matriz, builds y latencia de consulta"""
+        with self._lock:
+            meta, arrays = self._meta, self._arrays
+        return {
+            "enabled": self.enabled,
+            "version": meta.get("version"),
+            "products": len(meta.get("product_ids", [])),
+            "orders": meta.get("orders", 0),
+            "pairs": meta.get("pairs", 0),
+            "neighbors": meta.get("neighbors", 0),
+            "similarity": meta.get("similarity", self.similarity),
+            "bytes": int(sum(array.nbytes for array in arrays.values())),
+            "built_at": meta.get("built_at"),
+            "full_built_at": meta.get("full_built_at"),
+            "builds": self._builds,
+            "refreshes": self._refreshes,
+            "last_build_seconds": round(self._last_build_seconds, 3),
+            "lookups": self._lookups,
+            "avg_lookup_us": round(self._lookup_ns_total / self._lookups / 1000, 2) if self._lookups else 0.0
+        }
+
+
+# Instancia global
+co_purchase_recommender = CoPurchaseRecommender(
+    settings.recommender_dir,
+    neighbors=settings.recommender_neighbors,
+    max_basket=settings.recommender_max_basket,
+    min_co_orders=settings.recommender_min_co_orders,
+    similarity=settings.recommender_similarity,
+    refresh_seconds=settings.recommender_refresh_seconds,
+    full_rebuild_hours=settings.recommender_full_rebuild_hours
+)
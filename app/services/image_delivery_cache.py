@@ -0,0 +1,265 @@
+"""
+Cache de entrega de imágenes de productos por WhatsApp
+
+Cada ofrecimiento leía la imagen original, la codificaba entera en base64 y
+la mandaba a WAHA. Las mismas pocas imágenes se re-codificaban miles de
+veces al día.
+
+- Variante WhatsApp: JPEG redimensionado/recomprimido, generado una vez
+  (al subir la imagen o en el primer envío) y nombrado por el hash del
+  contenido original en static/products/whatsapp/.
+- Payload memoizado: el base64 de la variante se guarda en un LRU acotado
+  por bytes, indexado por hash de contenido. Un cambio de imagen cambia el
+  hash (y la firma mtime/tamaño del archivo), así que nunca se sirve un
+  payload viejo; invalidate() limpia además la entrada explícitamente y
+  borra la variante en disco.
+- Envío por URL: si settings.public_base_url está configurado, WAHA
+  descarga la variante desde nuestro mount /static y no viaja base64.
+
+Requiere Pillow para generar variantes; sin Pillow se envía el original.
+"""
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from config.settings import settings
+
+
+VARIANT_DIR = Path("static/products/whatsapp")
+
+MIMETYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp'
+}
+
+
+@dataclass(frozen=True)
+class DeliverableImage:
+    """Imagen lista para enviar por WAHA"""
+    content_hash: str
+    path: Path
+    mimetype: str
+    filename: str
+
+
+class ImageDeliveryCache:
+    """Variantes optimizadas y payloads memoizados por hash de contenido"""
+
+    def __init__(
+        self,
+        variant_dir: Path = VARIANT_DIR,
+        max_side: int = 1280,
+        quality: int = 80,
+        max_payload_bytes: int = 32 * 1024 * 1024
+    ):
+        """
+        Args:
+            variant_dir: Directorio de variantes (debe estar bajo el mount /static)
+            max_side: Lado máximo de la variante en píxeles
+            quality: Calidad JPEG de la variante
+            max_payload_bytes: Tamaño máximo total de base64 memoizado
+        """
+        self.variant_dir = Path(variant_dir)
+        self.max_side = max_side
+        self.quality = quality
+        self.max_payload_bytes = max_payload_bytes
+
+        self._lock = threading.Lock()
+        # (ruta, mtime_ns, tamaño) → imagen entregable (evita re-hashear en cada envío)
+        self._images: Dict[Tuple[str, int, int], DeliverableImage] = {}
+        # hash de contenido → base64 (LRU acotado por bytes)
+        self._payloads: "OrderedDict[str, str]" = OrderedDict()
+        self._payload_bytes = 0
+
+        # Métricas
+        self._hits = 0
+        self._misses = 0
+        self._variants_created = 0
+
+    # ═══════════════════════════════════════════════════════════
+    # VARIANTES
+    # ═══════════════════════════════════════════════════════════
+
+    def prepare(self, source_path: str) -> Optional[DeliverableImage]:
+        """
+        Obtiene (o genera) la versión entregable de una imagen
+
+        Args:
+            source_path: Ruta de la imagen original del producto
+
+        Returns:
+            DeliverableImage o None si el archivo no existe
+        """
+        try:
+            stat = os.stat(source_path)
+        except FileNotFoundError:
+            return None
+
+        signature = (os.path.abspath(source_path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            image = self._images.get(signature)
+        if image is not None and image.path.exists():
+            return image
+
+        hasher = hashlib.sha256()
+        with open(source_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                hasher.update(chunk)
+        content_hash = hasher.hexdigest()
+
+        image = self._build_variant(source_path, content_hash)
+
+        with self._lock:
+            # Una ruta solo tiene una firma vigente
+            for key in [k for k in self._images if k[0] == signature[0]]:
+                del self._images[key]
+            self._images[signature] = image
+        return image
+
+    def _build_variant(self, source_path: str, content_hash: str) -> DeliverableImage:
+        """Genera la variante JPEG para WhatsApp (o usa el original si no hay Pillow)"""
+        variant_path = self.variant_dir / f"{content_hash[:32]}.jpg"
+
+        if variant_path.exists():
+            return DeliverableImage(content_hash, variant_path, 'image/jpeg', variant_path.name)
+
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:
+            logger.debug("⚠️ [ImageCache] Pillow no instalado, se envía la imagen original")
+            extension = os.path.splitext(source_path)[1].lower()
+            return DeliverableImage(
+                content_hash, Path(source_path), MIMETYPES.get(extension, 'image/jpeg'), os.path.basename(source_path)
+            )
+
+        self.variant_dir.mkdir(parents=True, exist_ok=True)
+
+        with Image.open(source_path) as img:
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((self.max_side, self.max_side))
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+
+            tmp_path = variant_path.with_suffix(".part")
+            img.save(tmp_path, format="JPEG", quality=self.quality, optimize=True, progressive=True)
+            tmp_path.replace(variant_path)
+
+        self._variants_created += 1
+        logger.info(
+            f"🖼️ [ImageCache] Variante WhatsApp generada: {variant_path.name} "
+            f"({os.path.getsize(source_path) // 1024} KB → {variant_path.stat().st_size // 1024} KB)"
+        )
+        return DeliverableImage(content_hash, variant_path, 'image/jpeg', variant_path.name)
+
+    # ═══════════════════════════════════════════════════════════
+    # PAYLOADS
+    # ═══════════════════════════════════════════════════════════
+
+    def get_url(self, image: DeliverableImage) -> Optional[str]:
+        """URL pública de la imagen bajo /static (None si no hay public_base_url)"""
+        if not settings.public_base_url:
+            return None
+        try:
+            relative = image.path.resolve().relative_to(Path("static").resolve())
+        except ValueError:
+            return None
+        return f"{settings.public_base_url.rstrip('/')}/static/{relative.as_posix()}"
+
+    def get_base64(self, image: DeliverableImage) -> str:
+        """base64 de la imagen, codificado una sola vez por contenido"""
+        with self._lock:
+            data = self._payloads.get(image.content_hash)
+            if data is not None:
+                self._payloads.move_to_end(image.content_hash)
+                self._hits += 1
+                return data
+            self._misses += 1
+
+        data = base64.b64encode(image.path.read_bytes()).decode('ascii')
+
+        with self._lock:
+            if image.content_hash not in self._payloads:
+                self._payloads[image.content_hash] = data
+                self._payload_bytes += len(data)
+                while self._payload_bytes > self.max_payload_bytes and len(self._payloads) > 1:
+                    _, evicted = self._payloads.popitem(last=False)
+                    self._payload_bytes -= len(evicted)
+        return data
+
+    def invalidate(self, source_path: str) -> List[str]:
+        """
+        Olvida las entradas de una imagen y borra su variante WhatsApp (al reemplazarla o eliminarla)
+
+        Bloqueante si la imagen no estaba en memoria y hay que hashear el
+        original (usar con asyncio.to_thread). Si otro producto comparte el
+        mismo contenido, su variante se regenera en el próximo envío.
+
+        Returns:
+            Rutas de variantes eliminadas
+        """
+        from app.services.image_pipeline import content_key_from_path
+
+        absolute = os.path.abspath(source_path)
+        keys = set()
+        with self._lock:
+            for key in [k for k in self._images if k[0] == absolute]:
+                image = self._images.pop(key)
+                keys.add(image.content_hash[:32])
+                data = self._payloads.pop(image.content_hash, None)
+                if data is not None:
+                    self._payload_bytes -= len(data)
+
+        if not keys:
+            # No se envió desde este proceso: el nombre o el contenido dan la clave
+            key = content_key_from_path(source_path)
+            if key:
+                keys.add(key)
+            elif os.path.isfile(source_path):
+                hasher = hashlib.sha256()
+                with open(source_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(64 * 1024), b''):
+                        hasher.update(chunk)
+                keys.add(hasher.hexdigest()[:32])
+
+        removed = []
+        for key in keys:
+            variant_path = self.variant_dir / f"{key}.jpg"
+            try:
+                variant_path.unlink()
+                removed.append(str(variant_path))
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning(f"⚠️ [ImageCache] No se pudo eliminar {variant_path}: {e}")
+
+        if removed:
+            logger.info(f"🗑️ [ImageCache] Variante WhatsApp eliminada: {', '.join(Path(p).name for p in removed)}")
+        return removed
+
+    def get_stats(self) -> Dict:
+        """Métricas del cache"""
+        lookups = self._hits + self._misses
+        return {
+            "images": len(self._images),
+            "payloads": len(self._payloads),
+            "payload_bytes": self._payload_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 3) if lookups else None,
+            "variants_created": self._variants_created,
+            "url_sends": bool(settings.public_base_url)
+        }
+
+
+# Instancia global
+image_delivery_cache = ImageDeliveryCache()
@@ -0,0 +1,354 @@
+"""
+Pipeline de imágenes de productos
+
+Al subir una imagen se guardaba el archivo crudo con un nombre aleatorio y
+el dashboard y la webapp del carrito descargaban el original completo, sin
+cache, en cada visita.
+
+- Almacenamiento por contenido: el original se guarda como
+  static/products/{hash}{ext} (hash = primeros 32 hex del sha256). La misma
+  imagen subida dos veces es un solo archivo, y un cambio de imagen es
+  siempre una URL nueva.
+- Variantes: thumb/card/full en WebP y JPEG bajo
+  static/products/variants/{hash}/, generadas en un ProcessPoolExecutor para
+  no bloquear el event loop ni pelear por el GIL con Pillow.
+- Las rutas con hash son inmutables: se sirven con cache de un año
+  (ver app/utils/static_files.py).
+- GC: al eliminar o reemplazar una imagen se borran los originales y las
+  variantes (incluida la variante WhatsApp) que ya no usa ningún producto.
+  Las subidas tienen storage_lock desde que el original entra a
+  static/products hasta el commit, y el GC toma la foto de image_path y
+  borra con el mismo lock. Además no se borra nada modificado después de
+  la foto menos gc_grace_seconds (subidas de otros procesos).
+
+Requiere Pillow para generar variantes; sin Pillow solo se guarda el original.
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from config.settings import settings
+
+
+UPLOAD_DIR = Path("static/products")
+VARIANTS_DIR = UPLOAD_DIR / "variants"
+WHATSAPP_DIR = UPLOAD_DIR / "whatsapp"
+
+# Nombre → lado máximo en píxeles
+VARIANT_SIZES = {
+    "thumb": 160,
+    "card": 480,
+    "full": 1280
+}
+
+# Formato → (formato Pillow, extensión)
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "webp"),
+    "jpeg": ("JPEG", "jpg")
+}
+
+HASH_LENGTH = 32
+_HASH_RE = re.compile(rf"^[0-9a-f]{{{HASH_LENGTH}}}$")
+
+
+def content_key(sha256_hex: str) -> str:
+    """Parte del sha256 usada en nombres de archivo"""
+    return sha256_hex[:HASH_LENGTH]
+
+
+def content_key_from_path(image_path: Optional[str]) -> Optional[str]:
+    """Hash de una imagen almacenada por contenido (None si es un nombre legacy)"""
+    if not image_path:
+        return None
+    stem = Path(image_path).stem
+    return stem if _HASH_RE.match(stem) else None
+
+
+def is_content_addressed(path: str) -> bool:
+    """True si alguna parte de la ruta es un hash de contenido (archivo inmutable)"""
+    return any(_HASH_RE.match(Path(part).stem) for part in Path(path).parts)
+
+
+def variant_urls(image_path: Optional[str]) -> Optional[Dict[str, Dict[str, str]]]:
+    """
+    URLs de las variantes de una imagen
+
+    Returns:
+        {"thumb": {"webp": url, "jpeg": url}, "card": {...}, "full": {...}}
+        o None si la imagen no tiene variantes generadas
+    """
+    key = content_key_from_path(image_path)
+    if not key or not (VARIANTS_DIR / key).is_dir():
+        return None
+
+    base = f"/static/products/variants/{key}"
+    return {
+        size: {fmt: f"{base}/{size}.{ext}" for fmt, (_, ext) in VARIANT_FORMATS.items()}
+        for size in VARIANT_SIZES
+    }
+
+
+# ═══════════════════════════════════════════════════════════
+# CÓDIGO QUE CORRE EN LOS PROCESOS DEL POOL
+# ═══════════════════════════════════════════════════════════
+
+def _render_variants(source_path: str, dest_dir: str, quality: int) -> Dict[str, Any]:
+    """
+    Genera todas las variantes de una imagen
+
+    Escribe en un directorio temporal y lo renombra al final: un lector
+    nunca ve un juego de variantes a medias.
+
+    Returns:
+        dict con 'files' (nombre → bytes) y 'processing_seconds'
+    """
+    from PIL import Image, ImageOps
+
+    start = time.perf_counter()
+    dest = Path(dest_dir)
+    tmp_dir = dest.with_name(f"{dest.name}.part{os.getpid()}")
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    files = {}
+
+    try:
+        with Image.open(source_path) as original:
+            img = ImageOps.exif_transpose(original)
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+
+            # De mayor a menor: cada tamaño se reduce desde el anterior
+            for size, max_side in sorted(VARIANT_SIZES.items(), key=lambda item: -item[1]):
+                img = img.copy()
+                img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+                for pil_format, ext in VARIANT_FORMATS.values():
+                    frame = img.convert("RGB") if pil_format == "JPEG" and img.mode != "RGB" else img
+                    name = f"{size}.{ext}"
+                    frame.save(tmp_dir / name, format=pil_format, quality=quality, optimize=True)
+                    files[name] = (tmp_dir / name).stat().st_size
+
+        try:
+            tmp_dir.rename(dest)
+        except OSError:
+            # Otro proceso generó las mismas variantes primero (mismo contenido)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    return {"files": files, "processing_seconds": time.perf_counter() - start}
+
+
+# ═══════════════════════════════════════════════════════════
+# PIPELINE (lado del event loop)
+# ═══════════════════════════════════════════════════════════
+
+class ImagePipeline:
+    """Genera variantes en un pool de procesos y recolecta archivos huérfanos"""
+
+    def __init__(self, workers: int = 1, quality: int = 80, gc_grace_seconds: float = 300):
+        """
+        Args:
+            workers: Procesos del pool (= imágenes procesadas en paralelo)
+            quality: Calidad de WebP/JPEG
+            gc_grace_seconds: El GC no borra archivos modificados en esta ventana
+        """
+        self.workers = max(1, workers)
+        self.quality = quality
+        self.gc_grace_seconds = gc_grace_seconds
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+        # Subidas (del archivo al commit) y GC (de la foto al borrado) no se cruzan
+        self.storage_lock = asyncio.Lock()
+        # (ruta, mtime_ns, tamaño) de imágenes legacy → clave de contenido
+        self._legacy_keys: Dict[Tuple[str, int, int], str] = {}
+
+        # Métricas
+        self._processed = 0
+        self._deduplicated = 0
+        self._failed = 0
+        self._processing_seconds = 0.0
+        self._collected = 0
+
+    @property
+    def available(self) -> bool:
+        """True si el pool está arrancado"""
+        return self._executor is not None
+
+    def start(self):
+        """Crea el pool (los procesos arrancan con la primera imagen)"""
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            logger.warning("⚠️ [Images] Pillow no instalado, no se generarán variantes (pip install Pillow)")
+            return
+
+        # spawn: no heredar hilos ni conexiones del proceso principal
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        logger.info(f"✅ [Images] Pipeline de imágenes listo ({self.workers} procesos)")
+
+    async def stop(self):
+        """Detiene los procesos del pool"""
+        if self._executor:
+            await asyncio.to_thread(self._executor.shutdown, True, cancel_futures=True)
+            self._executor = None
+            logger.info("🛑 [Images] Pipeline de imágenes detenido")
+
+    async def process(self, image_path: str) -> Optional[Dict[str, Dict[str, str]]]:
+        """
+        Genera las variantes de una imagen almacenada por contenido
+
+        Args:
+            image_path: Ruta del original (static/products/{hash}{ext})
+
+        Returns:
+            URLs de las variantes (ver variant_urls) o None si no se pudieron generar
+        """
+        key = content_key_from_path(image_path)
+        if not key:
+            return None
+
+        # Mismo contenido ya procesado (re-subida o imagen compartida)
+        if (VARIANTS_DIR / key).is_dir():
+            self._deduplicated += 1
+            return variant_urls(image_path)
+
+        if not self.available:
+            return None
+
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(
+                self._executor, _render_variants, image_path, str(VARIANTS_DIR / key), self.quality
+            )
+        except Exception as e:
+            self._failed += 1
+            logger.error(f"❌ [Images] Error generando variantes de {image_path}: {e}")
+            return None
+
+        self._processed += 1
+        self._processing_seconds += result["processing_seconds"]
+        logger.info(
+            f"🖼️ [Images] {len(result['files'])} variantes de {key} en "
+            f"{result['processing_seconds'] * 1000:.0f}ms ({sum(result['files'].values()) // 1024} KB)"
+        )
+        return variant_urls(image_path)
+
+    # ═══════════════════════════════════════════════════════════
+    # GC
+    # ═══════════════════════════════════════════════════════════
+
+    def collect_garbage(self, referenced_paths: Iterable[Optional[str]], snapshot_at: Optional[float] = None) -> List[str]:
+        """
+        Borra originales y variantes que ningún producto referencia
+
+        Bloqueante (usar con asyncio.to_thread, con storage_lock tomado
+        desde la consulta de image_path). Solo toca archivos nombrados por
+        hash; los nombres legacy se borran explícitamente.
+
+        Args:
+            referenced_paths: image_path de todos los productos
+            snapshot_at: time.time() de la consulta de referenced_paths
+
+        Returns:
+            Rutas eliminadas
+        """
+        referenced = set()
+        for path in referenced_paths:
+            key = content_key_from_path(path)
+            if key:
+                referenced.add(key)
+            elif path:
+                # Imagen legacy: su variante WhatsApp está nombrada por el hash del contenido
+                key = self._legacy_key(path)
+                if key:
+                    referenced.add(key)
+
+        cutoff = (snapshot_at if snapshot_at is not None else time.time()) - self.gc_grace_seconds
+
+        candidates = []
+        if UPLOAD_DIR.is_dir():
+            candidates += [p for p in UPLOAD_DIR.iterdir() if p.is_file()]
+        for directory in (VARIANTS_DIR, WHATSAPP_DIR):
+            if directory.is_dir():
+                candidates += list(directory.iterdir())
+
+        removed = []
+        for path in candidates:
+            key = content_key_from_path(str(path))
+            if not key or key in referenced:
+                continue
+            try:
+                # Recién escrito: puede ser de una subida que todavía no hizo commit
+                if path.stat().st_mtime > cutoff:
+                    continue
+                if path.is_dir():
+                    shutil.rmtree(path)
+                else:
+                    path.unlink()
+                removed.append(str(path))
+            except OSError as e:
+                logger.warning(f"⚠️ [Images] No se pudo eliminar {path}: {e}")
+
+        self._collected += len(removed)
+        if removed:
+            logger.info(f"🗑️ [Images] GC: {len(removed)} archivos huérfanos eliminados")
+        return removed
+
+    def _legacy_key(self, path: str) -> Optional[str]:
+        """Clave de contenido de una imagen legacy (hasheada una vez por versión del archivo)"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        signature = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        key = self._legacy_keys.get(signature)
+        if key is None:
+            key = content_key(_file_sha256(path))
+            # Una ruta solo tiene una firma vigente
+            for old in [k for k in self._legacy_keys if k[0] == signature[0]]:
+                del self._legacy_keys[old]
+            self._legacy_keys[signature] = key
+        return key
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas del pipeline"""
+        return {
+            "available": self.available,
+            "workers": self.workers,
+            "processed": self._processed,
+            "deduplicated": self._deduplicated,
+            "failed": self._failed,
+            "avg_processing_ms": round(self._processing_seconds / self._processed * 1000, 1) if self._processed else None,
+            "garbage_collected": self._collected
+        }
+
+
+def _file_sha256(path: str) -> str:
+    """sha256 hex de un archivo, leído por chunks"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+# Instancia global
+image_pipeline = ImagePipeline(
+    workers=settings.image_pipeline_workers,
+    quality=settings.image_pipeline_quality,
+    gc_grace_seconds=settings.image_gc_grace_seconds
+)
@@ -1,11 +1,17 @@
 import asyncio
-from typing import Dict, List, Callable, Optional
+import sys
+from collections import OrderedDict
+from typing import Dict, List, Callable, Optional, Set
 from dataclasses import dataclass, field
 from datetime import datetime
 from loguru import logger
 
 
-@dataclass
+# dataclass(slots=True) solo existe desde Python 3.10; en 3.9 se usan dataclasses normales
+_DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**_DATACLASS_SLOTS)
 class BufferedMessage:
     """Representa un mensaje en el buffer"""
     phone: str
@@ -14,14 +20,15 @@ class BufferedMessage:
     message_type: str
     timestamp: datetime
     media_url: Optional[str] = None
+    pending: bool = False  # True mientras el texto no está listo (ej: nota de voz transcribiéndose)
 
 
-@dataclass
+@dataclass(**_DATACLASS_SLOTS)
 class MessageBuffer:
     """Buffer de mensajes para un usuario específico"""
     phone: str
     messages: List[BufferedMessage] = field(default_factory=list)
-    timer_task: Optional[asyncio.Task] = None
+    deadline: Optional[float] = None  # Instante (loop.time()) en que expira el debounce
     last_message_time: Optional[datetime] = None
     
     def add_message(self, message: BufferedMessage):
@@ -30,21 +37,23 @@ class MessageBuffer:
         self.last_message_time = datetime.utcnow()
     
     def get_combined_text(self) -> str:
-        """Combina todos los mensajes de texto en uno solo"""
+        """Combina todos los mensajes de texto (y notas de voz transcritas) en uno solo"""
         text_messages = [
             msg.message 
             for msg in self.messages 
-            if msg.message_type == "text"
+            if msg.message_type in ("text", "voice") and not msg.pending and msg.message
         ]
         return " ".join(text_messages)
+
+    def has_pending(self) -> bool:
+        """Verifica si algún mensaje sigue esperando su texto"""
+        return any(msg.pending for msg in self.messages)
     
     def clear(self):
         """Limpia el buffer"""
         self.messages.clear()
         self.last_message_time = None
-        if self.timer_task and not self.timer_task.done():
-            self.timer_task.cancel()
-        self.timer_task = None
+        self.deadline = None
     
     def has_messages(self) -> bool:
         """Verifica si hay mensajes en el buffer"""
@@ -55,6 +64,20 @@ class MessageBufferManager:
     """
     Gestiona buffers de mensajes para múltiples usuarios
     Implementa debouncing para agrupar mensajes rápidos
+
+    En lugar de crear (y cancelar) un asyncio.Task por mensaje, un único
+    coroutine scheduler vigila los deadlines de todos los buffers. Como el
+    debounce es constante, los deadlines quedan ordenados por orden de
+    re-armado: basta un OrderedDict (phone → deadline) donde re-armar es
+    move_to_end O(1) y el próximo vencimiento siempre está al frente.
+    Cada buffer vencido se procesa en su propia tarea: un callback lento
+    (LLM, WAHA) no atrasa los deadlines de los demás teléfonos.
+    Los buffers se eliminan de memoria en cuanto se procesan.
+
+    Las notas de voz entran como mensajes pendientes (add_pending_message)
+    en su posición de llegada; su transcripción corre en paralelo con el
+    debounce. Si el deadline vence con mensajes pendientes, el buffer se
+    procesa cuando se resuelve el último (resolve_message).
     """
     
     def __init__(self, debounce_seconds: float = 3.0):
@@ -66,6 +89,13 @@ class MessageBufferManager:
         self.buffers: Dict[str, MessageBuffer] = {}
         self.processing_callback: Optional[Callable] = None
         
+        # Cola de deadlines ordenada por vencimiento (phone → deadline)
+        self._deadlines: "OrderedDict[str, float]" = OrderedDict()
+        self._scheduler_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        # Buffers vencidos en proceso (referencia fuerte hasta que terminen)
+        self._processing: Set[asyncio.Task] = set()
+
         logger.info(f"MessageBufferManager inicializado (debounce: {debounce_seconds}s)")
     
     def set_processing_callback(self, callback: Callable):
@@ -73,9 +103,32 @@ class MessageBufferManager:
         Establece la función que se llamará cuando se procese un buffer
         
         Args:
-            callback: Función async que recibe (phone, combined_message, messages_list)
+            callback: Función async que recibe (phone, combined_message, messages_list).
+                      Cada buffer vencido la ejecuta en su propia tarea.
         """
         self.processing_callback = callback
+
+    def start(self):
+        """Inicia el scheduler de deadlines (requiere un event loop corriendo)"""
+        if self._scheduler_task and not self._scheduler_task.done():
+            return
+
+        self._wakeup = asyncio.Event()
+        self._scheduler_task = asyncio.create_task(self._scheduler_loop())
+        logger.debug("⏱️  Scheduler de debounce iniciado")
+
+    async def stop(self):
+        """Detiene el scheduler de deadlines (espera los buffers que ya se están procesando)"""
+        if self._scheduler_task:
+            self._scheduler_task.cancel()
+            try:
+                await self._scheduler_task
+            except asyncio.CancelledError:
+                pass
+            self._scheduler_task = None
+            logger.debug("⏱️  Scheduler de debounce detenido")
+        if self._processing:
+            await asyncio.gather(*self._processing, return_exceptions=True)
     
     async def add_message(
         self,
@@ -95,15 +148,6 @@ class MessageBufferManager:
             message_type: Tipo de mensaje (text, voice, image)
             media_url: URL de media si aplica
         """
-        
-        # Crear buffer si no existe
-        if phone not in self.buffers:
-            self.buffers[phone] = MessageBuffer(phone=phone)
-            logger.debug(f"Nuevo buffer creado para {phone}")
-        
-        buffer = self.buffers[phone]
-        
-        # Agregar mensaje al buffer
         buffered_msg = BufferedMessage(
             phone=phone,
             message=message,
@@ -113,42 +157,156 @@ class MessageBufferManager:
             media_url=media_url
         )
         
-        buffer.add_message(buffered_msg)
+        buffer = self._append(buffered_msg)
         
         logger.info(f"📥 Mensaje agregado al buffer de {phone} (total: {len(buffer.messages)})")
         logger.debug(f"   Contenido: '{message[:50]}...'")
         
-        # Cancelar timer anterior si existe
-        if buffer.timer_task and not buffer.timer_task.done():
-            logger.debug(f"⏱️  Cancelando timer anterior de {phone}")
-            buffer.timer_task.cancel()
+    async def add_pending_message(
+        self,
+        phone: str,
+        message_id: str,
+        message_type: str = "voice",
+        media_url: Optional[str] = None
+    ) -> BufferedMessage:
+        """
+        Reserva el lugar de un mensaje cuyo texto todavía no está listo
         
-        # Crear nuevo timer
-        buffer.timer_task = asyncio.create_task(
-            self._debounce_timer(phone)
+        El mensaje ocupa su posición de llegada en el buffer y re-arma el
+        debounce como cualquier otro; el texto se completa con resolve_message.
+
+        Args:
+            phone: Número de teléfono
+            message_id: ID del mensaje de WAHA
+            message_type: Tipo de mensaje (voice)
+            media_url: URL de media
+
+        Returns:
+            El mensaje pendiente (se pasa luego a resolve_message)
+        """
+        buffered_msg = BufferedMessage(
+            phone=phone,
+            message="",
+            message_id=message_id,
+            message_type=message_type,
+            timestamp=datetime.utcnow(),
+            media_url=media_url,
+            pending=True
         )
         
-        logger.debug(f"⏱️  Nuevo timer iniciado para {phone} ({self.debounce_seconds}s)")
+        buffer = self._append(buffered_msg)
     
-    async def _debounce_timer(self, phone: str):
+        logger.info(f"📥 Mensaje pendiente ({message_type}) agregado al buffer de {phone} (total: {len(buffer.messages)})")
+        return buffered_msg
+
+    async def resolve_message(self, buffered_msg: BufferedMessage, text: Optional[str]):
         """
-        Timer de debouncing. Si expira sin ser cancelado, procesa el buffer
+        Completa el texto de un mensaje pendiente
         
         Args:
-            phone: Número de teléfono del buffer
+            buffered_msg: Mensaje retornado por add_pending_message
+            text: Texto final (None o vacío si falló, el mensaje se descarta al combinar)
         """
-        try:
-            logger.debug(f"⏳ Timer iniciado para {phone}, esperando {self.debounce_seconds}s...")
-            await asyncio.sleep(self.debounce_seconds)
+        phone = buffered_msg.phone
+        buffered_msg.message = text or ""
+        buffered_msg.pending = False
             
-            # Si llegamos aquí, el timer expiró sin ser cancelado
-            logger.info(f"⏰ Timer expirado para {phone}, procesando buffer")
+        buffer = self.buffers.get(phone)
+        if buffer is None or not any(msg is buffered_msg for msg in buffer.messages):
+            # El buffer ya se procesó sin él (force_process/clear_buffer): entregarlo como mensaje nuevo
+            if text:
+                await self.add_message(phone, text, buffered_msg.message_id, buffered_msg.message_type, buffered_msg.media_url)
+            return
+
+        logger.debug(f"✅ Mensaje pendiente resuelto para {phone}")
+
+        # Si el deadline ya venció, el buffer solo esperaba a este mensaje
+        if not buffer.has_pending() and phone not in self._deadlines:
             await self._process_buffer(phone)
             
-        except asyncio.CancelledError:
-            logger.debug(f"⏱️  Timer cancelado para {phone} (nuevo mensaje recibido)")
-        except Exception as e:
-            logger.error(f"Error en timer de {phone}: {e}", exc_info=True)
+    def _append(self, buffered_msg: BufferedMessage) -> MessageBuffer:
+        """Agrega un mensaje al buffer de su teléfono y re-arma el deadline"""
+        self.start()
+
+        phone = buffered_msg.phone
+
+        # Crear buffer si no existe
+        if phone not in self.buffers:
+            self.buffers[phone] = MessageBuffer(phone=phone)
+            logger.debug(f"Nuevo buffer creado para {phone}")
+
+        buffer = self.buffers[phone]
+        buffer.add_message(buffered_msg)
+
+        self._arm(buffer)
+
+        logger.debug(f"⏱️  Deadline re-armado para {phone} ({self.debounce_seconds}s)")
+        return buffer
+
+    def _arm(self, buffer: MessageBuffer):
+        """
+        (Re)programa el deadline de un buffer en O(1)
+
+        Args:
+            buffer: Buffer a programar
+        """
+        was_empty = not self._deadlines
+
+        buffer.deadline = asyncio.get_running_loop().time() + self.debounce_seconds
+        self._deadlines[buffer.phone] = buffer.deadline
+        self._deadlines.move_to_end(buffer.phone)
+
+        # Solo hace falta despertar al scheduler si no tenía nada que esperar;
+        # si ya había deadlines, el nuevo vence después del que está al frente.
+        if was_empty and self._wakeup:
+            self._wakeup.set()
+
+    async def _scheduler_loop(self):
+        """Loop único que procesa los buffers cuyo deadline expiró"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            try:
+                if not self._deadlines:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                phone, deadline = next(iter(self._deadlines.items()))
+                delay = deadline - loop.time()
+
+                if delay > 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                del self._deadlines[phone]
+
+                buffer = self.buffers.get(phone)
+                if buffer is not None and buffer.has_pending():
+                    # Se procesará al resolverse el último mensaje pendiente
+                    buffer.deadline = None
+                    logger.info(f"⏳ Timer expirado para {phone}, esperando transcripción pendiente")
+                    continue
+
+                # Si llegamos aquí, el deadline expiró sin ser re-armado
+                logger.info(f"⏰ Timer expirado para {phone}, procesando buffer")
+                self._dispatch(phone)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en scheduler de debounce: {e}", exc_info=True)
+
+    def _dispatch(self, phone: str):
+        """Procesa un buffer vencido en su propia tarea (el scheduler no la espera)"""
+        task = asyncio.create_task(self._process_buffer(phone))
+        self._processing.add(task)
+        task.add_done_callback(self._processing.discard)
+
     async def _process_buffer(self, phone: str):
         """
         Procesa el buffer de un usuario, combinando todos sus mensajes
@@ -156,19 +314,26 @@ class MessageBufferManager:
         Args:
             phone: Número de teléfono
         """
-        if phone not in self.buffers:
+        # Sacar el buffer de memoria: el próximo mensaje crea uno nuevo
+        buffer = self.buffers.pop(phone, None)
+        self._deadlines.pop(phone, None)
+
+        if buffer is None:
             logger.warning(f"No hay buffer para {phone}")
             return
         
-        buffer = self.buffers[phone]
-        
         if not buffer.has_messages():
             logger.warning(f"Buffer vacío para {phone}")
             return
         
         # Combinar mensajes
         combined_message = buffer.get_combined_text()
-        messages_list = buffer.messages.copy()
+        messages_list = [msg for msg in buffer.messages if not msg.pending]
+
+        if not combined_message:
+            # Ej: solo había una nota de voz que no se pudo transcribir
+            logger.warning(f"Buffer de {phone} sin texto para procesar")
+            return
         
         logger.info("=" * 70)
         logger.info(f"🔄 PROCESANDO BUFFER DE {phone}")
@@ -198,9 +363,6 @@ class MessageBufferManager:
         logger.info(f"🔨 Forzando procesamiento de buffer para {phone}")
         
         if phone in self.buffers:
-            buffer = self.buffers[phone]
-            if buffer.timer_task and not buffer.timer_task.done():
-                buffer.timer_task.cancel()
             await self._process_buffer(phone)
     
     def get_buffer_info(self, phone: str) -> Dict:
@@ -212,12 +374,27 @@ class MessageBufferManager:
         return {
             "exists": True,
             "message_count": len(buffer.messages),
-            "has_timer": buffer.timer_task is not None and not buffer.timer_task.done(),
+            "has_timer": phone in self._deadlines,
+            "pending_messages": sum(1 for msg in buffer.messages if msg.pending),
             "last_message_time": buffer.last_message_time.isoformat() if buffer.last_message_time else None
         }
+
+    def get_stats(self) -> Dict:
+        """Obtiene estadísticas globales del buffer manager"""
+        return {
+            "active_buffers": len(self.buffers),
+            "pending_deadlines": len(self._deadlines),
+            "processing": len(self._processing),
+            "waiting_pending_messages": sum(
+                1 for phone, buffer in self.buffers.items()
+                if phone not in self._deadlines and buffer.has_pending()
+            ),
+            "scheduler_running": self._scheduler_task is not None and not self._scheduler_task.done()
+        }
     
     def clear_buffer(self, phone: str):
         """Limpia el buffer de un usuario"""
+        self._deadlines.pop(phone, None)
         if phone in self.buffers:
             self.buffers[phone].clear()
             del self.buffers[phone]
@@ -0,0 +1,290 @@
+"""
+Executor compartido de notificaciones
+
+Antes cada notificación (admin o cliente) lanzaba un threading.Thread nuevo
+que abría su propia sesión de BD y llamaba a asyncio.run(): un event loop y
+un cliente HTTP nuevos por evento, y una ráfaga de checkouts creaba hilos
+sin límite.
+
+Ahora hay un solo hilo con un event loop de larga vida:
+
+- Cola acotada (notification_queue_size): si se llena, la notificación se
+  descarta y se cuenta en 'dropped' (el pedido ya está guardado; no se
+  bloquea al worker de mensajes esperando a WhatsApp).
+- N consumidores (notification_workers) comparten un httpx.AsyncClient
+  (pool de conexiones a WAHA) y la session factory global.
+- Cada job recibe su propia sesión de BD, cerrada al terminar. Las
+  consultas van por run_db(), un pool de hilos chico
+  (notification_db_threads): una consulta lenta no frena el loop ni los
+  envíos en curso de los demás jobs.
+- stop() drena la cola hasta notification_drain_seconds antes de cancelar.
+- Métricas de espera en cola y duración por tipo de job.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import httpx
+from loguru import logger
+from sqlalchemy.orm import Session
+
+from config.settings import settings
+
+
+# Job: corutina que recibe una sesión de BD propia
+NotificationJob = Callable[[Session], Awaitable[Any]]
+
+T = TypeVar("T")
+
+
+@dataclass
+class _QueuedJob:
+    name: str
+    job: NotificationJob
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class NotificationExecutor:
+    """Hilo con event loop propio que ejecuta notificaciones en segundo plano"""
+
+    def __init__(self, workers: int = 4, max_queue: int = 200, drain_seconds: float = 10.0, db_threads: int = 2):
+        """
+        Args:
+            workers: Notificaciones ejecutándose en paralelo
+            max_queue: Notificaciones pendientes máximas (las demás se descartan)
+            drain_seconds: Tiempo máximo para vaciar la cola al detener
+            db_threads: Hilos para las consultas de BD de los jobs
+        """
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.drain_seconds = drain_seconds
+        self._db_pool = ThreadPoolExecutor(max_workers=max(1, db_threads), thread_name_prefix="notification-db")
+
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumers = []
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._drain_hooks: List[Callable[[], Awaitable[Any]]] = []
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        # Métricas
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._dropped = 0
+        self._per_job: Dict[str, Dict[str, float]] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None and self._loop.is_running()
+
+    # ═══════════════════════════════════════════════════════════
+    # CICLO DE VIDA
+    # ═══════════════════════════════════════════════════════════
+
+    def start(self):
+        """Arranca el hilo del executor (idempotente)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._ready.clear()
+            self._thread = threading.Thread(target=self._run_loop, name="notification-executor", daemon=True)
+            self._thread.start()
+        self._ready.wait(timeout=5)
+        logger.info(f"✅ [Notifications] Executor iniciado ({self.workers} workers, cola máx {self.max_queue})")
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Detiene el executor drenando las notificaciones pendientes
+
+        Args:
+            timeout: Tiempo máximo de drenado (default: drain_seconds)
+        """
+        if not self.running:
+            return
+
+        timeout = self.drain_seconds if timeout is None else timeout
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(timeout), self._loop)
+        try:
+            future.result(timeout=timeout + 5)
+        except FutureTimeoutError:
+            logger.warning("⚠️ [Notifications] Timeout deteniendo el executor")
+
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread:
+            self._thread.join(timeout=5)
+        logger.info("🛑 [Notifications] Executor detenido")
+
+    def add_drain_hook(self, hook: Callable[[], Awaitable[Any]]):
+        """Registra una corutina a ejecutar en el loop al detener, tras drenar la cola"""
+        self._drain_hooks.append(hook)
+
+    def _run_loop(self):
+        """Cuerpo del hilo: crea el loop, el cliente HTTP y los consumidores"""
+        from app.clients.waha_client import shared_http_client
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            limits=httpx.Limits(max_connections=self.workers * 2, max_keepalive_connections=self.workers)
+        )
+        # Los consumidores heredan el cliente compartido vía contexto
+        shared_http_client.set(self._http_client)
+        self._consumers = [loop.create_task(self._consume(i)) for i in range(self.workers)]
+
+        loop.call_soon(self._ready.set)
+        try:
+            loop.run_forever()
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+            self._loop = None
+
+    async def _shutdown(self, timeout: float):
+        """Drena la cola, cancela consumidores y cierra el cliente HTTP"""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ [Notifications] {self._pending} notificaciones sin enviar al detener")
+
+        for hook in self._drain_hooks:
+            try:
+                await hook()
+            except Exception as e:
+                logger.warning(f"⚠️ [Notifications] Error en drain hook: {e}")
+
+        for consumer in self._consumers:
+            consumer.cancel()
+        await asyncio.gather(*self._consumers, return_exceptions=True)
+        await self._http_client.aclose()
+
+    # ═══════════════════════════════════════════════════════════
+    # ENCOLADO / EJECUCIÓN
+    # ═══════════════════════════════════════════════════════════
+
+    async def run_db(self, fn: Callable[..., T], *args: Any) -> T:
+        """
+        Ejecuta trabajo de BD bloqueante fuera del event loop
+
+        Sirve desde cualquier loop (jobs, workers, API). La sesión de un job
+        se usa desde un hilo a la vez: los jobs esperan cada llamada.
+
+        Args:
+            fn: Función sincrónica (consultas, commit, cierre de sesión)
+            *args: Argumentos de fn
+
+        Returns:
+            Lo que retorne fn
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._db_pool, fn, *args)
+
+    def submit(self, name: str, job: NotificationJob) -> bool:
+        """
+        Programa una notificación (seguro desde cualquier hilo)
+
+        Args:
+            name: Tipo de notificación (para logs y métricas)
+            job: Función async que recibe una sesión de BD propia
+
+        Returns:
+            False si la cola estaba llena y la notificación se descartó
+        """
+        if not self.running:
+            self.start()
+
+        with self._lock:
+            if self._pending >= self.max_queue:
+                self._dropped += 1
+                logger.error(f"❌ [Notifications] Cola llena ({self._pending}), notificación '{name}' descartada")
+                return False
+            self._pending += 1
+            self._submitted += 1
+
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, _QueuedJob(name, job))
+        logger.debug(f"📤 [Notifications] '{name}' programada ({self._pending} pendientes)")
+        return True
+
+    async def _consume(self, worker_id: int):
+        """Consumidor: ejecuta jobs de la cola uno a la vez"""
+        from config.database import SessionLocal
+
+        while True:
+            item: _QueuedJob = await self._queue.get()
+            started_at = time.perf_counter()
+            db = SessionLocal()
+            success = False
+            try:
+                await item.job(db)
+                success = True
+            except Exception as e:
+                logger.warning(f"⚠️ [Notifications] Error en '{item.name}': {e}")
+            finally:
+                # Cerrar devuelve la conexión al pool (puede hacer rollback): fuera del loop
+                try:
+                    await self.run_db(db.close)
+                except Exception as e:
+                    logger.warning(f"⚠️ [Notifications] Error cerrando sesión de '{item.name}': {e}")
+                with self._lock:
+                    self._pending -= 1
+                self._record(item, started_at, success)
+                self._queue.task_done()
+
+    def _record(self, item: _QueuedJob, started_at: float, success: bool):
+        """Acumula métricas de un job terminado"""
+        finished_at = time.perf_counter()
+        stats = self._per_job.setdefault(item.name, {
+            "count": 0, "failed": 0, "queue_wait_seconds": 0.0, "run_seconds": 0.0, "max_run_seconds": 0.0
+        })
+        run_seconds = finished_at - started_at
+        stats["count"] += 1
+        stats["queue_wait_seconds"] += started_at - item.enqueued_at
+        stats["run_seconds"] += run_seconds
+        stats["max_run_seconds"] = max(stats["max_run_seconds"], run_seconds)
+
+        if success:
+            self._completed += 1
+        else:
+            self._failed += 1
+            stats["failed"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas del executor"""
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "submitted": self._submitted,
+            "completed": self._completed,
+            "failed": self._failed,
+            "dropped": self._dropped,
+            "jobs": {
+                name: {
+                    "count": int(stats["count"]),
+                    "failed": int(stats["failed"]),
+                    "avg_queue_wait_ms": round(stats["queue_wait_seconds"] / stats["count"] * 1000, 1),
+                    "avg_run_ms": round(stats["run_seconds"] / stats["count"] * 1000, 1),
+                    "max_run_ms": round(stats["max_run_seconds"] * 1000, 1)
+                }
+                for name, stats in self._per_job.items()
+            }
+        }
+
+
+# Instancia global
+notification_executor = NotificationExecutor(
+    workers=settings.notification_workers,
+    max_queue=settings.notification_queue_size,
+    drain_seconds=settings.notification_drain_seconds,
+    db_threads=settings.notification_db_threads
+)
@@ -3,11 +3,12 @@ Servicio para gestión de ofrecimientos de productos
 """
 from typing import Optional, Dict, List
 from sqlalchemy.orm import Session
-from app.database.models import Product, Customer, Order
+from app.database.models import Product, OrderItem
 from app.services.order_service import OrderService
 from app.services.product_service import ProductService
+from app.services.product_affinity import product_affinity
+from app.services.co_purchase_recommender import co_purchase_recommender
 from loguru import logger
-import random
 
 
 class OfferService:
@@ -28,9 +29,17 @@ class OfferService:
         Selecciona un producto para ofrecer basado en el historial del cliente
         
         Prioridad:
-        1. El producto que el cliente más ha ordenado (que no esté en la orden actual)
-        2. El segundo producto que el cliente más ha ordenado (que no esté en la orden actual)
-        3. Un producto aleatorio
+        1. Lo que otros clientes compraron junto con los productos de la orden actual
+        2. El producto que el cliente más ha ordenado (que no esté en la orden actual)
+        3. El siguiente más ordenado si el anterior está excluido o sin stock
+        4. Sin orden actual: lo comprado junto con lo que el cliente más ordena
+        5. El más vendido entre todos los clientes
+        6. Un producto aleatorio
+        
+        Los rankings salen de la tabla de afinidad cacheada en memoria (ver
+        product_affinity.py) y de la matriz de co-compra (ver
+        co_purchase_recommender.py): elegir es recorrer listas saltando
+        excluidos y leer el producto elegido por ID.
         
         Args:
             customer_id: ID del cliente
@@ -45,86 +54,94 @@ class OfferService:
                 "description": str,
                 "image_path": str,
                 "stock": int,
-                "selection_reason": str  # "most_ordered", "second_most_ordered", "random"
+                "selection_reason": str  # "bought_together", "most_ordered", "second_most_ordered", "popular", "random"
             }
             O None si no hay productos disponibles
         """
         try:
             logger.info(f"🎯 Seleccionando producto para ofrecer al cliente {customer_id}")
             
-            # 1. Obtener productos que NO deben estar en la oferta
-            excluded_ids = exclude_product_ids or []
+            # 1. Productos que NO deben estar en la oferta (los de la orden actual y los indicados)
+            order_product_ids = []
             if current_order_id:
-                products_in_order = self.order_service.get_products_not_in_order(current_order_id)
-                # Invertir la lógica: necesitamos los que SÍ están en la orden para excluirlos
-                order = self.db.query(Order).filter(Order.id == current_order_id).first()
-                if order:
-                    excluded_ids.extend([item.product_id for item in order.items])
-            
-            # 2. Obtener historial del cliente
-            history = self.order_service.get_customer_product_history(customer_id, limit=20)
-            
-            # 3. Filtrar productos del historial que no estén excluidos
-            available_history = [
-                item for item in history 
-                if item["product_id"] not in excluded_ids
-            ]
-            
-            # 4. Intentar ofrecer según prioridad
-            selected_product = None
-            selection_reason = None
+                order_product_ids = [
+                    row.product_id for row in self.db.query(OrderItem.product_id).filter(
+                        OrderItem.order_id == current_order_id
+                    )
+                ]
+            excluded_ids = set(exclude_product_ids or []) | set(order_product_ids)
             
-            # Prioridad 1: Producto más ordenado
-            if len(available_history) >= 1:
-                selected_product_id = available_history[0]["product_id"]
-                selected_product = self.product_service.get_product_by_id(selected_product_id)
-                selection_reason = "most_ordered"
-                logger.info(f"  ✅ Seleccionado producto más ordenado: {available_history[0]['product_name']} ({available_history[0]['times_ordered']} veces)")
+            # 2. Comprados junto con lo que lleva en la orden
+            if order_product_ids:
+                selected_product = self._bought_together(order_product_ids, excluded_ids)
+                if selected_product:
+                    return self._offer_dict(selected_product, "bought_together")
             
-            # Prioridad 2: Segundo producto más ordenado
-            elif len(available_history) >= 2:
-                selected_product_id = available_history[1]["product_id"]
-                selected_product = self.product_service.get_product_by_id(selected_product_id)
-                selection_reason = "second_most_ordered"
-                logger.info(f"  ✅ Seleccionado segundo producto más ordenado: {available_history[1]['product_name']} ({available_history[1]['times_ordered']} veces)")
+            # 3. Historial del cliente (más ordenado primero)
+            history = product_affinity.customer_ranking(self.db, customer_id)
+            for position, item in enumerate(history):
+                if item["product_id"] in excluded_ids:
+                    continue
+                selected_product = self._available_product(item["product_id"])
+                if selected_product:
+                    selection_reason = "most_ordered" if position == 0 else "second_most_ordered"
+                    logger.info(f"  ✅ Seleccionado producto más ordenado: {item['product_name']} ({item['times_ordered']} veces)")
+                    return self._offer_dict(selected_product, selection_reason)
             
-            # Prioridad 3: Producto aleatorio
-            else:
-                logger.info("  📦 No hay historial suficiente, seleccionando producto aleatorio...")
-                all_products = self.product_service.get_all_products()
-                available_products = [
-                    p for p in all_products 
-                    if p.id not in excluded_ids and p.stock > 0
-                ]
-                
-                if available_products:
-                    selected_product = random.choice(available_products)
-                    selection_reason = "random"
-                    logger.info(f"  ✅ Seleccionado producto aleatorio: {selected_product.name}")
-                else:
-                    logger.warning("  ⚠️ No hay productos disponibles para ofrecer")
-                    return None
+            # 4. Comprados junto con lo que el cliente suele pedir (ofrecimiento tras saludo)
+            if history and not order_product_ids:
+                selected_product = self._bought_together([item["product_id"] for item in history[:3]], excluded_ids)
+                if selected_product:
+                    return self._offer_dict(selected_product, "bought_together")
             
-            # 5. Verificar que el producto esté disponible
-            if not selected_product or selected_product.stock <= 0:
-                logger.warning(f"  ⚠️ Producto seleccionado no disponible o sin stock")
-                return None
+            # 5. Más vendidos y, después, el resto del catálogo en orden aleatorio
+            logger.info("  📦 No hay historial suficiente, seleccionando del ranking global...")
+            ranking, popular_count = product_affinity.popularity_ranking(self.db)
+            for position, product_id in enumerate(ranking):
+                if product_id in excluded_ids:
+                    continue
+                selected_product = self._available_product(product_id)
+                if selected_product:
+                    selection_reason = "popular" if position < popular_count else "random"
+                    logger.info(f"  ✅ Seleccionado producto ({selection_reason}): {selected_product.name}")
+                    return self._offer_dict(selected_product, selection_reason)
             
-            # 6. Retornar información del producto
-            return {
-                "product_id": selected_product.id,
-                "product_name": selected_product.name,
-                "price": float(selected_product.price),
-                "description": selected_product.description or "",
-                "image_path": selected_product.image_path or "",
-                "stock": selected_product.stock,
-                "selection_reason": selection_reason
-            }
+            logger.warning("  ⚠️ No hay productos disponibles para ofrecer")
+            return None
             
         except Exception as e:
             logger.error(f"❌ Error seleccionando producto para ofrecer: {e}")
             return None
     
+    def _bought_together(self, seed_ids: List[str], excluded_ids: set) -> Optional[Product]:
+        """Primer producto disponible de los comprados junto con los dados"""
+        for product_id, score in co_purchase_recommender.recommend(seed_ids, k=10, exclude=excluded_ids):
+            selected_product = self._available_product(product_id)
+            if selected_product:
+                logger.info(f"  ✅ Seleccionado producto comprado junto con {len(seed_ids)} productos: {selected_product.name} ({score:.2f})")
+                return selected_product
+        return None
+    
+    def _available_product(self, product_id: str) -> Optional[Product]:
+        """Producto activo y con stock, o None"""
+        product = self.db.get(Product, product_id)
+        if product and product.is_active and product.stock > 0:
+            return product
+        return None
+    
+    @staticmethod
+    def _offer_dict(product: Product, selection_reason: str) -> Dict:
+        """Información del producto para el ofrecimiento"""
+        return {
+            "product_id": product.id,
+            "product_name": product.name,
+            "price": float(product.price),
+            "description": product.description or "",
+            "image_path": product.image_path or "",
+            "stock": product.stock,
+            "selection_reason": selection_reason
+        }
+    
     def format_offer_message(self, product: Dict, include_price: bool = True) -> str:
         """
         Formatea el mensaje de ofrecimiento
@@ -7,6 +7,11 @@ from loguru import logger
 
 from config.database import SessionLocal
 from app.services.order_notification_service import OrderNotificationService
+from app.services.cluster_coordinator import cluster_coordinator
+
+
+# Lease de cluster: solo una instancia monitorea órdenes
+ORDER_MONITOR_LEASE = "order_monitor"
 
 
 class OrderMonitorWorker:
@@ -53,7 +58,10 @@ class OrderMonitorWorker:
         
         while self.running:
             try:
-                await self._check_orders()
+                if cluster_coordinator.is_leader(ORDER_MONITOR_LEASE):
+                    await self._check_orders()
+                else:
+                    logger.debug("🔍 [OrderMonitorWorker] Otra instancia tiene el lease, omitiendo chequeo")
             except Exception as e:
                 logger.error(f"❌ Error en monitor loop: {e}")
             
@@ -1,13 +1,17 @@
 """
 Servicio para notificar a usuarios sobre cambios de estado en órdenes
+
+Las consultas corren con notification_executor.run_db, fuera del event loop
+(el del executor de notificaciones, el del monitor o el de la API).
 """
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from loguru import logger
 
 from app.database.models import Order, Customer
 from app.clients.waha_client import WAHAClient
+from app.services.notification_executor import notification_executor
 from config.settings import settings
 from app.core.correlation import set_client_context
 
@@ -19,6 +23,41 @@ class OrderNotificationService:
         self.db = db
         self.waha = WAHAClient()
     
+    def _load_order_and_customer(self, order_id: str) -> Tuple[Optional[Order], Optional[Customer]]:
+        """
+        Carga la orden (con items) y su cliente
+        
+        Bloqueante: usar con notification_executor.run_db.
+        """
+        order = self.db.query(Order).options(selectinload(Order.items)).filter(Order.id == order_id).first()
+        if not order:
+            return None, None
+        
+        customer = self.db.query(Customer).filter(
+            Customer.id == order.customer_id
+        ).first()
+        return order, customer
+    
+    def _load_recent_confirmed(self) -> List[Tuple[Order, Optional[Customer]]]:
+        """
+        Órdenes confirmadas en las últimas 24 horas (con items) y sus clientes
+        
+        Bloqueante: usar con notification_executor.run_db.
+        """
+        orders = self.db.query(Order).options(selectinload(Order.items)).filter(
+            Order.status == "confirmed",
+            Order.confirmed_at.isnot(None),
+            # Solo órdenes confirmadas en las últimas 24 horas
+            Order.confirmed_at >= datetime.utcnow() - timedelta(hours=24)
+        ).all()
+        
+        customer_ids = {order.customer_id for order in orders}
+        customers = {
+            customer.id: customer
+            for customer in self.db.query(Customer).filter(Customer.id.in_(customer_ids))
+        } if customer_ids else {}
+        return [(order, customers.get(order.customer_id)) for order in orders]
+    
     async def check_and_notify_confirmed_orders(self) -> int:
         """
         Revisa órdenes que pasaron de pending a confirmed
@@ -30,18 +69,13 @@ class OrderNotificationService:
         try:
             # Buscar órdenes confirmadas recientemente (últimas 24 horas)
             # que no han sido notificadas
-            recent_confirmed = self.db.query(Order).filter(
-                Order.status == "confirmed",
-                Order.confirmed_at.isnot(None),
-                # Solo órdenes confirmadas en las últimas 24 horas
-                Order.confirmed_at >= datetime.utcnow() - timedelta(hours=24)
-            ).all()
+            recent_confirmed = await notification_executor.run_db(self._load_recent_confirmed)
             
             logger.debug(f"🔍 [OrderNotification] Encontradas {len(recent_confirmed)} órdenes confirmadas en últimas 24h")
             
             notifications_sent = 0
             
-            for order in recent_confirmed:
+            for order, customer in recent_confirmed:
                 logger.debug(f"🔍 [OrderNotification] Revisando orden {order.order_number}, confirmed_at={order.confirmed_at}")
                 # Verificar si ya fue notificada
                 # (podríamos agregar un campo order.notification_sent)
@@ -58,11 +92,6 @@ class OrderNotificationService:
                 
                 logger.debug(f"   ✅ Orden {order.order_number} dentro de ventana de notificación")
                 
-                # Obtener customer
-                customer = self.db.query(Customer).filter(
-                    Customer.id == order.customer_id
-                ).first()
-                
                 if not customer or not customer.phone:
                     logger.warning(f"⚠️ Customer no encontrado para orden {order.order_number}")
                     continue
@@ -186,16 +215,12 @@ class OrderNotificationService:
             True si se envió exitosamente
         """
         try:
-            order = self.db.query(Order).filter(Order.id == order_id).first()
+            order, customer = await notification_executor.run_db(self._load_order_and_customer, order_id)
             
             if not order:
                 logger.warning(f"⚠️ Orden no encontrada: {order_id}")
                 return False
             
-            customer = self.db.query(Customer).filter(
-                Customer.id == order.customer_id
-            ).first()
-            
             if not customer:
                 logger.warning(f"⚠️ Customer no encontrado para orden {order.order_number}")
                 return False
@@ -264,16 +289,12 @@ class OrderNotificationService:
             True si se envió exitosamente
         """
         try:
-            order = self.db.query(Order).filter(Order.id == order_id).first()
+            order, customer = await notification_executor.run_db(self._load_order_and_customer, order_id)
 
             if not order:
                 logger.warning(f"⚠️ Orden no encontrada: {order_id}")
                 return False
 
-            customer = self.db.query(Customer).filter(
-                Customer.id == order.customer_id
-            ).first()
-
             if not customer:
                 logger.warning(f"⚠️ Customer no encontrado para orden {order.order_number}")
                 return False
@@ -325,7 +346,7 @@ class OrderNotificationService:
                 logger.info(f"✅ Notificación de cancelación enviada para orden {order.order_number}")
 
                 # Limpiar la conversación del usuario (marcar como inactiva)
-                self._clear_customer_conversation(customer.id)
+                await notification_executor.run_db(self._clear_customer_conversation, customer.id)
             else:
                 logger.error(f"❌ Error notificando cancelación después de reintentos: {result}")
                 logger.critical(f"🚨 CRÍTICO: No se pudo notificar cancelación de orden {order.order_number} a {customer.phone}")
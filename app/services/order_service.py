@@ -6,10 +6,9 @@ from sqlalchemy.orm import Session
 from datetime import datetime
 from app.database.models import Order, OrderItem, OrderStatus, Product, Customer
 from app.services.product_service import ProductService
+from app.services.product_affinity import product_affinity
 from loguru import logger
 import uuid
-import asyncio
-import threading
 
 
 class OrderService:
@@ -21,45 +20,26 @@ class OrderService:
 
     def _notify_admins_async(self, order_id: str, notification_func: Callable):
         """
-        Helper para ejecutar notificaciones de admin de forma asíncrona sin bloquear.
-        Ejecuta la notificación en un thread separado con su propia sesión de DB.
+        Programa una notificación de admin en el executor compartido sin bloquear.
+        El job carga la orden con su propia sesión de DB.
 
         Args:
             order_id: ID de la orden
             notification_func: Función que recibe (admin_service, order) y retorna la corutina de notificación
         """
-        from config.database import SessionLocal
         from app.services.admin_notification_service import AdminNotificationService
+        from app.services.notification_executor import notification_executor
 
-        def run_notification():
-            thread_db = None
-            try:
-                # Create a new database session for this thread
-                thread_db = SessionLocal()
-
-                # Load the order in this thread's session
-                thread_order = thread_db.query(Order).filter(Order.id == order_id).first()
-
-                if thread_order:
-                    # Create service with thread's database session
-                    admin_service = AdminNotificationService(thread_db)
-
-                    # Get the notification coroutine and run it with its own event loop
-                    notification_coro = notification_func(admin_service, thread_order)
-                    asyncio.run(notification_coro)
-                else:
-                    logger.warning(f"⚠️ No se encontró la orden {order_id} en el thread de notificación")
-            except Exception as e:
-                logger.warning(f"⚠️ Error en thread de notificación de admin: {e}")
-            finally:
-                if thread_db:
-                    thread_db.close()
+        async def notify(db: Session):
+            admin_service = AdminNotificationService(db)
+            order = await notification_executor.run_db(admin_service.load_order, order_id)
+            if not order:
+                logger.warning(f"⚠️ No se encontró la orden {order_id} para la notificación de admin")
+                return
+            await notification_func(admin_service, order)
 
         try:
-            # Run in background thread to avoid blocking
-            notification_thread = threading.Thread(target=run_notification, daemon=True)
-            notification_thread.start()
-            logger.debug("📤 Tarea de notificación de admin programada")
+            notification_executor.submit("admin_order_update", notify)
         except Exception as e:
             logger.warning(f"⚠️ Error programando notificación de admin: {e}")
     
@@ -229,6 +209,7 @@ class OrderService:
                 self.product_service.update_stock(item.product_id, -item.quantity)
             
             # Actualizar estado
+            product_affinity.on_status_change(self.db, order, order.status, OrderStatus.CONFIRMED.value)
             order.status = OrderStatus.CONFIRMED.value
             order.confirmed_at = datetime.utcnow()
 
@@ -279,6 +260,7 @@ class OrderService:
                     self.product_service.update_stock(item.product_id, item.quantity)
             
             # Actualizar estado
+            product_affinity.on_status_change(self.db, order, order.status, OrderStatus.CANCELLED.value)
             order.status = OrderStatus.CANCELLED.value
             order.cancelled_at = datetime.utcnow()
             order.cancellation_reason = reason
@@ -328,6 +310,7 @@ class OrderService:
                 order.delivered_at = datetime.utcnow()
 
             old_status = order.status
+            product_affinity.on_status_change(self.db, order, old_status, new_status)
             order.status = new_status
 
             self.db.commit()
@@ -608,6 +591,7 @@ class OrderService:
                 
                 # Reducir stock
                 product.stock -= quantity
+                product_affinity.record_items(self.db, order.customer_id, [(product.id, product.name, 1, quantity)])
                 
                 logger.info(f"  ✅ Agregado: {product.name} x{quantity} (${item_subtotal:.2f})")
             
@@ -708,6 +692,12 @@ class OrderService:
                 logger.info(f"  ✅ Stock devuelto: {product_for_stock.name} +{quantity} (total: {product_for_stock.stock})")
             
             # 6. Actualizar o eliminar el OrderItem
+            removed_times = 1 if quantity == order_item.quantity else 0
+            product_affinity.record_items(
+                self.db, order.customer_id,
+                [(order_item.product_id, order_item.product_name, -removed_times, -quantity)]
+            )
+            
             if quantity == order_item.quantity:
                 # Eliminar completamente el item
                 logger.info(f"  🗑️ Eliminando item completamente (todas las unidades)")
@@ -757,6 +747,9 @@ class OrderService:
         Obtiene el historial de productos ordenados por un cliente,
         ordenados por frecuencia (más ordenados primero)
         
+        Lee la tabla de afinidad (mantenida al confirmar/cancelar órdenes) a
+        través del ranking cacheado, sin agregar order_items.
+        
         Args:
             customer_id: ID del cliente
             limit: Número máximo de productos a retornar
@@ -764,37 +757,8 @@ class OrderService:
         Returns:
             Lista de dicts con: {"product_id", "product_name", "times_ordered", "total_quantity"}
         """
-        from sqlalchemy import func
-        
         try:
-            # Query para agrupar productos por frecuencia
-            history = self.db.query(
-                OrderItem.product_id,
-                OrderItem.product_name,
-                func.count(OrderItem.id).label('times_ordered'),
-                func.sum(OrderItem.quantity).label('total_quantity')
-            ).join(
-                Order, OrderItem.order_id == Order.id
-            ).filter(
-                Order.customer_id == customer_id,
-                Order.status == OrderStatus.CONFIRMED.value
-            ).group_by(
-                OrderItem.product_id,
-                OrderItem.product_name
-            ).order_by(
-                func.count(OrderItem.id).desc()  # Más ordenados primero
-            ).limit(limit).all()
-            
-            result = [
-                {
-                    "product_id": item.product_id,
-                    "product_name": item.product_name,
-                    "times_ordered": item.times_ordered,
-                    "total_quantity": item.total_quantity
-                }
-                for item in history
-            ]
-            
+            result = product_affinity.customer_ranking(self.db, customer_id)[:limit]
             logger.info(f"📊 Historial de cliente: {len(result)} productos únicos")
             return result
             
@@ -0,0 +1,249 @@
+"""
+Afinidad cliente × producto y ranking de popularidad para los ofrecimientos
+
+El ofrecimiento se dispara tras cada orden y saludo, y antes agregaba con
+GROUP BY los order_items confirmados del cliente, cargaba todos los IDs del
+catálogo y, sin historial, el catálogo completo para random.choice. Ahora:
+
+- customer_product_affinity guarda veces y unidades por cliente y producto;
+  OrderService la actualiza en la misma transacción al confirmar, cancelar,
+  cambiar de estado o modificar items de una orden (on_status_change /
+  record_items). Cuentan las órdenes confirmadas y las que siguieron su curso
+  (en proceso, enviadas, entregadas).
+- Cada proceso cachea el ranking de cada cliente (LRU) y un ranking global:
+  primero los más vendidos y después el resto del catálogo activo en orden
+  aleatorio (el "producto aleatorio" de siempre sin cargar el catálogo).
+  El ranking del cliente se invalida al hacer commit de un cambio suyo; el
+  global y los de otras instancias vencen por TTL.
+
+Elegir un producto es recorrer la lista cacheada saltando los excluidos.
+"""
+import random
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from config.settings import settings
+from app.database.models import CustomerProductAffinity, OrderStatus, Product
+
+
+# Estados en los que una orden cuenta como compra
+COUNTED_STATUSES = {
+    OrderStatus.CONFIRMED.value,
+    OrderStatus.PROCESSING.value,
+    OrderStatus.SHIPPED.value,
+    OrderStatus.DELIVERED.value
+}
+
+# (product_id, product_name, delta de veces, delta de unidades)
+AffinityDelta = Tuple[str, str, int, int]
+
+
+class ProductAffinity:
+    """Escritura incremental de la tabla de afinidad y rankings cacheados"""
+
+    def __init__(self, max_customers: int = 5000, customer_ttl: float = 600, popularity_ttl: float = 300):
+        """
+        Args:
+            max_customers: Rankings de clientes en memoria (LRU)
+            customer_ttl: Vida de un ranking de cliente (cambios hechos por otra instancia)
+            popularity_ttl: Vida del ranking global
+        """
+        self.max_customers = max_customers
+        self.customer_ttl = customer_ttl
+        self.popularity_ttl = popularity_ttl
+
+        self._lock = threading.Lock()
+        self._customers: "OrderedDict[str, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._popularity: Optional[Tuple[float, List[str], int]] = None
+
+        # Métricas
+        self._hits = 0
+        self._misses = 0
+        self._popularity_builds = 0
+        self._updates = 0
+
+    # ═══════════════════════════════════════════════════════════
+    # ESCRITURA (dentro de la transacción de la orden)
+    # ═══════════════════════════════════════════════════════════
+
+    def on_status_change(self, db: Session, order, old_status: Optional[str], new_status: str) -> None:
+        """
+        Suma o resta los items de una orden si entra o sale de los estados que cuentan
+
+        No hace commit: va en la transacción del cambio de estado.
+        """
+        was_counted = old_status in COUNTED_STATUSES
+        is_counted = new_status in COUNTED_STATUSES
+        if was_counted == is_counted:
+            return
+
+        sign = 1 if is_counted else -1
+        self.record_items(db, order.customer_id, [
+            (item.product_id, item.product_name, sign, sign * item.quantity)
+            for item in order.items
+        ])
+
+    def record_items(self, db: Session, customer_id: str, deltas: Iterable[AffinityDelta]) -> None:
+        """
+        Aplica deltas de veces y unidades a la afinidad de un cliente
+
+        No hace commit; el ranking cacheado del cliente se invalida cuando la
+        transacción se confirma.
+        """
+        grouped: Dict[str, List[Any]] = defaultdict(lambda: ["", 0, 0])
+        for product_id, product_name, times, quantity in deltas:
+            entry = grouped[product_id]
+            entry[0] = product_name
+            entry[1] += times
+            entry[2] += quantity
+        if not grouped:
+            return
+
+        rows = {
+            row.product_id: row
+            for row in db.query(CustomerProductAffinity).filter(
+                CustomerProductAffinity.customer_id == customer_id,
+                CustomerProductAffinity.product_id.in_(list(grouped))
+            )
+        }
+        now = datetime.utcnow()
+        for product_id, (product_name, times, quantity) in grouped.items():
+            row = rows.get(product_id)
+            if row is None:
+                if times <= 0 and quantity <= 0:
+                    continue
+                row = CustomerProductAffinity(
+                    customer_id=customer_id,
+                    product_id=product_id,
+                    product_name=product_name,
+                    times_ordered=0,
+                    total_quantity=0
+                )
+                db.add(row)
+
+            row.times_ordered = max(0, (row.times_ordered or 0) + times)
+            row.total_quantity = max(0, (row.total_quantity or 0) + quantity)
+            if times > 0:
+                row.product_name = product_name
+                row.last_ordered_at = now
+            if row.times_ordered == 0 and row.total_quantity == 0 and product_id in rows:
+                db.delete(row)
+
+        self._updates += 1
+        event.listen(db, "after_commit", lambda session: self.invalidate(customer_id), once=True)
+
+    def invalidate(self, customer_id: Optional[str] = None) -> None:
+        """Descarta el ranking de un cliente (o todos los rankings)"""
+        with self._lock:
+            if customer_id is None:
+                self._customers.clear()
+                self._popularity = None
+            else:
+                self._customers.pop(customer_id, None)
+
+    # ═══════════════════════════════════════════════════════════
+    # LECTURA (rankings cacheados)
+    # ═══════════════════════════════════════════════════════════
+
+    def customer_ranking(self, db: Session, customer_id: str) -> List[Dict[str, Any]]:
+        """
+        Productos del cliente de más a menos comprados
+
+        Returns:
+            Lista de {"product_id", "product_name", "times_ordered", "total_quantity"}
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._customers.get(customer_id)
+            if cached is not None and cached[0] > now:
+                self._customers.move_to_end(customer_id)
+                self._hits += 1
+                return cached[1]
+            self._misses += 1
+
+        rows = db.query(CustomerProductAffinity).filter(
+            CustomerProductAffinity.customer_id == customer_id,
+            CustomerProductAffinity.times_ordered > 0
+        ).order_by(
+            CustomerProductAffinity.times_ordered.desc(),
+            CustomerProductAffinity.total_quantity.desc()
+        ).all()
+        ranking = [
+            {
+                "product_id": row.product_id,
+                "product_name": row.product_name,
+                "times_ordered": row.times_ordered,
+                "total_quantity": row.total_quantity
+            }
+            for row in rows
+        ]
+
+        with self._lock:
+            self._customers[customer_id] = (now + self.customer_ttl, ranking)
+            self._customers.move_to_end(customer_id)
+            while len(self._customers) > self.max_customers:
+                self._customers.popitem(last=False)
+        return ranking
+
+    def popularity_ranking(self, db: Session) -> Tuple[List[str], int]:
+        """
+        Ranking global de productos activos
+
+        Returns:
+            (product_ids, cuántos de los primeros son más vendidos; el resto va en orden aleatorio)
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._popularity is not None and self._popularity[0] > now:
+                return self._popularity[1], self._popularity[2]
+
+        sold = db.query(
+            CustomerProductAffinity.product_id
+        ).join(
+            Product, Product.id == CustomerProductAffinity.product_id
+        ).filter(
+            Product.is_active == True
+        ).group_by(
+            CustomerProductAffinity.product_id
+        ).order_by(
+            func.sum(CustomerProductAffinity.times_ordered).desc()
+        ).all()
+        popular = [row.product_id for row in sold]
+
+        seen = set(popular)
+        rest = [row.id for row in db.query(Product.id).filter(Product.is_active == True) if row.id not in seen]
+        random.shuffle(rest)
+
+        with self._lock:
+            self._popularity = (now + self.popularity_ttl, popular + rest, len(popular))
+            self._popularity_builds += 1
+        logger.debug(f"📊 [Affinity] Ranking global: {len(popular)} vendidos, {len(rest)} sin ventas")
+        return popular + rest, len(popular)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Aciertos del cache de rankings y actualizaciones incrementales"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "customers_cached": len(self._customers),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "popularity_builds": self._popularity_builds,
+                "updates": self._updates
+            }
+
+
+# Instancia global
+product_affinity = ProductAffinity(
+    max_customers=settings.offer_affinity_cache_entries,
+    customer_ttl=settings.offer_affinity_ttl_seconds,
+    popularity_ttl=settings.offer_popularity_ttl_seconds
+)
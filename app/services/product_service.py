@@ -83,6 +83,40 @@ class ProductService:
         
         return products
     
+    def get_similar_products(
+        self,
+        text: str,
+        k: int,
+        only_available: bool = True,
+        min_score: float = 0.0
+    ) -> List[Product]:
+        """
+        Productos semánticamente más parecidos a un texto (índice de embeddings)
+
+        Solo para prompts y sugerencias: un vecino parecido no es el producto
+        que el cliente nombró (get_product_by_name_fuzzy no lo usa).
+
+        Args:
+            text: Mensaje o nombre a buscar
+            k: Máximo de productos
+            only_available: Solo productos activos y con stock
+            min_score: Similitud coseno mínima
+
+        Returns:
+            Productos de mayor a menor similitud ([] si el índice no está disponible)
+        """
+        from app.services.product_vector_index import product_vector_index
+
+        ranked = [product_id for product_id, score in product_vector_index.search(text, k) if score >= min_score]
+        if not ranked:
+            return []
+
+        query = self.db.query(Product).filter(Product.id.in_(ranked), Product.is_active == True)
+        if only_available:
+            query = query.filter(Product.stock > 0)
+        by_id = {product.id: product for product in query.all()}
+        return [by_id[product_id] for product_id in ranked if product_id in by_id]
+
     def get_product_by_name_fuzzy(self, name: str) -> Optional[Product]:
         """
         Encuentra un producto por nombre con matching flexible
@@ -90,7 +124,10 @@ class ProductService:
         Args:
             name: Nombre del producto a buscar
         """
-        name_lower = name.lower().strip()
+        name_lower = (name or "").lower().strip()
+        if not name_lower:
+            # contains("") coincidiría con el primer producto activo
+            return None
         
         # Búsqueda exacta primero
         exact = self.db.query(Product).filter(
@@ -0,0 +1,457 @@
+"""
+Índice vectorial de productos - Recuperación semántica para los prompts
+
+Antes el prompt de extracción llevaba los primeros 20 productos por nombre
+(los demás eran invisibles para el LLM) y el matching dependía de LIKE.
+Este índice guarda un embedding por producto activo (nombre, categoría y
+descripción) y para cada mensaje devuelve los top-k más parecidos:
+
+- Almacenamiento: una matriz float32 (n, dim) con filas normalizadas en
+  <versión>/vectors.npy, que se abre con mmap (np.load(mmap_mode="r")):
+  cargarla no copia nada y varios procesos comparten las páginas del SO.
+  ids.json trae el modelo, la versión, el ID de cada fila y el hash del texto
+  embebido (si el texto no cambió, actualizar precio o stock no vuelve a
+  llamar al modelo).
+- Escritura: cada cambio escribe un directorio de versión nuevo y luego
+  ids.json pasa a apuntarlo (temporal + os.replace), como el recomendador de
+  co-compra: nunca se reemplaza un archivo mapeado (en Windows falla). Los
+  lectores recargan cuando cambia el mtime de ids.json. Solo escribe la API
+  (alta/edición/baja) y la sincronización al arrancar.
+- Búsqueda: un producto matriz-vector (coseno, las filas ya están
+  normalizadas) y argpartition para el top-k, sin ordenar todo el catálogo.
+  Los vectores de las consultas se cachean por texto plegado (el mismo
+  mensaje lo piden el análisis del turno y el SlotExtractor).
+
+numpy es opcional: sin él (o sin índice, o con el LLM caído) search()
+retorna [] y los llamadores usan la lista de siempre.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from config.settings import settings
+
+
+VECTORS_FILE = "vectors.npy"
+IDS_FILE = "ids.json"
+
+
+def _numpy():
+    """numpy si está instalado, None si no (el índice queda desactivado)"""
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+
+def product_text(name: str, category: Optional[str] = None, description: Optional[str] = None) -> str:
+    """Texto que se embebe de un producto"""
+    parts = [name.strip()]
+    if category:
+        parts.append(category.strip())
+    if description:
+        parts.append(description.strip())
+    return ". ".join(part for part in parts if part)
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class ProductVectorIndex:
+    """Embeddings de productos en una matriz mmap y búsqueda coseno top-k"""
+
+    def __init__(self, index_dir: Optional[str], model: str, query_cache_entries: int = 256):
+        """
+        Args:
+            index_dir: Directorio de vectors.npy e ids.json (None o "" = desactivado)
+            model: Modelo de embeddings (cambiarlo invalida el índice)
+            query_cache_entries: Vectores de consultas en memoria (LRU)
+        """
+        self.index_dir = Path(index_dir) if index_dir else None
+        self.model = model
+        self.query_cache_entries = query_cache_entries
+
+        self._lock = threading.Lock()
+        self._matrix = None  # np.ndarray (n, dim) float32, solo lectura
+        self._ids: List[str] = []
+        self._hashes: List[str] = []
+        self._mtime_ns: Optional[int] = None
+        self._queries: "OrderedDict[str, Any]" = OrderedDict()
+        self._sync_thread: Optional[threading.Thread] = None
+
+        # Métricas
+        self._searches = 0
+        self._search_ms_total = 0.0
+        self._query_cache_hits = 0
+        self._embedded = 0
+        self._embed_errors = 0
+        self._save_errors = 0
+        self._unavailable = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.index_dir is not None and _numpy() is not None
+
+    # ═══════════════════════════════════════════════════════════
+    # PERSISTENCIA
+    # ═══════════════════════════════════════════════════════════
+
+    def _vectors_path(self, meta: Dict[str, Any]) -> Path:
+        """vectors.npy de la versión de ids.json (los índices viejos no tienen versión)"""
+        version = meta.get("version")
+        return self.index_dir / version / VECTORS_FILE if version else self.index_dir / VECTORS_FILE
+
+    def _maybe_reload(self) -> None:
+        """Abre (o reabre si otro proceso lo reescribió) el índice del disco"""
+        ids_path = self.index_dir / IDS_FILE
+        try:
+            mtime_ns = ids_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns == self._mtime_ns:
+            return
+
+        np = _numpy()
+        with self._lock:
+            if mtime_ns == self._mtime_ns:
+                return
+            try:
+                meta = json.loads(ids_path.read_text(encoding="utf-8"))
+                matrix = np.load(self._vectors_path(meta), mmap_mode="r")
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ [ProductIndex] No se pudo abrir el índice: {e}")
+                return
+
+            if matrix.ndim != 2 or matrix.shape[0] != len(meta.get("ids", [])):
+                logger.warning("⚠️ [ProductIndex] vectors.npy no coincide con ids.json, se ignora")
+                return
+            self._mtime_ns = mtime_ns
+            if meta.get("model") != self.model:
+                logger.info(f"🔄 [ProductIndex] Índice de otro modelo ({meta.get('model')}), se reconstruirá")
+                self._matrix, self._ids, self._hashes = None, [], []
+                return
+
+            self._matrix = matrix
+            self._ids = list(meta["ids"])
+            self._hashes = list(meta.get("hashes", [""] * len(self._ids)))
+            logger.info(f"📂 [ProductIndex] {len(self._ids)} productos ({matrix.shape[1]} dims)")
+
+    def _save(self, matrix, ids: List[str], hashes: List[str]) -> bool:
+        """
+        Escribe una versión nueva, apunta ids.json a ella y la reabre con mmap
+        (llamar con el lock tomado)
+
+        Returns:
+            False si no se pudo escribir (el índice en memoria queda como estaba)
+        """
+        np = _numpy()
+        ids_path = self.index_dir / IDS_FILE
+        version = f"v{time.time_ns()}-{os.getpid()}"
+        version_dir = self.index_dir / version
+        try:
+            version_dir.mkdir(parents=True, exist_ok=True)
+            vectors_path = version_dir / VECTORS_FILE
+            np.save(vectors_path, np.ascontiguousarray(matrix, dtype=np.float32))
+
+            tmp_ids = ids_path.with_suffix(".tmp")
+            tmp_ids.write_text(
+                json.dumps({
+                    "model": self.model, "version": version, "dim": int(matrix.shape[1]),
+                    "ids": ids, "hashes": hashes
+                }),
+                encoding="utf-8"
+            )
+            os.replace(tmp_ids, ids_path)
+            new_matrix = np.load(vectors_path, mmap_mode="r")
+            mtime_ns = ids_path.stat().st_mtime_ns
+        except Exception as e:
+            self._save_errors += 1
+            logger.error(f"❌ [ProductIndex] No se pudo guardar el índice: {e}")
+            shutil.rmtree(version_dir, ignore_errors=True)
+            return False
+
+        self._matrix = new_matrix
+        self._ids = list(ids)
+        self._hashes = list(hashes)
+        self._mtime_ns = mtime_ns
+
+        # Versiones viejas (y el vectors.npy sin versión): los mmap abiertos siguen
+        # siendo válidos tras borrarlas; en Windows el borrado falla y se reintenta
+        # en el próximo guardado
+        for old in self.index_dir.glob("v*"):
+            if old.is_dir() and old.name != version:
+                shutil.rmtree(old, ignore_errors=True)
+        try:
+            (self.index_dir / VECTORS_FILE).unlink()
+        except OSError:
+            pass
+        return True
+
+    # ═══════════════════════════════════════════════════════════
+    # EMBEDDINGS
+    # ═══════════════════════════════════════════════════════════
+
+    def _embed(self, texts: List[str]):
+        """Matriz (len(texts), dim) normalizada; lanza excepción si el modelo falla"""
+        from app.clients.ollama_sync import ollama_sync_client
+
+        np = _numpy()
+        vectors = np.asarray(ollama_sync_client.embed(texts, model=self.model), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _query_vector(self, query: str):
+        from app.core.normalized_message import message_key
+
+        key = message_key(query)
+        with self._lock:
+            vector = self._queries.get(key)
+            if vector is not None:
+                self._queries.move_to_end(key)
+                self._query_cache_hits += 1
+                return vector
+
+        vector = self._embed([query])[0]
+        with self._lock:
+            self._queries[key] = vector
+            while len(self._queries) > self.query_cache_entries:
+                self._queries.popitem(last=False)
+        return vector
+
+    # ═══════════════════════════════════════════════════════════
+    # ESCRITURA
+    # ═══════════════════════════════════════════════════════════
+
+    def upsert(self, product_id: str, text: str) -> bool:
+        """
+        Agrega o actualiza un producto (no re-embebe si el texto no cambió)
+
+        Nunca lanza excepción: si el modelo falla el producto se agrega en la
+        próxima sincronización.
+
+        Returns:
+            True si el índice quedó al día
+        """
+        if not self.enabled:
+            return False
+        self._maybe_reload()
+
+        digest = _text_hash(text)
+        with self._lock:
+            row = self._ids.index(product_id) if product_id in self._ids else None
+            if row is not None and self._hashes[row] == digest:
+                return True
+
+        try:
+            vector = self._embed([text])
+        except Exception as e:
+            self._embed_errors += 1
+            logger.warning(f"⚠️ [ProductIndex] No se pudo embeber el producto {product_id}: {e}")
+            return False
+
+        np = _numpy()
+        with self._lock:
+            ids, hashes = list(self._ids), list(self._hashes)
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[1]:
+                # Índice vacío (o de otra dimensión): empieza con este producto
+                matrix, ids, hashes = vector, [product_id], [digest]
+            else:
+                matrix = np.array(self._matrix)
+                if product_id in ids:
+                    row = ids.index(product_id)
+                    matrix[row] = vector[0]
+                    hashes[row] = digest
+                else:
+                    matrix = np.vstack([matrix, vector])
+                    ids.append(product_id)
+                    hashes.append(digest)
+            if not self._save(matrix, ids, hashes):
+                return False
+            self._embedded += 1
+
+        logger.debug(f"🧭 [ProductIndex] Producto {product_id} indexado ({len(ids)} en total)")
+        return True
+
+    def remove(self, product_id: str) -> bool:
+        """
+        Quita un producto (borrado o desactivado)
+
+        Nunca lanza excepción: si no se puede guardar, la próxima
+        sincronización lo quita.
+
+        Returns:
+            True si el índice quedó al día
+        """
+        if not self.enabled:
+            return False
+        self._maybe_reload()
+
+        np = _numpy()
+        with self._lock:
+            if product_id not in self._ids:
+                return True
+            row = self._ids.index(product_id)
+            keep = [i for i in range(len(self._ids)) if i != row]
+            matrix = np.array(self._matrix)[keep]
+            ids = [self._ids[i] for i in keep]
+            hashes = [self._hashes[i] for i in keep]
+            return self._save(matrix, ids, hashes)
+
+    def sync(self, products: Iterable[Tuple[str, str]], batch_size: int = 32) -> Dict[str, int]:
+        """
+        Deja el índice igual al catálogo: embebe lo nuevo o cambiado y quita lo que ya no está
+
+        Args:
+            products: (product_id, texto) de los productos activos
+            batch_size: Textos por llamada al modelo
+
+        Returns:
+            {"embedded", "removed", "total"}
+        """
+        if not self.enabled:
+            return {"embedded": 0, "removed": 0, "total": 0}
+        self._maybe_reload()
+
+        np = _numpy()
+        wanted = [(product_id, text, _text_hash(text)) for product_id, text in products]
+        with self._lock:
+            current = {product_id: row for row, product_id in enumerate(self._ids)}
+            hashes = list(self._hashes)
+            matrix = self._matrix
+
+        stale = [(pid, text, digest) for pid, text, digest in wanted
+                 if pid not in current or hashes[current[pid]] != digest]
+        removed = len(set(current) - {pid for pid, _, _ in wanted})
+        if not stale and not removed:
+            return {"embedded": 0, "removed": 0, "total": len(wanted)}
+
+        fresh: Dict[str, Any] = {}
+        for start in range(0, len(stale), batch_size):
+            batch = stale[start:start + batch_size]
+            vectors = self._embed([text for _, text, _ in batch])
+            for (pid, _, _), vector in zip(batch, vectors):
+                fresh[pid] = vector
+
+        rows = [fresh[pid] if pid in fresh else matrix[current[pid]] for pid, _, _ in wanted]
+        if rows:
+            new_matrix = np.vstack(rows).astype(np.float32)
+        else:
+            new_matrix = np.zeros((0, matrix.shape[1] if matrix is not None else 0), dtype=np.float32)
+
+        with self._lock:
+            if not self._save(new_matrix, [pid for pid, _, _ in wanted], [digest for _, _, digest in wanted]):
+                raise OSError("no se pudo guardar el índice")
+            self._embedded += len(fresh)
+
+        logger.info(f"🧭 [ProductIndex] Sincronizado: {len(fresh)} embebidos, {removed} quitados, {len(wanted)} en total")
+        return {"embedded": len(fresh), "removed": removed, "total": len(wanted)}
+
+    def sync_from_db(self) -> Dict[str, int]:
+        """Sincroniza con los productos activos de la base de datos"""
+        from config.database import get_db_context
+        from app.database.models import Product
+
+        with get_db_context() as db:
+            products = [
+                (product.id, product_text(product.name, product.category, product.description))
+                for product in db.query(Product).filter(Product.is_active == True).order_by(Product.name).all()
+            ]
+        return self.sync(products)
+
+    def start(self) -> None:
+        """Sincroniza con la base de datos en segundo plano (no bloquea el arranque)"""
+        if not self.enabled:
+            if self.index_dir is not None:
+                logger.warning("⚠️ [ProductIndex] numpy no está instalado, se usa la lista de productos")
+            return
+
+        def _run():
+            try:
+                self.sync_from_db()
+            except Exception as e:
+                logger.warning(f"⚠️ [ProductIndex] Sincronización fallida (se reintenta al próximo arranque): {e}")
+
+        self._sync_thread = threading.Thread(target=_run, name="product-index-sync", daemon=True)
+        self._sync_thread.start()
+
+    # ═══════════════════════════════════════════════════════════
+    # BÚSQUEDA
+    # ═══════════════════════════════════════════════════════════
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """
+        Productos más parecidos a un texto
+
+        Args:
+            query: Mensaje o nombre a buscar
+            k: Cantidad de resultados
+
+        Returns:
+            [(product_id, similitud coseno)] de mayor a menor; [] si el índice
+            no está disponible (sin numpy, vacío, o el modelo falla)
+        """
+        if not self.enabled or not query or k <= 0:
+            return []
+        self._maybe_reload()
+
+        with self._lock:
+            matrix, ids = self._matrix, self._ids
+        if matrix is None or not ids:
+            self._unavailable += 1
+            return []
+
+        start = time.perf_counter()
+        try:
+            vector = self._query_vector(query)
+        except Exception as e:
+            self._unavailable += 1
+            self._embed_errors += 1
+            logger.debug(f"⚠️ [ProductIndex] Sin embedding para la consulta: {e}")
+            return []
+        if vector.shape[0] != matrix.shape[1]:
+            self._unavailable += 1
+            return []
+
+        np = _numpy()
+        scores = matrix @ vector
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        self._searches += 1
+        self._search_ms_total += (time.perf_counter() - start) * 1000
+        return [(ids[i], float(scores[i])) for i in top]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Tamaño del índice, búsquedas y errores del modelo de embeddings"""
+        with self._lock:
+            size = len(self._ids)
+            dim = int(self._matrix.shape[1]) if self._matrix is not None else 0
+        return {
+            "enabled": self.enabled,
+            "model": self.model,
+            "products": size,
+            "dim": dim,
+            "searches": self._searches,
+            "avg_search_ms": round(self._search_ms_total / self._searches, 2) if self._searches else 0.0,
+            "query_cache_hits": self._query_cache_hits,
+            "embedded": self._embedded,
+            "embed_errors": self._embed_errors,
+            "save_errors": self._save_errors,
+            "unavailable": self._unavailable
+        }
+
+
+# Instancia global
+product_vector_index = ProductVectorIndex(settings.product_index_dir, settings.embedding_model)
@@ -2,6 +2,7 @@
 Worker síncrono que procesa mensajes fuera del event loop
 """
 import queue
+import re
 import threading
 import requests
 from loguru import logger
@@ -9,6 +10,27 @@ from typing import Dict, Any
 from config.database import get_db_context
 from app.core.context_manager import ContextManager
 from app.core.correlation import set_client_context
+from app.clients.ollama_sync import ollama_sync_client, stop_on_label
+from app.clients.llm_models import model_for, CLASSIFICATION, GENERATION
+from app.core.prompt_registry import get_prompt_registry
+from app.core.turn_understanding import (
+    VALID_INTENTS, turn_understanding_extractor, set_current_turn, clear_current_turn
+)
+from app.core.circuit_breaker import llm_breaker, waha_breaker, is_service_failure, CircuitOpenError
+from app.core.slots.interrupt_gate import interrupt_gate
+from app.core.normalized_message import (
+    normalize_message, get_normalized, set_current_message, clear_current_message
+)
+
+
+# Clasificador por palabras clave para cuando el LLM no está disponible (breaker abierto).
+# En orden de prioridad; cancel_order/remove_from_order ya los cubre el regex previo.
+KEYWORD_INTENTS = [
+    ("check_order", re.compile(r"(estado|d[oó]nde\s+est[aá]|cu[aá]ndo\s+llega|seguimiento|mi\s+(pedido|orden))")),
+    ("create_order", re.compile(r"(quiero|quisiera|necesito|comprar|pedir|ordenar|me\s+das|dame|tienen|precio|cu[aá]nto\s+cuesta)")),
+    ("goodbye", re.compile(r"(adi[oó]s|chao|hasta\s+luego|nos\s+vemos|bye)")),
+    ("greeting", re.compile(r"(hola|buen[oa]s|saludos|qu[eé]\s+tal|hey)")),
+]
 
 
 class SyncMessageWorker:
@@ -32,12 +54,13 @@ class SyncMessageWorker:
         if self.worker_thread:
             self.worker_thread.join(timeout=5)
     
-    def enqueue_message(self, phone: str, message: str, message_id: str = None):
+    def enqueue_message(self, phone: str, message: str, message_id: str = None, message_type: str = "text"):
         """Agrega un mensaje a la cola para procesar"""
         self.queue.put({
             "phone": phone,
             "message": message,
-            "message_id": message_id
+            "message_id": message_id,
+            "message_type": message_type
         })
         logger.info(f"📥 Mensaje encolado para {phone}")
     
@@ -57,7 +80,8 @@ class SyncMessageWorker:
                 self._process_message_sync(
                     data["phone"],
                     data["message"],
-                    data.get("message_id")
+                    data.get("message_id"),
+                    data.get("message_type", "text")
                 )
                 
                 self.queue.task_done()
@@ -65,10 +89,13 @@ class SyncMessageWorker:
             except Exception as e:
                 logger.error(f"❌ Error en worker loop: {e}", exc_info=True)
     
-    def _process_message_sync(self, phone: str, message: str, message_id: str = None):
+    def _process_message_sync(self, phone: str, message: str, message_id: str = None, message_type: str = "text"):
         """Procesa un mensaje de forma completamente síncrona"""
         try:
             logger.info(f"🔵 [Worker] Procesando mensaje de {phone}: '{message[:50]}...'")
+
+            # Normalizar una sola vez: todas las etapas del turno reutilizan el resultado
+            set_current_message(normalize_message(message))
             
             # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
             # 1. Guardar mensaje en BD
@@ -78,7 +105,7 @@ class SyncMessageWorker:
                 context_manager.save_message(
                     phone=phone,
                     content=message,
-                    message_type="text",
+                    message_type=message_type,
                     is_from_bot=False,
                     waha_message_id=message_id
                 )
@@ -123,7 +150,8 @@ class SyncMessageWorker:
             # Algunos intents deben interrumpir el flujo actual (ej: cancel_order)
             # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
             high_priority_intent = None
-            if active_module:
+            # Si el mensaje es la respuesta al slot que el módulo espera, no hace falta el LLM
+            if active_module and interrupt_gate.needs_intent_check(active_module, module_context, message):
                 # Detectar intención para verificar si es de alta prioridad
                 intent_result = self._detect_intent_with_ollama(message)
                 detected_intent = intent_result.get("intent", "other")
@@ -274,12 +302,29 @@ class SyncMessageWorker:
                 # Respuesta None indica que el mensaje ya fue enviado (ej: ofrecimiento con imagen)
                 logger.info(f"ℹ️ [Worker] Respuesta es None, mensaje ya enviado previamente")
             else:
-                from config.settings import settings
-                from app.clients.waha_client import WAHAClient
-                
-                chat_id = phone if "@c.us" in phone else f"{phone}@c.us"
-                waha_client = WAHAClient()
-                
+                self._send_response(phone, response)
+            
+        except Exception as e:
+            logger.error(f"❌ [Worker] Error procesando mensaje: {e}", exc_info=True)
+        finally:
+            # El análisis del turno no debe filtrarse al siguiente mensaje del hilo
+            clear_current_turn()
+            clear_current_message()
+
+    def _send_response(self, phone: str, response: str):
+        """
+        Envía la respuesta por WAHA
+
+        Si WAHA falla (o su breaker está abierto) la respuesta no se pierde:
+        queda en la cola de reintentos persistente.
+        """
+        from config.settings import settings
+        from app.services.webhook_retry_service import webhook_retry_service
+
+        chat_id = phone if "@c.us" in phone else f"{phone}@c.us"
+
+        try:
+            with waha_breaker.guard():
                 waha_response = requests.post(
                     f"{settings.waha_base_url}/api/sendText",
                     json={
@@ -290,22 +335,31 @@ class SyncMessageWorker:
                     headers={"X-Api-Key": settings.waha_api_key},
                     timeout=10.0
                 )
-                
                 waha_response.raise_for_status()
-                logger.info(f"✅ [Worker] Respuesta enviada a {phone}")
-            
+            logger.info(f"✅ [Worker] Respuesta enviada a {phone}")
         except Exception as e:
-            logger.error(f"❌ [Worker] Error procesando mensaje: {e}", exc_info=True)
+            logger.error(f"❌ [Worker] No se pudo enviar la respuesta a {phone}: {e}")
+            if not is_service_failure(e):
+                return
+            webhook_retry_service.enqueue_send(
+                "send_text_message", "Respuesta del bot", phone, response, error=str(e)
+            )
 
     def _detect_intent_with_ollama(self, message: str) -> dict:
-        """Detecta la intención usando Ollama (llamada síncrona al proxy)"""
+        """
+        Detecta la intención del mensaje
+
+        Orden: regex para casos obvios → una llamada estructurada que además
+        extrae productos, cantidades y confirmación (queda publicada para los
+        módulos con set_current_turn) → clasificación por etiqueta si la
+        salida estructurada falla.
+        """
         try:
             # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
             # 🚨 REGEX FALLBACK: Detectar casos críticos ANTES del LLM
             # El regex es rápido y confiable para patrones obvios
             # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-            import re
-            message_lower = message.lower()
+            message_lower = get_normalized(message).lower
 
             # CASO 1: cancel_order (MÁXIMA PRIORIDAD)
             # Detectar cuando usuario quiere cancelar TODA la orden (no solo un producto)
@@ -338,48 +392,58 @@ class SyncMessageWorker:
                     "detection_method": "regex_fallback"
                 }
 
+            # LLM caído o lento: no esperar el timeout, clasificar por palabras clave
+            if llm_breaker.is_open:
+                return self._detect_intent_keywords(message)
+
             # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
             # Continuar con detección LLM si no hay match de regex
+            # Una sola inferencia: intención + productos + cantidades + confirmación
             # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+            turn = turn_understanding_extractor.extract(message)
+            if turn is not None:
+                set_current_turn(turn)
+                return turn.to_intent_result()
+
+            if llm_breaker.is_open:
+                return self._detect_intent_keywords(message)
 
-            prompt = f"""Responde SOLO con UNA de estas palabras exactas (en inglés):
-greeting
-goodbye
-create_order
-check_order
-cancel_order
-remove_from_order
-other
-
-Ejemplos:
-"hola" → greeting
-"adiós" → goodbye
-"quiero comprar" → create_order
-"quiero ordenar" → create_order
-"necesito algo" → create_order
-"ver mi pedido" → check_order
-"cancela mi orden" → cancel_order
-"elimina el mouse" → remove_from_order
-"cómo estás" → other
-
-"{message}" →"""
+            logger.warning(f"⚠️ [Worker] Salida estructurada no disponible, usando clasificación por etiqueta")
+            return self._detect_intent_label(message)
+
+        except Exception as e:
+            logger.error(f"❌ [Worker] Error llamando a Ollama: {e}")
+            return {
+                "intent": "other",
+                "confidence": 0.0,
+                "detection_method": "error"
+            }
+
+    def _detect_intent_label(self, message: str) -> dict:
+        """Clasificación por etiqueta en streaming (fallback de la llamada estructurada)"""
+        try:
+            # Prefijo estático + mensaje al final (reutiliza el KV-cache de Ollama)
+            prompt = get_prompt_registry().render("intent_label", message=message)
 
             logger.debug(f"🔵 [Worker] Enviando prompt al LLM para detección de intención")
 
-            response = requests.post(
-                'http://localhost:5001/generate',
-                json={
-                    "model": "llama3.2:latest",
-                    "prompt": prompt,
-                    "temperature": 0.0,  # Completamente determinístico
-                    "max_tokens": 5,     # Máximo 5 tokens para una palabra
-                    "stop": ["\n", ".", ",", " -"]  # Detener en nueva línea o puntuación
-                },
-                timeout=30.0
+            valid_intents = list(VALID_INTENTS)
+
+            # Streaming: cortar en cuanto aparece una etiqueta válida completa
+            result = ollama_sync_client.generate_stream(
+                prompt=prompt,
+                on_token=stop_on_label(valid_intents),
+                temperature=0.0,  # Completamente determinístico
+                max_tokens=5,     # Máximo 5 tokens para una palabra
+                stop=["\n", ".", ",", " -"],  # Detener en nueva línea o puntuación
+                timeout=30.0,
+                model=model_for(CLASSIFICATION)
+            )
+
+            logger.debug(
+                f"⏱️ [Worker] Intent LLM: ttft={result.get('ttft')}, total={result['total_time']:.2f}s, "
+                f"corte_temprano={result['stopped_early']}"
             )
-            
-            response.raise_for_status()
-            result = response.json()
             
             if result.get("success"):
                 intent_text = result["response"].strip().lower()
@@ -393,8 +457,6 @@ Ejemplos:
                 punctuation_without_underscore = string.punctuation.replace('_', '')
                 intent_text = intent_text.translate(str.maketrans('', '', punctuation_without_underscore)).strip()
 
-                valid_intents = ["greeting", "goodbye", "create_order", "check_order", "cancel_order", "remove_from_order", "other"]
-
                 # Primero buscar match exacto
                 if intent_text in valid_intents:
                     logger.info(f"✅ [Worker] LLM detectó intención: {intent_text}")
@@ -436,6 +498,8 @@ Ejemplos:
             else:
                 raise Exception(f"Ollama proxy error: {result.get('error')}")
             
+        except CircuitOpenError:
+            return self._detect_intent_keywords(message)
         except Exception as e:
             logger.error(f"❌ [Worker] Error llamando a Ollama: {e}")
             return {
@@ -444,6 +508,25 @@ Ejemplos:
                 "detection_method": "error"
             }
 
+    def _detect_intent_keywords(self, message: str) -> dict:
+        """Clasificación por palabras clave (modo degradado sin LLM)"""
+        message_lower = get_normalized(message).lower
+        for intent, pattern in KEYWORD_INTENTS:
+            if pattern.search(message_lower):
+                logger.info(f"⚡ [Worker] LLM no disponible, intención por palabras clave: {intent}")
+                return {
+                    "intent": intent,
+                    "confidence": 0.6,
+                    "detection_method": "keyword_fallback"
+                }
+
+        logger.info(f"⚡ [Worker] LLM no disponible y sin palabras clave, usando 'other'")
+        return {
+            "intent": "other",
+            "confidence": 0.3,
+            "detection_method": "keyword_fallback"
+        }
+
     def _generate_response_with_ollama(
         self, 
         message: str, 
@@ -502,20 +585,14 @@ Ejemplos:
 
             logger.debug(f"🔵 [Worker] Prompt para respuesta:\n{prompt}")
             
-            response = requests.post(
-                'http://localhost:5001/generate',
-                json={
-                    "model": "llama3.2:latest",
-                    "prompt": prompt,
-                    "temperature": 0.7,
-                    "max_tokens": 200
-                },
-                timeout=30.0
+            result = ollama_sync_client.generate(
+                prompt=prompt,
+                temperature=0.7,
+                max_tokens=200,
+                timeout=30.0,
+                model=model_for(GENERATION)
             )
             
-            response.raise_for_status()
-            result = response.json()
-            
             if result.get("success"):
                 generated_response = result["response"].strip()
                 logger.info(f"✅ [Worker] Respuesta de Ollama: '{generated_response[:100]}...'")
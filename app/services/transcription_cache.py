@@ -0,0 +1,223 @@
+"""
+Cache de transcripciones por contenido del audio
+
+Las notas de voz reenviadas y los reenvíos del mismo audio llegan con bytes
+idénticos: la clave es sha256(audio) + modelo + idioma, así que basta con
+transcribirlas una vez.
+
+- Nivel 1: LRU en memoria acotado por número de entradas.
+- Nivel 2: un archivo JSON por entrada en disco (sobrevive reinicios); un
+  hit en disco se promueve al LRU y renueva el mtime del archivo. Acotado
+  por número de archivos: al pasar el máximo se borran los de mtime más
+  viejo hasta quedar en el 90%.
+- Métricas: hits por nivel, tasa de aciertos y segundos de CPU ahorrados
+  (el tiempo que costó la transcripción original).
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+from config.settings import settings
+
+
+def audio_digest(audio_data: bytes) -> str:
+    """Hash sha256 (hex) de los bytes del audio"""
+    return hashlib.sha256(audio_data).hexdigest()
+
+
+class TranscriptionCache:
+    """LRU en memoria + nivel en disco para transcripciones"""
+
+    def __init__(self, max_entries: int = 1000, cache_dir: Optional[str] = None, max_disk_entries: int = 20000):
+        """
+        Args:
+            max_entries: Entradas máximas en memoria
+            cache_dir: Directorio del nivel en disco (None o "" = solo memoria)
+            max_disk_entries: Archivos máximos en disco (0 = sin límite)
+        """
+        self.max_entries = max_entries
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_disk_entries = max_disk_entries
+
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_count: Optional[int] = None  # Se cuenta en la primera escritura
+
+        # Métricas
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._saved_seconds = 0.0
+        self._disk_evictions = 0
+
+    @staticmethod
+    def make_key(digest: str, model: str, language: str) -> str:
+        """Clave de cache: el mismo audio con otro modelo/idioma es otra entrada"""
+        return f"{model}:{language}:{digest}"
+
+    def _disk_path(self, key: str) -> Path:
+        """Ruta del archivo de una clave (subdirectorio por prefijo para no saturar un solo directorio)"""
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.cache_dir / name[:2] / f"{name}.json"
+
+    # ═══════════════════════════════════════════════════════════
+    # API ASYNC (el disco se toca fuera del event loop)
+    # ═══════════════════════════════════════════════════════════
+
+    async def get(self, key: str) -> Optional[str]:
+        """
+        Busca una transcripción
+
+        Args:
+            key: Clave de make_key()
+
+        Returns:
+            Texto cacheado o None
+        """
+        entry = self._get_memory(key)
+        if entry is None and self.cache_dir:
+            entry = await asyncio.to_thread(self._read_disk, key)
+            if entry is not None:
+                self._disk_hits += 1
+                self._put_memory(key, entry)
+
+        if entry is None:
+            self._misses += 1
+            return None
+
+        self._saved_seconds += entry.get("processing_seconds", 0.0)
+        logger.info(f"♻️ [STT Cache] Hit ({len(entry['text'])} caracteres, {entry.get('processing_seconds', 0.0):.1f}s ahorrados)")
+        return entry["text"]
+
+    async def put(self, key: str, text: str, processing_seconds: float):
+        """
+        Guarda una transcripción
+
+        Args:
+            key: Clave de make_key()
+            text: Texto transcrito
+            processing_seconds: Costo de la transcripción (para métricas de ahorro)
+        """
+        entry = {
+            "text": text,
+            "processing_seconds": round(processing_seconds, 3),
+            "created_at": datetime.utcnow().isoformat()
+        }
+        self._put_memory(key, entry)
+
+        if self.cache_dir:
+            try:
+                await asyncio.to_thread(self._write_disk, key, entry)
+            except Exception as e:
+                logger.warning(f"⚠️ [STT Cache] No se pudo escribir en disco: {e}")
+
+    # ═══════════════════════════════════════════════════════════
+    # NIVELES
+    # ═══════════════════════════════════════════════════════════
+
+    def _get_memory(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._memory_hits += 1
+            return entry
+
+    def _put_memory(self, key: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._disk_path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+            # El mtime marca el último uso: la poda borra primero lo que no se usa
+            os.utime(path)
+            return entry
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ [STT Cache] Entrada ilegible {path.name}: {e}")
+            return None
+
+    def _write_disk(self, key: str, entry: Dict[str, Any]):
+        path = self._disk_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Escribir a un temporal y renombrar: un lector nunca ve un JSON a medias
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+        existed = path.exists()
+        tmp_path.replace(path)
+
+        if self.max_disk_entries and not existed:
+            with self._disk_lock:
+                if self._disk_count is None:
+                    self._disk_count = sum(1 for _ in self.cache_dir.glob("*/*.json"))
+                else:
+                    self._disk_count += 1
+                if self._disk_count > self.max_disk_entries:
+                    self._evict_disk()
+
+    def _evict_disk(self):
+        """Borra los archivos de mtime más viejo hasta dejar el 90% del máximo (con _disk_lock)"""
+        files = []
+        for file in self.cache_dir.glob("*/*.json"):
+            try:
+                files.append((file.stat().st_mtime, file))
+            except FileNotFoundError:
+                continue
+        files.sort()
+
+        target = int(self.max_disk_entries * 0.9)
+        excess = max(0, len(files) - target)
+        removed = 0
+        for _, file in files[:excess]:
+            try:
+                file.unlink()
+                removed += 1
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning(f"⚠️ [STT Cache] No se pudo borrar {file.name}: {e}")
+
+        self._disk_count = len(files) - removed
+        self._disk_evictions += removed
+        logger.info(f"🧹 [STT Cache] Disco: {removed} transcripciones viejas borradas ({self._disk_count} quedan)")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas del cache"""
+        hits = self._memory_hits + self._disk_hits
+        lookups = hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "disk_enabled": self.cache_dir is not None,
+            "disk_entries": self._disk_count,
+            "max_disk_entries": self.max_disk_entries,
+            "disk_evictions": self._disk_evictions,
+            "memory_hits": self._memory_hits,
+            "disk_hits": self._disk_hits,
+            "misses": self._misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "saved_cpu_seconds": round(self._saved_seconds, 1)
+        }
+
+
+# Instancia global
+transcription_cache = TranscriptionCache(
+    max_entries=settings.transcription_cache_entries,
+    cache_dir=settings.transcription_cache_dir,
+    max_disk_entries=settings.transcription_cache_disk_entries
+)
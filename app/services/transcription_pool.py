@@ -0,0 +1,302 @@
+"""
+Pool de transcripción de voz con el modelo Whisper cargado una sola vez
+
+Antes cada nota de voz lanzaba el CLI `whisper` (subprocess.run bloqueante
+dentro del event loop), que recargaba el modelo desde disco en cada llamada.
+Aquí un ProcessPoolExecutor mantiene N procesos con faster-whisper
+(CTranslate2, CPU) ya cargado; el audio viaja como bytes por el pipe del
+executor y se decodifica en memoria, sin archivos temporales.
+
+- Concurrencia limitada con un semáforo (no más transcripciones simultáneas
+  que procesos) y una cola máxima de pendientes para no acumular minutos de
+  audio si llega una ráfaga.
+- Métricas de real-time factor (RTF = tiempo de proceso / duración del audio).
+- Si un proceso muere (BrokenProcessPool) el pool se recrea en la siguiente
+  nota; la que estaba en curso falla.
+
+Requiere: pip install faster-whisper
+"""
+import asyncio
+import io
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Union
+
+from loguru import logger
+
+from config.settings import settings
+
+
+# ═══════════════════════════════════════════════════════════
+# CÓDIGO QUE CORRE EN LOS PROCESOS DEL POOL
+# ═══════════════════════════════════════════════════════════
+
+# Modelo cargado por el initializer (uno por proceso)
+_worker_model = None
+
+
+def _init_worker(model_name: str, compute_type: str, cpu_threads: int):
+    """Carga el modelo una vez al arrancar el proceso"""
+    global _worker_model
+    from faster_whisper import WhisperModel
+
+    _worker_model = WhisperModel(
+        model_name,
+        device="cpu",
+        compute_type=compute_type,
+        cpu_threads=cpu_threads
+    )
+
+
+def _warmup() -> bool:
+    """Fuerza el arranque del proceso (y la carga del modelo)"""
+    return _worker_model is not None
+
+
+def _transcribe_in_worker(audio_data: bytes, language: str) -> Dict[str, Any]:
+    """
+    Transcribe audio en el proceso del pool
+
+    Returns:
+        dict con 'text', 'audio_seconds' y 'processing_seconds'
+    """
+    start = time.perf_counter()
+
+    segments, info = _worker_model.transcribe(
+        io.BytesIO(audio_data),
+        language=language,
+        beam_size=1,
+        vad_filter=True
+    )
+    # segments es un generador: la transcripción ocurre al consumirlo
+    text = " ".join(segment.text.strip() for segment in segments).strip()
+
+    return {
+        "text": text,
+        "audio_seconds": info.duration,
+        "processing_seconds": time.perf_counter() - start
+    }
+
+
+# ═══════════════════════════════════════════════════════════
+# POOL (lado del event loop)
+# ═══════════════════════════════════════════════════════════
+
+class TranscriptionPool:
+    """Pool de procesos con Whisper precargado"""
+
+    def __init__(
+        self,
+        model: str = "base",
+        language: str = "es",
+        workers: int = 1,
+        max_pending: int = 20,
+        compute_type: str = "int8",
+        cpu_threads: int = 0
+    ):
+        """
+        Args:
+            model: Modelo de Whisper (tiny, base, small, ...)
+            language: Idioma de las notas de voz
+            workers: Procesos del pool (= transcripciones simultáneas)
+            max_pending: Máximo de notas en cola o en proceso; las demás se rechazan
+            compute_type: Cuantización de CTranslate2 (int8 es lo más rápido en CPU)
+            cpu_threads: Hilos por proceso (0 = default de CTranslate2)
+        """
+        self.model = model
+        self.language = language
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+
+        # Métricas
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._restarts = 0
+        self._audio_seconds = 0.0
+        self._processing_seconds = 0.0
+        self._queue_wait_seconds = 0.0
+        self._last_rtf: Optional[float] = None
+        self._max_rtf: Optional[float] = None
+
+    @property
+    def available(self) -> bool:
+        """True si el pool está arrancado"""
+        return self._executor is not None
+
+    async def start(self):
+        """Arranca los procesos y carga el modelo en cada uno"""
+        try:
+            import faster_whisper  # noqa: F401
+        except ImportError:
+            logger.warning("⚠️ [STT] faster-whisper no instalado, se usará el CLI de whisper (pip install faster-whisper)")
+            return
+
+        self._executor = self._create_executor()
+        self._semaphore = asyncio.Semaphore(self.workers)
+
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(*[
+                loop.run_in_executor(self._executor, _warmup)
+                for _ in range(self.workers)
+            ])
+        except Exception as e:
+            logger.error(f"❌ [STT] Error cargando Whisper en el pool: {e}")
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            return
+
+        logger.info(
+            f"✅ [STT] Pool de transcripción listo: {self.workers} procesos, "
+            f"modelo '{self.model}' ({self.compute_type}) en {time.perf_counter() - start:.1f}s"
+        )
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        """Procesos del pool (spawn: no heredar hilos ni conexiones del proceso principal)"""
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.model, self.compute_type, self.cpu_threads)
+        )
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        """Reemplaza un executor roto (solo una vez aunque fallen varias notas a la vez)"""
+        if self._executor is not broken:
+            return
+        broken.shutdown(wait=False, cancel_futures=True)
+        # El modelo se carga de nuevo con la próxima nota (initializer de cada proceso)
+        self._executor = self._create_executor()
+        self._restarts += 1
+        logger.warning(f"♻️ [STT] Un proceso del pool murió, pool recreado ({self._restarts} reinicios)")
+
+    async def stop(self):
+        """Detiene los procesos del pool"""
+        if self._executor:
+            await asyncio.to_thread(self._executor.shutdown, True, cancel_futures=True)
+            self._executor = None
+            logger.info("🛑 [STT] Pool de transcripción detenido")
+
+    async def transcribe(self, audio_data: Union[bytes, memoryview], timeout: float = 120.0) -> Optional[str]:
+        """
+        Transcribe una nota de voz
+
+        Args:
+            audio_data: Bytes del audio (ogg/opus, mp3, wav...) o memoryview (se copia al enviarlo al proceso)
+            timeout: Tiempo máximo incluyendo la espera en cola
+
+        Returns:
+            Texto transcrito, o None si falla, se excede el timeout o la cola está llena
+        """
+        result = await self.transcribe_with_stats(audio_data, timeout)
+        return result["text"] if result else None
+
+    async def transcribe_with_stats(self, audio_data: Union[bytes, memoryview], timeout: float = 120.0) -> Optional[Dict[str, Any]]:
+        """
+        Como transcribe(), pero retorna también las métricas de la transcripción
+
+        Returns:
+            dict con 'text', 'audio_seconds' y 'processing_seconds', o None si falla
+        """
+        if not self.available:
+            return None
+
+        if self._pending >= self.max_pending:
+            self._rejected += 1
+            logger.warning(f"⚠️ [STT] Cola llena ({self._pending} pendientes), nota de voz rechazada")
+            return None
+
+        self._pending += 1
+        enqueued_at = time.perf_counter()
+        try:
+            return await asyncio.wait_for(self._run(audio_data, enqueued_at), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._failed += 1
+            logger.error(f"⏱️ [STT] Timeout transcribiendo audio ({timeout}s)")
+            return None
+        except Exception as e:
+            self._failed += 1
+            logger.error(f"❌ [STT] Error transcribiendo audio: {e}")
+            return None
+        finally:
+            self._pending -= 1
+
+    async def _run(self, audio_data: Union[bytes, memoryview], enqueued_at: float) -> Optional[Dict[str, Any]]:
+        """Espera turno y ejecuta la transcripción en el pool"""
+        async with self._semaphore:
+            queue_wait = time.perf_counter() - enqueued_at
+            loop = asyncio.get_running_loop()
+            # Un memoryview no se puede picklear: tobytes() lo copia antes de enviarlo
+            payload = audio_data.tobytes() if isinstance(audio_data, memoryview) else audio_data
+            executor = self._executor
+            try:
+                result = await loop.run_in_executor(
+                    executor, _transcribe_in_worker, payload, self.language
+                )
+            except BrokenProcessPool:
+                self._restart(executor)
+                raise
+
+        self._record(result, queue_wait)
+        return result if result["text"] else None
+
+    def _record(self, result: Dict[str, Any], queue_wait: float):
+        """Acumula métricas de una transcripción completada"""
+        audio_seconds = result["audio_seconds"] or 0.0
+        processing_seconds = result["processing_seconds"]
+
+        self._completed += 1
+        self._audio_seconds += audio_seconds
+        self._processing_seconds += processing_seconds
+        self._queue_wait_seconds += queue_wait
+
+        if audio_seconds > 0:
+            rtf = processing_seconds / audio_seconds
+            self._last_rtf = rtf
+            self._max_rtf = rtf if self._max_rtf is None else max(self._max_rtf, rtf)
+
+        logger.info(
+            f"🎤 [STT] {audio_seconds:.1f}s de audio en {processing_seconds:.2f}s "
+            f"(RTF={self._last_rtf if self._last_rtf is None else f'{self._last_rtf:.2f}'}, "
+            f"cola={queue_wait:.2f}s)"
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas del pool"""
+        return {
+            "available": self.available,
+            "model": self.model,
+            "workers": self.workers,
+            "pending": self._pending,
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "restarts": self._restarts,
+            "audio_seconds": round(self._audio_seconds, 1),
+            "processing_seconds": round(self._processing_seconds, 1),
+            "avg_rtf": round(self._processing_seconds / self._audio_seconds, 3) if self._audio_seconds else None,
+            "last_rtf": round(self._last_rtf, 3) if self._last_rtf is not None else None,
+            "max_rtf": round(self._max_rtf, 3) if self._max_rtf is not None else None,
+            "avg_queue_wait_seconds": round(self._queue_wait_seconds / self._completed, 3) if self._completed else None
+        }
+
+
+# Instancia global
+transcription_pool = TranscriptionPool(
+    model=settings.whisper_model,
+    language=settings.whisper_language,
+    workers=settings.whisper_pool_workers,
+    max_pending=settings.whisper_max_pending,
+    compute_type=settings.whisper_compute_type,
+    cpu_threads=settings.whisper_cpu_threads
+)
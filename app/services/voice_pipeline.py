@@ -0,0 +1,86 @@
+"""
+Pipeline de notas de voz
+
+Las notas de voz pasan por el mismo camino que el texto: buffer de mensajes
+→ worker síncrono → módulos. Al llegar el webhook se reserva su lugar en el
+buffer (orden de llegada) y la descarga + transcripción arrancan de
+inmediato en paralelo con el debounce; el texto se inserta en el buffer al
+terminar. No se mantiene ninguna sesión de BD abierta durante la descarga
+ni la transcripción.
+"""
+import asyncio
+from typing import Optional, Set
+
+from loguru import logger
+
+from app.clients.waha_client import WAHAClient
+from app.clients.whisper_client import WhisperClient
+from app.services.message_buffer import message_buffer_manager, BufferedMessage
+
+
+class VoicePipeline:
+    """Descarga y transcribe notas de voz dentro del buffer de mensajes"""
+
+    def __init__(self):
+        self.waha = WAHAClient()
+        self.whisper = WhisperClient()
+        # Referencias a las tareas en curso (evita que el GC las cancele)
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, phone: str, media_url: Optional[str], message_id: str):
+        """
+        Reserva el lugar de la nota de voz en el buffer y arranca su transcripción
+
+        Args:
+            phone: Número de teléfono
+            media_url: URL de la media en WAHA
+            message_id: ID del mensaje de WAHA
+        """
+        placeholder = await message_buffer_manager.add_pending_message(
+            phone=phone,
+            message_id=message_id,
+            message_type="voice",
+            media_url=media_url
+        )
+
+        task = asyncio.create_task(self._transcribe(placeholder))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _transcribe(self, placeholder: BufferedMessage):
+        """Descarga y transcribe; siempre resuelve el mensaje pendiente"""
+        phone = placeholder.phone
+        transcription = None
+
+        try:
+            # Descarga en streaming: hash calculado al vuelo, audio en memoria (o disco si es grande)
+            media = await self.waha.download_media_stream({"mediaUrl": placeholder.media_url})
+
+            if media is None:
+                await self.waha.send_text_message(phone, "No pude descargar tu nota de voz. Podrias enviarla de nuevo?")
+                return
+
+            with media, media.view() as audio_view:
+                transcription = await self.whisper.transcribe_audio(
+                    audio_view, audio_format="ogg", audio_hash=media.sha256
+                )
+
+            if not transcription:
+                await self.waha.send_text_message(phone, "No pude entender tu nota de voz. Podrias repetir o escribirme?")
+                return
+
+            logger.info(f"🎤 Nota de voz de {phone} transcrita: '{transcription[:50]}...'")
+
+        except Exception as e:
+            logger.error(f"❌ Error en pipeline de voz para {phone}: {e}", exc_info=True)
+
+        finally:
+            await message_buffer_manager.resolve_message(placeholder, transcription)
+
+    def get_stats(self) -> dict:
+        """Notas de voz en descarga/transcripción"""
+        return {"in_flight": len(self._tasks)}
+
+
+# Instancia global
+voice_pipeline = VoicePipeline()
@@ -1,33 +1,102 @@
 """
 Servicio de retry logic para webhooks
+
+Antes los reintentos se hacían en línea con asyncio.sleep (hasta minutos):
+un request de la webapp quedaba abierto mientras WAHA estaba caído, y si
+todos los intentos fallaban el envío solo quedaba en el log.
+
+Ahora execute_with_retry hace un único intento inmediato. Si falla, el envío
+se persiste en retry_jobs con su próximo intento (backoff exponencial con
+jitter) y un scheduler en segundo plano lo reintenta. Al agotar los intentos
+pasa a dead_letters, desde donde se puede inspeccionar y re-encolar
+(ver app/api/retries.py). La latencia del llamador no depende de WAHA.
+
+- Solo se persisten métodos send_* de WAHAClient con argumentos JSON.
+- Los envíos a un mismo chat se mantienen en orden: si el chat ya tiene
+  envíos pendientes, el nuevo se encola detrás sin intentarlo. Los chats
+  con pendientes se llevan en memoria (cargados al iniciar, actualizados al
+  encolar/completar y re-sincronizados con la BD en cada pasada del
+  scheduler, también en las instancias sin lease): verificar no toca la BD.
+- La BD se usa fuera del event loop (asyncio.to_thread).
+- En modo cluster solo la instancia con el lease corre el scheduler.
+- retry_jobs y dead_letters se crean al arrancar (init_db) o con
+  scripts/migrate_add_retry_tables.py: sin ellas el encolado fallaría
+  justo cuando WAHA está caído.
+- Con el circuit breaker de WAHA abierto los envíos fallan al instante, se
+  encolan sin gastar un intento y el scheduler espera a que se pueda sondear.
 """
 import asyncio
-from typing import Callable, Any, Optional
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Any, Dict, List, Optional, Tuple
 from loguru import logger
 
+from config.database import SessionLocal
+from config.settings import settings
+from app.database.models import RetryJob, DeadLetter
+from app.services.cluster_coordinator import cluster_coordinator
+from app.core.circuit_breaker import waha_breaker, CircuitOpenError
+
+
+# Lease de cluster: solo una instancia ejecuta los reintentos
+RETRY_SCHEDULER_LEASE = "retry_scheduler"
+
 
 class WebhookRetryService:
-    """Servicio para reintentar operaciones de webhook con exponential backoff"""
-    
+    """Reintentos persistentes de envíos a WAHA con backoff exponencial y jitter"""
+
     def __init__(
         self,
-        max_retries: int = 3,
-        initial_delay: float = 1.0,
-        max_delay: float = 30.0,
-        exponential_base: float = 2.0
+        max_attempts: int = 6,
+        initial_delay: float = 30.0,
+        max_delay: float = 600.0,
+        exponential_base: float = 2.0,
+        jitter: float = 0.2,
+        poll_seconds: float = 5.0,
+        batch_size: int = 50,
+        concurrency: int = 5
     ):
         """
         Args:
-            max_retries: Número máximo de reintentos
-            initial_delay: Delay inicial en segundos
+            max_attempts: Intentos totales (incluido el inmediato) antes de pasar a dead letter
+            initial_delay: Delay del primer reintento en segundos
             max_delay: Delay máximo en segundos
             exponential_base: Base para el cálculo exponencial
+            jitter: Variación aleatoria del delay (0.2 = ±20%) para no reintentar todo a la vez
+            poll_seconds: Intervalo del scheduler
+            batch_size: Chats procesados por pasada del scheduler
+            concurrency: Chats reintentados en paralelo
         """
-        self.max_retries = max_retries
+        self.max_attempts = max(1, max_attempts)
         self.initial_delay = initial_delay
         self.max_delay = max_delay
         self.exponential_base = exponential_base
-    
+        self.jitter = jitter
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self.concurrency = max(1, concurrency)
+
+        self.running = False
+        self._task: Optional[asyncio.Task] = None
+
+        # chat_key → time.monotonic() de cuando se marcó con envíos pendientes
+        self._pending_chats: Dict[str, float] = {}
+        self._pending_lock = threading.Lock()
+
+        # Métricas
+        self._immediate_success = 0
+        self._enqueued = 0
+        self._retried_success = 0
+        self._retried_failed = 0
+        self._dead_lettered = 0
+
+    # ═══════════════════════════════════════════════════════════
+    # API PARA LLAMADORES
+    # ═══════════════════════════════════════════════════════════
+
     async def execute_with_retry(
         self,
         operation: Callable,
@@ -36,75 +105,408 @@ class WebhookRetryService:
         **kwargs
     ) -> tuple[bool, Optional[Any]]:
         """
-        Ejecuta una operación con reintentos automáticos
-        
+        Ejecuta una operación una vez; si falla, la deja en la cola de reintentos
+
         Args:
-            operation: Función async a ejecutar
+            operation: Método async de WAHAClient (send_text_message, send_location, ...)
             operation_name: Nombre descriptivo de la operación (para logs)
             *args, **kwargs: Argumentos para la operación
-            
+
         Returns:
-            (success: bool, result: Any)
+            (success: bool, result: Any). success=False significa que el envío
+            no ocurrió ahora; si era persistible queda en la cola de reintentos.
         """
-        last_exception = None
-        
-        for attempt in range(self.max_retries + 1):
-            try:
-                logger.debug(f"🔄 [{operation_name}] Intento {attempt + 1}/{self.max_retries + 1}")
-                
-                # Ejecutar operación
-                result = await operation(*args, **kwargs)
-                
-                logger.info(f"✅ [{operation_name}] Operación exitosa en intento {attempt + 1}")
-                return True, result
-                
-            except Exception as e:
-                last_exception = e
-                logger.warning(f"⚠️ [{operation_name}] Fallo en intento {attempt + 1}: {e}")
-                
-                # Si es el último intento, no esperar
-                if attempt == self.max_retries:
-                    logger.error(f"❌ [{operation_name}] Todos los intentos fallaron")
-                    break
-                
-                # Calcular delay con exponential backoff
-                delay = min(
-                    self.initial_delay * (self.exponential_base ** attempt),
-                    self.max_delay
-                )
-                
-                logger.info(f"⏳ [{operation_name}] Esperando {delay:.1f}s antes del siguiente intento...")
-                await asyncio.sleep(delay)
-        
-        # Todos los intentos fallaron
-        return False, last_exception
-    
+        spec = self._durable_spec(operation, args, kwargs)
+
+        # Mantener el orden por chat: si ya hay envíos pendientes, encolar detrás
+        if spec and self._has_pending(spec["chat_key"]):
+            await asyncio.to_thread(
+                self._enqueue, spec, operation_name, error="Encolado detrás de envíos pendientes", attempts=0, delay=0.0
+            )
+            logger.info(f"⏳ [{operation_name}] Chat con envíos pendientes, encolado para mantener el orden")
+            return False, None
+
+        try:
+            result = await operation(*args, **kwargs)
+            self._immediate_success += 1
+            logger.debug(f"✅ [{operation_name}] Operación exitosa")
+            return True, result
+
+        except CircuitOpenError as e:
+            if not spec:
+                logger.error(f"❌ [{operation_name}] WAHA no disponible y no es persistible para reintento: {e}")
+                return False, e
+
+            # No se intentó: no cuenta como intento, se reintenta cuando el breaker sondee
+            await asyncio.to_thread(self._enqueue, spec, operation_name, error=str(e), attempts=0, delay=e.retry_after)
+            logger.warning(f"⚡ [{operation_name}] WAHA no disponible, encolado para reintento")
+            return False, e
+
+        except Exception as e:
+            if not spec:
+                logger.error(f"❌ [{operation_name}] Falló y no es persistible para reintento: {e}")
+                return False, e
+
+            delay = self.calculate_next_delay(0)
+            await asyncio.to_thread(self._enqueue, spec, operation_name, error=str(e), attempts=1, delay=delay)
+            logger.warning(f"⚠️ [{operation_name}] Falló ({e}), reintento programado en {delay:.0f}s")
+            return False, e
+
+    def enqueue_send(self, operation: str, operation_name: str, *args, error: str = "", **kwargs):
+        """
+        Encola un envío que el llamador no pudo hacer (para código síncrono, fuera del event loop)
+
+        Args:
+            operation: Nombre del método send_* de WAHAClient
+            operation_name: Nombre descriptivo (para logs)
+            error: Motivo del fallo
+            *args, **kwargs: Argumentos del método (el primero es el teléfono)
+        """
+        from app.clients.waha_client import WAHAClient
+
+        spec = self._durable_spec(getattr(WAHAClient(), operation), args, kwargs)
+        if not spec:
+            logger.error(f"❌ [{operation_name}] No es persistible para reintento")
+            return
+
+        delay = 0.0 if self._has_pending(spec["chat_key"]) else self.calculate_next_delay(0)
+        self._enqueue(spec, operation_name, error=error, attempts=0, delay=delay)
+        logger.warning(f"⚠️ [{operation_name}] Encolado para reintento: {error}")
+
     def calculate_next_delay(self, attempt: int) -> float:
         """
-        Calcula el delay para el siguiente intento
-        
+        Calcula el delay para el siguiente intento (con jitter)
+
         Args:
             attempt: Número de intento (0-indexed)
-            
+
         Returns:
             Delay en segundos
         """
-        return min(
+        delay = min(
             self.initial_delay * (self.exponential_base ** attempt),
             self.max_delay
         )
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    # ═══════════════════════════════════════════════════════════
+    # PERSISTENCIA
+    # ═══════════════════════════════════════════════════════════
+
+    @staticmethod
+    def _durable_spec(operation: Callable, args: tuple, kwargs: dict) -> Optional[Dict[str, Any]]:
+        """Describe la operación si se puede persistir (método send_* de WAHAClient con args JSON)"""
+        from app.clients.waha_client import WAHAClient
 
+        owner = getattr(operation, "__self__", None)
+        name = getattr(operation, "__name__", "")
+        if not isinstance(owner, WAHAClient) or not name.startswith("send_") or not args:
+            return None
 
-# Instancia global con configuración por defecto
-# Distribución de reintentos en ~3 minutos para dar tiempo a que WAHA arranque:
-# Intento 1: 0s
-# Intento 2: +30s = 30s
-# Intento 3: +60s = 90s  
-# Intento 4: +90s = 180s (3 minutos)
+        try:
+            json.dumps([args, kwargs])
+        except (TypeError, ValueError):
+            return None
+
+        return {
+            "operation": name,
+            "chat_key": str(args[0]).split("@")[0],
+            "args": list(args),
+            "kwargs": dict(kwargs)
+        }
+
+    def _has_pending(self, chat_key: str) -> bool:
+        """True si el chat tiene envíos en la cola (en memoria, sin consultar la BD)"""
+        with self._pending_lock:
+            return chat_key in self._pending_chats
+
+    def _mark_pending(self, chat_key: str):
+        with self._pending_lock:
+            self._pending_chats[chat_key] = time.monotonic()
+
+    def _clear_pending(self, chat_key: str, since: float):
+        """Desmarca un chat vaciado, salvo que se haya vuelto a encolar después de since"""
+        with self._pending_lock:
+            if self._pending_chats.get(chat_key, since) < since:
+                del self._pending_chats[chat_key]
+
+    def _load_pending_chats(self):
+        """
+        Sincroniza los chats con pendientes con la BD (bloqueante)
+
+        Incluye los encolados por otras instancias y olvida los que el
+        scheduler del líder ya vació.
+        """
+        started = time.monotonic()
+        db = SessionLocal()
+        try:
+            keys = {key for (key,) in db.query(RetryJob.chat_key).distinct().all()}
+        finally:
+            db.close()
+
+        with self._pending_lock:
+            for key in keys:
+                self._pending_chats.setdefault(key, started)
+            for key in [k for k, marked_at in self._pending_chats.items() if k not in keys and marked_at < started]:
+                del self._pending_chats[key]
+
+    def _enqueue(self, spec: Dict[str, Any], operation_name: str, error: str, attempts: int, delay: float):
+        """Guarda un envío en la cola de reintentos (bloqueante)"""
+        db = SessionLocal()
+        try:
+            db.add(RetryJob(
+                operation=spec["operation"],
+                operation_name=operation_name,
+                chat_key=spec["chat_key"],
+                args=spec["args"],
+                kwargs=spec["kwargs"],
+                attempts=attempts,
+                next_attempt_at=datetime.utcnow() + timedelta(seconds=delay),
+                last_error=error
+            ))
+            db.commit()
+            self._mark_pending(spec["chat_key"])
+            self._enqueued += 1
+        except Exception as e:
+            db.rollback()
+            logger.error(f"❌ [{operation_name}] No se pudo guardar en la cola de reintentos: {e}")
+        finally:
+            db.close()
+
+    def replay_dead_letter(self, db, dead_letter: DeadLetter) -> RetryJob:
+        """
+        Re-encola un dead letter con los intentos en cero
+
+        Args:
+            db: Sesión de BD (el llamador hace commit)
+            dead_letter: Envío a re-encolar
+
+        Returns:
+            El RetryJob creado
+        """
+        job = RetryJob(
+            operation=dead_letter.operation,
+            operation_name=dead_letter.operation_name,
+            chat_key=dead_letter.chat_key,
+            args=dead_letter.args,
+            kwargs=dead_letter.kwargs,
+            attempts=0,
+            next_attempt_at=datetime.utcnow(),
+            last_error=dead_letter.last_error
+        )
+        db.add(job)
+        dead_letter.replayed_at = datetime.utcnow()
+        self._mark_pending(dead_letter.chat_key)
+        return job
+
+    # ═══════════════════════════════════════════════════════════
+    # SCHEDULER
+    # ═══════════════════════════════════════════════════════════
+
+    async def start(self):
+        """Inicia el scheduler de reintentos"""
+        if self.running:
+            return
+        self.running = True
+        try:
+            await asyncio.to_thread(self._load_pending_chats)
+        except Exception as e:
+            logger.error(f"❌ [Retry] No se pudieron cargar los chats con pendientes: {e}")
+        self._task = asyncio.create_task(self._scheduler_loop())
+        logger.info(f"✅ [Retry] Scheduler iniciado (intervalo: {self.poll_seconds}s, máx {self.max_attempts} intentos)")
+
+    async def stop(self):
+        """Detiene el scheduler (los envíos pendientes quedan en la BD)"""
+        if not self.running:
+            return
+        self.running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        logger.info("🛑 [Retry] Scheduler detenido")
+
+    async def _scheduler_loop(self):
+        while self.running:
+            try:
+                # Con WAHA caído no tiene sentido recorrer la cola; pasado el cooldown se sondea
+                if cluster_coordinator.is_leader(RETRY_SCHEDULER_LEASE) and not waha_breaker.is_open:
+                    await self.run_due()
+                await asyncio.to_thread(self._load_pending_chats)
+            except Exception as e:
+                logger.error(f"❌ [Retry] Error en scheduler: {e}")
+
+            try:
+                await asyncio.sleep(self.poll_seconds)
+            except asyncio.CancelledError:
+                break
+
+    async def run_due(self) -> int:
+        """
+        Reintenta los envíos vencidos
+
+        Returns:
+            Número de envíos completados en esta pasada
+        """
+        chat_keys = await asyncio.to_thread(self._due_chat_keys)
+
+        if not chat_keys:
+            return 0
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_chat(chat_key: str) -> int:
+            async with semaphore:
+                return await self._run_chat(chat_key)
+
+        results = await asyncio.gather(*[run_chat(key) for key in chat_keys])
+        return sum(results)
+
+    def _due_chat_keys(self) -> List[str]:
+        """Chats con envíos vencidos (bloqueante)"""
+        db = SessionLocal()
+        try:
+            return [
+                key for (key,) in db.query(RetryJob.chat_key)
+                .filter(RetryJob.next_attempt_at <= datetime.utcnow())
+                .distinct()
+                .limit(self.batch_size)
+                .all()
+            ]
+        finally:
+            db.close()
+
+    @staticmethod
+    def _chat_jobs(db, chat_key: str) -> List[RetryJob]:
+        return db.query(RetryJob).filter(
+            RetryJob.chat_key == chat_key
+        ).order_by(RetryJob.created_at).all()
+
+    @staticmethod
+    def _chat_is_empty(db, chat_key: str) -> bool:
+        return db.query(RetryJob.id).filter(RetryJob.chat_key == chat_key).first() is None
+
+    async def _run_chat(self, chat_key: str) -> int:
+        """Reintenta en orden los envíos de un chat; se detiene en el primer fallo"""
+        from app.clients.waha_client import WAHAClient
+
+        waha = WAHAClient()
+        completed = 0
+        started = time.monotonic()
+        # Sin expirar al hacer commit: leer los jobs siguientes no vuelve a consultar desde el loop
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            jobs: List[RetryJob] = await asyncio.to_thread(self._chat_jobs, db, chat_key)
+
+            for job in jobs:
+                if job.next_attempt_at > datetime.utcnow():
+                    break
+
+                try:
+                    success, error = await self._attempt(waha, job)
+                except CircuitOpenError:
+                    # Breaker abierto (o sondeo en curso): no cuenta como intento
+                    break
+                if success:
+                    db.delete(job)
+                    await asyncio.to_thread(db.commit)
+                    completed += 1
+                    self._retried_success += 1
+                    logger.info(f"✅ [Retry] {job.operation_name} enviado en el intento {job.attempts + 1}")
+                    continue
+
+                self._retried_failed += 1
+                job.attempts += 1
+                job.last_error = error
+
+                if job.attempts >= self.max_attempts:
+                    self._move_to_dead_letter(db, job)
+                    await asyncio.to_thread(db.commit)
+                    # El siguiente envío del chat ya no tiene que esperar a este
+                    continue
+
+                delay = self.calculate_next_delay(job.attempts - 1)
+                job.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+                await asyncio.to_thread(db.commit)
+                logger.warning(
+                    f"⚠️ [Retry] {job.operation_name} falló (intento {job.attempts}/{self.max_attempts}), "
+                    f"próximo en {delay:.0f}s: {error}"
+                )
+                break
+
+            # Chat vacío: los próximos envíos ya no esperan en la cola
+            if await asyncio.to_thread(self._chat_is_empty, db, chat_key):
+                self._clear_pending(chat_key, started)
+
+        except Exception as e:
+            await asyncio.to_thread(db.rollback)
+            logger.error(f"❌ [Retry] Error reintentando envíos de {chat_key}: {e}")
+        finally:
+            await asyncio.to_thread(db.close)
+
+        return completed
+
+    @staticmethod
+    async def _attempt(waha, job: RetryJob) -> Tuple[bool, Optional[str]]:
+        operation = getattr(waha, job.operation, None)
+        if operation is None:
+            return False, f"Operación desconocida: {job.operation}"
+        try:
+            await operation(*(job.args or []), **(job.kwargs or {}))
+            return True, None
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            return False, str(e)
+
+    def _move_to_dead_letter(self, db, job: RetryJob):
+        db.add(DeadLetter(
+            operation=job.operation,
+            operation_name=job.operation_name,
+            chat_key=job.chat_key,
+            args=job.args,
+            kwargs=job.kwargs,
+            attempts=job.attempts,
+            last_error=job.last_error,
+            created_at=job.created_at
+        ))
+        db.delete(job)
+        self._dead_lettered += 1
+        logger.error(f"☠️ [Retry] {job.operation_name} a {job.chat_key} agotó {job.attempts} intentos → dead letter")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas del servicio y tamaño de las colas"""
+        db = SessionLocal()
+        try:
+            pending = db.query(RetryJob).count()
+            dead = db.query(DeadLetter).filter(DeadLetter.replayed_at.is_(None)).count()
+        finally:
+            db.close()
+
+        return {
+            "running": self.running,
+            "leader": cluster_coordinator.is_leader(RETRY_SCHEDULER_LEASE),
+            "pending": pending,
+            "dead_letters": dead,
+            "pending_chats": len(self._pending_chats),
+            "immediate_success": self._immediate_success,
+            "enqueued": self._enqueued,
+            "retried_success": self._retried_success,
+            "retried_failed": self._retried_failed,
+            "dead_lettered": self._dead_lettered,
+            "waha_breaker": waha_breaker.state
+        }
+
+
+# Instancia global
+# Con los defaults: reintentos a ~30s, 1m, 2m, 4m y 8m (±20%) → ~15 minutos
+# antes de pasar a dead letter, sin bloquear a ningún llamador.
 webhook_retry_service = WebhookRetryService(
-    max_retries=3,          # 3 reintentos (4 intentos totales)
-    initial_delay=30.0,     # Empezar con 30 segundos
-    max_delay=90.0,         # Máximo 90 segundos entre intentos
-    exponential_base=2.0    # Duplicar cada vez: 30s, 60s, 90s (limitado por max_delay)
+    max_attempts=settings.retry_max_attempts,
+    initial_delay=settings.retry_initial_delay,
+    max_delay=settings.retry_max_delay,
+    jitter=settings.retry_jitter,
+    poll_seconds=settings.retry_poll_seconds
 )
-
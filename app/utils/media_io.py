@@ -0,0 +1,206 @@
+"""
+I/O de media en streaming
+
+Las descargas de WAHA y las imágenes subidas se leen por chunks: se corta
+en cuanto se excede el tamaño máximo (sin esperar a tener todo en memoria),
+el sha256 se calcula mientras se lee y el contenido queda en un
+SpooledTemporaryFile (en memoria si es chico, en disco si crece). El
+consumidor recibe el archivo o un memoryview sobre su buffer, sin copias
+extra de los bytes.
+"""
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+import httpx
+from loguru import logger
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class MediaTooLargeError(Exception):
+    """El archivo excede el tamaño máximo permitido"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"El archivo excede el máximo de {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+@dataclass
+class StreamedMedia:
+    """
+    Media descargada en streaming
+
+    Attributes:
+        file: Contenido (SpooledTemporaryFile posicionado al inicio)
+        size: Tamaño en bytes
+        sha256: Hash hex del contenido (calculado durante la descarga)
+        content_type: Content-Type reportado por el servidor
+    """
+    file: tempfile.SpooledTemporaryFile
+    size: int
+    sha256: str
+    content_type: Optional[str] = None
+
+    @property
+    def in_memory(self) -> bool:
+        """True si el contenido no se desbordó a disco"""
+        return not getattr(self.file, "_rolled", True)
+
+    @contextmanager
+    def view(self) -> Iterator[memoryview]:
+        """
+        memoryview de solo lectura sobre el contenido, sin copiarlo
+
+        En memoria apunta al buffer del BytesIO; en disco a un mmap del
+        archivo temporal. El view es válido solo dentro del 'with'.
+        """
+        if self.size == 0:
+            yield memoryview(b"")
+            return
+
+        if self.in_memory:
+            buffer = self.file._file.getbuffer()
+            readonly = buffer.toreadonly()
+            try:
+                yield readonly
+            finally:
+                readonly.release()
+                buffer.release()
+        else:
+            self.file.flush()
+            mapped = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            buffer = memoryview(mapped)
+            try:
+                yield buffer
+            finally:
+                buffer.release()
+                mapped.close()
+
+    def read_bytes(self) -> bytes:
+        """Copia el contenido a un bytes (para APIs que no aceptan buffers)"""
+        self.file.seek(0)
+        data = self.file.read()
+        self.file.seek(0)
+        return data
+
+    def close(self):
+        """Libera el archivo temporal"""
+        self.file.close()
+
+    def __enter__(self) -> "StreamedMedia":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+async def stream_download(
+    client: httpx.AsyncClient,
+    url: str,
+    headers: Optional[dict] = None,
+    max_bytes: int = 16 * 1024 * 1024,
+    spool_bytes: int = 1024 * 1024
+) -> StreamedMedia:
+    """
+    Descarga una URL por chunks con límite de tamaño y hash incremental
+
+    Args:
+        client: Cliente httpx
+        url: URL a descargar
+        headers: Headers adicionales (ej: X-Api-Key)
+        max_bytes: Tamaño máximo; se corta la descarga al excederlo
+        spool_bytes: Hasta este tamaño el contenido queda en memoria
+
+    Raises:
+        MediaTooLargeError: Si Content-Length o los bytes recibidos exceden max_bytes
+        httpx.HTTPError: Errores de red o HTTP
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+    hasher = hashlib.sha256()
+    size = 0
+
+    try:
+        async with client.stream("GET", url, headers=headers) as response:
+            response.raise_for_status()
+
+            # Rechazar antes de leer un solo byte si el servidor declara el tamaño
+            declared = response.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                raise MediaTooLargeError(max_bytes)
+
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise MediaTooLargeError(max_bytes)
+                hasher.update(chunk)
+                spool.write(chunk)
+
+            content_type = response.headers.get("content-type")
+
+    except BaseException:
+        spool.close()
+        raise
+
+    spool.seek(0)
+    return StreamedMedia(file=spool, size=size, sha256=hasher.hexdigest(), content_type=content_type)
+
+
+def stream_to_file(
+    source: BinaryIO,
+    dest_path: Path,
+    max_bytes: int,
+    chunk_size: int = CHUNK_SIZE
+) -> Tuple[int, str]:
+    """
+    Copia un stream a disco por chunks con límite de tamaño y hash incremental
+
+    Escribe a un temporal en el mismo directorio y lo renombra al final: si
+    se excede el límite o falla la copia no queda un archivo a medias.
+    Bloqueante (usar con asyncio.to_thread desde código async).
+
+    Args:
+        source: Stream de origen (ej: UploadFile.file)
+        dest_path: Ruta final
+        max_bytes: Tamaño máximo permitido
+
+    Returns:
+        (tamaño en bytes, sha256 hex)
+
+    Raises:
+        MediaTooLargeError: Si el stream excede max_bytes
+    """
+    dest_path = Path(dest_path)
+    dest_path.parent.mkdir(parents=True, exist_ok=True)
+
+    hasher = hashlib.sha256()
+    size = 0
+
+    fd, tmp_name = tempfile.mkstemp(dir=dest_path.parent, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise MediaTooLargeError(max_bytes)
+                hasher.update(chunk)
+                out.write(chunk)
+
+        shutil.move(tmp_name, dest_path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+    logger.debug(f"💾 [MediaIO] {size} bytes escritos en {dest_path}")
+    return size, hasher.hexdigest()
@@ -0,0 +1,30 @@
+"""
+Archivos estáticos con headers de cache
+
+StaticFiles ya responde con ETag/Last-Modified y 304 en revalidaciones; aquí
+se agrega Cache-Control según la ruta:
+
+- Rutas con hash de contenido (originales, variantes, variante WhatsApp):
+  nunca cambian, se cachean un año como 'immutable' y el navegador ni
+  siquiera revalida.
+- Resto (imágenes legacy con nombre aleatorio o fijo): 'no-cache', el
+  navegador revalida con el ETag y recibe 304 si no cambió.
+"""
+from fastapi.staticfiles import StaticFiles
+
+from app.services.image_pipeline import is_content_addressed
+
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles con Cache-Control inmutable para rutas con hash"""
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers["Cache-Control"] = (
+            IMMUTABLE_CACHE_CONTROL if is_content_addressed(scope["path"]) else REVALIDATE_CACHE_CONTROL
+        )
+        return response
@@ -6,4 +6,310 @@ INTENT_DETECTION_PROMPT = """Eres un experto en clasificación de intenciones pa
 
 RESPONSE_GENERATION_PROMPT = """Eres un asistente de ventas amigable y profesional."""
 
-SLOT_VALIDATION_PROMPT = """Eres un validador de información proporcionada por usuarios."""
\ No newline at end of file
+SLOT_VALIDATION_PROMPT = """Eres un validador de información proporcionada por usuarios."""
+
+# ═══════════════════════════════════════════════════════════
+# PLANTILLAS PARA EL PROMPT REGISTRY (app/core/prompt_registry.py)
+# ═══════════════════════════════════════════════════════════
+# Cada prompt se divide en un PREFIJO estático (idéntico byte a byte en
+# cada llamada, para que Ollama reutilice el KV-cache ya evaluado) y un
+# SUFIJO con las partes variables (mensaje, historial, catálogo), que
+# siempre va al final. Los sufijos usan str.format.
+
+# ─── Clasificación de intención (una palabra, sync_worker) ───
+INTENT_LABEL_PREFIX = """Responde SOLO con UNA de estas palabras exactas (en inglés):
+greeting
+goodbye
+create_order
+check_order
+cancel_order
+remove_from_order
+other
+
+Ejemplos:
+"hola" → greeting
+"adiós" → goodbye
+"quiero comprar" → create_order
+"quiero ordenar" → create_order
+"necesito algo" → create_order
+"ver mi pedido" → check_order
+"cancela mi orden" → cancel_order
+"elimina el mouse" → remove_from_order
+"cómo estás" → other
+
+"""
+
+INTENT_LABEL_SUFFIX = """"{message}" →"""
+
+# ─── Detección de intención en JSON (IntentDetector) ───
+# {intents_text} se rellena UNA vez al registrar la plantilla (catálogo estático)
+INTENT_DETECTION_RULES = """Eres un asistente de ventas por WhatsApp. Tu tarea es identificar la intención del usuario.
+
+INTENCIONES DISPONIBLES:
+{intents_text}
+
+🚨 REGLA #1 - MÁXIMA PRIORIDAD (VERIFICAR PRIMERO):
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+Si el mensaje contiene CUALQUIERA de estas palabras:
+   "eliminar", "quitar", "remover", "borrar", "sacar", "cancelar"
+   
+Y ADEMÁS menciona:
+   "orden", "pedido", "compra" o "de mi orden/pedido"
+
+→ ES **remove_from_order** SIN EXCEPCIONES
+
+NO IMPORTA si también dice "quiero" o cualquier otra palabra.
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+Ejemplos de remove_from_order:
+   ✓ "quiero eliminar un mouse de mi orden"
+   ✓ "quiero eliminar el monitor de mi orden" 
+   ✓ "quitar laptop de mi pedido"
+   ✓ "eliminar teclado"
+   ✓ "borrar de mi orden el mouse"
+   ✓ "ya no quiero el mouse en mi pedido"
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+REGLAS ADICIONALES:
+
+2. **AGREGAR/COMPRAR productos** (create_order):
+   - Si el mensaje contiene "quiero", "comprar", "ordenar", "necesito" + producto
+   - Y NO contiene palabras de eliminación
+   → create_order
+   - Ejemplos: "quiero una laptop", "comprar mouse", "ordenar teclado"
+
+3. **CONSULTAR orden** (check_order):
+   - Si pregunta "dónde está", "cuándo llega", "estado", "cómo va"
+   → check_order
+"""
+
+INTENT_DETECTION_OUTPUT_FORMAT = """
+Analiza el mensaje siguiendo las REGLAS CRÍTICAS en orden de prioridad.
+
+Responde SOLO en formato JSON:
+{
+    "intent": "nombre_de_la_intención",
+    "confidence": 0.95,
+    "entities": {
+        "product": "laptop",
+        "quantity": 2
+    },
+    "requires_action": true
+}
+"""
+
+INTENT_DETECTION_SUFFIX = """
+{conversation_context}
+
+MENSAJE DEL USUARIO:
+"{message}"
+
+JSON:"""
+
+# ─── Extracción de nombre de producto (SlotExtractor) ───
+PRODUCT_EXTRACTION_RULES = """Eres un asistente experto en extraer nombres de productos de mensajes de clientes.
+
+TAREA: Extrae el nombre o nombres de productos que el cliente menciona (para comprar, agregar, eliminar, etc.).
+
+REGLAS ESTRICTAS:
+1. Extrae ÚNICAMENTE el nombre del producto (sustantivo principal)
+2. NO incluyas verbos ni partes de verbos: quiero, deseo, necesito, comprar, adquirir, ordenar, orden (del verbo ordenar), eliminar, quitar, remover
+3. NO incluyas artículos: un, una, el, la, los, las
+4. NO incluyas saludos: hola, buenos días, gracias
+5. NO incluyas palabras de contexto: orden, pedido, compra, carrito
+6. NO incluyas palabras de relleno: por favor, me gustaría, podría, de mi
+7. Si hay marca y modelo, inclúyelos: "laptop HP" no solo "laptop"
+8. Si el cliente menciona MÚLTIPLES productos, sepáralos por comas
+9. Responde SOLO con el/los nombre(s) del producto, sin explicaciones
+10. Si el mensaje no menciona un producto claro, responde "NO_PRODUCTO"
+11. IMPORTANTE: Si el mensaje dice "ordenar una [PRODUCTO]", extrae solo [PRODUCTO], NO "orden"
+
+"""
+
+PRODUCT_EXTRACTION_EXAMPLES = """EJEMPLOS CORRECTOS (COMPRAR/ORDENAR):
+Mensaje: "Hola! Quiero comprar una laptop"
+Producto: laptop
+
+Mensaje: "Quiero ordenar una laptop"
+Producto: laptop
+
+Mensaje: "Quisiera ordenar un mouse"
+Producto: mouse
+
+Mensaje: "Quiero una laptop y un mouse"
+Producto: laptop, mouse
+
+Mensaje: "Me gustaría una laptop HP y auriculares"
+Producto: laptop HP, auriculares
+
+EJEMPLOS CORRECTOS (ELIMINAR/QUITAR):
+Mensaje: "quiero eliminar la laptop de mi orden"
+Producto: laptop
+
+Mensaje: "quiero eliminar la dell de mi orden"
+Producto: dell
+
+Mensaje: "quitar el mouse de mi pedido"
+Producto: mouse
+
+Mensaje: "remover laptop HP 15 de la orden"
+Producto: laptop HP 15
+
+EJEMPLOS INCORRECTOS:
+Mensaje: "Hola, buenos días"
+Producto: NO_PRODUCTO
+
+Mensaje: "¿cómo está mi orden?"
+Producto: NO_PRODUCTO
+
+EJEMPLOS DE ERRORES COMUNES (EVITAR):
+❌ Mensaje: "quiero ordenar una laptop"
+   Respuesta incorrecta: orden
+   Respuesta correcta: laptop
+
+❌ Mensaje: "quiero eliminar la dell de mi orden"
+   Respuesta incorrecta: orden
+   Respuesta correcta: dell
+
+"""
+
+PRODUCT_EXTRACTION_SUFFIX = """PRODUCTOS DISPONIBLES (para referencia):
+{available_products}
+
+MENSAJE DEL CLIENTE: "{message}"
+Producto:"""
+
+# ─── Productos con cantidades (MultiProductHandler) ───
+PRODUCT_QUANTITIES_PREFIX = """Eres un asistente experto en extraer productos y cantidades de mensajes de clientes.
+
+TAREA: Extrae CADA producto con su cantidad y devuelve en formato JSON.
+
+REGLAS ESTRICTAS:
+1. Extrae el nombre del producto (sin artículos ni verbos)
+2. SOLO extrae cantidad si hay un NÚMERO EXPLÍCITO antes del producto:
+   - Números: "2 laptops", "5 mouses" → extraer el número
+   - Palabras: "dos laptops", "tres teclados" → convertir a número
+   - Artículos singulares: "un mouse", "una laptop" → cantidad = 1
+3. Si NO hay número explícito, USA NULL (incluso si el producto está en plural)
+   - "laptops" (sin número) → null
+   - "teclados" (sin número) → null
+   - "y mouses" (sin número) → null
+4. Convierte palabras numéricas: "dos" → 2, "tres" → 3, "cuatro" → 4, etc.
+5. Responde SOLO en formato JSON válido, sin explicaciones
+
+FORMATO DE RESPUESTA:
+{"products": [{"product": "nombre", "quantity": numero_o_null}, ...]}
+
+EJEMPLOS:
+Mensaje: "dos laptops y un mouse"
+Respuesta: {"products": [{"product": "laptop", "quantity": 2}, {"product": "mouse", "quantity": 1}]}
+
+Mensaje: "quiero 3 teclados, una laptop y 2 mouses"
+Respuesta: {"products": [{"product": "teclado", "quantity": 3}, {"product": "laptop", "quantity": 1}, {"product": "mouse", "quantity": 2}]}
+
+Mensaje: "laptop, mouse"
+Respuesta: {"products": [{"product": "laptop", "quantity": null}, {"product": "mouse", "quantity": null}]}
+
+Mensaje: "necesito una laptop HP y 5 mouses Logitech"
+Respuesta: {"products": [{"product": "laptop HP", "quantity": 1}, {"product": "mouse Logitech", "quantity": 5}]}
+
+Mensaje: "quiero cuatro laptops, 2 mouse y teclados"
+Respuesta: {"products": [{"product": "laptop", "quantity": 4}, {"product": "mouse", "quantity": 2}, {"product": "teclado", "quantity": null}]}
+
+Mensaje: "2 laptops y mouses"
+Respuesta: {"products": [{"product": "laptop", "quantity": 2}, {"product": "mouse", "quantity": null}]}
+
+"""
+
+PRODUCT_QUANTITIES_SUFFIX = """MENSAJE DEL CLIENTE: "{product_string}"
+Respuesta:"""
+
+# ─── Lista de productos sin cantidades (MultiProductHandler) ───
+PRODUCT_LIST_PREFIX = """Eres un asistente experto en extraer nombres de productos de mensajes de clientes.
+
+TAREA: Extrae CADA producto mencionado y devuelve una lista separada por comas.
+
+REGLAS ESTRICTAS:
+1. Extrae ÚNICAMENTE el nombre de cada producto (sustantivo principal)
+2. NO incluyas verbos: quiero, deseo, necesito, comprar, etc.
+3. NO incluyas artículos: un, una, el, la, los, las
+4. NO incluyas números o cantidades
+5. Separa cada producto con COMA
+6. Responde SOLO con los nombres de productos separados por comas, sin explicaciones
+
+EJEMPLOS:
+Mensaje: "una laptop y un mouse"
+Productos: laptop, mouse
+
+Mensaje: "quiero 2 teclados, una laptop y 3 mouses"
+Productos: teclado, laptop, mouse
+
+Mensaje: "necesito una laptop HP y un mouse Logitech"
+Productos: laptop HP, mouse Logitech
+
+Mensaje: "dame laptop, mouse, teclado"
+Productos: laptop, mouse, teclado
+
+"""
+
+PRODUCT_LIST_SUFFIX = """MENSAJE DEL CLIENTE: "{product_string}"
+Productos:"""
+
+# ─── Comprensión del turno en una sola llamada (TurnUnderstandingExtractor) ───
+# Reemplaza intent_label + product_extraction + product_quantities en un turno.
+# La salida se restringe con el JSON schema de TurnUnderstanding (format de Ollama).
+TURN_UNDERSTANDING_PREFIX = """Eres el analizador de mensajes de un bot de ventas por WhatsApp.
+Analiza el mensaje del cliente y responde SOLO con un objeto JSON.
+
+CAMPOS:
+- "intent": UNA de estas intenciones (en inglés):
+    greeting          → saludos ("hola", "buenas tardes")
+    goodbye           → despedidas ("adiós", "gracias, chao")
+    create_order      → quiere comprar/ordenar/pedir productos
+    check_order       → pregunta por el estado de su pedido
+    cancel_order      → quiere cancelar TODA su orden
+    remove_from_order → quiere eliminar/quitar un producto de su orden
+    other             → cualquier otra cosa
+- "confidence": número entre 0 y 1
+- "products": lista de productos mencionados, cada uno {"product": nombre, "quantity": número o null}
+- "confirmation": true si el mensaje confirma ("sí", "ok", "confirmo"), false si niega ("no"), null si no aplica
+
+REGLAS:
+1. Si menciona "eliminar", "quitar", "remover", "borrar" o "sacar" junto a "orden" o "pedido" → remove_from_order
+2. "cancelar mi orden/pedido" sin mencionar un producto → cancel_order
+3. Nombre de producto SIN verbos, artículos ni palabras como orden/pedido/carrito
+   ("ordenar una laptop" → "laptop"). Si hay marca o modelo, inclúyelos ("laptop HP").
+4. quantity SOLO si hay número explícito: "2 laptops" → 2, "dos laptops" → 2,
+   "un mouse" → 1. Sin número (aunque esté en plural) → null.
+5. Si no menciona productos, "products" es [].
+
+EJEMPLOS:
+Mensaje: "hola"
+{"intent": "greeting", "confidence": 0.98, "products": [], "confirmation": null}
+
+Mensaje: "quiero dos laptops y un mouse"
+{"intent": "create_order", "confidence": 0.95, "products": [{"product": "laptop", "quantity": 2}, {"product": "mouse", "quantity": 1}], "confirmation": null}
+
+Mensaje: "necesito una laptop HP y teclados"
+{"intent": "create_order", "confidence": 0.95, "products": [{"product": "laptop HP", "quantity": 1}, {"product": "teclado", "quantity": null}], "confirmation": null}
+
+Mensaje: "quiero eliminar el monitor de mi orden"
+{"intent": "remove_from_order", "confidence": 0.95, "products": [{"product": "monitor", "quantity": null}], "confirmation": null}
+
+Mensaje: "ya no quiero nada, cancela mi pedido"
+{"intent": "cancel_order", "confidence": 0.95, "products": [], "confirmation": null}
+
+Mensaje: "sí, confirmo"
+{"intent": "other", "confidence": 0.9, "products": [], "confirmation": true}
+
+Mensaje: "¿dónde está mi pedido?"
+{"intent": "check_order", "confidence": 0.95, "products": [], "confirmation": null}
+
+"""
+
+TURN_UNDERSTANDING_SUFFIX = """PRODUCTOS DISPONIBLES (para referencia):
+{available_products}
+
+MENSAJE DEL CLIENTE: "{message}"
+"""
@@ -30,10 +30,75 @@ class Settings(BaseSettings):
     ollama_base_url: str = "http://localhost:11434"
     ollama_model: str = "llama3.2:latest"
     ollama_timeout: int = 120
+    ollama_proxy_url: str = "http://localhost:5001"  # Proxy HTTP (ollama_proxy.py) usado por el worker
+    ollama_keep_alive: str = "30m"  # Tiempo que Ollama mantiene el modelo (y su KV-cache) cargado
+    ollama_num_ctx: int = 0  # Tamaño de contexto fijo para todas las llamadas (0 = default del modelo)
+    llm_backends: str = ""  # Proxies separados por coma, "url|modelo|modelo" limita modelos ("" = ollama_proxy_url)
+    llm_backend_failure_threshold: int = 3  # Fallos seguidos que sacan un backend de rotación
+    llm_backend_cooldown_seconds: float = 15.0  # Tiempo fuera de rotación
+    llm_hedge_after_seconds: float = 0  # Duplicar en otro backend si tarda más (0 = sin hedging)
+    llm_model_classification: str = ""  # Intención y análisis del turno ("" = ollama_model)
+    llm_model_extraction: str = ""  # Extracción de productos y cantidades ("" = ollama_model)
+    llm_model_generation: str = ""  # Respuestas libres ("" = ollama_model)
+    llm_warmup_enabled: bool = True  # Precargar los modelos al arrancar
+    llm_keepalive_interval_seconds: float = 600  # Ping para mantenerlos cargados (menor que ollama_keep_alive, 0 = off)
+    llm_cold_start_ms: float = 500  # load_ms a partir del cual una llamada cuenta como cold start
+    order_parser_min_confidence: float = 0.75  # Confianza del parser de pedidos para no llamar al LLM
+    catalog_index_ttl_seconds: float = 60  # Vida del índice de nombres de productos del parser
+    prompt_chars_per_token: float = 3.5  # Caracteres por token para estimar el tamaño de los prompts
+    prompt_budget_classification_tokens: int = 1024  # Presupuesto de prompt: intención y análisis del turno
+    prompt_budget_extraction_tokens: int = 1024  # Presupuesto de prompt: productos y cantidades
+    prompt_budget_generation_tokens: int = 1536  # Presupuesto de prompt: respuestas libres
+    context_recent_messages: int = 10  # Mensajes que la conversación guarda completos (el resto va al resumen)
+    context_summary_max_chars: int = 1200  # Tamaño máximo del resumen incremental de la conversación
+    embedding_model: str = "nomic-embed-text"  # Modelo de embeddings del índice de productos (debe servirlo algún backend)
+    product_index_dir: str = "cache/product_index"  # Matriz de embeddings de productos (.npy) y su mapa de IDs ("" = desactivado)
+    product_retrieval_top_k: int = 12  # Productos candidatos que van al prompt (los más parecidos al mensaje)
+    semantic_match_min_score: float = 0.8  # Similitud coseno mínima para sugerir un producto sin match textual
     
     # Whisper
     whisper_model: str = "base"
     whisper_language: str = "es"
+    whisper_pool_workers: int = 1  # Procesos con el modelo precargado (= transcripciones simultáneas)
+    whisper_max_pending: int = 20  # Notas de voz en cola o en proceso antes de rechazar
+    whisper_compute_type: str = "int8"  # Cuantización de faster-whisper en CPU
+    whisper_cpu_threads: int = 0  # Hilos por proceso (0 = default)
+    transcription_cache_entries: int = 1000  # Transcripciones en memoria (LRU)
+    transcription_cache_dir: str = "cache/transcriptions"  # Nivel en disco ("" = solo memoria)
+    transcription_cache_disk_entries: int = 20000  # Archivos máximos en disco (0 = sin límite, se borran los más viejos)
+    
+    # Media
+    max_media_bytes: int = 16 * 1024 * 1024  # Tamaño máximo de media descargada de WAHA
+    media_spool_bytes: int = 1024 * 1024  # Hasta este tamaño la media queda en memoria, luego a disco
+    public_base_url: str = ""  # URL con la que WAHA llega a nuestro /static (envío de imágenes por URL, "" = base64)
+    image_pipeline_workers: int = 1  # Procesos que generan variantes de imágenes subidas
+    image_pipeline_quality: int = 80  # Calidad WebP/JPEG de las variantes
+    image_gc_grace_seconds: float = 300  # El GC de imágenes no borra archivos más nuevos (subidas en curso)
+    
+    # Notificaciones (admins y clientes, en segundo plano)
+    notification_workers: int = 4  # Notificaciones enviándose en paralelo
+    notification_queue_size: int = 200  # Pendientes máximas; al llenarse se descartan
+    notification_drain_seconds: float = 10.0  # Tiempo para vaciar la cola al apagar
+    notification_db_threads: int = 2  # Hilos para las consultas de BD de las notificaciones
+    admin_notification_concurrency: int = 5  # Envíos simultáneos a admins por evento
+    admin_notification_digest_seconds: float = 0  # Ventana de resumen de eventos para admins (0 = un mensaje por evento)
+    admin_numbers_cache_seconds: float = 60  # Cache de los números de admin
+    
+    # Reintentos de envíos a WAHA (cola persistente + dead letters)
+    retry_max_attempts: int = 6  # Intentos totales antes de pasar a dead letter
+    retry_initial_delay: float = 30.0  # Delay del primer reintento (segundos)
+    retry_max_delay: float = 600.0  # Delay máximo entre reintentos
+    retry_jitter: float = 0.2  # Variación aleatoria del delay (±20%)
+    retry_poll_seconds: float = 5.0  # Intervalo del scheduler de reintentos
+    
+    # Circuit breakers (LLM y WAHA fallan en seco mientras están caídos)
+    breaker_window_seconds: float = 60.0  # Ventana deslizante de llamadas
+    breaker_min_calls: int = 5  # Llamadas mínimas en la ventana para abrir
+    breaker_failure_threshold: float = 0.5  # Tasa de fallos que abre el circuito
+    breaker_slow_call_threshold: float = 0.8  # Tasa de llamadas lentas que abre el circuito
+    breaker_open_seconds: float = 30.0  # Tiempo abierto antes de sondear (half-open)
+    llm_breaker_slow_call_seconds: float = 15.0  # Llamada al LLM considerada lenta
+    waha_breaker_slow_call_seconds: float = 8.0  # Llamada a WAHA considerada lenta
     
     # Database
     database_url: str
@@ -41,6 +106,12 @@ class Settings(BaseSettings):
     # Redis (opcional)
     redis_url: str = "redis://localhost:6379/0"
     
+    # Cluster (varias instancias contra la misma BD)
+    cluster_enabled: bool = False  # Habilitar modo scale-out
+    cluster_instance_url: str = ""  # URL con la que otras instancias llegan a esta (obligatoria y única por instancia en modo cluster)
+    cluster_heartbeat_seconds: float = 5.0  # Intervalo de heartbeat / renovación de leases
+    cluster_member_ttl_seconds: float = 15.0  # Sin heartbeat en este tiempo → instancia muerta
+    
     # Business Rules
     max_validation_attempts: int = 3
     session_timeout_minutes: int = 30
@@ -57,10 +128,22 @@ class Settings(BaseSettings):
     offer_after_greeting: bool = True  # Ofrecer producto después de saludo
     offer_with_image: bool = True  # Incluir imagen del producto en el ofrecimiento
     offer_image_as_caption: bool = True  # True: imagen con caption, False: solo texto sin imagen
+    offer_affinity_cache_entries: int = 5000  # Rankings de clientes en memoria para elegir el ofrecimiento
+    offer_affinity_ttl_seconds: float = 600  # Vida de un ranking de cliente (cambios hechos por otra instancia)
+    offer_popularity_ttl_seconds: float = 300  # Vida del ranking global de más vendidos
+    recommender_dir: str = "cache/recommender"  # Matriz de co-compra (.npy con mmap, "" = desactivado)
+    recommender_neighbors: int = 20  # Productos comprados-juntos guardados por producto
+    recommender_max_basket: int = 50  # Órdenes con más productos distintos no aportan pares
+    recommender_min_co_orders: int = 2  # Órdenes mínimas con el par para recomendarlo
+    recommender_similarity: str = "cosine"  # Normalización de la co-ocurrencia: cosine o lift
+    recommender_refresh_seconds: float = 300  # Intervalo del refresco incremental (órdenes nuevas)
+    recommender_full_rebuild_hours: float = 24  # Rebuild completo (aplica cancelaciones y cambios de items)
     
     # WebApp Carrito
     webapp_base_url: str = "http://localhost:5174"  # URL base de la webapp del carrito
     cart_session_hours: int = 24  # Horas de validez de una sesión de carrito
+    cart_token_secret: str = ""  # Clave HMAC de los tokens del link (vacío = deriva de webhook_secret)
+    cart_revocation_sync_seconds: float = 5  # Cada cuánto se traen las sesiones usadas en otras instancias
     
     class Config:
         env_file = ".env"
@@ -8,6 +8,7 @@ export interface Product {
   stock: number
   category: string | null
   image_path: string | null
+  image_variants?: Record<'thumb' | 'card' | 'full', { webp: string; jpeg: string }> | null
   sku: string | null
   is_active: boolean
   created_at: string
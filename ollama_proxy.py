@@ -1,47 +1,147 @@
 """
 Proxy HTTP simple para Ollama
 Ejecutar en una terminal separada
+
+Endpoints:
+    POST /generate  {"model", "prompt", "temperature", "max_tokens", "stop", "stream",
+                     "keep_alive", "num_ctx", "format"}
+        - stream=False (default): responde {"success": true, "response": "...", ...métricas}
+        - stream=True: responde NDJSON, una línea por token {"token": "..."} y una
+          línea final {"done": true, ...métricas de Ollama}. Si el cliente cierra la
+          conexión, se cierra también la conexión con Ollama y la generación se aborta.
+        - format: "json" o un JSON schema; Ollama restringe la salida con una gramática
+    POST /embed  {"model", "input": ["texto", ...], "keep_alive"}
+        - responde {"success": true, "embeddings": [[...], ...]} (un vector por texto, en orden)
+
+Variables de entorno (un proxy por nodo, ver LLM_BACKENDS en el bot):
+    OLLAMA_URL   Ollama del nodo (default: http://localhost:11434)
+    PROXY_PORT   Puerto del proxy (default: 5001)
 """
-from flask import Flask, request, jsonify
+import json
+import os
+from flask import Flask, request, jsonify, Response, stream_with_context
 import requests
 from loguru import logger
 
 app = Flask(__name__)
 
+OLLAMA_URL = os.environ.get('OLLAMA_URL', 'http://localhost:11434').rstrip('/')
+OLLAMA_GENERATE_URL = OLLAMA_URL + '/api/generate'
+OLLAMA_EMBED_URL = OLLAMA_URL + '/api/embed'
+PROXY_PORT = int(os.environ.get('PROXY_PORT', '5001'))
+
+
+def _build_ollama_payload(data: dict, stream: bool) -> dict:
+    """Traduce el request del proxy al formato de /api/generate de Ollama"""
+    options = {
+        "num_predict": data.get('max_tokens', 500),
+        "temperature": data.get('temperature', 0.7)
+    }
+    if data.get('stop'):
+        options["stop"] = data['stop']
+    # Un num_ctx distinto entre llamadas obliga a Ollama a recargar el modelo y pierde el KV-cache
+    if data.get('num_ctx'):
+        options["num_ctx"] = data['num_ctx']
+
+    payload = {
+        "model": data.get('model', 'llama3.2:latest'),
+        "prompt": data.get('prompt'),
+        "stream": stream,
+        "options": options
+    }
+    if data.get('keep_alive'):
+        payload["keep_alive"] = data['keep_alive']
+    if data.get('format'):
+        payload["format"] = data['format']
+
+    return payload
+
+
+def _ns_to_ms(value) -> float:
+    """Convierte duraciones de Ollama (nanosegundos) a milisegundos"""
+    return round((value or 0) / 1_000_000, 1)
+
+
+def _timings(result: dict) -> dict:
+    """Métricas de tiempo de la respuesta final de Ollama"""
+    return {
+        "load_ms": _ns_to_ms(result.get('load_duration')),
+        "prompt_eval_count": result.get('prompt_eval_count', 0),
+        "prompt_eval_ms": _ns_to_ms(result.get('prompt_eval_duration')),
+        "eval_count": result.get('eval_count', 0),
+        "eval_ms": _ns_to_ms(result.get('eval_duration'))
+    }
+
+
+def _stream_generate(data: dict):
+    """Genera líneas NDJSON a medida que Ollama produce tokens"""
+    upstream = None
+    try:
+        upstream = requests.post(
+            OLLAMA_GENERATE_URL,
+            json=_build_ollama_payload(data, stream=True),
+            stream=True,
+            timeout=60.0
+        )
+        upstream.raise_for_status()
+
+        for line in upstream.iter_lines():
+            if not line:
+                continue
+
+            chunk = json.loads(line)
+
+            if chunk.get('done'):
+                yield json.dumps({"done": True, **_timings(chunk)}) + "\n"
+                break
+
+            yield json.dumps({"token": chunk.get('response', '')}) + "\n"
+
+    except GeneratorExit:
+        # El cliente cortó la respuesta (early cut-off): liberar el modelo
+        logger.info("[Proxy] Stream cortado por el cliente")
+        raise
+    except Exception as e:
+        logger.error(f"[Proxy] Error en stream: {e}")
+        yield json.dumps({"error": str(e)}) + "\n"
+    finally:
+        if upstream is not None:
+            upstream.close()
+
+
 @app.route('/generate', methods=['POST'])
 def generate():
     """Endpoint para generar texto con Ollama"""
     try:
         data = request.json
-        
-        logger.info(f"[Proxy] Request recibido: {data.get('model')}")
-        
+
+        logger.info(f"[Proxy] Request recibido: {data.get('model')} (stream={bool(data.get('stream'))})")
+
+        if data.get('stream'):
+            return Response(
+                stream_with_context(_stream_generate(data)),
+                mimetype='application/x-ndjson'
+            )
+
         # Llamar a Ollama directamente
         response = requests.post(
-            'http://localhost:11434/api/generate',
-            json={
-                "model": data.get('model', 'llama3.2:latest'),
-                "prompt": data.get('prompt'),
-                "temperature": data.get('temperature', 0.7),
-                "stream": False,
-                "options": {
-                    "num_predict": data.get('max_tokens', 500)
-                }
-            },
+            OLLAMA_GENERATE_URL,
+            json=_build_ollama_payload(data, stream=False),
             timeout=60.0
         )
-        
+
         response.raise_for_status()
         result = response.json()
-        
+
         generated_text = result.get('response', '')
         logger.info(f"[Proxy] Respuesta generada: {len(generated_text)} caracteres")
-        
+
         return jsonify({
             "success": True,
-            "response": generated_text
+            "response": generated_text,
+            **_timings(result)
         })
-        
+
     except Exception as e:
         logger.error(f"[Proxy] Error: {e}")
         return jsonify({
@@ -49,6 +149,44 @@ def generate():
             "error": str(e)
         }), 500
 
+
+@app.route('/embed', methods=['POST'])
+def embed():
+    """Endpoint para generar embeddings de varios textos en una sola llamada"""
+    try:
+        data = request.json
+        texts = data.get('input') or []
+        if isinstance(texts, str):
+            texts = [texts]
+
+        payload = {
+            "model": data.get('model', 'nomic-embed-text'),
+            "input": texts
+        }
+        if data.get('keep_alive'):
+            payload["keep_alive"] = data['keep_alive']
+
+        response = requests.post(OLLAMA_EMBED_URL, json=payload, timeout=60.0)
+        response.raise_for_status()
+        result = response.json()
+
+        embeddings = result.get('embeddings', [])
+        logger.info(f"[Proxy] Embeddings generados: {len(embeddings)} ({payload['model']})")
+
+        return jsonify({
+            "success": True,
+            "embeddings": embeddings,
+            "load_ms": _ns_to_ms(result.get('load_duration'))
+        })
+
+    except Exception as e:
+        logger.error(f"[Proxy] Error en embeddings: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
 if __name__ == '__main__':
-    logger.info("🚀 Iniciando Ollama Proxy en http://localhost:5001")
-    app.run(host='0.0.0.0', port=5001, debug=False)
\ No newline at end of file
+    logger.info(f"🚀 Iniciando Ollama Proxy en http://localhost:{PROXY_PORT} → {OLLAMA_GENERATE_URL}")
+    app.run(host='0.0.0.0', port=PROXY_PORT, debug=False, threaded=True)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Benchmark: parser determinista de pedidos vs LLM
+
+Corre un corpus de frases de pedido con su resultado esperado contra el
+catálogo de seed_products.py y reporta:
+    - Cobertura: frases resueltas sin LLM (confianza >= ORDER_PARSER_MIN_CONFIDENCE)
+    - Precisión de las resueltas: productos y cantidades iguales a lo esperado
+      (un error aquí es un pedido mal armado, lo que nunca debería pasar)
+    - Frases ambiguas que van al LLM
+    - Latencia por frase del parser (y del LLM con --llm)
+
+Un producto esperado en minúsculas es un nombre genérico ("mouse" con varios
+mouses en el catálogo): el parser debe devolverlo tal cual para que el
+módulo pregunte cuál.
+
+Uso:
+    python scripts/benchmark_order_parser.py
+    python scripts/benchmark_order_parser.py --verbose
+    python scripts/benchmark_order_parser.py --llm      # con ollama_proxy.py corriendo
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+from loguru import logger
+
+from config.settings import settings
+from app.core.order_phrase_parser import CatalogIndex, OrderPhraseParser
+
+
+CATALOG = [
+    "Laptop HP 15",
+    "MacBook Air M2",
+    "Dell XPS 13",
+    "Mouse Logitech MX Master 3",
+    "Mouse Básico USB",
+    "Teclado Mecánico RGB",
+    "Teclado Inalámbrico",
+    'Monitor LG 24"',
+    'Monitor Samsung 27" 4K',
+    "Audífonos Sony WH-1000XM5",
+    "Audífonos Gamer",
+    "Webcam Logitech C920",
+]
+
+# (frase, esperado) — esperado None: ambigua, debe ir al LLM
+CORPUS = [
+    ("quiero dos laptops y un mouse logitech", [("Laptop HP 15", 2), ("Mouse Logitech MX Master 3", 1)]),
+    ("3 teclados mecanicos, 1 webcam", [("Teclado Mecánico RGB", 3), ("Webcam Logitech C920", 1)]),
+    ("una macbook air", [("MacBook Air M2", 1)]),
+    ("dame un par de audifonos gamer", [("Audífonos Gamer", 2)]),
+    ("necesito 5 mouses basicos", [("Mouse Básico USB", 5)]),
+    ("quiero una laptop hp y dos teclados inalambricos", [("Laptop HP 15", 1), ("Teclado Inalámbrico", 2)]),
+    ("dos dell xps", [("Dell XPS 13", 2)]),
+    ("un monitor samsung más una webcam", [("Monitor Samsung 27\" 4K", 1), ("Webcam Logitech C920", 1)]),
+    ("webcam x2", [("Webcam Logitech C920", 2)]),
+    ("2x laptop hp", [("Laptop HP 15", 2)]),
+    ("quiero 10 audifonos sony", [("Audífonos Sony WH-1000XM5", 10)]),
+    ("media docena de mouses basicos", [("Mouse Básico USB", 6)]),
+    ("una docena de webcams", [("Webcam Logitech C920", 12)]),
+    ("treinta y dos teclados mecanicos", [("Teclado Mecánico RGB", 32)]),
+    ("veintidos webcams y tres macbooks", [("Webcam Logitech C920", 22), ("MacBook Air M2", 3)]),
+    ("me gustaria un monitor lg por favor", [("Monitor LG 24\"", 1)]),
+    ("hola, quiero unas laptops", [("Laptop HP 15", None)]),
+    ("laptops", [("Laptop HP 15", None)]),
+    ("quiero un mouse", [("mouse", 1)]),
+    ("dos teclados y un monitor", [("teclado", 2), ("monitor", 1)]),
+    ("unos audifonos", [("audifonos", None)]),
+    ("el mouse logitech y la webcam", [("Mouse Logitech MX Master 3", None), ("Webcam Logitech C920", None)]),
+    ("quisiera 4 laptops hp, 2 mouses logitech y 1 webcam",
+     [("Laptop HP 15", 4), ("Mouse Logitech MX Master 3", 2), ("Webcam Logitech C920", 1)]),
+    ("1 macbook + 1 mouse basico", [("MacBook Air M2", 1), ("Mouse Básico USB", 1)]),
+    ("ponme tres audifonos gamer tambien un teclado inalambrico",
+     [("Audífonos Gamer", 3), ("Teclado Inalámbrico", 1)]),
+    ("quiero el monitor de 27", [("Monitor Samsung 27\" 4K", None)]),
+    ("la webcam c920", [("Webcam Logitech C920", None)]),
+    ("dame 2 unidades de macbook air", [("MacBook Air M2", 2)]),
+    ("cinco piezas de mouse basico", [("Mouse Básico USB", 5)]),
+    # Ambiguas o fuera del catálogo: al LLM
+    ("quiero algo para jugar", None),
+    ("una impresora y un mouse", None),
+    ("lo mismo que la otra vez", None),
+    ("dos", None),
+    ("un cargador para laptop", None),
+    ("el monitor de 32 pulgadas", None),
+    ("algo barato", None),
+]
+
+
+def normalize_name(name):
+    return name.lower() if name else name
+
+
+def is_correct(items, expected) -> bool:
+    got = [(normalize_name(item["product"]), item["quantity"]) for item in items]
+    return got == [(normalize_name(name), qty) for name, qty in expected]
+
+
+def run_parser(parser: OrderPhraseParser, threshold: float, verbose: bool):
+    resolved = correct = wrong = ambiguous_ok = ambiguous_leaked = 0
+
+    for phrase, expected in CORPUS:
+        result = parser.parse(phrase)
+        confident = bool(result.items) and result.confidence >= threshold
+        items = result.to_list()
+
+        if expected is None:
+            if confident:
+                ambiguous_leaked += 1
+                logger.warning(f"   ⚠️ Ambigua resuelta sin LLM: '{phrase}' → {items} ({result.confidence:.2f})")
+            else:
+                ambiguous_ok += 1
+            continue
+
+        if not confident:
+            if verbose:
+                logger.info(f"   → LLM: '{phrase}' ({result.confidence:.2f}) {items}")
+            continue
+
+        resolved += 1
+        if is_correct(items, expected):
+            correct += 1
+            if verbose:
+                logger.info(f"   ✅ '{phrase}' → {items} ({result.confidence:.2f})")
+        else:
+            wrong += 1
+            logger.warning(f"   ❌ '{phrase}' → {items}, esperado {expected}")
+
+    return resolved, correct, wrong, ambiguous_ok, ambiguous_leaked
+
+
+def time_parser(parser: OrderPhraseParser, rounds: int) -> list:
+    latencies = []
+    for _ in range(rounds):
+        for phrase, _expected in CORPUS:
+            start = time.perf_counter()
+            parser.parse(phrase)
+            latencies.append((time.perf_counter() - start) * 1e6)
+    return latencies
+
+
+def time_llm(phrases: list) -> list:
+    from app.clients.ollama_sync import ollama_sync_client, stop_on_json_object
+    from app.clients.llm_models import model_for, EXTRACTION
+    from app.core.prompt_registry import get_prompt_registry
+
+    latencies = []
+    for phrase in phrases:
+        prompt = get_prompt_registry().render("product_quantities", product_string=phrase)
+        start = time.perf_counter()
+        ollama_sync_client.generate_stream(
+            prompt=prompt, on_token=stop_on_json_object, temperature=0.1,
+            max_tokens=200, timeout=60.0, model=model_for(EXTRACTION)
+        )
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return latencies
+
+
+def report(name: str, latencies: list, unit: str = "µs", scale: float = 1.0):
+    ordered = sorted(latencies)
+    p99 = ordered[max(0, int(len(ordered) * 0.99) - 1)]
+    logger.info(
+        f"   {name:<8} media={statistics.mean(latencies) / scale:10.1f}{unit} "
+        f"p50={statistics.median(latencies) / scale:10.1f}{unit} p99={p99 / scale:10.1f}{unit}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del parser de pedidos")
+    parser.add_argument("--rounds", "-r", type=int, default=200, help="Repeticiones del corpus para medir latencia")
+    parser.add_argument("--threshold", type=float, default=settings.order_parser_min_confidence)
+    parser.add_argument("--llm", action="store_true", help="Medir también el camino del LLM")
+    parser.add_argument("--verbose", "-v", action="store_true")
+    args = parser.parse_args()
+
+    order_parser = OrderPhraseParser(CatalogIndex(CATALOG))
+
+    logger.info("=" * 70)
+    logger.info(f"BENCHMARK: PARSER DE PEDIDOS ({len(CORPUS)} frases, umbral {args.threshold})")
+    logger.info("=" * 70)
+
+    resolved, correct, wrong, ambiguous_ok, ambiguous_leaked = run_parser(order_parser, args.threshold, args.verbose)
+    parseable = sum(1 for _, expected in CORPUS if expected is not None)
+    ambiguous = len(CORPUS) - parseable
+
+    logger.info(f"\n📊 Precisión")
+    logger.info(f"   Resueltas sin LLM:   {resolved}/{parseable} ({resolved / parseable * 100:.1f}%)")
+    logger.info(f"   Correctas:           {correct}/{resolved} ({correct / resolved * 100 if resolved else 0:.1f}%)")
+    logger.info(f"   Incorrectas:         {wrong}")
+    logger.info(f"   Ambiguas al LLM:     {ambiguous_ok}/{ambiguous}")
+
+    logger.info(f"\n⏱️ Latencia por frase")
+    report("parser", time_parser(order_parser, args.rounds))
+    if args.llm:
+        report("llm", time_llm([phrase for phrase, _ in CORPUS]), unit="ms", scale=1000.0)
+
+    if wrong or ambiguous_leaked:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark: tiempo de evaluación de prompt con layout anterior vs plantillas v2
+
+El layout anterior intercalaba partes variables (historial, catálogo) entre
+las instrucciones fijas, así que cada llamada re-evaluaba casi todo el prompt.
+Las plantillas v2 del PromptRegistry dejan un prefijo estático y las partes
+variables al final, de modo que Ollama reutiliza el KV-cache del prefijo.
+
+Mide prompt_eval_ms y prompt_eval_count reportados por el proxy (max_tokens=1).
+Las tareas se ejecutan agrupadas: si se intercalan tareas distintas en el mismo
+slot de Ollama, el cache del prefijo de una tarea se pierde al evaluar la otra.
+
+Uso:
+    python ollama_proxy.py            # en otra terminal
+    python scripts/benchmark_prompt_layout.py
+    python scripts/benchmark_prompt_layout.py --rounds 3
+"""
+import argparse
+import statistics
+import sys
+from pathlib import Path
+
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+from loguru import logger
+
+from config import prompts
+from app.clients.ollama_sync import OllamaSyncClient
+from app.core.intent_detector import IntentDetector
+from app.core.prompt_registry import get_prompt_registry
+
+
+MESSAGES = [
+    "hola, quiero comprar una laptop",
+    "necesito dos mouses y un teclado",
+    "dónde está mi pedido?",
+    "quiero eliminar el monitor de mi orden",
+    "me gustaría una laptop HP y auriculares",
+    "cuánto cuesta el teclado mecánico",
+    "ya no quiero nada, cancela todo",
+    "quisiera ordenar un mouse inalámbrico",
+]
+
+HISTORY = "Mensajes recientes:\nUsuario: hola\nBot: ¡Hola! ¿En qué puedo ayudarte?"
+CATALOG = "Laptop HP 15, Laptop Dell Inspiron, Mouse Logitech, Teclado Mecánico, Monitor 24, Auriculares Sony"
+
+
+def legacy_intent_prompt(message: str) -> str:
+    """Layout anterior de IntentDetector: historial y mensaje antes del formato de salida"""
+    rules = prompts.INTENT_DETECTION_RULES.format(intents_text=IntentDetector.format_intents_catalog())
+    return f'{rules}\n{HISTORY}\n\nMENSAJE DEL USUARIO:\n"{message}"\n{prompts.INTENT_DETECTION_OUTPUT_FORMAT}'
+
+
+def legacy_product_prompt(message: str) -> str:
+    """Layout anterior de SlotExtractor: catálogo entre las reglas y los ejemplos"""
+    return (
+        prompts.PRODUCT_EXTRACTION_RULES
+        + f"PRODUCTOS DISPONIBLES (para referencia):\n{CATALOG}\n\n"
+        + prompts.PRODUCT_EXTRACTION_EXAMPLES
+        + f'MENSAJE DEL CLIENTE: "{message}"\nProducto:'
+    )
+
+
+def v2_intent_prompt(message: str) -> str:
+    return get_prompt_registry().render("intent_detection", conversation_context=HISTORY, message=message)
+
+
+def v2_product_prompt(message: str) -> str:
+    return get_prompt_registry().render("product_extraction", available_products=CATALOG, message=message)
+
+
+def run_layout(client: OllamaSyncClient, build_prompt, rounds: int):
+    """Ejecuta todos los mensajes con un layout y retorna (prompt_eval_ms, prompt_eval_count)"""
+    eval_ms = []
+    eval_count = []
+
+    for _ in range(rounds):
+        for message in MESSAGES:
+            result = client.generate(build_prompt(message), temperature=0.0, max_tokens=1, timeout=120.0)
+            if not result.get("success"):
+                raise RuntimeError(result.get("error"))
+            eval_ms.append(result.get("prompt_eval_ms", 0.0))
+            eval_count.append(result.get("prompt_eval_count", 0))
+
+    return eval_ms, eval_count
+
+
+def report(name: str, eval_ms, eval_count):
+    ordered = sorted(eval_ms)
+    p95 = ordered[max(0, int(len(ordered) * 0.95) - 1)]
+    logger.info(
+        f"   {name:<10} prompt_eval: media={statistics.mean(eval_ms):8.1f}ms "
+        f"p50={statistics.median(eval_ms):8.1f}ms p95={p95:8.1f}ms "
+        f"tokens evaluados (media)={statistics.mean(eval_count):6.1f}"
+    )
+    return statistics.mean(eval_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de layout de prompts")
+    parser.add_argument("--rounds", "-r", type=int, default=2, help="Repeticiones de la lista de mensajes")
+    args = parser.parse_args()
+
+    client = OllamaSyncClient()
+
+    tasks = [
+        ("intent_detection", legacy_intent_prompt, v2_intent_prompt),
+        ("product_extraction", legacy_product_prompt, v2_product_prompt),
+    ]
+
+    logger.info("=" * 70)
+    logger.info("BENCHMARK: LAYOUT DE PROMPTS (antes vs plantillas v2)")
+    logger.info("=" * 70)
+
+    for task_name, legacy_builder, v2_builder in tasks:
+        logger.info(f"\n📝 {task_name}")
+
+        # Calentar el modelo para no medir la carga inicial
+        client.generate(v2_builder(MESSAGES[0]), temperature=0.0, max_tokens=1, timeout=300.0)
+
+        before = report("antes", *run_layout(client, legacy_builder, args.rounds))
+        after = report("v2", *run_layout(client, v2_builder, args.rounds))
+
+        if before:
+            logger.info(f"   → Reducción de prompt_eval: {(1 - after / before) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
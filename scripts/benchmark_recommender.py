@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Benchmark: recomendador de co-compra
+
+Genera order_items sintéticos (popularidad tipo Zipf, órdenes de 1 a 8
+productos y "combos" de productos que se compran juntos) y mide:
+    - Build sobre arrays: conteo de pares, normalización y top-N
+    - rebuild() real contra una SQLite sembrada con esas órdenes, por etapa:
+      lectura de order_items por partes con IDs → enteros (_load_items) y
+      conteo + publicación
+    - Memoria: pico de numpy durante el build (tracemalloc) y tamaño en disco
+    - Carga con mmap (cero copias) y latencia de recommend() en µs
+    - Refresco incremental con órdenes nuevas
+    - Calidad: cuántos combos recupera el top-5 del primer producto
+
+Uso:
+    python scripts/benchmark_recommender.py
+    python scripts/benchmark_recommender.py --items 1000000 --products 5000
+    python scripts/benchmark_recommender.py --skip-db   # solo arrays
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+import numpy as np
+from loguru import logger
+
+from app.services.co_purchase_recommender import (
+    CoPurchaseRecommender, co_occurrence, merge_counts, top_neighbors
+)
+
+
+def synthetic_orders(n_items: int, n_products: int, n_bundles: int, seed: int, first_order: int = 0):
+    """(order_idx, product_idx, bundles): ~30% de las órdenes traen un combo completo"""
+    rng = np.random.default_rng(seed)
+    bundles = rng.choice(n_products, size=(n_bundles, 3), replace=False) if n_bundles * 3 <= n_products \
+        else rng.integers(0, n_products, size=(n_bundles, 3))
+
+    sizes = np.clip(rng.geometric(0.4, size=n_items // 2), 1, 8)
+    sizes = sizes[np.cumsum(sizes) <= n_items]
+    order_idx = np.repeat(np.arange(first_order, first_order + len(sizes)), sizes)
+
+    popularity = 1.0 / np.arange(1, n_products + 1) ** 1.1
+    popularity /= popularity.sum()
+    product_idx = rng.choice(n_products, size=len(order_idx), p=popularity)
+
+    # Combos: las primeras posiciones de algunas órdenes de 3+ productos
+    starts = np.cumsum(sizes) - sizes
+    with_bundle = np.flatnonzero((sizes >= 3) & (rng.random(len(sizes)) < 0.3))
+    chosen = bundles[rng.integers(0, n_bundles, size=len(with_bundle))]
+    for column in range(3):
+        product_idx[starts[with_bundle] + column] = chosen[:, column]
+
+    return order_idx, product_idx, bundles
+
+
+def seed_database(url: str, order_idx, product_idx, n_products: int, chunk: int = 50_000):
+    """SQLite con los productos, órdenes confirmadas y order_items sintéticos (inserción masiva)"""
+    from sqlalchemy import create_engine, insert
+    from config.database import Base
+    from app.database.models import Customer, Order, OrderItem, Product, OrderStatus
+
+    engine = create_engine(url)
+    Base.metadata.create_all(engine, tables=[t.__table__ for t in (Customer, Product, Order, OrderItem)])
+
+    now = datetime.utcnow()
+    n_orders = int(order_idx.max()) + 1
+    with engine.begin() as conn:
+        conn.execute(insert(Customer), [{"id": "c0", "phone": "3000000000"}])
+        conn.execute(insert(Product), [
+            {"id": f"p{i}", "name": f"Producto {i}", "price": 1.0, "stock": 10, "sku": f"SKU{i}",
+             "created_at": now, "updated_at": now}
+            for i in range(n_products)
+        ])
+        for first in range(0, n_orders, chunk):
+            conn.execute(insert(Order), [
+                {"id": f"o{i}", "order_number": f"ORD-{i}", "customer_id": "c0",
+                 "status": OrderStatus.CONFIRMED.value, "subtotal": 1.0, "total": 1.0,
+                 "created_at": now, "confirmed_at": now - timedelta(seconds=n_orders - i)}
+                for i in range(first, min(first + chunk, n_orders))
+            ])
+        for first in range(0, len(order_idx), chunk):
+            conn.execute(insert(OrderItem), [
+                {"id": f"i{i}", "order_id": f"o{order_idx[i]}", "product_id": f"p{product_idx[i]}",
+                 "product_name": f"Producto {product_idx[i]}", "quantity": 1, "unit_price": 1.0,
+                 "subtotal": 1.0, "created_at": now}
+                for i in range(first, min(first + chunk, len(order_idx)))
+            ])
+    return engine
+
+
+def benchmark_rebuild(order_idx, product_idx, n_products: int, neighbors: int) -> None:
+    """Tiempo de rebuild() contra la base de datos, separado por etapa"""
+    from sqlalchemy.orm import sessionmaker
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        engine = seed_database(f"sqlite:///{directory}/bench.db", order_idx, product_idx, n_products)
+        logger.info(f"\n🗄️ rebuild() contra SQLite (sembrada en {time.perf_counter() - start:.1f}s, no cuenta)")
+
+        db = sessionmaker(bind=engine)()
+        try:
+            recommender = CoPurchaseRecommender(str(Path(directory) / "matrix"), neighbors=neighbors, min_co_orders=2)
+
+            start = time.perf_counter()
+            _, _, _, orders = recommender._load_items(db, [])
+            load_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            result = recommender.rebuild(db)
+            total_seconds = time.perf_counter() - start
+        finally:
+            db.close()
+            engine.dispose()
+
+    rest = max(total_seconds - load_seconds, 0.0)
+    logger.info(f"   Órdenes:      {orders:,} ({result['pairs']:,} pares)")
+    logger.info(f"   Lectura+IDs:  {load_seconds:.2f}s")
+    logger.info(f"   Conteo+disco: {rest:.2f}s")
+    logger.info(f"   rebuild():    {total_seconds:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del recomendador de co-compra")
+    parser.add_argument("--items", type=int, default=1_000_000, help="order_items sintéticos")
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--bundles", type=int, default=200, help="Combos que se compran juntos")
+    parser.add_argument("--neighbors", type=int, default=20)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--new-items", type=int, default=10000, help="Items del refresco incremental")
+    parser.add_argument("--skip-db", action="store_true", help="No medir rebuild() contra SQLite")
+    args = parser.parse_args()
+
+    logger.info("=" * 70)
+    logger.info(f"BENCHMARK: CO-COMPRA ({args.items:,} items, {args.products:,} productos)")
+    logger.info("=" * 70)
+
+    order_idx, product_idx, bundles = synthetic_orders(args.items, args.products, args.bundles, seed=1)
+    n_orders = int(order_idx.max()) + 1
+
+    # Build completo
+    tracemalloc.start()
+    start = time.perf_counter()
+    keys, counts, freq = co_occurrence(order_idx, product_idx, args.products, max_basket=50)
+    count_seconds = time.perf_counter() - start
+    indptr, indices, scores = top_neighbors(keys, counts, freq, args.products, n_orders, args.neighbors, 2)
+    build_seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    logger.info(f"\n🧮 Build sobre arrays (sin lectura de BD)")
+    logger.info(f"   Items:        {len(order_idx):,} en {n_orders:,} órdenes")
+    logger.info(f"   Pares:        {len(keys):,} (vecinos guardados: {len(indices):,})")
+    logger.info(f"   Conteo:       {count_seconds:.2f}s")
+    logger.info(f"   Total:        {build_seconds:.2f}s")
+    logger.info(f"   Pico memoria: {peak / 1024 / 1024:.1f} MB")
+
+    # Persistencia y carga con mmap
+    product_ids = [f"p{i}" for i in range(args.products)]
+    with tempfile.TemporaryDirectory() as directory:
+        recommender = CoPurchaseRecommender(directory, neighbors=args.neighbors, min_co_orders=2)
+        recommender.publish(keys, counts, freq, {"product_ids": product_ids, "orders": n_orders}, time.perf_counter())
+        on_disk = sum(f.stat().st_size for f in Path(directory).rglob("*.npy"))
+        neighbors_bytes = indptr.nbytes + indices.nbytes + scores.nbytes
+
+        start = time.perf_counter()
+        loaded = CoPurchaseRecommender(directory, neighbors=args.neighbors)
+        loaded._maybe_reload(force=True)
+        load_ms = (time.perf_counter() - start) * 1000
+
+        logger.info(f"\n💾 Persistencia")
+        logger.info(f"   En disco:     {on_disk / 1024 / 1024:.1f} MB (vecinos: {neighbors_bytes / 1024 / 1024:.2f} MB)")
+        logger.info(f"   Carga mmap:   {load_ms:.1f} ms")
+
+        # Latencia de consulta
+        rng = np.random.default_rng(2)
+        seeds = rng.integers(0, args.products, size=(args.lookups, 2))
+        latencies = []
+        for a, b in seeds:
+            t = time.perf_counter_ns()
+            loaded.recommend([product_ids[a], product_ids[b]], k=5)
+            latencies.append((time.perf_counter_ns() - t) / 1000)
+        ordered = sorted(latencies)
+        logger.info(f"\n⏱️ recommend() con 2 semillas")
+        logger.info(
+            f"   media={statistics.mean(latencies):.1f}µs p50={statistics.median(latencies):.1f}µs "
+            f"p99={ordered[int(len(ordered) * 0.99) - 1]:.1f}µs"
+        )
+
+        # Calidad: el combo completo aparece en el top-5 de su primer producto
+        hits = 0
+        for bundle in bundles:
+            top = {pid for pid, _ in loaded.recommend([product_ids[bundle[0]]], k=5)}
+            hits += product_ids[bundle[1]] in top and product_ids[bundle[2]] in top
+        logger.info(f"\n🎯 Combos recuperados en el top-5: {hits}/{len(bundles)}")
+
+    # Refresco incremental
+    new_orders, new_products, _ = synthetic_orders(args.new_items, args.products, args.bundles, seed=3, first_order=n_orders)
+    start = time.perf_counter()
+    new_keys, new_counts, new_freq = co_occurrence(new_orders, new_products, args.products, max_basket=50)
+    merged_keys, merged_counts = merge_counts(keys, counts, args.products, new_keys, new_counts, args.products, args.products)
+    top_neighbors(merged_keys, merged_counts, freq + new_freq, args.products,
+                  n_orders + len(np.unique(new_orders)), args.neighbors, 2)
+    logger.info(f"\n🔄 Refresco incremental ({args.new_items:,} items nuevos): {time.perf_counter() - start:.2f}s")
+
+    if not args.skip_db:
+        benchmark_rebuild(order_idx, product_idx, args.products, args.neighbors)
+
+
+if __name__ == "__main__":
+    main()
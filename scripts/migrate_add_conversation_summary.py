@@ -0,0 +1,78 @@
+"""
+Script de migración: Agregar recent_messages y summary a la tabla conversations
+
+La ventana de mensajes recientes y el resumen incremental se llenan solos:
+la primera vez que se lee una conversación sin ventana se construye desde
+la tabla messages.
+
+Uso:
+    python scripts/migrate_add_conversation_summary.py
+"""
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+from sqlalchemy import text
+from config.database import get_db
+from loguru import logger
+
+
+NEW_COLUMNS = {
+    "recent_messages": "JSON",
+    "summary": "TEXT",
+}
+
+
+def migrate_add_conversation_summary():
+    """
+    Agrega las columnas recent_messages y summary a la tabla conversations
+    """
+    logger.info("🔄 Iniciando migración: Agregar recent_messages y summary a conversations")
+    
+    try:
+        # Obtener conexión a la base de datos
+        db = next(get_db())
+        
+        # Verificar qué columnas ya existen
+        result = db.execute(text("PRAGMA table_info(conversations)"))
+        columns = [row[1] for row in result]
+        
+        for column, column_type in NEW_COLUMNS.items():
+            if column in columns:
+                logger.info(f"✅ La columna '{column}' ya existe")
+                continue
+            
+            logger.info(f"➕ Agregando columna '{column}'...")
+            db.execute(text(f"ALTER TABLE conversations ADD COLUMN {column} {column_type}"))
+        
+        db.commit()
+        
+        logger.info("✅ Migración completada exitosamente")
+        return True
+        
+    except Exception as e:
+        logger.error(f"❌ Error durante la migración: {e}")
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    logger.info("=" * 60)
+    logger.info("MIGRACIÓN DE BASE DE DATOS")
+    logger.info("=" * 60)
+    
+    success = migrate_add_conversation_summary()
+    
+    if success:
+        logger.info("=" * 60)
+        logger.info("✅ Migración completada con éxito")
+        logger.info("=" * 60)
+    else:
+        logger.error("=" * 60)
+        logger.error("❌ La migración falló")
+        logger.error("=" * 60)
+        sys.exit(1)
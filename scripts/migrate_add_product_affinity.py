@@ -0,0 +1,98 @@
+"""
+Script de migración: Crear y llenar la tabla customer_product_affinity
+
+La tabla se crea sola al arrancar la app (init_db en el lifespan), pero solo
+recibe las órdenes confirmadas o canceladas desde entonces. Este script la reconstruye desde
+order_items de las órdenes que cuentan como compra (confirmadas, en proceso,
+enviadas, entregadas). Se puede correr de nuevo para rehacerla desde cero.
+
+Uso:
+    python scripts/migrate_add_product_affinity.py
+"""
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+from sqlalchemy import func
+from config.database import engine, get_db
+from app.database.models import CustomerProductAffinity, Order, OrderItem
+from app.services.product_affinity import COUNTED_STATUSES
+from loguru import logger
+
+
+def migrate_add_product_affinity():
+    """
+    Crea customer_product_affinity y la llena agregando order_items una sola vez
+    """
+    logger.info("🔄 Iniciando migración: Tabla customer_product_affinity")
+
+    db = None
+    try:
+        CustomerProductAffinity.__table__.create(bind=engine, checkfirst=True)
+
+        db = next(get_db())
+
+        rows = db.query(
+            Order.customer_id,
+            OrderItem.product_id,
+            func.max(OrderItem.product_name).label('product_name'),
+            func.count(OrderItem.id).label('times_ordered'),
+            func.sum(OrderItem.quantity).label('total_quantity'),
+            func.max(Order.confirmed_at).label('last_ordered_at')
+        ).join(
+            Order, OrderItem.order_id == Order.id
+        ).filter(
+            Order.status.in_(COUNTED_STATUSES)
+        ).group_by(
+            Order.customer_id,
+            OrderItem.product_id
+        ).all()
+
+        deleted = db.query(CustomerProductAffinity).delete()
+        if deleted:
+            logger.info(f"🗑️ {deleted} filas anteriores eliminadas")
+
+        for row in rows:
+            db.add(CustomerProductAffinity(
+                customer_id=row.customer_id,
+                product_id=row.product_id,
+                product_name=row.product_name,
+                times_ordered=row.times_ordered,
+                total_quantity=row.total_quantity or 0,
+                last_ordered_at=row.last_ordered_at
+            ))
+
+        db.commit()
+
+        logger.info(f"✅ {len(rows)} pares cliente-producto cargados")
+        return True
+
+    except Exception as e:
+        logger.error(f"❌ Error durante la migración: {e}")
+        if db is not None:
+            db.rollback()
+        return False
+    finally:
+        if db is not None:
+            db.close()
+
+
+if __name__ == "__main__":
+    logger.info("=" * 60)
+    logger.info("MIGRACIÓN DE BASE DE DATOS")
+    logger.info("=" * 60)
+
+    success = migrate_add_product_affinity()
+
+    if success:
+        logger.info("=" * 60)
+        logger.info("✅ Migración completada con éxito")
+        logger.info("=" * 60)
+    else:
+        logger.error("=" * 60)
+        logger.error("❌ La migración falló")
+        logger.error("=" * 60)
+        sys.exit(1)
@@ -0,0 +1,56 @@
+"""
+Script de migración: Crear las tablas retry_jobs y dead_letters
+
+Los envíos a WAHA que fallan se encolan en retry_jobs y, al agotar los
+intentos, pasan a dead_letters. La app las crea al arrancar (init_db en el
+lifespan); este script sirve para crearlas antes de desplegar, sin esperar
+al primer arranque. No toca datos existentes.
+
+Uso:
+    python scripts/migrate_add_retry_tables.py
+"""
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+from config.database import engine
+from app.database.models import RetryJob, DeadLetter
+from loguru import logger
+
+
+def migrate_add_retry_tables():
+    """
+    Crea retry_jobs y dead_letters si no existen
+    """
+    logger.info("🔄 Iniciando migración: Tablas retry_jobs y dead_letters")
+
+    try:
+        for model in (RetryJob, DeadLetter):
+            model.__table__.create(bind=engine, checkfirst=True)
+            logger.info(f"✅ Tabla {model.__tablename__} lista")
+        return True
+
+    except Exception as e:
+        logger.error(f"❌ Error durante la migración: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    logger.info("=" * 60)
+    logger.info("MIGRACIÓN DE BASE DE DATOS")
+    logger.info("=" * 60)
+
+    success = migrate_add_retry_tables()
+
+    if success:
+        logger.info("=" * 60)
+        logger.info("✅ Migración completada con éxito")
+        logger.info("=" * 60)
+    else:
+        logger.error("=" * 60)
+        logger.error("❌ La migración falló")
+        logger.error("=" * 60)
+        sys.exit(1)
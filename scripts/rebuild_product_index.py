@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Sincroniza el índice de embeddings de productos con la base de datos
+
+Embebe los productos activos nuevos o cambiados y quita los que ya no están
+(la API lo hace sola al arrancar y en cada alta/edición; esto sirve tras
+cargar productos por script o al cambiar EMBEDDING_MODEL). Con --query
+muestra los productos más parecidos a un texto.
+
+Requiere ollama_proxy.py corriendo y el modelo de embeddings descargado:
+    ollama pull nomic-embed-text
+
+Uso:
+    python scripts/rebuild_product_index.py
+    python scripts/rebuild_product_index.py --full
+    python scripts/rebuild_product_index.py --query "algo para escribir rápido"
+"""
+import argparse
+import shutil
+import sys
+import time
+from pathlib import Path
+
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+from loguru import logger
+
+from config.settings import settings
+from app.services.product_vector_index import product_vector_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sincroniza el índice de embeddings de productos")
+    parser.add_argument("--full", action="store_true", help="Borrar el índice y embeber todo de nuevo")
+    parser.add_argument("--query", "-q", help="Texto de prueba: muestra los productos más parecidos")
+    parser.add_argument("--top-k", "-k", type=int, default=settings.product_retrieval_top_k)
+    args = parser.parse_args()
+
+    if not product_vector_index.enabled:
+        logger.error("❌ Índice desactivado (PRODUCT_INDEX_DIR vacío o numpy no instalado)")
+        sys.exit(1)
+
+    if args.full and product_vector_index.index_dir.exists():
+        shutil.rmtree(product_vector_index.index_dir)
+        logger.info(f"🗑️ Índice borrado: {product_vector_index.index_dir}")
+
+    start = time.perf_counter()
+    result = product_vector_index.sync_from_db()
+    logger.info(
+        f"✅ {result['total']} productos ({result['embedded']} embebidos, {result['removed']} quitados) "
+        f"en {time.perf_counter() - start:.1f}s con {settings.embedding_model}"
+    )
+
+    if args.query:
+        from config.database import get_db_context
+        from app.database.models import Product
+
+        ranked = product_vector_index.search(args.query, args.top_k)
+        with get_db_context() as db:
+            names = {p.id: p.name for p in db.query(Product).filter(Product.id.in_([pid for pid, _ in ranked]))}
+        logger.info(f"\n🔍 '{args.query}'")
+        for product_id, score in ranked:
+            logger.info(f"   {score:.3f}  {names.get(product_id, product_id)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Prueba del modo cluster con varias instancias locales contra la misma BD
+
+Levanta N procesos uvicorn (cada uno en su puerto) con CLUSTER_ENABLED=true y
+verifica:
+    1. Todas las instancias ven la misma membresía (→ mismo dueño por teléfono)
+    2. Exactamente una instancia tiene el lease de order_monitor
+    3. Al matar al líder, su lease y sus teléfonos pasan a otra instancia
+
+Uso:
+    python scripts/test_cluster_local.py
+    python scripts/test_cluster_local.py --instances 3 --base-port 8100
+    python scripts/test_cluster_local.py --database-url sqlite:///./cluster_test.db
+
+La BD debe tener las tablas creadas (python scripts/create_tables.py).
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+from loguru import logger
+
+LEASE = "order_monitor"
+HEARTBEAT_SECONDS = 1.0
+MEMBER_TTL_SECONDS = 3.0
+
+
+def start_instance(port: int, database_url: str = None) -> subprocess.Popen:
+    """Levanta una instancia del bot en un puerto"""
+    env = os.environ.copy()
+    env.update({
+        "CLUSTER_ENABLED": "true",
+        "CLUSTER_INSTANCE_URL": f"http://127.0.0.1:{port}",
+        "CLUSTER_HEARTBEAT_SECONDS": str(HEARTBEAT_SECONDS),
+        "CLUSTER_MEMBER_TTL_SECONDS": str(MEMBER_TTL_SECONDS),
+        "PORT": str(port),
+    })
+    if database_url:
+        env["DATABASE_URL"] = database_url
+
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=str(root_dir),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def get_status(port: int):
+    """Obtiene /cluster/status de una instancia (None si no responde)"""
+    try:
+        response = requests.get(f"http://127.0.0.1:{port}/cluster/status", timeout=2)
+        response.raise_for_status()
+        return response.json()
+    except Exception:
+        return None
+
+
+def wait_for(condition, timeout: float, description: str):
+    """Espera hasta que condition() sea verdadera"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        result = condition()
+        if result:
+            return result
+        time.sleep(0.5)
+    raise AssertionError(f"Timeout esperando: {description}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de cluster con procesos locales")
+    parser.add_argument("--instances", "-n", type=int, default=3)
+    parser.add_argument("--base-port", "-p", type=int, default=8100)
+    parser.add_argument("--database-url", "-d", default=None, help="BD compartida (default: la del .env)")
+    args = parser.parse_args()
+
+    ports = [args.base_port + i for i in range(args.instances)]
+    processes = {port: start_instance(port, args.database_url) for port in ports}
+
+    try:
+        logger.info("=" * 70)
+        logger.info(f"TEST: CLUSTER CON {args.instances} INSTANCIAS")
+        logger.info("=" * 70)
+
+        # 1. Membresía consistente
+        def all_agree():
+            statuses = {port: get_status(port) for port in processes}
+            if any(s is None for s in statuses.values()):
+                return None
+            views = {tuple(s["members"]) for s in statuses.values()}
+            if len(views) == 1 and len(next(iter(views))) == len(processes):
+                return statuses
+            return None
+
+        wait_for(all_agree, 60, "membresía consistente")
+        logger.success(f"✓ Todas las instancias ven {len(processes)} miembros")
+
+        # 2. Un único líder
+        def single_leader():
+            statuses = {port: get_status(port) for port in processes}
+            leaders = [port for port, s in statuses.items() if s and LEASE in s["held_leases"]]
+            return leaders if len(leaders) == 1 else None
+
+        leader_port = wait_for(single_leader, 30, "un único líder")[0]
+        logger.success(f"✓ Líder de '{LEASE}': puerto {leader_port}")
+
+        # 3. Hand-off al matar al líder (kill, sin shutdown limpio)
+        logger.info(f"💀 Matando instancia del puerto {leader_port}...")
+        processes[leader_port].kill()
+        processes[leader_port].wait()
+        del processes[leader_port]
+
+        wait_for(all_agree, MEMBER_TTL_SECONDS * 5, "membresía sin la instancia muerta")
+        logger.success(f"✓ Membresía actualizada a {len(processes)} miembros")
+
+        new_leader = wait_for(single_leader, MEMBER_TTL_SECONDS * 5, "nuevo líder")[0]
+        logger.success(f"✓ Nuevo líder de '{LEASE}': puerto {new_leader}")
+
+        logger.info("=" * 70)
+        logger.info("✓ TEST COMPLETADO")
+        logger.info("=" * 70)
+
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
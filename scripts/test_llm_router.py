@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Prueba del router de LLM contra proxies stub locales
+
+Levanta N servidores HTTP que imitan a ollama_proxy.py (POST /generate con y
+sin streaming, latencia configurable) y verifica:
+    1. Reparto por menos requests en curso: con un nodo lento, el rápido
+       recibe la mayoría de las llamadas concurrentes
+    2. Failover: al apagar un nodo las llamadas siguen saliendo por el otro
+       y el caído queda fuera de rotación
+    3. Hedging: con un nodo muy lento la latencia de cola queda acotada por
+       el umbral de hedging
+    4. Modelos declarados: "url|modelo" solo recibe ese modelo
+
+No necesita Ollama.
+
+Uso:
+    python scripts/test_llm_router.py
+    python scripts/test_llm_router.py --calls 60 --concurrency 8
+"""
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+from loguru import logger
+
+from app.clients.llm_router import LLMRouter, parse_backends
+from app.clients.ollama_sync import OllamaSyncClient
+
+
+class StubProxy:
+    """Servidor que responde como ollama_proxy.py tras 'latency' segundos"""
+
+    def __init__(self, port: int, latency: float):
+        self.port = port
+        self.latency = latency
+        self.hits = 0
+        self.models = set()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                data = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.hits += 1
+                stub.models.add(data.get("model"))
+                time.sleep(stub.latency)
+
+                if data.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.end_headers()
+                    for token in ("create", "_order"):
+                        self.wfile.write((json.dumps({"token": token}) + "\n").encode())
+                    self.wfile.write((json.dumps({"done": True}) + "\n").encode())
+                    return
+
+                body = json.dumps({"success": True, "response": f"ok:{stub.port}"}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def make_client(spec: str, **router_kwargs) -> OllamaSyncClient:
+    client = OllamaSyncClient(model="llama3.2:latest")
+    client.router = LLMRouter(parse_backends(spec), **router_kwargs)
+    return client
+
+
+def run_calls(client: OllamaSyncClient, calls: int, concurrency: int, **kwargs):
+    """Lanza llamadas concurrentes; retorna latencias"""
+    def one(_):
+        start = time.perf_counter()
+        client.generate("hola", max_tokens=5, **kwargs)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, range(calls)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba del router de LLM con proxies stub")
+    parser.add_argument("--calls", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=6)
+    parser.add_argument("--base-port", type=int, default=18501)
+    args = parser.parse_args()
+
+    ok = True
+
+    # 1. Menos requests en curso
+    fast = StubProxy(args.base_port, latency=0.05)
+    slow = StubProxy(args.base_port + 1, latency=0.4)
+    client = make_client(f"{fast.url},{slow.url}")
+    run_calls(client, args.calls, args.concurrency)
+    logger.info(f"1. Reparto: rápido={fast.hits}, lento={slow.hits}")
+    ok &= fast.hits > slow.hits * 2
+
+    # 2. Failover y salud
+    slow.stop()
+    before = fast.hits
+    run_calls(client, 10, 2)
+    stats = client.router.get_stats()
+    slow_healthy = [b["healthy"] for b in stats["backends"] if b["url"] == slow.url][0]
+    logger.info(f"2. Failover: {fast.hits - before}/10 por el nodo vivo, caído sano={slow_healthy}, failovers={stats['failovers']}")
+    ok &= fast.hits - before == 10 and not slow_healthy
+
+    # 3. Hedging
+    very_slow = StubProxy(args.base_port + 2, latency=1.5)
+    fast.hits = 0
+    client = make_client(f"{very_slow.url},{fast.url}", hedge_after_seconds=0.2)
+    latencies = run_calls(client, 10, 1)
+    p_max = max(latencies)
+    logger.info(
+        f"3. Hedging: p50={statistics.median(latencies) * 1000:.0f}ms, max={p_max * 1000:.0f}ms, "
+        f"duplicados={client.router.get_stats()['hedges_sent']}"
+    )
+    ok &= p_max < 1.0
+
+    # Streaming sin hedging pasa por el router igual
+    result = client.generate_stream("hola", max_tokens=5)
+    ok &= result["response"] == "create_order"
+
+    # 4. Modelos declarados
+    tiny = StubProxy(args.base_port + 3, latency=0.01)
+    client = make_client(f"{fast.url}|llama3.2:latest,{tiny.url}|llama3.2:1b")
+    client.generate("hola", model="llama3.2:1b")
+    client.generate("hola")
+    logger.info(f"4. Modelos: stub 1b recibió {tiny.models}")
+    ok &= tiny.models == {"llama3.2:1b"}
+
+    for stub in (fast, very_slow, tiny):
+        stub.stop()
+
+    if ok:
+        logger.info("✅ Router OK")
+    else:
+        logger.error("❌ Alguna verificación falló")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
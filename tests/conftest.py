@@ -0,0 +1,12 @@
+"""
+Configuración de pytest
+
+config.settings exige algunas variables sin default; para las pruebas de
+módulos puros basta con valores de relleno (no se conecta a WAHA ni a la BD).
+"""
+import os
+
+os.environ.setdefault("WEBHOOK_SECRET", "test-secret")
+os.environ.setdefault("WAHA_BASE_URL", "http://localhost:3000")
+os.environ.setdefault("WAHA_API_KEY", "test")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
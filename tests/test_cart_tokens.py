@@ -0,0 +1,139 @@
+"""Pruebas de los tokens de carrito firmados (firma, expiración y revocación)"""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from config.database import Base
+from app.database.models import CartSession, Customer
+from app.services.cart_tokens import CartTokenError, CartTokens
+
+
+@pytest.fixture
+def tokens():
+    # sync_seconds=0: cada is_revoked sincroniza con la BD
+    return CartTokens("secreto-de-prueba", sync_seconds=0)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(Customer(id="c1", phone="3001234567"))
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def _expires(hours: float = 24) -> datetime:
+    return (datetime.utcnow() + timedelta(hours=hours)).replace(microsecond=0)
+
+
+def test_sign_and_verify_roundtrip(tokens):
+    nonce = str(uuid.uuid4())
+    expires_at = _expires()
+    token = tokens.sign(nonce, "c1", expires_at)
+
+    claims = tokens.verify(token)
+
+    assert tokens.is_signed(token)
+    assert tokens.nonce_of(token) == nonce
+    assert (claims.nonce, claims.customer_id, claims.expires_at) == (nonce, "c1", expires_at)
+    assert not claims.is_expired
+
+
+def test_sign_is_deterministic(tokens):
+    expires_at = _expires()
+    assert tokens.sign("n", "c1", expires_at) == tokens.sign("n", "c1", expires_at)
+
+
+@pytest.mark.parametrize("part", [0, 1, 2, 3])
+def test_tampered_token_is_rejected(tokens, part):
+    pieces = tokens.sign(str(uuid.uuid4()), "c1", _expires()).split(".")
+    pieces[part] = pieces[part][:-1] + ("A" if pieces[part][-1] != "A" else "B")
+
+    with pytest.raises(CartTokenError):
+        tokens.verify(".".join(pieces))
+
+
+def test_token_from_another_secret_is_rejected(tokens):
+    token = CartTokens("otro-secreto").sign("n", "c1", _expires())
+
+    with pytest.raises(CartTokenError):
+        tokens.verify(token)
+
+
+@pytest.mark.parametrize("token", ["", "a.b", "a.b.c.d.e", "n.c1.no-es-numero.firma"])
+def test_malformed_token_is_rejected(tokens, token):
+    with pytest.raises(CartTokenError):
+        tokens.verify(token)
+
+
+def test_legacy_token_is_not_signed(tokens):
+    legacy = str(uuid.uuid4())
+
+    assert not tokens.is_signed(legacy)
+    assert tokens.nonce_of(legacy) == legacy
+
+
+def test_expired_token_verifies_but_reports_expired(tokens):
+    token = tokens.sign("n", "c1", _expires(hours=-1))
+
+    assert tokens.verify(token).is_expired
+
+
+def test_revoke_in_this_process(tokens, db):
+    tokens.revoke("n1", _expires())
+
+    assert tokens.is_revoked("n1", db)
+    assert not tokens.is_revoked("n2", db)
+
+
+def test_sessions_used_by_other_instances_are_synced(tokens, db):
+    db.add(CartSession(token="used", customer_id="c1", expires_at=_expires(), used=True))
+    db.add(CartSession(token="fresh", customer_id="c1", expires_at=_expires(), used=False))
+    db.commit()
+
+    assert tokens.is_revoked("used", db)
+    assert not tokens.is_revoked("fresh", db)
+
+
+def test_expired_revocations_are_pruned(tokens, db):
+    tokens.revoke("old", datetime.utcnow() - timedelta(seconds=1))
+
+    assert not tokens.is_revoked("old", db)
+
+
+def test_session_details_are_bounded_and_dropped_on_revoke():
+    tokens = CartTokens("secreto-de-prueba", max_sessions=2)
+    for nonce in ("a", "b", "c"):
+        tokens.remember_session(nonce, f"s-{nonce}", {"suggested_products": [nonce]}, _expires())
+
+    assert tokens.session_details("a") is None
+    assert tokens.session_details("c") == ("s-c", {"suggested_products": ["c"]})
+
+    tokens.revoke("c", _expires())
+    assert tokens.session_details("c") is None
+
+
+def test_validate_cart_token_keeps_session_id_and_cart_data(db):
+    from app.services.cart_service import CartService
+    from app.services.cart_tokens import cart_tokens
+
+    service = CartService(db)
+    created = service.create_cart_session("c1", suggested_products=["p1"])
+    expected = {"session_id": created["session_id"], "cart_data": {"suggested_products": ["p1"]}}
+
+    # Datos guardados al crear y, en otra instancia, leídos de la BD la primera vez
+    for clear in (False, True):
+        if clear:
+            cart_tokens._sessions.clear()
+        validation = service.validate_cart_token(created["token"])
+        assert validation["valid"]
+        assert {key: validation[key] for key in expected} == expected
+        assert validation == service.validate_cart_session(created["token"])
@@ -0,0 +1,173 @@
+"""Pruebas de las transiciones del circuit breaker (closed → open → half_open)"""
+import pytest
+
+from app.core import circuit_breaker
+from app.core.circuit_breaker import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, is_service_failure
+)
+
+
+class FakeClock:
+    """Reemplaza el módulo time del breaker: el tiempo avanza solo con advance()"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(circuit_breaker, "time", fake)
+    return fake
+
+
+def make_breaker(**overrides) -> CircuitBreaker:
+    options = dict(
+        window_seconds=60, min_calls=4, failure_threshold=0.5,
+        slow_call_seconds=10, slow_call_threshold=0.8, open_seconds=30, half_open_max_calls=1
+    )
+    options.update(overrides)
+    return CircuitBreaker("test", **options)
+
+
+def trip(breaker: CircuitBreaker):
+    for _ in range(breaker.min_calls):
+        breaker.record_failure(0.1)
+
+
+def test_stays_closed_below_min_calls(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_failure(0.1)
+
+    assert breaker.state == CLOSED
+
+
+def test_opens_on_failure_rate_and_rejects(clock):
+    breaker = make_breaker()
+    breaker.record_success(0.1)
+    breaker.record_success(0.1)
+    breaker.record_failure(0.1)
+    assert breaker.state == CLOSED
+
+    breaker.record_failure(0.1)  # 2/4 = umbral
+
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.allow_request()
+    assert excinfo.value.retry_after == pytest.approx(30)
+    assert breaker.get_state()["rejected"] == 1
+
+
+def test_opens_on_slow_call_rate(clock):
+    breaker = make_breaker()
+    for _ in range(4):
+        breaker.record_success(12.0)
+
+    assert breaker.state == OPEN
+
+
+def test_old_calls_leave_the_window(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_failure(0.1)
+    clock.advance(61)
+    breaker.record_failure(0.1)
+
+    assert breaker.state == CLOSED
+
+
+def test_half_open_after_cooldown_and_closes_on_success(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.advance(29)
+    assert breaker.state == OPEN
+
+    clock.advance(1)
+    assert breaker.state == HALF_OPEN
+
+    breaker.allow_request()
+    # Un solo sondeo a la vez
+    with pytest.raises(CircuitOpenError):
+        breaker.allow_request()
+
+    breaker.record_success(0.1)
+    assert breaker.state == CLOSED
+    assert breaker.get_state()["window_calls"] == 0
+
+
+def test_failed_probe_reopens(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.advance(30)
+
+    breaker.allow_request()
+    breaker.record_failure(0.1)
+
+    assert breaker.state == OPEN
+    assert breaker.get_state()["times_opened"] == 2
+
+
+def test_slow_probe_reopens(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.advance(30)
+
+    breaker.allow_request()
+    breaker.record_success(11.0)
+
+    assert breaker.state == OPEN
+
+
+def test_half_open_needs_every_probe_to_succeed(clock):
+    breaker = make_breaker(half_open_max_calls=2)
+    trip(breaker)
+    clock.advance(30)
+
+    breaker.allow_request()
+    breaker.allow_request()
+    breaker.record_success(0.1)
+    assert breaker.state == HALF_OPEN
+
+    breaker.record_success(0.1)
+    assert breaker.state == CLOSED
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.response = type("Response", (), {"status_code": status_code})()
+
+
+def test_guard_counts_only_service_failures(clock):
+    breaker = make_breaker()
+    for _ in range(4):
+        with pytest.raises(HTTPError):
+            with breaker.guard():
+                raise HTTPError(404)
+    assert breaker.state == CLOSED
+
+    for _ in range(4):
+        with pytest.raises(HTTPError):
+            with breaker.guard():
+                raise HTTPError(503)
+    assert breaker.state == OPEN
+
+    with pytest.raises(CircuitOpenError):
+        with breaker.guard():
+            pytest.fail("no debe llamar con el circuito abierto")
+
+
+def test_is_service_failure():
+    assert is_service_failure(TimeoutError())
+    assert is_service_failure(HTTPError(500))
+    assert not is_service_failure(HTTPError(400))
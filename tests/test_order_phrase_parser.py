@@ -0,0 +1,95 @@
+"""Pruebas del parser determinista de pedidos (frase → productos y cantidades)"""
+import pytest
+
+from app.core.order_phrase_parser import (
+    CatalogIndex, OrderPhraseParser, find_quantity, fold
+)
+
+
+CATALOG = [
+    "Laptop HP", "Laptop Dell", "Mouse Logitech", "Teclado Mecánico",
+    "Monitor Samsung 24", "Mouse y Pad", "Lápiz"
+]
+
+
+@pytest.fixture(scope="module")
+def parser():
+    return OrderPhraseParser(CatalogIndex(CATALOG))
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("dos laptops hp y un mouse logitech", [("Laptop HP", 2), ("Mouse Logitech", 1)]),
+    ("3 teclados, 1 monitor samsung", [("Teclado Mecánico", 3), ("Monitor Samsung 24", 1)]),
+    ("teclado mecánico + mouse logitech", [("Teclado Mecánico", None), ("Mouse Logitech", None)]),
+    # Números compuestos y en palabras
+    ("quiero treinta y dos lapices", [("Lápiz", 32)]),
+    ("veintidós lapices por favor", [("Lápiz", 22)]),
+    # Expresiones de cantidad
+    ("una docena de lápices", [("Lápiz", 12)]),
+    ("media docena de lapices", [("Lápiz", 6)]),
+    ("un par de teclados mecanicos", [("Teclado Mecánico", 2)]),
+    ("mouse logitech x2", [("Mouse Logitech", 2)]),
+    ("2x teclado mecanico", [("Teclado Mecánico", 2)]),
+    # Nombre del catálogo con conjunción: no se corta
+    ("quiero un mouse y pad", [("Mouse y Pad", 1)]),
+])
+def test_parse_table(parser, message, expected):
+    result = parser.parse(message)
+
+    assert [(item.product, item.quantity) for item in result.items] == expected
+    assert result.confidence == 1.0
+
+
+def test_generic_name_keeps_candidates_with_lower_confidence(parser):
+    result = parser.parse("laptops")
+
+    assert result.items[0].quantity is None
+    assert result.items[0].candidates == ["Laptop Dell", "Laptop HP"]
+    assert result.confidence == 0.9
+
+
+def test_number_inside_unknown_name_is_low_confidence(parser):
+    # "27" no está en el catálogo: puede ser parte del nombre, no una cantidad
+    assert parser.parse("monitor 27").confidence <= 0.5
+
+
+def test_unknown_text_is_low_confidence(parser):
+    assert parser.parse("nada que ver").confidence < 0.5
+
+
+def test_quantity_without_product_is_not_listed(parser):
+    result = parser.parse("quiero dos")
+
+    assert result.confidence == 0.0
+    assert result.items[0].quantity == 2
+    assert result.to_list() == []
+
+
+def test_empty_message(parser):
+    result = parser.parse("")
+
+    assert result.items == []
+    assert result.confidence == 0.0
+
+
+@pytest.mark.parametrize("word, folded", [
+    ("mouses", "mous"), ("mouse", "mous"),
+    ("monitores", "monitor"), ("monitor", "monitor"),
+    ("lapices", "lapiz"), ("lapiz", "lapiz"),
+    ("dos", "dos"), ("24", "24"),
+])
+def test_fold_singular_and_plural(word, folded):
+    assert fold(word) == folded
+
+
+@pytest.mark.parametrize("message, quantity", [
+    ("3", 3),
+    ("quiero tres", 3),
+    ("treinta y dos", 32),
+    ("una docena de lapices", 12),
+    ("un par", 2),
+    ("mouse x2", 2),
+    ("ninguno", None),
+])
+def test_find_quantity(message, quantity):
+    assert find_quantity(message) == quantity
@@ -1,5 +1,5 @@
 import axios from 'axios'
-import type { Product, CartSession, CompleteCartRequest, CompleteCartResponse } from '@/types'
+import type { Product, CartSession, CompleteCartRequest, CompleteCartResponse, ImageSize } from '@/types'
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000'
 
@@ -59,6 +59,18 @@ export const cartAPI = {
     
     // Construir URL completa
     return `${API_BASE_URL}${imagePath}`
+  },
+
+  /**
+   * URL de la variante WebP del tamaño pedido (cacheada como inmutable);
+   * si la imagen aún no tiene variantes, la imagen original
+   */
+  getProductImageUrl(product: Product, size: ImageSize): string {
+    const variant = product.image_variants?.[size]
+    if (variant) {
+      return `${API_BASE_URL}${variant.webp}`
+    }
+    return this.getImageUrl(product.image_path)
   }
 }
 
@@ -1,3 +1,7 @@
+export type ImageSize = 'thumb' | 'card' | 'full'
+
+export type ImageVariants = Record<ImageSize, { webp: string; jpeg: string }>
+
 export interface Product {
   id: string
   name: string
@@ -7,6 +11,7 @@ export interface Product {
   category: string | null
   sku: string | null
   image_path: string | null
+  image_variants?: ImageVariants | null
 }
 
 export interface CartItem {